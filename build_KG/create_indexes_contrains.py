@@ -1,63 +1,216 @@
+"""
+This script is used to provision the indexes and constraints of the MetagenomicKG Neo4j database.
+
+The desired schema is compared against SHOW INDEXES / SHOW CONSTRAINTS and only the missing entries are created
+(concurrently, with IF NOT EXISTS), after which the script blocks until every index is ONLINE. Re-running it on a
+provisioned database only costs the two SHOW queries. A plain node_id index left by older versions of this script is
+dropped right before the uniqueness constraint (whose backing index replaces it) is created.
+"""
+
 import neo4j
 import os
+import re
+import time
+import argparse
+from concurrent.futures import ThreadPoolExecutor, as_completed
 from config_loader import get_neo4j_config
 
+# Properties that get a range index on every node label
+NODE_PROPERTY_INDEXES = ['node_type', 'knowledge_source', 'link', 'is_pathogen']
+# Multi-property range indexes as (label, [properties]); none of the current queries filter on several exact-match
+# properties of one label, so none are declared by default
+COMPOSITE_NODE_INDEXES = []
+# Free-text properties are searched by substring (e.g. names containing 'Staphylococcus aureus'), which range indexes
+# cannot serve, so they get full-text indexes spanning all labels
+FULLTEXT_NODE_INDEXES = {
+    'node_names_fulltext': ['all_names', 'synonyms'],
+    'node_description_fulltext': ['description'],
+}
+UNIQUE_NODE_PROPERTY = 'node_id'
+
 # Load Neo4j configuration
 neo4j_config = get_neo4j_config()
 neo4j_bolt = neo4j_config['neo4j_bolt']
-neo4j_username = neo4j_config['neo4j_username']  
+neo4j_username = neo4j_config['neo4j_username']
 neo4j_password = neo4j_config['neo4j_password']
 
 # Initialize the Neo4j driver
 driver = neo4j.GraphDatabase.driver(neo4j_bolt, auth=(neo4j_username, neo4j_password))
 
-def run_query(query):
+def run_query(query, parameters=None, max_retries=3):
     """
     Execute a Cypher query and return the result.
     :param query: a Cypher statement as a string to run
+    :param parameters: optional query parameters
+    :param max_retries: number of retries on transient errors (e.g. schema lock contention)
     """
-    with driver.session() as session:
-        result = session.run(query)
-        return list(result)
+    for attempt in range(max_retries + 1):
+        try:
+            with driver.session() as session:
+                result = session.run(query, parameters or {})
+                return list(result)
+        except (neo4j.exceptions.TransientError, neo4j.exceptions.ServiceUnavailable):
+            if attempt == max_retries:
+                raise
+            time.sleep(2 ** attempt)
 
 def node_labels():
     """
     Retrieve distinct node labels from the database.
     """
-    labels_query = "MATCH (n) RETURN distinct labels(n) as labels"
-    results = run_query(labels_query)
-    label_list = [result['labels'][0] for result in results if result['labels']]
+    # db.labels() reads the label token store instead of scanning every node
+    results = run_query("CALL db.labels() YIELD label RETURN label")
+    label_list = [result['label'] for result in results]
     return label_list
 
-def create_index(label_list, property_name):
+def schema_name(*parts):
+    """
+    Build a deterministic index/constraint name from labels and properties.
+    """
+    return re.sub(r'[^0-9A-Za-z_]', '_', '_'.join(parts))
+
+def desired_schema(label_list):
     """
-    Create an index on a given property for each label in the list.
+    Return the desired indexes and constraints as a list of dicts with name, kind, labels, properties and statement.
     :param label_list: a list of the node labels in Neo4j
-    :param property_name: the property name to index
     """
+    schema = []
     for label in label_list:
-        # Adjusted to use the new CREATE INDEX syntax
-        index_query = f"CREATE INDEX FOR (n:`{label}`) ON (n.{property_name})"
-        run_query(index_query)
+        name = schema_name('unique', label, UNIQUE_NODE_PROPERTY)
+        schema += [{'name': name, 'kind': 'UNIQUENESS', 'labels': [label], 'properties': [UNIQUE_NODE_PROPERTY],
+                    'statement': f"CREATE CONSTRAINT `{name}` IF NOT EXISTS FOR (n:`{label}`) REQUIRE n.{UNIQUE_NODE_PROPERTY} IS UNIQUE"}]
+        for property_name in NODE_PROPERTY_INDEXES:
+            name = schema_name('range', label, property_name)
+            schema += [{'name': name, 'kind': 'RANGE', 'labels': [label], 'properties': [property_name],
+                        'statement': f"CREATE INDEX `{name}` IF NOT EXISTS FOR (n:`{label}`) ON (n.{property_name})"}]
+    for label, properties in COMPOSITE_NODE_INDEXES:
+        if label not in label_list:
+            continue
+        name = schema_name('composite', label, *properties)
+        property_list = ', '.join([f'n.{property_name}' for property_name in properties])
+        schema += [{'name': name, 'kind': 'RANGE', 'labels': [label], 'properties': list(properties),
+                    'statement': f"CREATE INDEX `{name}` IF NOT EXISTS FOR (n:`{label}`) ON ({property_list})"}]
+    if label_list:
+        label_pattern = '|'.join([f'`{label}`' for label in label_list])
+        for name, properties in FULLTEXT_NODE_INDEXES.items():
+            property_list = ', '.join([f'n.{property_name}' for property_name in properties])
+            schema += [{'name': name, 'kind': 'FULLTEXT', 'labels': sorted(label_list), 'properties': list(properties),
+                        'statement': f"CREATE FULLTEXT INDEX `{name}` IF NOT EXISTS FOR (n:{label_pattern}) ON EACH [{property_list}]"}]
+    return schema
 
-def constraint(label_list):
+def existing_schema():
     """
-    Create a unique constraint on the 'id' property for nodes with the label 'Base'.
-    :param label_list: a list of the node labels in Neo4j
+    Return the existing indexes and constraints keyed by (kind, labels, properties), plus all existing names.
     """
-    if 'Base' in label_list:
-        constraint_query = "CREATE CONSTRAINT ON (n:Base) ASSERT n.id IS UNIQUE"
-        run_query(constraint_query)
+    existing, names = {}, set()
+    for record in run_query("SHOW INDEXES YIELD name, type, entityType, labelsOrTypes, properties, owningConstraint "
+                            "WHERE entityType = 'NODE' RETURN *"):
+        names.add(record['name'])
+        if record['type'] in ('RANGE', 'BTREE', 'FULLTEXT') and record['labelsOrTypes']:
+            labels = sorted(record['labelsOrTypes']) if record['type'] == 'FULLTEXT' else list(record['labelsOrTypes'])
+            # A constraint's backing index also serves single-property lookups
+            kind = 'UNIQUENESS' if record['owningConstraint'] else ('FULLTEXT' if record['type'] == 'FULLTEXT' else 'RANGE')
+            existing[(kind, tuple(labels), tuple(record['properties']))] = record['name']
+    for record in run_query("SHOW CONSTRAINTS YIELD name, type, labelsOrTypes, properties RETURN *"):
+        names.add(record['name'])
+        if 'UNIQUE' in record['type'] and record['labelsOrTypes']:
+            existing[('UNIQUENESS', tuple(record['labelsOrTypes']), tuple(record['properties']))] = record['name']
+    return existing, names
+
+def missing_schema(schema, existing, existing_names):
+    """
+    Filter the desired schema down to entries that do not exist yet (by definition or by name).
+    """
+    missing = []
+    for item in schema:
+        key = (item['kind'], tuple(item['labels']), tuple(item['properties']))
+        if key in existing or item['name'] in existing_names:
+            continue
+        # A uniqueness constraint cannot be created over an existing plain index on the same property; the index is
+        # redundant with the constraint's backing index, so it is dropped first (and restored if the constraint fails)
+        if item['kind'] == 'UNIQUENESS' and ('RANGE', key[1], key[2]) in existing:
+            index_name = existing[('RANGE', key[1], key[2])]
+            label, property_name = key[1][0], key[2][0]
+            item = dict(item, drop_statement=f"DROP INDEX `{index_name}` IF EXISTS",
+                        restore_statement=f"CREATE INDEX `{index_name}` IF NOT EXISTS FOR (n:`{label}`) ON (n.{property_name})")
+        missing += [item]
+    return missing
+
+def create_schema_item(item):
+    """
+    Create one index or constraint, first dropping the plain index that it replaces if there is one.
+    """
+    if 'drop_statement' not in item:
+        return run_query(item['statement'])
+    run_query(item['drop_statement'])
+    try:
+        return run_query(item['statement'])
+    except neo4j.exceptions.Neo4jError:
+        run_query(item['restore_statement'])
+        raise
+
+def create_schema(items, max_workers=4):
+    """
+    Create indexes and constraints concurrently.
+    :param items: schema entries returned by missing_schema
+    :param max_workers: number of concurrent schema transactions
+    """
+    failed = []
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        futures = {executor.submit(create_schema_item, item): item for item in items}
+        for future in as_completed(futures):
+            item = futures[future]
+            try:
+                future.result()
+                print(f"Created {item['kind'].lower()} {item['name']}", flush=True)
+            except neo4j.exceptions.Neo4jError as e:
+                restored = f" (the index it replaces was restored; resolve duplicate {UNIQUE_NODE_PROPERTY} values and re-run)" if 'drop_statement' in item else ''
+                print(f"Failed to create {item['name']}{restored}: {e}", flush=True)
+                failed += [item['name']]
+    return failed
+
+def wait_for_indexes(timeout=3600, poll_seconds=5):
+    """
+    Block until all node indexes are ONLINE, reporting the population progress of the others.
+    :param timeout: maximum number of seconds to wait
+    :param poll_seconds: seconds between two progress checks
+    """
+    start = time.time()
+    while True:
+        records = run_query("SHOW INDEXES YIELD name, state, populationPercent WHERE state <> 'ONLINE' RETURN *")
+        failed = [record['name'] for record in records if record['state'] == 'FAILED']
+        if failed:
+            raise RuntimeError(f"Index population failed for: {', '.join(failed)}")
+        if not records:
+            print("All indexes are online", flush=True)
+            return
+        if time.time() - start > timeout:
+            raise TimeoutError(f"{len(records)} indexes are still populating after {timeout} seconds")
+        progress = ', '.join([f"{record['name']} {record['populationPercent']:.1f}%" for record in records])
+        print(f"Waiting for {len(records)} indexes to come online: {progress}", flush=True)
+        time.sleep(poll_seconds)
 
 if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Create the missing indexes and constraints of the MetagenomicKG Neo4j database')
+    parser.add_argument('--max_workers', type=int, help='number of concurrent schema transactions', default=4)
+    parser.add_argument('--timeout', type=int, help='maximum number of seconds to wait for index population', default=3600)
+    parser.add_argument('--dry_run', action='store_true', help='only print the statements that would be run')
+    args = parser.parse_args()
+
     node_label_list = node_labels()
-    
-    # Create Indexes on Node Properties
-    create_index(node_label_list, 'node_id')
-    create_index(node_label_list, 'node_type')
-    create_index(node_label_list, 'all_names')
-    create_index(node_label_list, 'description')
-    create_index(node_label_list, 'knowledge_source')
-    create_index(node_label_list, 'link')
-    create_index(node_label_list, 'synonyms')
-    create_index(node_label_list, 'is_pathogen')
\ No newline at end of file
+    schema = desired_schema(node_label_list)
+    existing, existing_names = existing_schema()
+    missing = missing_schema(schema, existing, existing_names)
+    print(f"{len(schema)} desired indexes/constraints, {len(schema) - len(missing)} already exist, {len(missing)} to create", flush=True)
+
+    if args.dry_run:
+        for item in missing:
+            if 'drop_statement' in item:
+                print(item['drop_statement'])
+            print(item['statement'])
+    else:
+        failed = create_schema(missing, max_workers=args.max_workers)
+        wait_for_indexes(timeout=args.timeout)
+        if failed:
+            raise SystemExit(f"Failed to create: {', '.join(failed)}")
+    driver.close()
@@ -0,0 +1,520 @@
+"""
+This script provides an in-process query layer over a built MetagenomicKG (no Neo4j needed).
+
+The graph is compiled into a GraphIndex: nodes, node types, predicates and knowledge sources are interned into
+integers and the edges are stored once (COO) with CSR orderings for outgoing and incoming edges. Queries expand
+whole frontiers at once with NumPy, so typed neighbor lookups, k-hop traversals, shortest paths and path patterns
+are interactive on the full v6 graph. The index can be saved to / loaded from a single .npz snapshot.
+
+Examples:
+    python graph_query.py --kg_dir ../data/merged_KG --save_snapshot kg_v6_index.npz
+    python graph_query.py --snapshot kg_v6_index.npz khop GTDB:GCF_000005845.2 --k 2 --target_types biolink:Disease
+    python graph_query.py --snapshot kg_v6_index.npz path <source> <target>
+    python graph_query.py --snapshot kg_v6_index.npz pattern biolink:OrganismTaxon biolink:BiologicalEntity biolink:Pathway --start <node>
+"""
+
+## Import standard libraries
+import os
+import sys
+import ast
+import csv
+import json
+import argparse
+import logging
+from array import array
+from typing import List, Dict, Tuple, Optional, Union, Iterable
+import numpy as np
+from tqdm import tqdm
+
+## Import custom libraries
+from utils import get_logger
+
+SNAPSHOT_VERSION = 2
+STRING_SEPARATOR = '\x00'
+DIRECTIONS = ('out', 'in', 'both')
+
+
+def encode_strings(values: List[str]) -> np.ndarray:
+    # Every value is terminated by the separator so that empty strings survive the round trip
+    return np.frombuffer(''.join([value + STRING_SEPARATOR for value in values]).encode('utf-8'), dtype=np.uint8)
+
+
+def decode_strings(blob: np.ndarray) -> List[str]:
+    text = blob.tobytes().decode('utf-8')
+    return text.split(STRING_SEPARATOR)[:-1]
+
+
+def _parse_list(value: str) -> list:
+    if value in ('', '[nan]'):
+        return []
+    return ast.literal_eval(value)
+
+
+def _build_csr(keys: np.ndarray, n_rows: int) -> Tuple[np.ndarray, np.ndarray]:
+    order = np.argsort(keys, kind='stable').astype(np.int64)
+    indptr = np.zeros(n_rows + 1, dtype=np.int64)
+    np.cumsum(np.bincount(keys, minlength=n_rows), out=indptr[1:])
+    return indptr, order
+
+
+def _gather(indptr: np.ndarray, values: np.ndarray, rows: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Return the concatenated CSR rows of `rows` and, for each gathered entry, the position of its row in `rows`.
+    """
+    starts, ends = indptr[rows], indptr[rows + 1]
+    lengths = ends - starts
+    total = int(lengths.sum())
+    if total == 0:
+        return np.empty(0, dtype=values.dtype), np.empty(0, dtype=np.int64)
+    offsets = np.repeat(starts - np.cumsum(lengths) + lengths, lengths)
+    return values[offsets + np.arange(total)], np.repeat(np.arange(len(rows)), lengths)
+
+
+class GraphIndex:
+
+    def __init__(self, node_ids: List[str], node_type_ids: np.ndarray, node_types: List[str], node_names: List[str],
+                 node_source_masks: np.ndarray, is_pathogen: np.ndarray, edge_source: np.ndarray, edge_target: np.ndarray,
+                 edge_predicate_ids: np.ndarray, predicates: List[str], edge_source_masks: np.ndarray, knowledge_sources: List[str],
+                 synonyms: List[str], synonym_node_indices: np.ndarray):
+        self.node_ids = node_ids
+        self.node_type_ids = node_type_ids
+        self.node_types = node_types
+        self.node_names = node_names
+        self.node_source_masks = node_source_masks
+        self.is_pathogen = is_pathogen
+        self.edge_source = edge_source
+        self.edge_target = edge_target
+        self.edge_predicate_ids = edge_predicate_ids
+        self.predicates = predicates
+        self.edge_source_masks = edge_source_masks
+        self.knowledge_sources = knowledge_sources
+        self.synonyms = synonyms
+        self.synonym_node_indices = synonym_node_indices
+        # Number of edges dropped while building the index because an endpoint is not a node of the graph
+        self.n_skipped_edges = 0
+
+        self.node_index = {node_id: index for index, node_id in enumerate(node_ids)}
+        self.synonym_index = {synonym: int(node_index) for synonym, node_index in zip(synonyms, synonym_node_indices)}
+        self.node_type_index = {node_type: index for index, node_type in enumerate(node_types)}
+        self.predicate_index = {predicate: index for index, predicate in enumerate(predicates)}
+        self.knowledge_source_index = {source: index for index, source in enumerate(knowledge_sources)}
+        self.out_indptr, self.out_edges = _build_csr(edge_source, len(node_ids))
+        self.in_indptr, self.in_edges = _build_csr(edge_target, len(node_ids))
+
+    @property
+    def n_nodes(self) -> int:
+        return len(self.node_ids)
+
+    @property
+    def n_edges(self) -> int:
+        return len(self.edge_source)
+
+    # ---------------------------------------------- Construction ---------------------------------------------- #
+
+    @classmethod
+    def from_tsv(cls, node_file: str, edge_file: str, logger=None) -> 'GraphIndex':
+        """
+        Stream the KG node/edge TSV files (as written by KnowledgeGraph.save_graph) into a GraphIndex.
+        """
+        csv.field_size_limit(sys.maxsize)
+        node_ids, node_type_ids, node_names, node_source_masks, is_pathogen = [], array('H'), [], array('Q'), array('b')
+        node_types, predicates, knowledge_sources = {}, {}, {}
+        synonyms, synonym_node_indices = [], array('q')
+
+        def source_mask(sources: Iterable[str]) -> int:
+            mask = 0
+            for source in sources:
+                if source not in knowledge_sources:
+                    if len(knowledge_sources) == 64:
+                        raise ValueError('More than 64 knowledge sources cannot be stored as a bitmask')
+                    knowledge_sources[source] = len(knowledge_sources)
+                mask |= 1 << knowledge_sources[source]
+            return mask
+
+        with open(node_file, newline='', encoding='utf-8') as f:
+            reader = csv.reader(f, delimiter='\t')
+            header = next(reader)
+            columns = {column: header.index(column) for column in ['node_id', 'node_type', 'all_names', 'knowledge_source', 'synonyms', 'is_pathogen']}
+            for row in tqdm(reader, desc='Indexing nodes'):
+                node_index = len(node_ids)
+                node_ids.append(row[columns['node_id']])
+                node_type = row[columns['node_type']]
+                node_type_ids.append(node_types.setdefault(node_type, len(node_types)))
+                all_names = _parse_list(row[columns['all_names']])
+                node_names.append(str(all_names[0]) if all_names else '')
+                node_source_masks.append(source_mask(_parse_list(row[columns['knowledge_source']])))
+                is_pathogen.append(row[columns['is_pathogen']] == 'True')
+                for synonym in _parse_list(row[columns['synonyms']]):
+                    synonyms.append(synonym)
+                    synonym_node_indices.append(node_index)
+        node_lookup = {node_id: index for index, node_id in enumerate(node_ids)}
+
+        edge_source, edge_target, edge_predicate_ids, edge_source_masks = array('q'), array('q'), array('H'), array('Q')
+        skipped_edges = 0
+        with open(edge_file, newline='', encoding='utf-8') as f:
+            reader = csv.reader(f, delimiter='\t')
+            header = next(reader)
+            columns = {column: header.index(column) for column in ['source_node', 'target_node', 'predicate', 'knowledge_source']}
+            for row in tqdm(reader, desc='Indexing edges'):
+                source_index = node_lookup.get(row[columns['source_node']])
+                target_index = node_lookup.get(row[columns['target_node']])
+                if source_index is None or target_index is None:
+                    skipped_edges += 1
+                    continue
+                edge_source.append(source_index)
+                edge_target.append(target_index)
+                edge_predicate_ids.append(predicates.setdefault(row[columns['predicate']], len(predicates)))
+                edge_source_masks.append(source_mask(_parse_list(row[columns['knowledge_source']])))
+        if skipped_edges > 0 and logger is not None:
+            logger.warning(f"Skipped {skipped_edges} edges whose source or target node is missing")
+
+        graph = cls(node_ids, np.frombuffer(node_type_ids, dtype=np.uint16), list(node_types), node_names,
+                    np.frombuffer(node_source_masks, dtype=np.uint64), np.frombuffer(is_pathogen, dtype=np.int8).astype(bool),
+                    np.frombuffer(edge_source, dtype=np.int64), np.frombuffer(edge_target, dtype=np.int64),
+                    np.frombuffer(edge_predicate_ids, dtype=np.uint16), list(predicates),
+                    np.frombuffer(edge_source_masks, dtype=np.uint64), list(knowledge_sources),
+                    synonyms, np.frombuffer(synonym_node_indices, dtype=np.int64))
+        graph.n_skipped_edges = skipped_edges
+        return graph
+
+    @classmethod
+    def from_knowledge_graph(cls, kg) -> 'GraphIndex':
+        """
+        Build a GraphIndex from an in-memory KnowledgeGraph object.
+        """
+        node_ids = list(kg.nodes)
+        node_lookup = {node_id: index for index, node_id in enumerate(node_ids)}
+        node_types = sorted({node.node_type for node in kg.nodes.values()})
+        node_type_lookup = {node_type: index for index, node_type in enumerate(node_types)}
+        knowledge_sources = sorted({source for node in kg.nodes.values() for source in node.knowledge_source} |
+                                   {source for edge in kg.edges.values() for source in edge.knowledge_source})
+        if len(knowledge_sources) > 64:
+            raise ValueError('More than 64 knowledge sources cannot be stored as a bitmask')
+        source_lookup = {source: index for index, source in enumerate(knowledge_sources)}
+        source_mask = lambda sources: sum(1 << source_lookup[source] for source in set(sources))
+        edges = [edge for edge in kg.edges.values() if edge.source_node in node_lookup and edge.target_node in node_lookup]
+        predicates = sorted({edge.predicate for edge in edges})
+        predicate_lookup = {predicate: index for index, predicate in enumerate(predicates)}
+        synonyms = [(synonym, node_lookup[node_id]) for synonym, node_id in kg.map_synonym_to_node_id.items() if node_id in node_lookup]
+        return cls(node_ids,
+                   np.array([node_type_lookup[kg.nodes[node_id].node_type] for node_id in node_ids], dtype=np.uint16), node_types,
+                   [str(kg.nodes[node_id].all_names[0]) if kg.nodes[node_id].all_names else '' for node_id in node_ids],
+                   np.array([source_mask(kg.nodes[node_id].knowledge_source) for node_id in node_ids], dtype=np.uint64),
+                   np.array([bool(kg.nodes[node_id].is_pathogen) for node_id in node_ids], dtype=bool),
+                   np.array([node_lookup[edge.source_node] for edge in edges], dtype=np.int64),
+                   np.array([node_lookup[edge.target_node] for edge in edges], dtype=np.int64),
+                   np.array([predicate_lookup[edge.predicate] for edge in edges], dtype=np.uint16), predicates,
+                   np.array([source_mask(edge.knowledge_source) for edge in edges], dtype=np.uint64), knowledge_sources,
+                   [synonym for synonym, _ in synonyms], np.array([node_index for _, node_index in synonyms], dtype=np.int64))
+
+    def save(self, file_path: str):
+        np.savez(file_path, version=np.array([SNAPSHOT_VERSION]),
+                 node_ids=encode_strings(self.node_ids), node_type_ids=self.node_type_ids, node_types=encode_strings(self.node_types),
+                 node_names=encode_strings(self.node_names), node_source_masks=self.node_source_masks, is_pathogen=self.is_pathogen,
+                 edge_source=self.edge_source, edge_target=self.edge_target, edge_predicate_ids=self.edge_predicate_ids,
+                 predicates=encode_strings(self.predicates), edge_source_masks=self.edge_source_masks,
+                 knowledge_sources=encode_strings(self.knowledge_sources), synonyms=encode_strings(self.synonyms),
+                 synonym_node_indices=self.synonym_node_indices, n_skipped_edges=np.array([self.n_skipped_edges], dtype=np.int64))
+
+    @classmethod
+    def load(cls, file_path: str) -> 'GraphIndex':
+        with np.load(file_path) as snapshot:
+            if int(snapshot['version'][0]) != SNAPSHOT_VERSION:
+                raise ValueError(f'Graph snapshot {file_path} has version {int(snapshot["version"][0])}, expected {SNAPSHOT_VERSION}')
+            graph = cls(decode_strings(snapshot['node_ids']), snapshot['node_type_ids'], decode_strings(snapshot['node_types']),
+                        decode_strings(snapshot['node_names']), snapshot['node_source_masks'], snapshot['is_pathogen'],
+                        snapshot['edge_source'], snapshot['edge_target'], snapshot['edge_predicate_ids'],
+                        decode_strings(snapshot['predicates']), snapshot['edge_source_masks'],
+                        decode_strings(snapshot['knowledge_sources']), decode_strings(snapshot['synonyms']),
+                        snapshot['synonym_node_indices'])
+            graph.n_skipped_edges = int(snapshot['n_skipped_edges'][0])
+            return graph
+
+    # ------------------------------------------------ Lookups ------------------------------------------------- #
+
+    def find_node(self, identifier: str) -> Optional[int]:
+        """
+        Resolve a node id or synonym to a node index (GTDB GCF_/GCA_ accessions match any version, as in
+        KnowledgeGraph.find_node_by_synonym).
+        """
+        if identifier in self.node_index:
+            return self.node_index[identifier]
+        if 'GTDB:' in identifier and (':GCF_' in identifier or ':GCA_' in identifier):
+            base_part = identifier.split(':')[1].split('_')[1].split('.')[0]
+            candidates = ['GTDB:' + prefix + base_part + suffix for prefix in ['GCF_', 'GCA_'] for suffix in ['.1', '.2', '.3', '.4', '.5', '.6', '.7', '.8', '.9']]
+        else:
+            candidates = [identifier]
+        for candidate in candidates:
+            if candidate in self.synonym_index:
+                return self.synonym_index[candidate]
+        return None
+
+    def describe_node(self, node_index: int) -> dict:
+        return {'node_id': self.node_ids[node_index],
+                'node_type': self.node_types[self.node_type_ids[node_index]],
+                'name': self.node_names[node_index],
+                'knowledge_source': self.decode_source_mask(int(self.node_source_masks[node_index])),
+                'is_pathogen': bool(self.is_pathogen[node_index])}
+
+    def decode_source_mask(self, mask: int) -> List[str]:
+        return [source for index, source in enumerate(self.knowledge_sources) if mask >> index & 1]
+
+    def source_mask(self, knowledge_sources: Optional[Iterable[str]]) -> Optional[int]:
+        if knowledge_sources is None:
+            return None
+        return sum(1 << self.knowledge_source_index[source] for source in set(knowledge_sources) if source in self.knowledge_source_index)
+
+    def _ids(self, lookup: Dict[str, int], values: Optional[Union[str, Iterable[str]]]) -> Optional[np.ndarray]:
+        if values is None:
+            return None
+        if isinstance(values, str):
+            values = [values]
+        return np.array([lookup[value] for value in values if value in lookup], dtype=np.int64)
+
+    # ---------------------------------------------- Expansion ------------------------------------------------- #
+
+    def expand(self, frontier: np.ndarray, direction: str = 'both', predicates=None, node_types=None) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+        """
+        Expand a frontier of node indices by one hop.
+        Returns (frontier position, neighbor index, edge index) arrays for every matching edge.
+        """
+        if direction not in DIRECTIONS:
+            raise ValueError(f'direction must be one of {DIRECTIONS}')
+        frontier = np.asarray(frontier, dtype=np.int64)
+        positions, neighbors, edges = [], [], []
+        if direction in ('out', 'both'):
+            edge_ids, position = _gather(self.out_indptr, self.out_edges, frontier)
+            positions.append(position), neighbors.append(self.edge_target[edge_ids]), edges.append(edge_ids)
+        if direction in ('in', 'both'):
+            edge_ids, position = _gather(self.in_indptr, self.in_edges, frontier)
+            positions.append(position), neighbors.append(self.edge_source[edge_ids]), edges.append(edge_ids)
+        positions, neighbors, edges = np.concatenate(positions), np.concatenate(neighbors), np.concatenate(edges)
+
+        keep = np.ones(len(edges), dtype=bool)
+        predicate_ids = self._ids(self.predicate_index, predicates)
+        if predicate_ids is not None:
+            keep &= np.isin(self.edge_predicate_ids[edges], predicate_ids)
+        node_type_ids = self._ids(self.node_type_index, node_types)
+        if node_type_ids is not None:
+            keep &= np.isin(self.node_type_ids[neighbors], node_type_ids)
+        return positions[keep], neighbors[keep], edges[keep]
+
+    def neighbors(self, node: str, direction: str = 'both', predicates=None, node_types=None) -> List[dict]:
+        """
+        Typed neighbor expansion of a single node (by id or synonym).
+        """
+        node_index = self.find_node(node)
+        if node_index is None:
+            return []
+        _, neighbor_indices, edge_indices = self.expand(np.array([node_index]), direction, predicates, node_types)
+        return [{'node_id': self.node_ids[neighbor],
+                 'node_type': self.node_types[self.node_type_ids[neighbor]],
+                 'predicate': self.predicates[self.edge_predicate_ids[edge]],
+                 'direction': 'out' if self.edge_source[edge] == node_index else 'in'}
+                for neighbor, edge in zip(neighbor_indices.tolist(), edge_indices.tolist())]
+
+    def k_hop(self, nodes: Union[str, List[str]], k: int, direction: str = 'both', predicates=None, node_types=None,
+              target_types=None) -> Dict[str, int]:
+        """
+        All nodes within k hops of the seed nodes, with their hop distance. node_types restricts the nodes that may be
+        traversed, target_types only restricts the returned nodes.
+        """
+        distances = self.k_hop_indices(nodes, k, direction, predicates, node_types)
+        target_type_ids = self._ids(self.node_type_index, target_types)
+        result = dict()
+        for node_index, distance in distances.items():
+            if target_type_ids is None or self.node_type_ids[node_index] in target_type_ids:
+                result[self.node_ids[node_index]] = distance
+        return result
+
+    def k_hop_indices(self, nodes: Union[str, List[str]], k: int, direction: str = 'both', predicates=None, node_types=None) -> Dict[int, int]:
+        seeds = [self.find_node(node) for node in ([nodes] if isinstance(nodes, str) else nodes)]
+        frontier = np.unique(np.array([seed for seed in seeds if seed is not None], dtype=np.int64))
+        visited = np.zeros(self.n_nodes, dtype=bool)
+        visited[frontier] = True
+        distances = {int(node_index): 0 for node_index in frontier}
+        for hop in range(1, k + 1):
+            if len(frontier) == 0:
+                break
+            _, neighbors, _ = self.expand(frontier, direction, predicates, node_types)
+            frontier = np.unique(neighbors[~visited[neighbors]])
+            visited[frontier] = True
+            distances.update({int(node_index): hop for node_index in frontier})
+        return distances
+
+    def shortest_path(self, source: str, target: str, direction: str = 'both', predicates=None, node_types=None,
+                      max_depth: Optional[int] = None) -> Optional[List[dict]]:
+        """
+        One shortest path between two nodes as a list of steps ({'node_id', 'predicate'}), or None if unreachable.
+        """
+        source_index, target_index = self.find_node(source), self.find_node(target)
+        if source_index is None or target_index is None:
+            return None
+        parent_node = np.full(self.n_nodes, -1, dtype=np.int64)
+        parent_edge = np.full(self.n_nodes, -1, dtype=np.int64)
+        parent_node[source_index] = source_index
+        frontier = np.array([source_index], dtype=np.int64)
+        depth = 0
+        while len(frontier) > 0 and parent_node[target_index] < 0 and (max_depth is None or depth < max_depth):
+            positions, neighbors, edges = self.expand(frontier, direction, predicates, node_types)
+            new = parent_node[neighbors] < 0
+            neighbors, first = np.unique(neighbors[new], return_index=True)
+            parent_node[neighbors] = frontier[positions[new][first]]
+            parent_edge[neighbors] = edges[new][first]
+            frontier = neighbors
+            depth += 1
+        if parent_node[target_index] < 0:
+            return None
+        path = [{'node_id': self.node_ids[target_index], 'predicate': None}]
+        node_index = target_index
+        while node_index != source_index:
+            path[-1]['predicate'] = self.predicates[self.edge_predicate_ids[parent_edge[node_index]]]
+            node_index = int(parent_node[node_index])
+            path.append({'node_id': self.node_ids[node_index], 'predicate': None})
+        path.reverse()
+        # Move each predicate onto the step it leads out of
+        for step, next_step in zip(path, path[1:]):
+            step['predicate'], next_step['predicate'] = next_step['predicate'], None
+        return path
+
+    def match_path_pattern(self, categories: List[str], predicates: Optional[List[Optional[str]]] = None, start_nodes=None,
+                           direction: str = 'both', limit: int = 100) -> List[List[str]]:
+        """
+        Simple paths whose i-th node has type categories[i] and whose i-th edge has predicate predicates[i]
+        (None means any predicate), e.g. OrganismTaxon - BiologicalEntity - Pathway - Disease.
+        """
+        if predicates is None:
+            predicates = [None] * (len(categories) - 1)
+        if len(predicates) != len(categories) - 1:
+            raise ValueError('predicates must have one entry less than categories')
+        if start_nodes is None:
+            first_type = self.node_type_index.get(categories[0])
+            if first_type is None:
+                return []
+            starts = np.flatnonzero(self.node_type_ids == first_type)
+        else:
+            starts = [self.find_node(node) for node in ([start_nodes] if isinstance(start_nodes, str) else start_nodes)]
+            starts = [start for start in starts if start is not None and self.node_types[self.node_type_ids[start]] == categories[0]]
+
+        starts = np.asarray(starts, dtype=np.int64)
+        n_hops = len(categories) - 1
+
+        def hop(frontier: np.ndarray, step: int):
+            predicate = predicates[step]
+            return self.expand(frontier, direction, None if predicate is None else [predicate], [categories[step + 1]])
+
+        def prune(starts: np.ndarray) -> List[np.ndarray]:
+            """
+            Masks of the nodes of each position that can still be extended to the end of the pattern: a forward pass
+            collects the nodes reachable at each position, a backward pass drops those without a matching next hop.
+            """
+            levels = [np.unique(starts)]
+            for step in range(n_hops):
+                reached = np.zeros(self.n_nodes, dtype=bool)
+                reached[hop(levels[-1], step)[1]] = True
+                levels.append(np.flatnonzero(reached))
+            alive = [np.zeros(self.n_nodes, dtype=bool) for _ in categories]
+            alive[-1][levels[-1]] = True
+            for step in range(n_hops - 1, -1, -1):
+                positions, neighbors, _ = hop(levels[step], step)
+                alive[step][levels[step][positions[alive[step + 1][neighbors]]]] = True
+            return alive
+
+        # Expand all partial paths hop by hop; a path is stored as (row of its prefix, last node) per position and only
+        # the rows kept at the end are turned into node lists. Rows stay in lexicographic order, so when the starts or a
+        # position have more than `max_rows` rows the first ones are kept, and the expansion is redone with more rows if
+        # that leaves fewer than `limit` paths.
+        max_rows = max(limit, 1) * 16
+        while True:
+            truncated = len(starts) > max_rows
+            alive = prune(starts[:max_rows])
+            nodes, parents = [starts[:max_rows][alive[0][starts[:max_rows]]]], [None]
+            for step in range(n_hops):
+                positions, neighbors, _ = hop(nodes[-1], step)
+                keep = alive[step + 1][neighbors]
+                # Simple paths only: the new node must not be on its prefix
+                rows = positions
+                for level in range(step, -1, -1):
+                    keep &= nodes[level][rows] != neighbors
+                    if level > 0:
+                        rows = parents[level][rows]
+                pairs = np.unique(positions[keep] * self.n_nodes + neighbors[keep])
+                truncated |= len(pairs) > max_rows
+                pairs = pairs[:max_rows]
+                parents.append(pairs // self.n_nodes)
+                nodes.append(pairs % self.n_nodes)
+            if len(nodes[-1]) >= limit or not truncated:
+                break
+            max_rows *= 4
+
+        rows = np.arange(min(limit, len(nodes[-1])))
+        columns = []
+        for level in range(n_hops, -1, -1):
+            columns.append(nodes[level][rows])
+            if level > 0:
+                rows = parents[level][rows]
+        return [[self.node_ids[node_index] for node_index in path] for path in zip(*[column.tolist() for column in reversed(columns)])]
+
+
+def load_graph_index(snapshot: Optional[str] = None, kg_dir: Optional[str] = None, node_filename: str = 'KG_nodes_v6.tsv',
+                     edge_filename: str = 'KG_edges_v6.tsv', logger=None) -> GraphIndex:
+    """
+    Load a GraphIndex from a snapshot if it exists, otherwise build it from the KG TSV files.
+    """
+    if snapshot is not None and os.path.exists(snapshot):
+        return GraphIndex.load(snapshot)
+    if kg_dir is None:
+        raise ValueError('Either an existing snapshot or the KG directory is required')
+    return GraphIndex.from_tsv(os.path.join(kg_dir, node_filename), os.path.join(kg_dir, edge_filename), logger=logger)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='Query a built MetagenomicKG without Neo4j')
+    parser.add_argument('--kg_dir', type=str, help='path of the knowledge graph directory', default=None)
+    parser.add_argument('--node_filename', type=str, help='name of the node TSV file', default='KG_nodes_v6.tsv')
+    parser.add_argument('--edge_filename', type=str, help='name of the edge TSV file', default='KG_edges_v6.tsv')
+    parser.add_argument('--snapshot', type=str, help='path of a saved graph index snapshot (.npz)', default=None)
+    parser.add_argument('--save_snapshot', type=str, help='save the graph index to this path', default=None)
+    subparsers = parser.add_subparsers(dest='command')
+    neighbors_parser = subparsers.add_parser('neighbors', help='typed neighbors of a node')
+    neighbors_parser.add_argument('node', type=str)
+    khop_parser = subparsers.add_parser('khop', help='nodes within k hops of a node')
+    khop_parser.add_argument('node', type=str)
+    khop_parser.add_argument('--k', type=int, default=2)
+    khop_parser.add_argument('--target_types', type=str, nargs='*', default=None)
+    path_parser = subparsers.add_parser('path', help='shortest path between two nodes')
+    path_parser.add_argument('source', type=str)
+    path_parser.add_argument('target', type=str)
+    path_parser.add_argument('--max_depth', type=int, default=None)
+    pattern_parser = subparsers.add_parser('pattern', help='paths following a sequence of node categories')
+    pattern_parser.add_argument('categories', type=str, nargs='+')
+    pattern_parser.add_argument('--start', type=str, nargs='*', default=None)
+    pattern_parser.add_argument('--limit', type=int, default=20)
+    for subparser in [neighbors_parser, khop_parser, path_parser, pattern_parser]:
+        subparser.add_argument('--direction', type=str, choices=DIRECTIONS, default='both')
+    for subparser in [neighbors_parser, khop_parser, path_parser]:
+        subparser.add_argument('--predicates', type=str, nargs='*', default=None)
+        subparser.add_argument('--node_types', type=str, nargs='*', default=None)
+    args = parser.parse_args()
+
+    logger = get_logger()
+    logger.setLevel(logging.INFO)
+
+    graph = load_graph_index(args.snapshot, args.kg_dir, args.node_filename, args.edge_filename, logger=logger)
+    logger.info(f"Graph index with {graph.n_nodes} nodes and {graph.n_edges} edges is ready")
+    if args.save_snapshot:
+        graph.save(args.save_snapshot)
+        logger.info(f"Graph index is saved to {args.save_snapshot}")
+
+    if args.command == 'neighbors':
+        result = graph.neighbors(args.node, args.direction, args.predicates, args.node_types)
+    elif args.command == 'khop':
+        result = graph.k_hop(args.node, args.k, args.direction, args.predicates, args.node_types, args.target_types)
+    elif args.command == 'path':
+        result = graph.shortest_path(args.source, args.target, args.direction, args.predicates, args.node_types, args.max_depth)
+    elif args.command == 'pattern':
+        result = graph.match_path_pattern(args.categories, start_nodes=args.start, direction=args.direction, limit=args.limit)
+    else:
+        result = None
+    if result is not None:
+        print(json.dumps(result, indent=2))
@@ -5,23 +5,42 @@ This script is used to integrate AMR data generated by AMRFinderPlus into a knol
 ## Import standard libraries
 import os
 import sys
-from tqdm import tqdm, trange
-from glob import glob
+from tqdm import tqdm
 import pandas as pd
 import argparse
 import logging
 import pytaxonkit
 
 ## Import custom libraries
-from utils import get_logger, read_tsv_file, Node, Edge, KnowledgeGraph, change_prefix, extract_disease_synonyms
+from utils import get_logger, read_tsv_file, Node, KnowledgeGraph
 
+# columns of the AMRFinderPlus results used to build the knowledge graph
+AMR_RESULT_COLUMNS = ['Contig id', 'Start', 'Stop', 'Strand', 'Method', 'Target length', 'Reference sequence length', '% Coverage of reference sequence',
+                      '% Identity to reference sequence', 'Alignment length', 'Accession of closest sequence', 'genome_id', 'source']
+
+# candidate synonyms of a genome for each source, in order of priority
+GENOME_SYNONYM_TEMPLATES = {
+    'GTDB': ["GTDB:{genome_id}"],
+    'NCBI': ["NCBI:{genome_id}", "KEGG:gn_{genome_id}", "NCBI:{ncbi_name}"],
+    'PATRIC': ["BVBRC:gn_{genome_id}"],
+    'KEGG': ["KEGG:gn_{genome_id}"],
+}
+
+def read_amr_result(file_path):
+    """
+    Read only the needed columns of the combined AMRFinderPlus results (Parquet generated by run_AMRFinderPlus/combine.py or TSV).
+    """
+    if file_path.endswith('.parquet'):
+        return pd.read_parquet(file_path, columns=AMR_RESULT_COLUMNS)
+    else:
+        return pd.read_csv(file_path, sep='\t', header=0, usecols=AMR_RESULT_COLUMNS, dtype=str, keep_default_na=False)
 
 
 if __name__ == "__main__":
     parser = argparse.ArgumentParser(description='Integrate AMR data generated by AMRFinderPlus into a knolwedge graph')
     parser.add_argument('--existing_KG_nodes', type=str, help='path of the existing knowledge graph nodes')
     parser.add_argument('--existing_KG_edges', type=str, help='path of the existing knowledge graph edges')
-    parser.add_argument('--amr_result', type=str, help='path of the AMR result file')
+    parser.add_argument('--amr_result', type=str, help='path of the AMR result file (.parquet or .tsv)')
     parser.add_argument('--amr_metadata', type=str, help='path of the AMR metadata file')
     parser.add_argument('--coverage_threshold', type=float, default=80, help='coverage threshold for AMR gene selection')
     parser.add_argument('--identity_threshold', type=float, default=90, help='identity threshold for AMR gene selection')
@@ -47,12 +66,14 @@ if __name__ == "__main__":
         logger.error(f'Could not find AMR result file at {args.amr_result}')
         sys.exit(1)
     else:
-        temp_file = read_tsv_file(args.amr_result)
-        amr_result = pd.DataFrame(temp_file[1:], columns=temp_file[0])
+        amr_result = read_amr_result(args.amr_result)
     # remove rows with no aligned sequence
     amr_result = amr_result.loc[amr_result['Accession of closest sequence'] != '',:].reset_index(drop=True)
     # filter rows with coverage and identity
-    amr_result = amr_result.loc[(amr_result['% Coverage of reference sequence'].astype(float) >= args.coverage_threshold) & (amr_result['% Identity to reference sequence'].astype(float) >= args.identity_threshold),:].reset_index(drop=True)
+    coverage = pd.to_numeric(amr_result['% Coverage of reference sequence'], errors='coerce')
+    identity = pd.to_numeric(amr_result['% Identity to reference sequence'], errors='coerce')
+    amr_result = amr_result.loc[(coverage >= args.coverage_threshold) & (identity >= args.identity_threshold),:].reset_index(drop=True)
+    amr_result['source'] = amr_result['source'].astype(str)
     # get ncbi id to name mapping
     result = pytaxonkit.lineage(list(set(amr_result.query('source == "NCBI"')['genome_id'])))
     ncbi_id_to_name = {str(taxid):name for taxid, name in result[['TaxID','Name']].to_numpy()}
@@ -103,119 +124,84 @@ if __name__ == "__main__":
             else:
                 amr_dict[temp_genbank_accession]['accession'].update([temp_genbank_accession])
 
+    # Resolve genome ids to KG nodes in one lookup
+    logger.info("Resolving genome ids...")
+    genomes = amr_result[['genome_id', 'source']].drop_duplicates().reset_index(drop=True)
+    unknown_sources = set(genomes['source']) - set(GENOME_SYNONYM_TEMPLATES)
+    for source in unknown_sources:
+        logger.debug(f'Unknown source {source}')
+    genome_synonyms = genomes.loc[genomes['source'].isin(GENOME_SYNONYM_TEMPLATES),:].copy()
+    genome_synonyms['ncbi_name'] = genome_synonyms['genome_id'].map(ncbi_id_to_name)
+    # one row per candidate synonym, ordered by priority
+    genome_synonyms['synonym'] = [[template.format(genome_id=genome_id, ncbi_name=ncbi_name) for template in GENOME_SYNONYM_TEMPLATES[source] if isinstance(ncbi_name, str) or '{ncbi_name}' not in template]
+                                  for genome_id, source, ncbi_name in genome_synonyms[['genome_id', 'source', 'ncbi_name']].to_numpy()]
+    genome_synonyms = genome_synonyms.explode('synonym').dropna(subset=['synonym'])
+    genome_synonyms['genome_node_id'] = kg.resolve_synonyms(genome_synonyms['synonym']).to_numpy()
+    genome_nodes = genome_synonyms.dropna(subset=['genome_node_id']).drop_duplicates(subset=['genome_id', 'source'], keep='first')[['genome_id', 'source', 'genome_node_id']]
+    genomes = genomes.merge(genome_nodes, on=['genome_id', 'source'], how='left')
+    missing_genomes = genomes.loc[genomes['genome_node_id'].isna() & genomes['source'].isin(GENOME_SYNONYM_TEMPLATES),:]
+    for genome_id in missing_genomes.loc[missing_genomes['source'] == 'PATRIC','genome_id']:
+        logger.debug(f'Skip {genome_id} because it may not be included in KG due to the lack of disease relationship')
+    for genome_id in missing_genomes.loc[missing_genomes['source'] == 'GTDB','genome_id']:
+        logger.debug(f'Skip {genome_id} because it does not exist in GTDB anymore. Please double check the genome id.')
+    missing_genomes = missing_genomes.loc[missing_genomes['source'].isin(['NCBI', 'KEGG']),:]
+    if len(missing_genomes) > 0:
+        logger.error(f"Cannot find nodes for {len(missing_genomes)} NCBI/KEGG genomes, e.g., {missing_genomes['genome_id'].iloc[0]}")
+        sys.exit(1)
+    amr_result = amr_result.merge(genomes, on=['genome_id', 'source'], how='inner')
+    amr_result = amr_result.loc[~amr_result['genome_node_id'].isna(),:].reset_index(drop=True)
+
     # Add AMR genes to KG
-    columns_list = amr_result.columns.to_list()
-    for row in tqdm(amr_result.to_numpy(), desc='Adding AMR genes to KG'):
-        AMR_seq_id = row[columns_list.index('Accession of closest sequence')]
-        genome_id = row[columns_list.index('genome_id')]
-        source = row[columns_list.index('source')]
-        
-        ## process genome id node
-        if source == 'GTDB':
-            genome_synonyms = [f"GTDB:{genome_id}"]
-        elif source == 'NCBI':
-            genome_synonyms = [f"NCBI:{genome_id}", f"KEGG:gn_{genome_id}", f"NCBI:{ncbi_id_to_name[genome_id]}"]
-        elif source == 'PATRIC':
-            genome_synonyms = [f"BVBRC:gn_{genome_id}"]
-        elif source == 'KEGG':
-            genome_synonyms = [f"KEGG:gn_{genome_id}"]
-        else:
-            logger.debug(f'Unknown source {source}')
-            continue
-        
-        # find if the genome node exists
-        pass_flag = False
-        for genome_synonym in genome_synonyms:
-            genome_node_id = kg.find_node_by_synonym(f"{genome_synonym}")
-            if not genome_node_id:
-                logger.debug(f'Cannot find node for {genome_synonym}')
-                continue
-            else:
-                pass_flag = True
-                break
-        if not pass_flag:
-            if source == 'PATRIC':
-                logger.debug(f'Skip {genome_id} because it may not be included in KG due to the lack of disease relationship')
-                continue
-            if source == 'GTDB':
-                logger.debug(f'Skip {genome_id} because it does not exist in GTDB anymore. Please double check the genome id.')
-                continue
-            exit(1)
-        
-        ## process AMR gene node
-        if AMR_seq_id in amr_dict:
-            temp_gene_family = list(amr_dict[AMR_seq_id]['gene_family'])
-            temp_all_names = list(amr_dict[AMR_seq_id]['product_name'])
-            temp_type = list(amr_dict[AMR_seq_id]['type'])
-            temp_class = list(amr_dict[AMR_seq_id]['class'])
-            temp_accession = list(amr_dict[AMR_seq_id]['accession'])
-            temp_link = [f"https://www.ncbi.nlm.nih.gov/protein/{x}" for x in temp_accession]
-            
-            
-            # 1. if it is an existing node in the knowledge graph
-            amr_node_id = kg.find_node_by_synonym(f"NCBI:pt_{AMR_seq_id}")
-            if amr_node_id:
-                existing_node = kg.get_node_by_id(amr_node_id)
-                existing_node.synonyms = list(set(existing_node.synonyms + [f"NCBI:pt_{AMR_seq_id}"] + [f"NCBI:pt_{x}" for x in temp_accession]))
-                existing_description_dict = dict(existing_node.description)
-                existing_description_dict['gene_family'] = '#####'.join(list(set(existing_description_dict['gene_family'].split('#####') + temp_gene_family)))
-                existing_description_dict['type'] = '#####'.join(list(set(existing_description_dict['type'].split('#####') + temp_type)))
-                existing_description_dict['class'] = '#####'.join(list(set(existing_description_dict['class'].split('#####') + temp_class)))
-                existing_node.description = list(existing_description_dict.items())
-                existing_node.link = list(set(existing_node.link + temp_link))
-                existing_node.all_names = list(set(existing_node.all_names + temp_all_names))
-                existing_node.knowledge_source = list(set(existing_node.knowledge_source + ['NCBI']))
-                existing_node.is_pathogen = False
-            else:
-                # 2. if it is not an existing node in the knowledge graph
-                temp_node = Node(node_type="AMR", all_names=temp_all_names, description=[('gene_family', '#####'.join(temp_gene_family)), ('type', '#####'.join(temp_type)), ('class', '#####'.join(temp_class))], knowledge_source=['AMRFinderPlus'], synonyms=[f"NCBI:pt_{AMR_seq_id}"] + [f"NCBI:pt_{x}" for x in temp_accession], link=temp_link, is_pathogen=False)
-                kg.add_node(temp_node)
-        else:
-            logger.error(f'Cannot find metadata for {AMR_seq_id}')
-            exit(1)
+    missing_metadata = [AMR_seq_id for AMR_seq_id in amr_result['Accession of closest sequence'].unique() if AMR_seq_id not in amr_dict]
+    if len(missing_metadata) > 0:
+        logger.error(f'Cannot find metadata for {missing_metadata[0]}')
+        sys.exit(1)
+    # One row per AMR gene with the fields of its node; genes that are already in the KG are merged into the existing node
+    amr_nodes = pd.DataFrame({'seq_id': amr_result['Accession of closest sequence'].unique()})
+    for field in ['gene_family', 'product_name', 'type', 'class', 'accession']:
+        amr_nodes[field] = [list(amr_dict[AMR_seq_id][field]) for AMR_seq_id in amr_nodes['seq_id']]
+    amr_nodes['synonyms'] = [[f"NCBI:pt_{AMR_seq_id}"] + [f"NCBI:pt_{x}" for x in accession] for AMR_seq_id, accession in zip(amr_nodes['seq_id'], amr_nodes['accession'])]
+    amr_nodes['link'] = [[f"https://www.ncbi.nlm.nih.gov/protein/{x}" for x in accession] for accession in amr_nodes['accession']]
+    amr_nodes['node_id'] = kg.resolve_synonyms('NCBI:pt_' + amr_nodes['seq_id']).to_numpy()
+    is_existing = amr_nodes['node_id'].notna()
+
+    # 1. if it is an existing node in the knowledge graph
+    for amr_node_id, synonyms, gene_family, all_names, temp_type, temp_class, link in tqdm(amr_nodes.loc[is_existing, ['node_id', 'synonyms', 'gene_family', 'product_name', 'type', 'class', 'link']].to_numpy(),
+                                                                                          total=is_existing.sum(), desc='Merging AMR genes into existing nodes'):
+        existing_node = kg.get_node_by_id(amr_node_id)
+        existing_node.synonyms = list(set(existing_node.synonyms + synonyms))
+        existing_description_dict = dict(existing_node.description)
+        existing_description_dict['gene_family'] = '#####'.join(list(set(existing_description_dict['gene_family'].split('#####') + gene_family)))
+        existing_description_dict['type'] = '#####'.join(list(set(existing_description_dict['type'].split('#####') + temp_type)))
+        existing_description_dict['class'] = '#####'.join(list(set(existing_description_dict['class'].split('#####') + temp_class)))
+        existing_node.description = list(existing_description_dict.items())
+        existing_node.link = list(set(existing_node.link + link))
+        existing_node.all_names = list(set(existing_node.all_names + all_names))
+        existing_node.knowledge_source = list(set(existing_node.knowledge_source + ['NCBI']))
+        existing_node.is_pathogen = False
+
+    # 2. if it is not an existing node in the knowledge graph
+    new_amr_nodes = amr_nodes.loc[~is_existing,:]
+    new_count, merged_count = kg.add_nodes([Node(node_type="AMR", all_names=all_names, description=[('gene_family', '#####'.join(gene_family)), ('type', '#####'.join(temp_type)), ('class', '#####'.join(temp_class))],
+                                                 knowledge_source=['AMRFinderPlus'], synonyms=synonyms, link=link, is_pathogen=False)
+                                            for gene_family, all_names, temp_type, temp_class, synonyms, link in new_amr_nodes[['gene_family', 'product_name', 'type', 'class', 'synonyms', 'link']].to_numpy()])
+    logger.info(f"{is_existing.sum()} AMR genes are merged into existing nodes, {new_count} new AMR nodes are added and {merged_count} are merged into each other")
 
     # Add edge between genome and AMR gene to KG
-    for row in tqdm(amr_result.to_numpy(), desc='Adding edge between genome and AMR gene to KG'):
-        temp_contig_id = row[columns_list.index('Contig id')]
-        temp_start = row[columns_list.index('Start')]
-        temp_stop = row[columns_list.index('Stop')]
-        temp_strand = row[columns_list.index('Strand')]
-        temp_method = row[columns_list.index('Method')]
-        temp_target_length = row[columns_list.index('Target length')]
-        temp_reference_length = row[columns_list.index('Reference sequence length')]
-        temp_coverage = row[columns_list.index('% Coverage of reference sequence')]
-        temp_identity = row[columns_list.index('% Identity to reference sequence')]
-        temp_alignment_length = row[columns_list.index('Alignment length')]
-        
-        temp_AMR_seq_id = row[columns_list.index('Accession of closest sequence')]
-        temp_genome_id = row[columns_list.index('genome_id')]
-        temp_source = row[columns_list.index('source')]
-        
-        temp_description_dict = {}
-        temp_description_dict[temp_contig_id] = f"Contig id: {temp_contig_id}; Start: {temp_start}; Stop: {temp_stop}; Strand: {temp_strand}; Method: {temp_method}; Target length: {temp_target_length}; Reference sequence length: {temp_reference_length}; Coverage: {temp_coverage}; Identity: {temp_identity}; Alignment length: {temp_alignment_length}" 
-
-        if temp_source == 'GTDB':
-            genome_node_id = kg.find_node_by_synonym(f"GTDB:{temp_genome_id}")
-            if not genome_node_id:
-                logger.debug(f'Skip {temp_genome_id} because it does not exist in GTDB anymore. Please double check the genome id.')
-                continue
-        elif temp_source == 'NCBI':
-            for temp_genome_synonym in [f"NCBI:{temp_genome_id}", f"KEGG:gn_{temp_genome_id}", f"NCBI:{ncbi_id_to_name[temp_genome_id]}"]:
-                genome_node_id = kg.find_node_by_synonym(f"{temp_genome_synonym}")
-                if genome_node_id:
-                    break
-        elif temp_source == 'PATRIC':
-            genome_node_id = kg.find_node_by_synonym(f"BVBRC:gn_{temp_genome_id}")
-            if not genome_node_id:
-                logger.debug(f'Skip {temp_genome_id} because it may not be included in KG due to the lack of disease relationship')
-                continue
-        else:
-            genome_node_id = kg.find_node_by_synonym(f"KEGG:gn_{temp_genome_id}")
-            
-        amr_node_id = kg.find_node_by_synonym(f"NCBI:pt_{temp_AMR_seq_id}")
-    
-        kg.add_edge(Edge(source_node=amr_node_id, target_node=genome_node_id, predicate='biolink:associated_with', description=list(temp_description_dict.items()), knowledge_source=["AMRFinderPlus"]))
-        kg.add_edge(Edge(source_node=genome_node_id, target_node=amr_node_id, predicate='biolink:associated_with', description=list(temp_description_dict.items()), knowledge_source=["AMRFinderPlus"]))
+    logger.info("Adding edges between genomes and AMR genes to KG...")
+    amr_result['amr_node_id'] = kg.resolve_synonyms('NCBI:pt_' + amr_result['Accession of closest sequence']).to_numpy()
+    text = {column: amr_result[column].astype(str) for column in AMR_RESULT_COLUMNS[:10]}
+    amr_descriptions = ("Contig id: " + text['Contig id'] + "; Start: " + text['Start'] + "; Stop: " + text['Stop'] + "; Strand: " + text['Strand'] + "; Method: " + text['Method'] +
+                        "; Target length: " + text['Target length'] + "; Reference sequence length: " + text['Reference sequence length'] +
+                        "; Coverage: " + text['% Coverage of reference sequence'] + "; Identity: " + text['% Identity to reference sequence'] + "; Alignment length: " + text['Alignment length'])
+    amr_result['description'] = [[(contig_id, amr_description)] for contig_id, amr_description in zip(text['Contig id'], amr_descriptions)]
+    edge_table = pd.concat([
+        pd.DataFrame({'source_node': amr_result['amr_node_id'], 'target_node': amr_result['genome_node_id'], 'description': amr_result['description']}),
+        pd.DataFrame({'source_node': amr_result['genome_node_id'], 'target_node': amr_result['amr_node_id'], 'description': amr_result['description']})
+    ], ignore_index=True)
+    edge_table['predicate'] = 'biolink:associated_with'
+    edge_table['knowledge_source'] = [["AMRFinderPlus"]] * len(edge_table)
+    kg.add_edges(edge_table, resolved=True)
 
     # Save the knowledge graph
     logger.info("Saving the knowledge graph...")
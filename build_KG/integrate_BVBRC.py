@@ -10,13 +10,18 @@ from glob import glob
 import pandas as pd
 import argparse
 import pytaxonkit
-import requests
 import logging
+import itertools
 
 ## Import custom libraries
-from utils import get_logger, read_tsv_file, Node, Edge, KnowledgeGraph, extract_disease_synonyms, UMLSMapping
+from utils import get_logger, read_tsv_file, load_gtdbtk_assignment, Node, Edge, KnowledgeGraph, extract_disease_synonyms_batch, AsyncMappingResolver
 from kg2_utils.node_synonymizer import NodeSynonymizer
 
+# disease names in the BV-BRC metadata that are not real diseases
+SKIPPED_DISEASE_NAMES = ['other', 'Not connected', 'agn', 'and sepsis', 'and soft tissue infections.', 'healthy', 'healthy controls', 'healty', 'lrti', 'pcs']
+# disease names that need to be queried as multiple diseases
+COMPOSITE_DISEASE_NAMES = {'Urinary tract and respiratory infections': ['Respiratory Tract Infections', 'Urinary tract infection']}
+
 def get_new_name(disease_name):
     
     if disease_name == 'Seticemic plague':
@@ -68,6 +73,23 @@ def get_new_name(disease_name):
                     
     return disease_name
 
+def explode_disease_names(diseases):
+    """
+    Split the raw BV-BRC disease strings into one row per cleaned disease name.
+    :param diseases: a pandas Series of raw disease strings (e.g., 'Pneumonia;Sepsis/Bacteremia')
+    :return: a dataframe with columns 'disease' (raw string), 'disease_name' (cleaned name) and 'query_name' (name sent to the synonymizer)
+    """
+    disease_table = pd.DataFrame({'disease': diseases.drop_duplicates()})
+    disease_table['disease_name'] = disease_table['disease'].str.split(r'[;,/]')
+    disease_table = disease_table.explode('disease_name')
+    disease_table['disease_name'] = disease_table['disease_name'].str.strip()
+    disease_table = disease_table.loc[(disease_table['disease_name'] != '') & ~disease_table['disease_name'].isin(SKIPPED_DISEASE_NAMES),:]
+    # Fix dirty data
+    disease_table['disease_name'] = disease_table['disease_name'].map(get_new_name)
+    disease_table['query_name'] = disease_table['disease_name'].map(lambda x: COMPOSITE_DISEASE_NAMES.get(x, [x]))
+    disease_table = disease_table.explode('query_name').drop_duplicates().reset_index(drop=True)
+    return disease_table
+
 if __name__ == "__main__":
     parser = argparse.ArgumentParser(description='Integrate all BV-BRC data into a knolwedge graph')
     parser.add_argument('--existing_KG_nodes', type=str, help='path of the existing knowledge graph nodes')
@@ -77,6 +99,7 @@ if __name__ == "__main__":
     parser.add_argument('--gtdb_assignment', type=str, help='path of the gtdb assignment using GTDB-Tk')
     parser.add_argument('--synonymizer_dir', type=str, help='path of the synonymizer directory')
     parser.add_argument('--synonymizer_dbname', type=str, help='name of the synonymizer database')
+    parser.add_argument('--max_concurrency', type=int, help='maximum number of concurrent UMLS requests', default=8)
     parser.add_argument('--ANI_threshold', type=float, help='ANI threshold to identify the same strain (default 0 for no filtering)', default=0.0)
     parser.add_argument('--AF_threshold', type=float, help='AF threshold to dentify the same strain (default 0 for no filtering)', default=0.0)
     parser.add_argument('--output_dir', type=str, help='path of the output directory')
@@ -101,19 +124,12 @@ if __name__ == "__main__":
     
     # set up umls mapping
     logger.info('Setting up UMLS mapping')
-    umls_class = UMLSMapping(args.umls_api_key)
+    resolver = AsyncMappingResolver(args.umls_api_key, max_concurrency=args.max_concurrency) if args.umls_api_key else None
     
     # Import GTDB assignment data
     logger.info("Importing GTDB assignment data...")
-    gtdb_assignment = read_tsv_file(args.gtdb_assignment)
-    temp_header = gtdb_assignment[0]
-    mapping_gn_to_microbe_id = {}
-    for row in tqdm(gtdb_assignment[1:]):
-        if (row[temp_header.index('closest_genome_ani')] != 'N/A' and float(row[temp_header.index('closest_genome_ani')]) >= args.ANI_threshold) and (row[temp_header.index('closest_genome_af')] != 'N/A' and float(row[temp_header.index('closest_genome_af')]) >= args.AF_threshold):
-            mapping_gn_to_microbe_id[f"BVBRC:gn_{row[temp_header.index('user_genome')]}"] = [f"GTDB:{row[temp_header.index('closest_genome_reference')]}"]
-        else:
-            mapping_gn_to_microbe_id[f"BVBRC:gn_{row[temp_header.index('user_genome')]}"] = [f"BVBRC:gn_{row[temp_header.index('user_genome')]}"]
-        mapping_gn_to_microbe_id[f"BVBRC:gn_{row[temp_header.index('user_genome')]}"] += [row[temp_header.index('classification')], f"ANI_reference_radius:{row[temp_header.index('closest_genome_reference_radius')]}; ANI:{row[temp_header.index('closest_genome_ani')]}; AF:{row[temp_header.index('closest_genome_af')]}; classification_method:{row[temp_header.index('classification_method')]}; MSA_percent:{row[temp_header.index('msa_percent')]}"]
+    gtdb_assignment = load_gtdbtk_assignment(args.gtdb_assignment, 'BVBRC', args.ANI_threshold, args.AF_threshold)
+    mapping_gn_to_microbe_id = dict(zip(gtdb_assignment['genome_id'], zip(gtdb_assignment['assigned_id'], gtdb_assignment['classification'], gtdb_assignment['description'])))
 
     # Import BV-BRC data
     logger.info("Importing BV-BRC data...")
@@ -137,36 +153,19 @@ if __name__ == "__main__":
     #     raise ValueError(f"Found non-bacterial/archaeal genomes")
 
     ## Extract Disease Synonyms
-    mapping_disease_to_synonyms = {}
     logger.info("Extracting Disease Synonyms...")
-    unknown = []
-    for disease_name_list1 in tqdm(set(bvbrc_relation_data['disease'].tolist())):
-        for disease_name_list2 in disease_name_list1.split(';'):
-            for disease_name_list3 in disease_name_list2.split(','):
-                for disease_name in disease_name_list3.split('/'):
-                    if disease_name == '':
-                        continue
-                    disease_name = disease_name.strip()
-                    if disease_name in ['other', 'Not connected', 'agn', 'and sepsis', 'and soft tissue infections.', 'healthy', 'healthy controls', 'healty', 'lrti', 'pcs']:
-                        continue
-                    # Fix dirty data:
-                    disease_name = get_new_name(disease_name)
-                    if disease_name == 'Urinary tract and respiratory infections':
-                        for x in ['Respiratory Tract Infections', 'Urinary tract infection']:
-                            synonym_res = extract_disease_synonyms(x, nodesynonymizer, umls_class, args.umls_api_key)
-                            if len(synonym_res) != 0:
-                                mapping_disease_to_synonyms[disease_name] = synonym_res
-                            else:
-                                logger.warning(f"Cannot find synonyms for {disease_name}")
-                                unknown += [disease_name]
-                        continue
-                    synonym_res = extract_disease_synonyms(disease_name, nodesynonymizer, umls_class, args.umls_api_key)
-                    if len(synonym_res) != 0:
-                        mapping_disease_to_synonyms[disease_name] = synonym_res
-                    else:
-                        logger.warning(f"Cannot find synonyms for {disease_name}")
-                        unknown += [disease_name]
-                
+    disease_table = explode_disease_names(bvbrc_relation_data['disease'])
+    synonyms_by_query_name = extract_disease_synonyms_batch(disease_table['query_name'].unique().tolist(), nodesynonymizer, resolver)
+    if resolver is not None:
+        resolver.close()
+    logger.info(f"NodeSynonymizer result cache: {nodesynonymizer.get_cache_info()}")
+    disease_table['synonyms'] = disease_table['query_name'].map(synonyms_by_query_name)
+    mapping_disease_to_synonyms = disease_table.groupby('disease_name')['synonyms'].agg(lambda x: list(set(itertools.chain.from_iterable(x)))).to_dict()
+    unknown = [disease_name for disease_name, synonyms in mapping_disease_to_synonyms.items() if len(synonyms) == 0]
+    for disease_name in unknown:
+        logger.warning(f"Cannot find synonyms for {disease_name}")
+        del mapping_disease_to_synonyms[disease_name]
+
     ## Map the BVBRC genomes to KEGG nodes
     parent_dict = {}
     for row in tqdm(bvbrc_relation_data.to_numpy(), desc="Map the BVBRC genomes to KEGG nodes"):
@@ -183,8 +182,8 @@ if __name__ == "__main__":
             elif 'taxid' not in description_dict:
                 description_dict['taxid'] = taxon_id
                 description_dict['rank'] = ncbi_rank
-            if mapping_gn_to_microbe_id.get(f"BVBRC:gn_{genome_id}", None) and mapping_gn_to_microbe_id[f"BVBRC:gn_{genome_id}"][2].split(';')[1].split(':')[1] != 'N/A':
-                description_dict.update(dict([tuple(item.strip().split(':')) for item in mapping_gn_to_microbe_id[f"BVBRC:gn_{genome_id}"][2].split(';')]))
+            if mapping_gn_to_microbe_id.get(f"BVBRC:gn_{genome_id}", None) and mapping_gn_to_microbe_id[f"BVBRC:gn_{genome_id}"][2]:
+                description_dict.update(dict(mapping_gn_to_microbe_id[f"BVBRC:gn_{genome_id}"][2]))
             existing_node.description = list(description_dict.items())
             existing_node.link = list(set(existing_node.link + [f"https://gtdb.ecogenomic.org/genome?gid={assembly_accession}", f"https://www.ncbi.nlm.nih.gov/assembly/{assembly_accession}", f"https://www.bv-brc.org/view/Genome/{genome_id}"]))
             existing_node.all_names = list(set(existing_node.all_names + [genome_name]))
@@ -204,8 +203,8 @@ if __name__ == "__main__":
                 elif 'taxid' not in description_dict:
                     description_dict['taxid'] = taxon_id
                     description_dict['rank'] = ncbi_rank
-                if assignment_info[2].split(';')[1].split(':')[1] != 'N/A':
-                    description_dict.update(dict([tuple(item.strip().split(':')) for item in assignment_info[2].split(';')]))
+                if assignment_info[2]:
+                    description_dict.update(dict(assignment_info[2]))
                 existing_node.description = list(description_dict.items())
                 existing_node.link = list(set(existing_node.link + [f"https://www.bv-brc.org/view/Genome/{genome_id}"]))
                 if assembly_accession != '':
@@ -219,8 +218,8 @@ if __name__ == "__main__":
             else:
                 temp_all_names = [genome_name]
                 temp_description_dict = {'taxid': taxon_id, 'rank': ncbi_rank}
-                if assignment_info[2].split(';')[1].split(':')[1] != 'N/A':
-                    temp_description_dict.update(dict([tuple(item.strip().split(':')) for item in assignment_info[2].split(';')]))
+                if assignment_info[2]:
+                    temp_description_dict.update(dict(assignment_info[2]))
                 temp_knowledge_source = ['BVBRC']
                 temp_synonyms = [f"BVBRC:gn_{genome_id}"]
                 temp_link = [f"https://www.bv-brc.org/view/Genome/{genome_id}"]
@@ -263,32 +262,25 @@ if __name__ == "__main__":
     
     
     ## Connect the BVBRC genomes to BVBRC disease
-    for row in tqdm(bvbrc_relation_data.to_numpy(), desc="Connecting BVBRC genomes to BVBRC disease"):
-        genome_id, _, _, _, _, _, _, _, _, disease_list, _, _, _, _, _ = row
-        kg_source = 'BVBRC'
-        for disease_name_list1 in disease_list.split(';'):
-            for disease_name_list2 in disease_name_list1.split(','):
-                for disease_name in disease_name_list2.split('/'):
-                    disease_name = disease_name.strip()
-                    genome_node_id = kg.find_node_by_synonym(f"BVBRC:gn_{genome_id}")
-                    if not genome_node_id:
-                        continue
-                    if disease_name not in mapping_disease_to_synonyms:
-                        continue
-                    disease_ids = list(set([kg.find_node_by_synonym(x) for x in mapping_disease_to_synonyms[disease_name] if kg.find_node_by_synonym(x)]))
-                    if len(disease_ids) == 0:
-                        continue
-                    if len(disease_ids) == 1:
-                        disease_node_id = disease_ids[0]
-                        # Add edge to the knowledge graph
-                        kg.add_edge(Edge(source_node=genome_node_id, target_node=disease_node_id, predicate='biolink:associated_with', knowledge_source=[kg_source]))
-                        kg.add_edge(Edge(source_node=disease_node_id, target_node=genome_node_id, predicate='biolink:associated_with', knowledge_source=[kg_source]))
-                    else:
-                        logger.warning(f"Multiple disease nodes found for {disease_name}")
-                        for disease_node_id in disease_ids:
-                            # Add edge to the knowledge graph
-                            kg.add_edge(Edge(source_node=genome_node_id, target_node=disease_node_id, predicate='biolink:associated_with', knowledge_source=[kg_source]))
-                            kg.add_edge(Edge(source_node=disease_node_id, target_node=genome_node_id, predicate='biolink:associated_with', knowledge_source=[kg_source]))
+    logger.info('Connecting BVBRC genomes to BVBRC disease')
+    kg_source = 'BVBRC'
+    genome_disease_pairs = bvbrc_relation_data[['genome_id', 'disease']].drop_duplicates().merge(disease_table[['disease', 'disease_name']].drop_duplicates(), on='disease', how='inner')
+    genome_disease_pairs['genome_node_id'] = kg.resolve_synonyms('BVBRC:gn_' + genome_disease_pairs['genome_id']).to_numpy()
+    genome_disease_pairs = genome_disease_pairs.loc[~genome_disease_pairs['genome_node_id'].isna(),:]
+    # resolve each disease synonym only once
+    disease_synonyms = pd.DataFrame([(disease_name, synonym) for disease_name, synonyms in mapping_disease_to_synonyms.items() for synonym in synonyms], columns=['disease_name', 'synonym'])
+    disease_synonyms['disease_node_id'] = kg.resolve_synonyms(disease_synonyms['synonym']).to_numpy()
+    disease_nodes = disease_synonyms.loc[~disease_synonyms['disease_node_id'].isna(),['disease_name', 'disease_node_id']].drop_duplicates()
+    for disease_name in disease_nodes.loc[disease_nodes['disease_name'].duplicated(),'disease_name'].unique():
+        logger.warning(f"Multiple disease nodes found for {disease_name}")
+    genome_disease_pairs = genome_disease_pairs.merge(disease_nodes, on='disease_name', how='inner')[['genome_node_id', 'disease_node_id']].drop_duplicates()
+    edge_table = pd.concat([
+        pd.DataFrame({'source_node': genome_disease_pairs['genome_node_id'], 'target_node': genome_disease_pairs['disease_node_id']}),
+        pd.DataFrame({'source_node': genome_disease_pairs['disease_node_id'], 'target_node': genome_disease_pairs['genome_node_id']})
+    ], ignore_index=True)
+    edge_table['predicate'] = 'biolink:associated_with'
+    edge_table['knowledge_source'] = [[kg_source]] * len(edge_table)
+    kg.add_edges(edge_table, resolved=True)
 
     # Save the knowledge graph
     logger.info("Saving the knowledge graph...")
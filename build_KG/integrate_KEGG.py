@@ -4,18 +4,108 @@ This script is used to integrate all KEGG data into a knolwedge graph.
 
 ## Import standard libraries
 import os
-import sys
-from tqdm import tqdm, trange
+from tqdm import tqdm
 from glob import glob
 import pandas as pd
 import argparse
 import re
 import logging
+from multiprocessing import Pool
 
 ## Import custom libraries
-from utils import get_logger, read_tsv_file, Node, Edge, KnowledgeGraph
+from utils import get_logger, load_gtdbtk_assignment, Node, Edge, KnowledgeGraph
 from kegg_utils.extract_KEGG_data import KEGGData
 
+# KEGG entity types: processed data file, KEGG prefix, node type, link template and optional description fields
+KEGG_ENTITY_REGISTRY = [
+    {'name': 'compounds', 'file': 'kegg_compounds.txt', 'prefix': 'cpd', 'node_type': 'Compound', 'link': 'https://www.genome.jp/entry/cpd:{}'},
+    {'name': 'pathways', 'file': 'kegg_pathways.txt', 'prefix': 'path', 'node_type': 'Pathway', 'link': 'https://www.genome.jp/entry/path:{}'},
+    {'name': 'modules', 'file': 'kegg_modules.txt', 'prefix': 'md', 'node_type': 'Module', 'link': 'https://www.genome.jp/entry/md:{}'},
+    {'name': 'KOs', 'file': 'kegg_koids.txt', 'prefix': 'ko', 'node_type': 'KO', 'link': 'https://www.genome.jp/entry/ko:{}', 'descriptions': ['KO_hierarchy', 'KO_related_genes']},
+    {'name': 'diseases', 'file': 'kegg_diseases.txt', 'prefix': 'ds', 'node_type': 'Disease', 'link': 'https://www.genome.jp/entry/ds:{}'},
+    {'name': 'drugs', 'file': 'kegg_drugs.txt', 'prefix': 'dr', 'node_type': 'Drug', 'link': 'https://www.genome.jp/entry/dr:{}'},
+    {'name': 'reactions', 'file': 'kegg_reactions.txt', 'prefix': 'rn', 'node_type': 'Reaction', 'link': 'https://www.genome.jp/entry/rn:{}'},
+    {'name': 'enzymes', 'file': 'kegg_enzymes.txt', 'prefix': 'ec', 'node_type': 'Enzyme', 'link': 'https://www.genome.jp/entry/ec:{}'},
+    {'name': 'glycans', 'file': 'kegg_glycans.txt', 'prefix': 'gl', 'node_type': 'Glycan', 'link': 'https://www.genome.jp/entry/gl:{}'},
+    # network synonyms are not used
+    {'name': 'networks', 'file': 'kegg_networks.txt', 'prefix': 'ne', 'node_type': 'Network', 'link': 'https://www.genome.jp/entry/ne:{}', 'use_synonyms': False},
+    {'name': 'drug groups', 'file': 'kegg_dgroups.txt', 'prefix': 'dg', 'node_type': 'Drug_Group', 'link': 'https://www.genome.jp/entry/dg:{}'},
+    {'name': 'reaction classes', 'file': 'kegg_rclasses.txt', 'prefix': 'rc', 'node_type': 'Reaction', 'link': 'https://www.genome.jp/entry/rc:{}'},
+]
+
+# link files whose source nodes are genomes (KEGG T numbers or organism codes)
+GENOME_LINK_FILES = ['link_compound_to_gn.txt', 'link_module_to_gn.txt', 'link_disease_to_gn.txt', 'link_pathway_to_gn.txt']
+
+def to_kegg_curies(kegg_ids):
+    """
+    Convert a pandas Series of KEGG ids (e.g., 'cpd:C00001') to KG synonyms (e.g., 'KEGG:cpd_C00001').
+    """
+    return 'KEGG:' + kegg_ids.str.replace(':', '_', regex=False)
+
+# virus gene id -> KEGG genome synonym, shared with the gene link workers
+_gene_to_genome = {}
+
+def init_gene_link_worker(gene_to_genome):
+    global _gene_to_genome
+    _gene_to_genome = gene_to_genome
+
+def aggregate_gene_links(task):
+    """
+    Collapse one gene-level link file to deduplicated genome-level links.
+    :param task: a tuple of (file path, file type, organism code, genome synonym); the last two are None for virus gene links
+    :return: a dataframe with columns 'genome_node', 'target_node' and 'gene_count' (number of supporting genes)
+    """
+    file_path, file_type, org_code, genome_node = task
+    try:
+        infile = pd.read_csv(file_path, sep='\t', header=None, names=['gene_id', 'node_ids'], usecols=[0, 1], dtype=str)
+    except pd.errors.EmptyDataError:
+        return pd.DataFrame(columns=['genome_node', 'target_node', 'gene_count'])
+    if genome_node is None:
+        infile['genome_node'] = infile['gene_id'].map(_gene_to_genome)
+        infile = infile.loc[~infile['genome_node'].isna(),:]
+    else:
+        infile['genome_node'] = genome_node
+    infile = infile.assign(node_id=infile['node_ids'].str.split(';')).explode('node_id')
+    infile = infile.loc[~infile['node_id'].isna(),:]
+    if org_code is not None and file_type == 'pathway':
+        infile['node_id'] = infile['node_id'].str.replace(f":{org_code}", ':map', regex=False)
+    if org_code is not None and file_type == 'module':
+        infile['node_id'] = infile['node_id'].str.replace(f"{org_code}_", "", regex=False)
+    infile['target_node'] = to_kegg_curies(infile['node_id'])
+    return infile.groupby(['genome_node', 'target_node'], sort=False)['gene_id'].nunique().reset_index(name='gene_count')
+
+# KEGG synonyms and description data, shared with the entity workers
+_kegg_synonyms, _description_data = {}, {}
+
+def init_kegg_entity_worker(kegg_synonyms, description_data):
+    global _kegg_synonyms, _description_data
+    _kegg_synonyms, _description_data = kegg_synonyms, description_data
+
+def load_kegg_entities(task):
+    """
+    Build the node fields of one KEGG entity type. Plain lists are returned instead of Node objects because they are
+    much cheaper to send back to the parent process, which creates the nodes.
+    :param task: a tuple of (an entry of KEGG_ENTITY_REGISTRY, path of the KEGG processed data directory)
+    :return: a tuple of aligned lists (names, descriptions, synonyms, links)
+    """
+    entity, data_dir = task
+    entity_table = pd.read_csv(os.path.join(data_dir, entity['file']), sep='\t', header=0)
+    entity_ids, names = entity_table.iloc[:, 0], entity_table.iloc[:, 1]
+    # ids, synonyms, links and descriptions are built column-wise before the nodes are created
+    kegg_ids = f"KEGG:{entity['prefix']}_" + entity_ids.astype(str)
+    if entity.get('use_synonyms', True):
+        synonyms = [[kegg_id] + _kegg_synonyms.get(kegg_id, []) for kegg_id in kegg_ids]
+    else:
+        synonyms = [[kegg_id] for kegg_id in kegg_ids]
+    links = entity_ids.astype(str).map(entity['link'].format)
+    descriptions = [[] for _ in range(len(entity_table))]
+    for field in entity.get('descriptions', []):
+        field_data = _description_data[field]
+        for descriptions_row, entity_id in zip(descriptions, entity_ids):
+            if entity_id in field_data:
+                descriptions_row.append((field, '#####'.join(field_data[entity_id])))
+    return names.tolist(), descriptions, synonyms, links.tolist()
+
 
 if __name__ == "__main__":
     parser = argparse.ArgumentParser(description='Integrate all KEGG data into a knolwedge graph based on the above graph structure')
@@ -27,6 +117,7 @@ if __name__ == "__main__":
     parser.add_argument('--microb_only', action='store_true', help="only extract microbial data (e.g. 'Archaea', 'viruses', 'Bacteria', 'Fungi')", default=False)
     parser.add_argument('--ANI_threshold', type=float, help='ANI threshold to identify the same strain (default 0 for no filtering)', default=0.0)
     parser.add_argument('--AF_threshold', type=float, help='AF threshold to dentify the same strain (default 0 for no filtering)', default=0.0)
+    parser.add_argument('--n_jobs', type=int, help='number of threads/processes used to load KEGG entities and gene links', default=4)
     parser.add_argument('--output_dir', type=str, help='path of the output directory')
     args = parser.parse_args()
 
@@ -86,15 +177,8 @@ if __name__ == "__main__":
 
     ## read KEGG archeaa and bacteria assignment
     logger.info('Reading KEGG archeaa and bacteria assignment')
-    kegg_archaea_bacteria_assignment = read_tsv_file(args.gtdb_assignment)
-    temp_header = kegg_archaea_bacteria_assignment[0]
-    mapping_gn_to_microbe_id = {}
-    for row in tqdm(kegg_archaea_bacteria_assignment[1:]):
-        if (row[temp_header.index('closest_genome_ani')] != 'N/A' and float(row[temp_header.index('closest_genome_ani')]) >= args.ANI_threshold) and (row[temp_header.index('closest_genome_af')] != 'N/A' and float(row[temp_header.index('closest_genome_af')]) >= args.AF_threshold):
-            mapping_gn_to_microbe_id[f"KEGG:gn_{row[temp_header.index('user_genome')]}"] = [f"GTDB:{row[temp_header.index('closest_genome_reference')]}"]
-        else:
-            mapping_gn_to_microbe_id[f"KEGG:gn_{row[temp_header.index('user_genome')]}"] = [f"KEGG:gn_{row[temp_header.index('user_genome')]}"]
-        mapping_gn_to_microbe_id[f"KEGG:gn_{row[temp_header.index('user_genome')]}"] += [row[temp_header.index('classification')], f"ANI_reference_radius:{row[temp_header.index('closest_genome_reference_radius')]}; ANI:{row[temp_header.index('closest_genome_ani')]}; AF:{row[temp_header.index('closest_genome_af')]}; classification_method:{row[temp_header.index('classification_method')]}; MSA_percent:{row[temp_header.index('msa_percent')]}"]
+    kegg_archaea_bacteria_assignment = load_gtdbtk_assignment(args.gtdb_assignment, 'KEGG', args.ANI_threshold, args.AF_threshold)
+    mapping_gn_to_microbe_id = dict(zip(kegg_archaea_bacteria_assignment['genome_id'], zip(kegg_archaea_bacteria_assignment['assigned_id'], kegg_archaea_bacteria_assignment['classification'], kegg_archaea_bacteria_assignment['description'])))
 
     if args.microb_only:
         logger.info("Only microbial organism data (e.g. 'Archaea', 'viruses', 'Bacteria', 'Fungi') are used in KG construction.")
@@ -147,9 +231,8 @@ if __name__ == "__main__":
                 elif 'taxid' not in description_dict:
                     description_dict['taxid'] = taxon_id
                     description_dict['rank'] = ncbi_rank
-                if gtdb_assignment_info and gtdb_assignment_info.split(';')[1].split(':')[1] != 'N/A':
-                    temp_description_dict = dict([tuple(item.strip().split(':')) for item in gtdb_assignment_info.split(';')])
-                    description_dict.update(temp_description_dict)
+                if gtdb_assignment_info:
+                    description_dict.update(dict(gtdb_assignment_info))
                 existing_node.description = list(description_dict.items())
                 existing_node.knowledge_source = list(set(existing_node.knowledge_source + ['KEGG']))
                 temp_synonyms = [f"KEGG:gn_{gn_id}"]
@@ -224,142 +307,17 @@ if __name__ == "__main__":
                 kg.add_node(temp_node)
                 parent_dict[f"KEGG:gn_{gn_id}"] = f"NCBI:{ncbi_full_lineage.split(';')[-1]}"
 
-    # KEGG compounds
-    file_path = os.path.join(args.kegg_processed_data_dir, 'kegg_compounds.txt')
-    compound_table = pd.read_csv(file_path, sep='\t', header=0)
-    for row in tqdm(compound_table.to_numpy(), desc='integrating info of KEGG compounds'):
-        compound_id, desc = row
-        if f"KEGG:cpd_{compound_id}" in kegg_synonyms:
-            temp_synonyms = kegg_synonyms[f"KEGG:cpd_{compound_id}"]
-            
-        temp_node = Node(node_type="Compound", all_names=[desc], description=[], knowledge_source=['KEGG'], synonyms=[f"KEGG:cpd_{compound_id}"] + temp_synonyms, link=[f"https://www.genome.jp/entry/cpd:{compound_id}"])
-        kg.add_node(temp_node)
-        
-    # KEGG pathways
-    file_path = os.path.join(args.kegg_processed_data_dir, 'kegg_pathways.txt')
-    pathway_table = pd.read_csv(file_path, sep='\t', header=0)
-    for row in tqdm(pathway_table.to_numpy(), desc='integrating info of KEGG pathways'):
-        pathway_id, desc = row
-        if f"KEGG:path_{pathway_id}" in kegg_synonyms:
-            temp_synonyms = kegg_synonyms[f"KEGG:path_{pathway_id}"]
-            
-        temp_node = Node(node_type="Pathway", all_names=[desc], description=[], knowledge_source=['KEGG'], synonyms=[f"KEGG:path_{pathway_id}"] + temp_synonyms, link=[f"https://www.genome.jp/entry/path:{pathway_id}"])
-        kg.add_node(temp_node)
-
-    # KEGG modules
-    file_path = os.path.join(args.kegg_processed_data_dir, 'kegg_modules.txt')
-    module_table = pd.read_csv(file_path, sep='\t', header=0)
-    for row in tqdm(module_table.to_numpy(), desc='integrating info of KEGG modules'):
-        module_id, desc = row
-        if f"KEGG:md_{module_id}" in kegg_synonyms:
-            temp_synonyms = kegg_synonyms[f"KEGG:md_{module_id}"]
-            
-        temp_node = Node(node_type="Module", all_names=[desc], description=[], knowledge_source=['KEGG'], synonyms=[f"KEGG:md_{module_id}"] + temp_synonyms, link=[f"https://www.genome.jp/entry/md:{module_id}"])
-        kg.add_node(temp_node)
-
-    # KEGG KOs
-    file_path = os.path.join(args.kegg_processed_data_dir, 'kegg_koids.txt')
-    kos_table = pd.read_csv(file_path, sep='\t', header=0)
-    for row in tqdm(kos_table.to_numpy(), desc='integrating info of KEGG KOs'):
-        kos_id, desc = row
-        temp_description = []
-        if kos_id in ko_hierarchy:
-            temp_description += [('KO_hierarchy', '#####'.join(ko_hierarchy[kos_id]))]
-        if kos_id in ko_related_genes:
-            temp_description += [('KO_related_genes', '#####'.join(ko_related_genes[kos_id]))]
-        if f"KEGG:ko_{kos_id}" in kegg_synonyms:
-            temp_synonyms = kegg_synonyms[f"KEGG:ko_{kos_id}"]
-        
-        temp_node = Node(node_type="KO", all_names=[desc], description=temp_description, knowledge_source=['KEGG'], synonyms=[f"KEGG:ko_{kos_id}"] + temp_synonyms, link=[f"https://www.genome.jp/entry/ko:{kos_id}"])
-        kg.add_node(temp_node)
-
-    # KEGG diseases
-    file_path = os.path.join(args.kegg_processed_data_dir, 'kegg_diseases.txt')
-    disease_table = pd.read_csv(file_path, sep='\t', header=0)
-    for row in tqdm(disease_table.to_numpy(), desc='integrating info of KEGG diseases'):
-        disease_id, desc = row
-        if f"KEGG:ds_{disease_id}" in kegg_synonyms:
-            temp_synonyms = kegg_synonyms[f"KEGG:ds_{disease_id}"]
-        
-        temp_node = Node(node_type="Disease", all_names=[desc], description=[], knowledge_source=['KEGG'], synonyms=[f"KEGG:ds_{disease_id}"] + temp_synonyms, link=[f"https://www.genome.jp/entry/ds:{disease_id}"])
-        kg.add_node(temp_node)
-
-    # KEGG drugs
-    file_path = os.path.join(args.kegg_processed_data_dir, 'kegg_drugs.txt')
-    drug_table = pd.read_csv(file_path, sep='\t', header=0)
-    for row in tqdm(drug_table.to_numpy(), desc='integrating info of KEGG drugs'):
-        drug_id, desc = row
-        if f"KEGG:dr_{drug_id}" in kegg_synonyms:
-            temp_synonyms = kegg_synonyms[f"KEGG:dr_{drug_id}"]
-        
-        temp_node = Node(node_type="Drug", all_names=[desc], description=[], knowledge_source=['KEGG'], synonyms=[f"KEGG:dr_{drug_id}"] + temp_synonyms, link=[f"https://www.genome.jp/entry/dr:{drug_id}"])
-        kg.add_node(temp_node)
-
-    # KEGG reactions
-    file_path = os.path.join(args.kegg_processed_data_dir, 'kegg_reactions.txt')
-    reaction_table = pd.read_csv(file_path, sep='\t', header=0)
-    for row in tqdm(reaction_table.to_numpy(), desc='integrating info of KEGG reactions'):
-        reaction_id, desc = row
-        if f"KEGG:rn_{reaction_id}" in kegg_synonyms:
-            temp_synonyms = kegg_synonyms[f"KEGG:rn_{reaction_id}"]
-        
-        temp_node = Node(node_type="Reaction", all_names=[desc], description=[], knowledge_source=['KEGG'], synonyms=[f"KEGG:rn_{reaction_id}"] + temp_synonyms, link=[f"https://www.genome.jp/entry/rn:{reaction_id}"])
-        kg.add_node(temp_node)
-
-    # KEGG enzymes
-    file_path = os.path.join(args.kegg_processed_data_dir, 'kegg_enzymes.txt')
-    enzyme_table = pd.read_csv(file_path, sep='\t', header=0)
-    for row in tqdm(enzyme_table.to_numpy(), desc='integrating info of KEGG enzymes'):
-        enzyme_id, desc = row
-        if f"KEGG:ec_{enzyme_id}" in kegg_synonyms:
-            temp_synonyms = kegg_synonyms[f"KEGG:ec_{enzyme_id}"]
-        
-        temp_node = Node(node_type="Enzyme", all_names=[desc], description=[], knowledge_source=['KEGG'], synonyms=[f"KEGG:ec_{enzyme_id}"] + temp_synonyms, link=[f"https://www.genome.jp/entry/ec:{enzyme_id}"])
-        kg.add_node(temp_node)
-
-    # KEGG glycans
-    file_path = os.path.join(args.kegg_processed_data_dir, 'kegg_glycans.txt')
-    glycan_table = pd.read_csv(file_path, sep='\t', header=0)
-    for row in tqdm(glycan_table.to_numpy(), desc='integrating info of KEGG glycans'):
-        glycan_id, desc = row
-        if f"KEGG:gl_{glycan_id}" in kegg_synonyms:
-            temp_synonyms = kegg_synonyms[f"KEGG:gl_{glycan_id}"]
-        
-        temp_node = Node(node_type="Glycan", all_names=[desc], description=[], knowledge_source=['KEGG'], synonyms=[f"KEGG:gl_{glycan_id}"] + temp_synonyms, link=[f"https://www.genome.jp/entry/gl:{glycan_id}"])
-        kg.add_node(temp_node)
-
-    # KEGG networks
-    file_path = os.path.join(args.kegg_processed_data_dir, 'kegg_networks.txt')
-    network_table = pd.read_csv(file_path, sep='\t', header=0)
-    for row in tqdm(network_table.to_numpy(), desc='integrating info of KEGG networks'):
-        network_id, desc = row
-        # if f"KEGG:ne_{network_id}" in kegg_synonyms:
-        #     temp_synonyms = kegg_synonyms[f"KEGG:ne_{network_id}"]
-        
-        temp_node = Node(node_type="Network", all_names=[desc], description=[], knowledge_source=['KEGG'], synonyms=[f"KEGG:ne_{network_id}"] + temp_synonyms, link=[f"https://www.genome.jp/entry/ne:{network_id}"])
-        kg.add_node(temp_node)
-
-    # KEGG drug groups
-    file_path = os.path.join(args.kegg_processed_data_dir, 'kegg_dgroups.txt')
-    dgroup_table = pd.read_csv(file_path, sep='\t', header=0)
-    for row in tqdm(dgroup_table.to_numpy(), desc='integrating info of KEGG drug groups'):
-        dgroup_id, desc = row
-        if f"KEGG:dg_{dgroup_id}" in kegg_synonyms:
-            temp_synonyms = kegg_synonyms[f"KEGG:dg_{dgroup_id}"]
-        
-        temp_node = Node(node_type="Drug_Group", all_names=[desc], description=[], knowledge_source=['KEGG'], synonyms=[f"KEGG:dg_{dgroup_id}"] + temp_synonyms, link=[f"https://www.genome.jp/entry/dg:{dgroup_id}"])
-        kg.add_node(temp_node)
-
-    # KEGG reaction classes
-    file_path = os.path.join(args.kegg_processed_data_dir, 'kegg_rclasses.txt')
-    rclass_table = pd.read_csv(file_path, sep='\t', header=0)
-    for row in tqdm(rclass_table.to_numpy(), desc='integrating info of KEGG reaction classes'):
-        rclass_id, desc = row
-        if f"KEGG:rc_{rclass_id}" in kegg_synonyms:
-            temp_synonyms = kegg_synonyms[f"KEGG:rc_{rclass_id}"]
-        
-        temp_node = Node(node_type="Reaction", all_names=[desc], description=[], knowledge_source=['KEGG'], synonyms=[f"KEGG:rc_{rclass_id}"] + temp_synonyms, link=[f"https://www.genome.jp/entry/rc:{rclass_id}"])
-        kg.add_node(temp_node)
+    # KEGG entities (compounds, pathways, modules, KOs, diseases, drugs, ...)
+    logger.info('Loading KEGG entities')
+    description_data = {'KO_hierarchy': ko_hierarchy, 'KO_related_genes': ko_related_genes}
+    # the entity types are parsed in worker processes (the parsing is CPU-bound) and merged in registry order so that node ids stay deterministic
+    entity_tasks = [(entity, args.kegg_processed_data_dir) for entity in KEGG_ENTITY_REGISTRY]
+    with Pool(processes=args.n_jobs, initializer=init_kegg_entity_worker, initargs=(kegg_synonyms, description_data)) as pool:
+        for entity, (names, descriptions, synonyms, links) in zip(KEGG_ENTITY_REGISTRY, pool.imap(load_kegg_entities, entity_tasks)):
+            entity_nodes = [Node(node_type=entity['node_type'], all_names=[name], description=description, knowledge_source=['KEGG'], synonyms=synonym_list, link=[link])
+                            for name, description, synonym_list, link in zip(names, descriptions, synonyms, links)]
+            new_count, merged_count = kg.add_nodes(entity_nodes)
+            logger.info(f"integrating info of KEGG {entity['name']}: {new_count} new nodes, {merged_count} merged nodes")
 
     ## Connect genome hierarchy
     logger.info('Connecting genome hierarchy')
@@ -376,85 +334,77 @@ if __name__ == "__main__":
 
     ## Get all KEGG-baesd connections
     logger.info('Getting KEGG-baesd connections')
+    orgcode_table = pd.DataFrame(list(orgcode_to_gnid.items()), columns=['org_code', 'genome_node'])
     link_file_list = glob(os.path.join(args.kegg_processed_data_dir,'link_*'))
     for file_path in tqdm(link_file_list, desc='integrating KEGG connections'):
         logger.info(f'Read {file_path}')
+        file_name = os.path.basename(file_path)
         infile = pd.read_csv(file_path, sep='\t', header=0)
-        for row in infile.to_numpy():
-            source_node, target_node, source_to_target, target_to_source = row
-            if os.path.basename(file_path) in ['link_compound_to_gn.txt', 'link_module_to_gn.txt', 'link_disease_to_gn.txt','link_pathway_to_gn.txt']:
-                if not source_node.split(':')[1].startswith('T') and source_node.split(':')[1] not in orgcode_to_gnid:
-                    continue
-                if source_node.split(':')[1].startswith('T'):
-                    source_node = 'KEGG:' + source_node.replace(':','_')
-                else:
-                    source_node = orgcode_to_gnid[source_node.split(':')[1]]
-                target_node = 'KEGG:' + target_node.replace(':','_')
-            else:
-                source_node = 'KEGG:' + source_node.replace(':','_')
-                target_node = 'KEGG:' + target_node.replace(':','_')
-            
-            ## All genomes that connect to disease nodes are pathogens
-            if os.path.basename(file_path) == 'link_disease_to_gn.txt':
-                existing_node = kg.get_node_by_id(source_node)
-                if existing_node:
-                    existing_node.is_pathogen = True
-            
-            # Add edge to the knowledge graph
-            if not isinstance(source_to_target, float):
-                kg.add_edge(Edge(source_node=source_node, target_node=target_node, predicate=source_to_target, knowledge_source=['KEGG']))
-            if not isinstance(target_to_source, float):
-                kg.add_edge(Edge(source_node=target_node, target_node=source_node, predicate=target_to_source, knowledge_source=['KEGG']))
+        infile.columns = ['source_node', 'target_node', 'source_to_target', 'target_to_source']
+        if file_name in GENOME_LINK_FILES:
+            # genomes are given either as KEGG T numbers or as organism codes
+            infile['genome_code'] = infile['source_node'].str.split(':').str[1]
+            infile = infile.merge(orgcode_table, left_on='genome_code', right_on='org_code', how='left')
+            infile = infile.loc[infile['genome_code'].str.startswith('T', na=False) | ~infile['genome_node'].isna(),:].reset_index(drop=True)
+            is_t_number = infile['genome_code'].str.startswith('T', na=False)
+            infile['source_node'] = to_kegg_curies(infile['source_node']).where(is_t_number, infile['genome_node'])
+        else:
+            infile['source_node'] = to_kegg_curies(infile['source_node'])
+        infile['target_node'] = to_kegg_curies(infile['target_node'])
+
+        ## All genomes that connect to disease nodes are pathogens
+        if file_name == 'link_disease_to_gn.txt':
+            for node_id in kg.resolve_synonyms(infile['source_node'].unique()).dropna().unique():
+                kg.nodes[node_id].is_pathogen = True
+
+        # Add edges to the knowledge graph
+        edge_table = pd.concat([
+            infile[['source_node', 'target_node', 'source_to_target']].set_axis(['source_node', 'target_node', 'predicate'], axis=1),
+            infile[['target_node', 'source_node', 'target_to_source']].set_axis(['source_node', 'target_node', 'predicate'], axis=1)
+        ], ignore_index=True)
+        edge_table['knowledge_source'] = [['KEGG']] * len(edge_table)
+        kg.add_edges(edge_table)
 
 
     # connect genome to other node types based on genes
     logger.info('connect genome to other node types based on genes')
     # viruses
     vg_id_to_gnid = {row[0]:f"KEGG:{row[1].replace(':','_')}" for row in keggdata.virus_table[['gene_id','gn_id']].to_numpy()}
-    link_file_list = glob(os.path.join(args.kegg_processed_data_dir,'viruses','vg_link_*'))
-    for file_path in tqdm(link_file_list, desc='integrating viruses gene-based connections'):
-        if os.path.basename(file_path).replace('vg_link_','').replace('_to_gene.txt','') in ['ncbi_geneid','uniprot','pfam','rs','pdb','ncbi_proteinid']:
+    gene_link_tasks = []
+    for file_path in glob(os.path.join(args.kegg_processed_data_dir,'viruses','vg_link_*')):
+        file_type = os.path.basename(file_path).replace('vg_link_','').replace('_to_gene.txt','')
+        if file_type in ['ncbi_geneid','uniprot','pfam','rs','pdb','ncbi_proteinid']:
             continue
-        infile = pd.read_csv(file_path, sep='\t', header=None)
-        for row in infile.to_numpy():
-            virus_gene_id, node_ids = row
-
-            if virus_gene_id in vg_id_to_gnid:
-                for node_id in node_ids.split(';'):
-                    source_node = vg_id_to_gnid[virus_gene_id]
-                    target_node = 'KEGG:' + node_id.replace(':','_')
-                    # Add edge to the knowledge graph
-                    kg.add_edge(Edge(source_node=source_node, target_node=target_node, predicate='biolink:genetically_associated_with', knowledge_source=['KEGG']))
-                    kg.add_edge(Edge(source_node=target_node, target_node=source_node, predicate='biolink:genetically_associated_with', knowledge_source=['KEGG']))
+        gene_link_tasks += [(file_path, file_type, None, None)]
 
     #FIXME: Consider if we need to connect non-virus genome to other node types based on genes because they are too many
     # bacteria/fungi/archaea
-    flag = False
-    link_file_list = glob(os.path.join(args.kegg_processed_data_dir,'organisms','link_*'))
-    for dir_path in tqdm(link_file_list, desc='integrating bacteria/fungi/archaea gene-based connections'):
-        if os.path.basename(dir_path).replace('link_','').replace('_to_gene','') in ['brite','uniprot','pfam','rs','pdb','ncbi_proteinid']:
-            continue
+    for dir_path in glob(os.path.join(args.kegg_processed_data_dir,'organisms','link_*')):
         file_type = os.path.basename(dir_path).replace('link_','').replace('_to_gene','')
-        temp_file_list = [os.path.join(dir_path,x) for x in os.listdir(dir_path)]
-        for file_path in tqdm(temp_file_list, desc=f'integrating {file_type} gene-based connections'):
-            org_code = os.path.basename(file_path).split('_')[0]
+        if file_type in ['brite','uniprot','pfam','rs','pdb','ncbi_proteinid']:
+            continue
+        for file_name in os.listdir(dir_path):
+            org_code = file_name.split('_')[0]
             if org_code in orgcode_to_gnid:
-                infile = pd.read_csv(file_path, sep='\t', header=None)
-                for row in infile.to_numpy():
-                    _, node_ids = row
-                    for node_id in node_ids.split(';'):
-                        if file_type == 'pathway':
-                            node_id = node_id.replace(f":{org_code}", ':map').replace(':','_')
-                        if file_type == 'module':
-                            node_id = node_id.replace(f"{org_code}_", "").replace(':','_')
-
-                        source_node = orgcode_to_gnid[org_code]
-                        target_node = f"KEGG:{node_id.replace(':','_')}"
-                        
-                        # Add edge to the knowledge graph
-                        kg.add_edge(Edge(source_node=source_node, target_node=target_node, predicate='biolink:genetically_associated_with', knowledge_source=['KEGG']))
-                        kg.add_edge(Edge(source_node=target_node, target_node=source_node, predicate='biolink:genetically_associated_with', knowledge_source=['KEGG']))
-    
+                gene_link_tasks += [(os.path.join(dir_path, file_name), file_type, org_code, orgcode_to_gnid[org_code])]
+
+    # each worker collapses one gene-level link file to genome-level links; tasks are sorted and results kept in task order
+    # so that the edge order of the saved graph does not depend on the file system or on the worker scheduling
+    gene_link_tasks = sorted(gene_link_tasks, key=lambda task: task[0])
+    with Pool(processes=args.n_jobs, initializer=init_gene_link_worker, initargs=(vg_id_to_gnid,)) as pool:
+        gene_links = list(tqdm(pool.imap(aggregate_gene_links, gene_link_tasks), total=len(gene_link_tasks), desc='aggregating gene-based connections'))
+    gene_links = [x for x in gene_links if len(x) > 0]
+    if len(gene_links) > 0:
+        gene_links = pd.concat(gene_links, ignore_index=True).groupby(['genome_node', 'target_node'], sort=True)['gene_count'].sum().reset_index()
+        gene_links['description'] = [[('supporting_gene_count', str(gene_count))] for gene_count in gene_links['gene_count']]
+        edge_table = pd.concat([
+            gene_links[['genome_node', 'target_node', 'description']].set_axis(['source_node', 'target_node', 'description'], axis=1),
+            gene_links[['target_node', 'genome_node', 'description']].set_axis(['source_node', 'target_node', 'description'], axis=1)
+        ], ignore_index=True)
+        edge_table['predicate'] = 'biolink:genetically_associated_with'
+        edge_table['knowledge_source'] = [['KEGG']] * len(edge_table)
+        kg.add_edges(edge_table)
+
 
     # Save the knowledge graph
     logger.info("Saving the knowledge graph...")
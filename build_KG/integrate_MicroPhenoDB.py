@@ -10,72 +10,14 @@ from glob import glob
 import pandas as pd
 import argparse
 import pytaxonkit
-import requests
 import logging
 import json
 import itertools
 
 ## Import custom libraries
-from utils import get_logger, read_tsv_file, Node, Edge, KnowledgeGraph, change_prefix, extract_disease_synonyms, UMLSMapping, OxOMapping, MappingLink
+from utils import get_logger, read_tsv_file, Node, Edge, KnowledgeGraph, change_prefix, extract_disease_synonyms_batch, AsyncMappingResolver, MappingLink
 from kg2_utils.node_synonymizer import NodeSynonymizer
 
-def map_umls_to_taxon_id(ncit, umls_id, apikey):
-    
-    def _parse_response(response_json, preferred_name):
-        temp = list(set([int(res['code'].split('/')[-1]) for res in response_json['result'] if res['rootSource'] == 'NCBI' and res['name'].lower() == preferred_name.lower()]))
-        if len(temp) == 0:
-            temp = list(set([int(res['code'].split('/')[-1]) for res in response_json['result'] if res['rootSource'] == 'NCBI']))
-            return temp
-        else:
-            return temp
-    
-    if isinstance(ncit, str):        
-        umls_api = f"https://uts-ws.nlm.nih.gov/rest/content/current/source/NCI/{ncit.split('_')[1]}/atoms"
-        response = requests.get(umls_api, params={'apiKey':apikey})
-        if response.status_code == 200:
-            umls_id = response.json()['result'][0]['concept'].split('/')[-1]
-            umls_api = f"https://uts-ws.nlm.nih.gov/rest/content/current/CUI/{umls_id}"
-            response = requests.get(umls_api, params={'apiKey':apikey})
-            if response.status_code == 200:
-                preferred_name = response.json()['result']['name']
-            else:
-                return None
-
-            umls_api = f"https://uts-ws.nlm.nih.gov/rest/content/current/CUI/{umls_id}/atoms"
-            response = requests.get(umls_api, params={'apiKey':apikey})
-            if response.status_code == 200:
-                res = _parse_response(response.json(), preferred_name)
-                if len(res) > 0:
-                    return res
-                else:
-                    return None
-            else:
-                return None
-        else:
-            return None
-
-    elif umls_id and umls_id.split(':')[0] == 'UMLS':
-        umls_api = f"https://uts-ws.nlm.nih.gov/rest/content/current/CUI/{umls_id.split(':')[1]}"
-        response = requests.get(umls_api, params={'apiKey':apikey})
-        if response.status_code == 200:
-            preferred_name = response.json()['result']['name']
-        else:
-            return None
-
-        umls_api = f"https://uts-ws.nlm.nih.gov/rest/content/current/CUI/{umls_id.split(':')[1]}/atoms"
-        response = requests.get(umls_api, params={'apiKey':apikey})
-        if response.status_code == 200:
-            res = _parse_response(response.json(), preferred_name)
-            if len(res) > 0:
-                return res
-            else:
-                return None
-        else:
-            return None
-    else:
-        return None
-
-
 if __name__ == "__main__":
     parser = argparse.ArgumentParser(description='Integrate all MicroPhenoDB into a knolwedge graph')
     parser.add_argument('--existing_KG_nodes', type=str, help='path of the existing knowledge graph nodes')
@@ -86,6 +28,7 @@ if __name__ == "__main__":
     parser.add_argument('--umls_api_key', type=str, help='UMLS API key')
     parser.add_argument('--synonymizer_dir', type=str, help='path of the synonymizer directory')
     parser.add_argument('--synonymizer_dbname', type=str, help='name of the synonymizer database')
+    parser.add_argument('--max_concurrency', type=int, help='maximum number of concurrent UMLS/OxO requests', default=8)
     parser.add_argument('--output_dir', type=str, help='path of the output directory')
     args = parser.parse_args()
 
@@ -105,13 +48,9 @@ if __name__ == "__main__":
     # Import Node Synonymizer
     nodesynonymizer = NodeSynonymizer(args.synonymizer_dir, args.synonymizer_dbname)
 
-    # set up oxo mappingf
-    logger.info('Setting up OxO mapping')
-    oxo_class = OxOMapping()
-    
-    # set up umls mapping
-    logger.info('Setting up UMLS mapping')
-    umls_class = UMLSMapping(args.umls_api_key)
+    # set up the concurrent UMLS/OxO resolver
+    logger.info('Setting up UMLS/OxO resolver')
+    resolver = AsyncMappingResolver(args.umls_api_key, max_concurrency=args.max_concurrency)
 
     # # Read bacteria metadata
     # logger.info("Reading bacteria metadata...")
@@ -164,10 +103,14 @@ if __name__ == "__main__":
     # find taxon id for species
     taxon_names = list(set(MDBcorrelation[['Microbe']]['Microbe']))
     name_to_ncit = {name:ncit_id for name, ncit_id in MDBcorrelation[['Microbe', 'NCIT_id']].to_numpy()}
-    umls_ids = {name:umls_class.get_mapping(name) for name in taxon_names}
-    name_umls = pd.DataFrame([(key, value) for key, value in umls_ids.items() if value], columns=['name', 'umls_id'])
-    name_umls_taxonid = pd.DataFrame([(name, umls, map_umls_to_taxon_id(name_to_ncit[name], umls, args.umls_api_key)) for name, umls in name_umls.to_numpy()])
-    # use node synonymizer to find the taxon ids
+    logger.info(f'Querying UMLS ids for {len(taxon_names)} microbes')
+    name_umls = resolver.get_umls_mappings(taxon_names)
+    name_umls = name_umls.loc[~name_umls['umls_id'].isna(),:].reset_index(drop=True)
+    logger.info(f'Querying NCBI taxon ids for {len(name_umls)} microbes')
+    name_umls_taxonid = resolver.get_taxon_ids(list(name_umls['name']), [name_to_ncit[name] for name in name_umls['name']], list(name_umls['umls_id']))
+    # use node synonymizer to find the taxon ids of the microbes without one, in a single query
+    taxon_misses = [name for name, _, taxon_id in name_umls_taxonid.to_numpy() if not taxon_id]
+    taxon_miss_normalizer = nodesynonymizer.get_equivalent_nodes(names=taxon_misses) if len(taxon_misses) > 0 else {}
     temp = []
     for name, umls, taxon_id in name_umls_taxonid.to_numpy():
         if taxon_id:
@@ -177,7 +120,7 @@ if __name__ == "__main__":
                 logger.warning(f'Found multiple taxon ids for {name} with UMLS id {umls}: {taxon_id}')
                 temp.append((name, umls, str(taxon_id[0])))
         else:
-            normalizer = nodesynonymizer.get_equivalent_nodes(names=name)[name]
+            normalizer = taxon_miss_normalizer.get(name)
             if normalizer:
                 taxon_id = [int(x.split(':')[1]) for x in normalizer if x.split(':')[0] == 'NCBITaxon']
                 if len(taxon_id) == 0:
@@ -194,7 +137,29 @@ if __name__ == "__main__":
     temp_result['TaxID'] = temp_result['TaxID'].astype(str)
     name_umls_taxonid = name_umls_taxonid.merge(temp_result, left_on='taxon_id', right_on='TaxID', how='left')
     name_umls_taxonid_dict = {row[0]: row[1:] for row in name_umls_taxonid.to_numpy()}
-    
+
+    # query OxO for all EFO ids at once
+    efo_ids = [efo_id.replace('_',':') for efo_id in MDBcorrelation['EFO_id'] if isinstance(efo_id, str)]
+    logger.info(f'Querying OxO mappings for {len(set(efo_ids))} EFO ids')
+    efo_mappings = resolver.get_oxo_mappings(efo_ids, distance=1)
+    efo_to_synonyms = efo_mappings.groupby('query_id')['curie'].agg(list).to_dict()
+
+    # diseases whose EFO synonyms match no node fall back to the Node Synonymizer and UMLS; resolve them all at once
+    fallback_diseases = []
+    for microbe, disease, efo_id in MDBcorrelation[['Microbe', 'Disease', 'EFO_id']].to_numpy():
+        if disease in ['Disease', 'Disease-free', 'Null', 'Not foundthogenic'] or not isinstance(efo_id, str):
+            continue
+        elif disease in ['Pelvic inflamm atory disease', 'Pelvic in铿俛mmatory disease']:
+            disease = 'Pelvic inflammatory disease'
+        efo_id = efo_id.replace('_',':')
+        if efo_id not in efo_to_synonyms:
+            continue
+        synonyms = [efo_id] + [change_prefix(synonym) for synonym in efo_to_synonyms[efo_id] if change_prefix(synonym)]
+        if not any(kg.find_node_by_synonym(x) for x in synonyms):
+            fallback_diseases.append(disease)
+    logger.info(f'Querying synonyms for {len(set(fallback_diseases))} diseases not found by their EFO mappings')
+    fallback_disease_synonyms = extract_disease_synonyms_batch(fallback_diseases, nodesynonymizer, resolver)
+    resolver.close()
     
     for row in tqdm(MDBcorrelation.to_numpy(), desc='Generating disease and species mapping dict'):
         _, microbe, disease, _, pmid, _, _, _, disease_name, efo_id, disease_annotation, species_name, ncit_id, species_annotation = row
@@ -211,16 +176,15 @@ if __name__ == "__main__":
 
         efo_id = str(efo_id)
         efo_id = efo_id.replace('_',':')
-        synonyms = oxo_class.get_mappings(efo_id, distance=1)    
-        if synonyms and len(synonyms[efo_id]) > 0:
-            synonyms = synonyms[efo_id]
+        if efo_id in efo_to_synonyms:
+            synonyms = efo_to_synonyms[efo_id]
         else:
             continue
         
         synonyms = [efo_id] + [change_prefix(synonym) for synonym in synonyms if change_prefix(synonym)]
         disease_node_ids = list(set([kg.find_node_by_synonym(x) for x in synonyms if kg.find_node_by_synonym(x)]))
         if len(disease_node_ids) == 0:
-            synonyms = extract_disease_synonyms(disease, nodesynonymizer, umls_class, args.umls_api_key)
+            synonyms = fallback_disease_synonyms.get(disease, [])
             if len(synonyms) != 0:
                 disease_node_ids = list(set([kg.find_node_by_synonym(x) for x in synonyms if kg.find_node_by_synonym(x)]))
                 if len(disease_node_ids) == 0:
@@ -303,6 +267,7 @@ if __name__ == "__main__":
 
 
     # Save the knowledge graph
+    logger.info(f"NodeSynonymizer result cache: {nodesynonymizer.get_cache_info()}")
     logger.info("Saving the knowledge graph...")
     kg.save_graph(save_dir = args.output_dir, node_filename = 'KG_nodes_v5.tsv', edge_filename = 'KG_edges_v5.tsv')
     logger.info("KG node is saved to {}".format(os.path.join(args.output_dir, 'KG_nodes_v5.tsv')))
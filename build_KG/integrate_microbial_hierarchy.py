@@ -5,14 +5,55 @@ This script is used to integrate all microbial hierarchical data into a knolwedg
 ## Import standard libraries
 import os
 import sys
-from tqdm import tqdm, trange
-from glob import glob
 import pandas as pd
 import argparse
 import logging
 
 ## Import custom libraries
-from utils import get_logger, check_files, read_tsv_file, Node, Edge, KnowledgeGraph
+from utils import get_logger, check_files, read_tsv_file, Node, KnowledgeGraph
+
+NCBI_TAXONOMY_URL = "https://www.ncbi.nlm.nih.gov/Taxonomy/Browser/wwwtax.cgi"
+
+def get_taxa(taxa, ranks, taxids, kg_source, name_mapping):
+    """
+    Convert one side (parent or child) of a hierarchy table into a taxon table.
+    :param taxa: a pandas Series of taxon names (or GTDB genome accessions with 'GB_'/'RS_' prefixes)
+    :param ranks: a pandas Series of taxon ranks
+    :param taxids: a pandas Series of NCBI taxon ids ('' if unknown)
+    :param kg_source: 'NCBI' or 'GTDB'
+    :param name_mapping: a dictionary mapping GTDB genome accessions to NCBI organism names
+    :return: a dataframe with columns 'synonym', 'name', 'rank', 'taxid' and 'link' (a list)
+    """
+    taxid_links = [f"{NCBI_TAXONOMY_URL}?mode=Info&id={taxid}" if taxid != '' else None for taxid in taxids]
+    if kg_source == 'NCBI':
+        names = taxa
+        synonyms = 'NCBI:' + taxa
+        links = [[taxid_link] if taxid_link else [f"{NCBI_TAXONOMY_URL}?name={name}"] for name, taxid_link in zip(names, taxid_links)]
+    else:
+        is_genome = taxa.str.split('_').str[0].isin(['GB', 'RS'])
+        names = taxa.where(~is_genome, taxa.map(name_mapping))
+        accessions = taxa.where(~is_genome, taxa.str.replace('GB_', '', regex=False).str.replace('RS_', '', regex=False))
+        synonyms = 'GTDB:' + accessions
+        links = [([f"https://gtdb.ecogenomic.org/genome?gid={accession}", f"https://www.ncbi.nlm.nih.gov/assembly/{accession}"] if genome_flag else []) + ([taxid_link] if taxid_link else [])
+                 for accession, genome_flag, taxid_link in zip(accessions, is_genome, taxid_links)]
+    return pd.DataFrame({'synonym': synonyms.to_numpy(), 'name': names.to_numpy(), 'rank': ranks.to_numpy(), 'taxid': taxids.to_numpy(), 'link': links})
+
+def get_taxon_nodes(taxa, kg_source):
+    """
+    Merge the rows of a taxon table into one Microbe node per synonym.
+    """
+    taxa = taxa.drop_duplicates(subset=['synonym', 'name', 'rank', 'taxid'])
+    merged_taxa = {}
+    for synonym, name, rank, taxid, link in taxa[['synonym', 'name', 'rank', 'taxid', 'link']].itertuples(index=False, name=None):
+        if synonym not in merged_taxa:
+            merged_taxa[synonym] = ([], [], [])
+        all_names, description, links = merged_taxa[synonym]
+        if isinstance(name, str):
+            all_names.append(name)
+        description += [('rank', rank), ('taxid', taxid)]
+        links += link
+    return [Node(node_type="Microbe", all_names=all_names, description=description, knowledge_source=[kg_source], synonyms=[synonym], link=links)
+            for synonym, (all_names, description, links) in merged_taxa.items()]
 
 if __name__ == "__main__":
     parser = argparse.ArgumentParser(description='Integrate all microbial hierarchical data into a knolwedge graph')
@@ -55,64 +96,21 @@ if __name__ == "__main__":
     for microbial_hierarchy_file in microbial_hierarchy_files:
         microbial_hierarchy_file_path = os.path.join(args.data_dir, microbial_hierarchy_file)
         logger.info("Reading {}...".format(microbial_hierarchy_file_path))
-        temp_data = read_tsv_file(microbial_hierarchy_file_path)
-        temp_df = pd.DataFrame(temp_data[1:], columns=temp_data[0])
-        for row in tqdm(temp_df.to_numpy(), desc="Integrating {}...".format(microbial_hierarchy_file), total=len(temp_df)):
-            if microbial_hierarchy_file.split('_')[0] in ['viruses', 'fungi']:
-                kg_source = 'NCBI'
-                source_synonyms = [f"NCBI:{row[0]}"]
-                source_name = [row[0]]
-                if row[2] == '':
-                    source_link = [f"https://www.ncbi.nlm.nih.gov/Taxonomy/Browser/wwwtax.cgi?name={row[0]}"]
-                else:
-                    source_link = [f"https://www.ncbi.nlm.nih.gov/Taxonomy/Browser/wwwtax.cgi?mode=Info&id={row[2]}"]
-                target_synonyms = [f"NCBI:{row[3]}"]
-                target_name = [row[3]]
-                if row[5] == '':
-                    target_link = [f"https://www.ncbi.nlm.nih.gov/Taxonomy/Browser/wwwtax.cgi?name={row[3]}"]
-                else:
-                    target_link = [f"https://www.ncbi.nlm.nih.gov/Taxonomy/Browser/wwwtax.cgi?mode=Info&id={row[5]}"]
-            elif microbial_hierarchy_file.split('_')[0] in ['bacteria', 'archaea']:
-                kg_source = 'GTDB'
-                if row[0].split('_')[0] in ['GB', 'RS']:
-                    source_name = [name_mapping[row[0]]]
-                    row[0] = row[0].replace('GB_', '').replace('RS_', '')
-                    source_link = [f"https://gtdb.ecogenomic.org/genome?gid={row[0]}"]
-                    source_link += [f"https://www.ncbi.nlm.nih.gov/assembly/{row[0]}"]
-                    if row[2] != '':
-                        source_link += [f"https://www.ncbi.nlm.nih.gov/Taxonomy/Browser/wwwtax.cgi?mode=Info&id={row[2]}"]
-                else:
-                    source_name = [row[0]]
-                    if row[2] != '':
-                        source_link = [f"https://www.ncbi.nlm.nih.gov/Taxonomy/Browser/wwwtax.cgi?mode=Info&id={row[2]}"]
-                    else:
-                        source_link = []
-                source_synonyms = [f"GTDB:{row[0]}"]
-                
-                if row[3].split('_')[0] in ['GB', 'RS']:
-                    target_name = [name_mapping[row[3]]]
-                    row[3] = row[3].replace('GB_', '').replace('RS_', '')
-                    target_link = [f"https://gtdb.ecogenomic.org/genome?gid={row[3]}"]
-                    target_link += [f"https://www.ncbi.nlm.nih.gov/assembly/{row[3]}"]
-                    if row[5] != '':
-                        target_link += [f"https://www.ncbi.nlm.nih.gov/Taxonomy/Browser/wwwtax.cgi?mode=Info&id={row[5]}"]
-                else:
-                    target_name = [row[3]]
-                    if row[5] != '':
-                        target_link = [f"https://www.ncbi.nlm.nih.gov/Taxonomy/Browser/wwwtax.cgi?mode=Info&id={row[5]}"]
-                    else:
-                        target_link = []
-                target_synonyms = [f"GTDB:{row[3]}"]
-
-            source_node = Node(node_type="Microbe", all_names=source_name, description=[('rank',row[1]), ('taxid', row[2])], knowledge_source=[kg_source], synonyms=source_synonyms, link=source_link)
-            target_node = Node(node_type="Microbe", all_names=target_name, description=[('rank',row[4]), ('taxid', row[5])], knowledge_source=[kg_source], synonyms=target_synonyms, link=target_link)
-
-            # Add nodes to the knowledge graph
-            kg.add_node(source_node)
-            kg.add_node(target_node)
-            # Add edge to the knowledge graph
-            kg.add_edge(Edge(source_node=source_synonyms[0], target_node=target_synonyms[0], predicate='biolink:superclass_of', knowledge_source=[kg_source]))
-            kg.add_edge(Edge(source_node=target_synonyms[0], target_node=source_synonyms[0], predicate='biolink:subclass_of', knowledge_source=[kg_source]))
+        temp_df = pd.read_csv(microbial_hierarchy_file_path, sep='\t', header=0, dtype=str, keep_default_na=False)
+        parent, parent_rank, parent_taxid, child, child_rank, child_taxid = [temp_df[column] for column in temp_df.columns[:6]]
+        if microbial_hierarchy_file.split('_')[0] in ['viruses', 'fungi']:
+            kg_source = 'NCBI'
+        elif microbial_hierarchy_file.split('_')[0] in ['bacteria', 'archaea']:
+            kg_source = 'GTDB'
+        else:
+            logger.warning(f"Skip {microbial_hierarchy_file} because its kingdom is unknown")
+            continue
+        parent_taxa = get_taxa(parent, parent_rank, parent_taxid, kg_source, name_mapping)
+        child_taxa = get_taxa(child, child_rank, child_taxid, kg_source, name_mapping)
+        # parent and child taxa are interleaved row by row, so node ids are numbered in the same order as when each row was added on its own
+        taxon_nodes = get_taxon_nodes(pd.concat([parent_taxa, child_taxa]).sort_index(kind='stable'), kg_source)
+        new_count, merged_count = kg.add_hierarchy(parent_taxa['synonym'], child_taxa['synonym'], taxon_nodes, kg_source)
+        logger.info(f"{microbial_hierarchy_file}: {len(temp_df)} hierarchy pairs, {new_count} new nodes, {merged_count} merged nodes")
 
 
     # Save the knowledge graph
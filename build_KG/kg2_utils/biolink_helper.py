@@ -1,9 +1,10 @@
 #!/bin/env python3
 """
-Usage:  python biolink_helper.py [biolink version number, e.g. 3.0.3]
+Usage:  python biolink_helper.py [biolink version number, e.g. 3.0.3] [--biolink_yaml path/to/biolink-model.yaml]
 """
 
 import argparse
+import hashlib
 import json
 import os
 import pathlib
@@ -15,17 +16,24 @@ import requests
 import yaml
 from treelib import Tree
 
+BIOLINK_LOOKUP_KINDS = ("categories", "predicates", "category_mixins", "predicate_mixins", "aspects", "directions")
+COMPILED_LOOKUP_FORMAT_VERSION = 1
+
 
 class BiolinkHelper:
 
-    def __init__(self, biolink_version: Optional[str] = '3.0.0', is_test: bool = False):
+    def __init__(self, biolink_version: Optional[str] = '3.0.0', is_test: bool = False, biolink_yaml_path: Optional[str] = None):
         self.biolink_version = biolink_version if biolink_version else self.get_current_arax_biolink_version()
+        self.biolink_yaml_path = biolink_yaml_path  # Local Biolink yaml to build from (avoids the network request)
         self.root_category = "biolink:NamedThing"
         self.root_predicate = "biolink:related_to"
         self.root_imaginary = "ROOT"
         biolink_helper_dir = os.path.dirname(os.path.abspath(__file__))
-        self.biolink_lookup_map_path = f"{biolink_helper_dir}/biolink_lookup_map_{self.biolink_version}_v3.pickle"
-        self.biolink_lookup_map = self._load_biolink_lookup_map(is_test=is_test)
+        # Lookups built from a local yaml are keyed by its content, so editing the yaml never reuses a stale lookup
+        lookup_key = f"{self.biolink_version}_{self._hash_file(biolink_yaml_path)}" if biolink_yaml_path else self.biolink_version
+        self.biolink_lookup_map_path = f"{biolink_helper_dir}/biolink_lookup_map_{lookup_key}_v3.pickle"
+        self.compiled_lookup_path = f"{biolink_helper_dir}/biolink_lookup_compiled_{lookup_key}_v{COMPILED_LOOKUP_FORMAT_VERSION}.pickle"
+        self._load_compiled_lookup(is_test=is_test)
         protein_like_categories = {"biolink:Protein", "biolink:Gene"}
         disease_like_categories = {"biolink:Disease", "biolink:PhenotypicFeature", "biolink:DiseaseOrPhenotypicFeature"}
         self.arax_conflations = {
@@ -45,29 +53,8 @@ class BiolinkHelper:
         """
         # TODO: Make the include_mixins work for mixin inputs? (return only categories/predicates)
         input_item_set = self._convert_to_set(biolink_items)
-        categories = input_item_set.intersection(set(self.biolink_lookup_map["categories"]))
-        predicates = input_item_set.intersection(set(self.biolink_lookup_map["predicates"]))
-        category_mixins = input_item_set.intersection(set(self.biolink_lookup_map["category_mixins"]))
-        predicate_mixins = input_item_set.intersection(set(self.biolink_lookup_map["predicate_mixins"]))
-        aspects = input_item_set.intersection(set(self.biolink_lookup_map["aspects"]))
-        directions = input_item_set.intersection(set(self.biolink_lookup_map["directions"]))
-        ancestors = input_item_set.copy()
-        ancestor_property = "ancestors_with_mixins" if include_mixins else "ancestors"
-        if include_conflations:
-            categories = set(self.add_conflations(categories))
-        for category in categories:
-            ancestors.update(self.biolink_lookup_map["categories"][category][ancestor_property])
-        for predicate in predicates:
-            ancestors.update(self.biolink_lookup_map["predicates"][predicate][ancestor_property])
-        for category_mixin in category_mixins:
-            ancestors.update(self.biolink_lookup_map["category_mixins"][category_mixin]["ancestors"])
-        for predicate_mixin in predicate_mixins:
-            ancestors.update(self.biolink_lookup_map["predicate_mixins"][predicate_mixin]["ancestors"])
-        for aspect in aspects:
-            ancestors.update(self.biolink_lookup_map["aspects"][aspect]["ancestors"])
-        for direction in directions:
-            ancestors.update(self.biolink_lookup_map["directions"][direction]["ancestors"])
-        return list(ancestors)
+        ancestors_bits = self._get_closure_bits(input_item_set, "ancestors", include_mixins, include_conflations)
+        return list(input_item_set.union(self._decode_bits(ancestors_bits)))
 
     def get_descendants(self, biolink_items: Union[str, List[str], Set[str]], include_mixins: bool = True, include_conflations: bool = True) -> List[str]:
         """
@@ -78,29 +65,21 @@ class BiolinkHelper:
         """
         # TODO: Make the include_mixins work for mixin inputs? (return only categories/predicates)
         input_item_set = self._convert_to_set(biolink_items)
-        categories = input_item_set.intersection(set(self.biolink_lookup_map["categories"]))
-        predicates = input_item_set.intersection(set(self.biolink_lookup_map["predicates"]))
-        category_mixins = input_item_set.intersection(set(self.biolink_lookup_map["category_mixins"]))
-        predicate_mixins = input_item_set.intersection(set(self.biolink_lookup_map["predicate_mixins"]))
-        aspects = input_item_set.intersection(set(self.biolink_lookup_map["aspects"]))
-        directions = input_item_set.intersection(set(self.biolink_lookup_map["directions"]))
-        descendants = input_item_set.copy()
-        descendant_property = "descendants_with_mixins" if include_mixins else "descendants"
-        if include_conflations:
-            categories = set(self.add_conflations(categories))
-        for category in categories:
-            descendants.update(self.biolink_lookup_map["categories"][category][descendant_property])
-        for predicate in predicates:
-            descendants.update(self.biolink_lookup_map["predicates"][predicate][descendant_property])
-        for category_mixin in category_mixins:
-            descendants.update(self.biolink_lookup_map["category_mixins"][category_mixin]["descendants"])
-        for predicate_mixin in predicate_mixins:
-            descendants.update(self.biolink_lookup_map["predicate_mixins"][predicate_mixin]["descendants"])
-        for aspect in aspects:
-            descendants.update(self.biolink_lookup_map["aspects"][aspect]["descendants"])
-        for direction in directions:
-            descendants.update(self.biolink_lookup_map["directions"][direction]["descendants"])
-        return list(descendants)
+        descendants_bits = self._get_closure_bits(input_item_set, "descendants", include_mixins, include_conflations)
+        return list(input_item_set.union(self._decode_bits(descendants_bits)))
+
+    def is_ancestor(self, ancestor: str, biolink_item: str, include_mixins: bool = True, include_conflations: bool = True) -> bool:
+        """
+        Returns whether the first Biolink item is an ancestor of (or the same as) the second one. This is a single bit
+        test against the precomputed closures, so it is much cheaper than checking membership in get_ancestors().
+        """
+        if ancestor == biolink_item:
+            return True
+        ancestor_id = self._item_ids.get(ancestor)
+        if ancestor_id is None:
+            return False
+        ancestors_bits = self._get_closure_bits({biolink_item}, "ancestors", include_mixins, include_conflations)
+        return bool(ancestors_bits >> ancestor_id & 1)
 
     def get_canonical_predicates(self, predicates: Union[str, List[str], Set[str]]) -> List[str]:
         """
@@ -126,8 +105,8 @@ class BiolinkHelper:
 
     def replace_mixins_with_direct_mappings(self, biolink_items: Union[str, List[str], Set[str]]) -> List[str]:
         input_item_set = self._convert_to_set(biolink_items)
-        category_mixins = input_item_set.intersection(set(self.biolink_lookup_map["category_mixins"]))
-        predicate_mixins = input_item_set.intersection(set(self.biolink_lookup_map["predicate_mixins"]))
+        category_mixins = input_item_set.intersection(self._kind_items["category_mixins"])
+        predicate_mixins = input_item_set.intersection(self._kind_items["predicate_mixins"])
         non_mixins = input_item_set.difference(category_mixins).difference(predicate_mixins)
         mixin_direct_mappings = set()
         for category_mixin in category_mixins:
@@ -143,9 +122,7 @@ class BiolinkHelper:
         Removes any predicate or category mixins in the input list.
         """
         input_item_set = self._convert_to_set(biolink_items)
-        all_predicate_mixins = set(self.biolink_lookup_map["predicate_mixins"])
-        all_category_mixins = set(self.biolink_lookup_map["category_mixins"])
-        non_mixin_items = input_item_set.difference(all_predicate_mixins).difference(all_category_mixins)
+        non_mixin_items = input_item_set.difference(self._kind_items["predicate_mixins"]).difference(self._kind_items["category_mixins"])
         return list(non_mixin_items)
 
     def add_conflations(self, categories: Union[str, List[str], Set[str]]) -> List[str]:
@@ -176,33 +153,109 @@ class BiolinkHelper:
 
     # ------------------------------------- Internal methods -------------------------------------------------- #
 
+    def _load_compiled_lookup(self, is_test: bool = False):
+        compiled_lookup_file = pathlib.Path(self.compiled_lookup_path)
+        compiled_lookup = None
+        if not is_test and compiled_lookup_file.exists():
+            with open(self.compiled_lookup_path, "rb") as compiled_file:
+                compiled_lookup = pickle.load(compiled_file)
+            if compiled_lookup.get("format_version") != COMPILED_LOOKUP_FORMAT_VERSION:
+                compiled_lookup = None
+        if compiled_lookup is None:
+            compiled_lookup = self._compile_biolink_lookup(self._load_biolink_lookup_map(is_test=is_test))
+            if not is_test:  # Test builds leave no files behind
+                with open(self.compiled_lookup_path, "wb") as output_file:
+                    pickle.dump(compiled_lookup, output_file)
+
+        self.biolink_lookup_map = compiled_lookup["lookup_map"]
+        self._item_names = compiled_lookup["item_names"]
+        self._item_ids = {item: item_id for item_id, item in enumerate(self._item_names)}
+        self._kind_items = {kind: frozenset(self.biolink_lookup_map[kind]) for kind in BIOLINK_LOOKUP_KINDS}
+        self._closure_bits = compiled_lookup["closure_bits"]
+
+    def _compile_biolink_lookup(self, biolink_lookup_map: dict) -> dict:
+        """
+        Interns every Biolink item into an integer id and stores each ancestor/descendant closure as an int bitset
+        over those ids, so closure unions are integer ORs.
+        """
+        closure_properties = ("ancestors", "descendants", "ancestors_with_mixins", "descendants_with_mixins")
+        item_names = set()
+        for kind in BIOLINK_LOOKUP_KINDS:
+            for item, info in biolink_lookup_map[kind].items():
+                item_names.add(item)
+                for closure_property in closure_properties:
+                    item_names.update(info.get(closure_property, set()))
+        item_names = sorted(item_names)
+        item_ids = {item: item_id for item_id, item in enumerate(item_names)}
+        closure_bits = dict()
+        for kind in BIOLINK_LOOKUP_KINDS:
+            for closure_property in closure_properties:
+                closure_bits[(kind, closure_property)] = {item: sum(1 << item_ids[relative] for relative in info[closure_property])
+                                                          for item, info in biolink_lookup_map[kind].items()
+                                                          if closure_property in info}
+        return {"format_version": COMPILED_LOOKUP_FORMAT_VERSION,
+                "biolink_version": self.biolink_version,
+                "lookup_map": biolink_lookup_map,
+                "item_names": item_names,
+                "closure_bits": closure_bits}
+
+    def _get_closure_bits(self, input_item_set: Set[str], direction: str, include_mixins: bool, include_conflations: bool) -> int:
+        # Mixins, aspects and directions only have plain closures; categories/predicates may also include their mixins
+        closure_property = f"{direction}_with_mixins" if include_mixins else direction
+        categories = input_item_set.intersection(self._kind_items["categories"])
+        if include_conflations:
+            categories = set(self.add_conflations(categories))
+        bits = 0
+        for category in categories:
+            bits |= self._closure_bits[("categories", closure_property)].get(category, 0)
+        for kind in BIOLINK_LOOKUP_KINDS[1:]:
+            kind_property = closure_property if kind == "predicates" else direction
+            kind_bits = self._closure_bits[(kind, kind_property)]
+            for item in input_item_set.intersection(self._kind_items[kind]):
+                bits |= kind_bits[item]
+        return bits
+
+    def _decode_bits(self, bits: int) -> Set[str]:
+        items = set()
+        while bits:
+            lowest_bit = bits & -bits
+            items.add(self._item_names[lowest_bit.bit_length() - 1])
+            bits ^= lowest_bit
+        return items
+
     def _load_biolink_lookup_map(self, is_test: bool = False):
         lookup_map_file = pathlib.Path(self.biolink_lookup_map_path)
         if is_test or not lookup_map_file.exists():
             # Parse the relevant Biolink yaml file and create/save local indexes
-            return self._create_biolink_lookup_map()
+            return self._create_biolink_lookup_map(save=not is_test)
         else:
             # A local file already exists for this Biolink version, so just load it
             with open(self.biolink_lookup_map_path, "rb") as biolink_map_file:
                 biolink_lookup_map = pickle.load(biolink_map_file)
             return biolink_lookup_map
 
-    def _create_biolink_lookup_map(self) -> Dict[str, Dict[str, Dict[str, Union[str, List[str], bool]]]]:
+    def _create_biolink_lookup_map(self, save: bool = True) -> Dict[str, Dict[str, Dict[str, Union[str, List[str], bool]]]]:
         print(f"INFO: Building local Biolink {self.biolink_version} ancestor/descendant lookup map because one "
               f"doesn't yet exist")
         biolink_lookup_map = {"predicates": dict(), "categories": dict(),
                               "predicate_mixins": dict(), "category_mixins": dict(),
                               "aspects": dict(), "directions": dict()}
-        # Grab the relevant Biolink yaml file
-        response = requests.get(f"https://raw.githubusercontent.com/biolink/biolink-model/{self.biolink_version}/biolink-model.yaml",
-                                timeout=10)
-        if response.status_code != 200:  # Sometimes Biolink's tags start with 'v', so try that
-            response = requests.get(f"https://raw.githubusercontent.com/biolink/biolink-model/v{self.biolink_version}/biolink-model.yaml",
+        # Grab the relevant Biolink yaml file (from disk if a local copy was given)
+        if self.biolink_yaml_path:
+            with open(self.biolink_yaml_path) as biolink_yaml_file:
+                biolink_yaml_text = biolink_yaml_file.read()
+            status_code = 200
+        else:
+            response = requests.get(f"https://raw.githubusercontent.com/biolink/biolink-model/{self.biolink_version}/biolink-model.yaml",
                                     timeout=10)
+            if response.status_code != 200:  # Sometimes Biolink's tags start with 'v', so try that
+                response = requests.get(f"https://raw.githubusercontent.com/biolink/biolink-model/v{self.biolink_version}/biolink-model.yaml",
+                                        timeout=10)
+            biolink_yaml_text, status_code = response.text, response.status_code
 
-        if response.status_code == 200:
+        if status_code == 200:
             # Build predicate, category, and mixin trees from the Biolink yaml
-            biolink_model = yaml.safe_load(response.text)
+            biolink_model = yaml.safe_load(biolink_yaml_text)
             predicate_tree, canonical_predicate_map, predicate_to_mixins_map, \
                 predicate_mixin_tree, symmetric_predicates = self._build_predicate_trees(biolink_model)
             mixin_to_predicates_map = self._reverse_map(predicate_to_mixins_map)
@@ -287,15 +340,16 @@ class BiolinkHelper:
             del biolink_lookup_map["directions"][self.root_imaginary]  # No longer need this imaginary root node
 
             # And cache it (never needs to be refreshed for the given Biolink version)
-            with open(self.biolink_lookup_map_path, "wb") as output_file:
-                pickle.dump(biolink_lookup_map, output_file)  # Use pickle so we can save Sets
-            # Also save a JSON version to help with debugging
-            json_file_path = self.biolink_lookup_map_path.replace(".pickle", ".json")
-            with open(json_file_path, "w+") as output_json_file:
-                json.dump(biolink_lookup_map, output_json_file, default=self._serialize_with_sets, indent=4)
+            if save:
+                with open(self.biolink_lookup_map_path, "wb") as output_file:
+                    pickle.dump(biolink_lookup_map, output_file)  # Use pickle so we can save Sets
+                # Also save a JSON version to help with debugging
+                json_file_path = self.biolink_lookup_map_path.replace(".pickle", ".json")
+                with open(json_file_path, "w+") as output_json_file:
+                    json.dump(biolink_lookup_map, output_json_file, default=self._serialize_with_sets, indent=4)
         else:
             raise RuntimeError(f"ERROR: Request to get Biolink {self.biolink_version} YAML file returned "
-                               f"{response.status_code} response. Cannot load BiolinkHelper.")
+                               f"{status_code} response. Cannot load BiolinkHelper.")
 
         return biolink_lookup_map
 
@@ -447,6 +501,11 @@ class BiolinkHelper:
         else:
             return set()
 
+    @staticmethod
+    def _hash_file(file_path: str) -> str:
+        with open(file_path, "rb") as input_file:
+            return hashlib.sha256(input_file.read()).hexdigest()[:16]
+
     @staticmethod
     def _serialize_with_sets(obj: any) -> any:
         return list(obj) if isinstance(obj, set) else obj
@@ -463,9 +522,10 @@ class BiolinkHelper:
 def main():
     arg_parser = argparse.ArgumentParser()
     arg_parser.add_argument('version', nargs='?', help="The Biolink Model version number to use")
+    arg_parser.add_argument('--biolink_yaml', type=str, help="Local Biolink Model yaml file to build the lookup from")
     args = arg_parser.parse_args()
 
-    bh = BiolinkHelper(biolink_version=args.version, is_test=True)
+    bh = BiolinkHelper(biolink_version=args.version, is_test=True, biolink_yaml_path=args.biolink_yaml)
 
     # Test descendants
     chemical_entity_descendants = bh.get_descendants("biolink:ChemicalEntity", include_mixins=True)
@@ -492,6 +552,11 @@ def main():
     affects_descendants = bh.get_descendants("biolink:affects")
     assert "biolink:treats" in affects_descendants
 
+    # Test single ancestor checks
+    assert bh.is_ancestor("biolink:NamedThing", "biolink:Protein")
+    assert not bh.is_ancestor("biolink:Protein", "biolink:NamedThing")
+    assert bh.is_ancestor("biolink:related_to", "biolink:treats")
+
     # Test lists
     combined_ancestors = bh.get_ancestors(["biolink:Gene", "biolink:Drug"])
     assert "biolink:Drug" in combined_ancestors
@@ -6,7 +6,9 @@ import pathlib
 import sqlite3
 import string
 import sys
-from collections import defaultdict
+import threading
+import warnings
+from collections import defaultdict, OrderedDict
 from typing import Optional, Union, List, Set, Dict, Tuple
 
 import pandas as pd
@@ -18,13 +20,65 @@ from kg2_utils.models.attribute import Attribute
 from kg2_utils.models.retrieval_source import RetrievalSource
 
 
+class LRUCache:
+    """
+    Bounded, thread-safe least-recently-used cache with hit/miss counters.
+    """
+
+    def __init__(self, maxsize: int):
+        self.maxsize = maxsize
+        self.hits = 0
+        self.misses = 0
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key: tuple) -> Tuple[bool, any]:
+        with self._lock:
+            if key in self._data:
+                self._data.move_to_end(key)
+                self.hits += 1
+                return True, self._data[key]
+            self.misses += 1
+            return False, None
+
+    def put(self, key: tuple, value: any):
+        if self.maxsize <= 0:
+            return
+        with self._lock:
+            self._data[key] = value
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+            self.hits = 0
+            self.misses = 0
+
+    def info(self) -> dict:
+        with self._lock:
+            return {"hits": self.hits, "misses": self.misses, "size": len(self._data), "maxsize": self.maxsize}
+
+
 class NodeSynonymizer:
 
-    def __init__(self, databaseLocation: str, databaseName: str):
+    def __init__(self, databaseLocation: str, databaseName: str, members_index_path: Optional[str] = None,
+                 read_only: bool = True, mmap_size: int = 2 ** 30, page_cache_kib: int = 262144,
+                 result_cache_size: int = 100000):
         self.databaseLocation = databaseLocation
         self.databaseName = databaseName
         self.database_path = f"{self.databaseLocation}/{self.databaseName}"
-        self.placeholder_lookup_values_str = "**LOOKUP_VALUES_GO_HERE**"
+        # The synonymizer is never written to during a build, so by default it is opened read-only with memory-mapped
+        # I/O; parallel integrator processes map the same file and so share its pages through the OS page cache
+        self.read_only = read_only
+        self.mmap_size = mmap_size
+        self.page_cache_kib = page_cache_kib
+        self.result_cache = LRUCache(result_cache_size)  # Per-CURIE lookup results
+        # Optional companion index with decoded cluster memberships (see build_members_index)
+        self.members_index_path = members_index_path if members_index_path else get_members_index_path(self.database_path)
+        self.use_members_index = False
+        self.lookup_table_name = "temp.lookup_values"
         self.unnecessary_chars_map = {ord(char): None for char in string.punctuation + string.whitespace}
         self.kg2_infores_curie = "infores:rtx-kg2"
         self.sri_nn_infores_curie = "infores:sri-node-normalizer"
@@ -34,7 +88,14 @@ class NodeSynonymizer:
             raise ValueError(f"Synonymizer specified in config_dbs file does not exist locally, even after "
                              f"running the database manager! It should be at: {self.database_path}")
         else:
-            self.db_connection = sqlite3.connect(self.database_path)
+            if self.read_only:
+                self.db_connection = sqlite3.connect(self._get_read_only_uri(self.database_path), uri=True)
+            else:
+                self.db_connection = sqlite3.connect(self.database_path)
+            self._configure_connection()
+            self._create_lookup_table()
+            if pathlib.Path(self.members_index_path).exists():
+                self._attach_members_index()
 
     def __del__(self):
         if hasattr(self, "db_connection"):
@@ -49,40 +110,41 @@ class NodeSynonymizer:
         # Convert any input values to Set format
         curies_set = self._convert_to_set_format(curies)
         names_set = self._convert_to_set_format(names)
-        results_dict = dict()
+        cache_key = ("canonical", return_all_categories)
+        results_dict, uncached_curies_set = self._get_cached_results(curies_set, cache_key)
 
-        if curies_set:
+        if uncached_curies_set:
             # First transform curies so that their prefixes are entirely uppercase
-            curies_to_capitalized_curies, capitalized_curies = self._map_to_capitalized_curies(curies_set)
+            curies_to_capitalized_curies, capitalized_curies = self._map_to_capitalized_curies(uncached_curies_set)
 
             # Query the synonymizer sqlite database for these identifiers
-            sql_query_template = f"""
+            sql_query = f"""
                         SELECT N.id_simplified, N.cluster_id, C.name, C.category
-                        FROM nodes as N
-                        INNER JOIN clusters as C on C.cluster_id == N.cluster_id
-                        WHERE N.id_simplified in ('{self.placeholder_lookup_values_str}')"""
-            matching_rows = self._run_sql_query_in_batches(sql_query_template, capitalized_curies)
+                        FROM {self.lookup_table_name} as L
+                        INNER JOIN nodes as N on N.id_simplified == L.value
+                        INNER JOIN clusters as C on C.cluster_id == N.cluster_id"""
+            matching_rows = self._run_sql_query_with_lookup_values(sql_query, capitalized_curies)
 
             # Transform the results into the proper response format
             results_dict_capitalized = {row[0]: self._create_preferred_node_dict(preferred_id=row[1],
                                                                                  preferred_category=row[3],
                                                                                  preferred_name=row[2])
                                         for row in matching_rows}
-            results_dict = {input_curie: results_dict_capitalized[capitalized_curie]
-                            for input_curie, capitalized_curie in curies_to_capitalized_curies.items()
-                            if capitalized_curie in results_dict_capitalized}
+            results_dict.update({input_curie: results_dict_capitalized[capitalized_curie]
+                                 for input_curie, capitalized_curie in curies_to_capitalized_curies.items()
+                                 if capitalized_curie in results_dict_capitalized})
 
         if names_set:
             # First transform to simplified names (lowercase, no punctuation/whitespace)
             names_to_simplified_names, simplified_names = self._map_to_simplified_names(names_set)
 
             # Query the synonymizer sqlite database for these names
-            sql_query_template = f"""
+            sql_query = f"""
                         SELECT N.id, N.name_simplified, N.cluster_id, C.name, C.category
-                        FROM nodes as N
-                        INNER JOIN clusters as C on C.cluster_id == N.cluster_id
-                        WHERE N.name_simplified in ('{self.placeholder_lookup_values_str}')"""
-            matching_rows = self._run_sql_query_in_batches(sql_query_template, simplified_names)
+                        FROM {self.lookup_table_name} as L
+                        INNER JOIN nodes as N on N.name_simplified == L.value
+                        INNER JOIN clusters as C on C.cluster_id == N.cluster_id"""
+            matching_rows = self._run_sql_query_with_lookup_values(sql_query, simplified_names)
 
             # For each simplified name, pick the cluster that nodes with that simplified name most often belong to
             names_to_best_cluster_id = self._count_clusters_per_name(matching_rows, name_index=1, cluster_id_index=2)
@@ -108,12 +170,13 @@ class NodeSynonymizer:
         # Tack on all categories, if asked for (infrequent enough that it's ok to have an extra query for this)
         if return_all_categories:
             cluster_ids = {canonical_info["preferred_curie"]
-                           for canonical_info in results_dict.values()}
-            sql_query_template = f"""
+                           for canonical_info in results_dict.values()
+                           if canonical_info and "all_categories" not in canonical_info}
+            sql_query = f"""
                         SELECT N.cluster_id, N.category
-                        FROM nodes as N
-                        WHERE N.cluster_id in ('{self.placeholder_lookup_values_str}')"""
-            matching_rows = self._run_sql_query_in_batches(sql_query_template, cluster_ids)
+                        FROM {self.lookup_table_name} as L
+                        INNER JOIN nodes as N on N.cluster_id == L.value"""
+            matching_rows = self._run_sql_query_with_lookup_values(sql_query, cluster_ids)
 
             # Count up how many members this cluster has with different categories
             clusters_by_category_counts = defaultdict(lambda: defaultdict(int))
@@ -123,6 +186,8 @@ class NodeSynonymizer:
 
             # Add the counts to our response
             for canonical_info in results_dict.values():
+                if not canonical_info or "all_categories" in canonical_info:
+                    continue
                 cluster_id = canonical_info["preferred_curie"]
                 category_counts = clusters_by_category_counts[cluster_id]
                 canonical_info["all_categories"] = dict(category_counts)
@@ -132,6 +197,7 @@ class NodeSynonymizer:
         for unrecognized_value in unrecognized_input_values:
             results_dict[unrecognized_value] = None
 
+        self._cache_results(uncached_curies_set.difference(names_set), results_dict, cache_key)
         return results_dict
 
     def get_equivalent_nodes(self, curies: Optional[Union[str, Set[str], List[str]]] = None,
@@ -141,51 +207,49 @@ class NodeSynonymizer:
         # Convert any input values to Set format
         curies_set = self._convert_to_set_format(curies)
         names_set = self._convert_to_set_format(names)
-        results_dict = dict()
+        cache_key = ("equivalent",)
+        results_dict, uncached_curies_set = self._get_cached_results(curies_set, cache_key)
+        if not include_unrecognized_entities:
+            results_dict = {curie: equivalent_curies for curie, equivalent_curies in results_dict.items() if equivalent_curies is not None}
 
-        if curies_set:
+        if uncached_curies_set:
             # First transform curies so that their prefixes are entirely uppercase
-            curies_to_capitalized_curies, capitalized_curies = self._map_to_capitalized_curies(curies_set)
+            curies_to_capitalized_curies, capitalized_curies = self._map_to_capitalized_curies(uncached_curies_set)
 
-            # Query the synonymizer sqlite database for these identifiers (in batches, if necessary)
-            sql_query_template = f"""
-                        SELECT N.id_simplified, C.member_ids
-                        FROM nodes as N
-                        INNER JOIN clusters as C on C.cluster_id == N.cluster_id
-                        WHERE N.id_simplified in ('{self.placeholder_lookup_values_str}')"""
-            matching_rows = self._run_sql_query_in_batches(sql_query_template, capitalized_curies)
+            # Query the synonymizer sqlite database for these identifiers
+            sql_query = f"""
+                        SELECT N.id_simplified, N.cluster_id
+                        FROM {self.lookup_table_name} as L
+                        INNER JOIN nodes as N on N.id_simplified == L.value"""
+            matching_rows = self._run_sql_query_with_lookup_values(sql_query, capitalized_curies)
+            cluster_members = self._get_cluster_members({row[1] for row in matching_rows})
 
             # Transform the results into the proper response format
-            results_dict_capitalized = {row[0]: ast.literal_eval(row[1]) for row in matching_rows}
-            results_dict = {input_curie: results_dict_capitalized[capitalized_curie]
-                            for input_curie, capitalized_curie in curies_to_capitalized_curies.items()
-                            if capitalized_curie in results_dict_capitalized}
+            results_dict_capitalized = {row[0]: cluster_members[row[1]] for row in matching_rows if row[1] in cluster_members}
+            results_dict.update({input_curie: list(results_dict_capitalized[capitalized_curie])
+                                 for input_curie, capitalized_curie in curies_to_capitalized_curies.items()
+                                 if capitalized_curie in results_dict_capitalized})
 
         if names_set:
             # First transform to simplified names (lowercase, no punctuation/whitespace)
             names_to_simplified_names, simplified_names = self._map_to_simplified_names(names_set)
 
             # Query the synonymizer sqlite database for these names
-            sql_query_template = f"""
-                        SELECT N.id, N.name_simplified, C.cluster_id, C.member_ids
-                        FROM nodes as N
-                        INNER JOIN clusters as C on C.cluster_id == N.cluster_id
-                        WHERE N.name_simplified in ('{self.placeholder_lookup_values_str}')"""
-            matching_rows = self._run_sql_query_in_batches(sql_query_template, simplified_names)
+            sql_query = f"""
+                        SELECT N.id, N.name_simplified, N.cluster_id
+                        FROM {self.lookup_table_name} as L
+                        INNER JOIN nodes as N on N.name_simplified == L.value"""
+            matching_rows = self._run_sql_query_with_lookup_values(sql_query, simplified_names)
 
             # For each simplified name, pick the cluster that nodes with that simplified name most often belong to
             names_to_best_cluster_id = self._count_clusters_per_name(matching_rows, name_index=1, cluster_id_index=2)
-
-            # Create some helper maps
-            cluster_ids_to_node_id = {row[2]: row[0] for row in matching_rows}  # Doesn't matter that this gives ONE node per cluster
-            node_ids_to_rows = {row[0]: row for row in matching_rows}
-            names_to_cluster_rows = {name: node_ids_to_rows[cluster_ids_to_node_id[cluster_id]]
-                                     for name, cluster_id in names_to_best_cluster_id.items()}
+            cluster_members = self._get_cluster_members(set(names_to_best_cluster_id.values()))
 
             # Transform the results into the proper response format
-            results_dict_names_simplified = {name: ast.literal_eval(cluster_row[3])
-                                             for name, cluster_row in names_to_cluster_rows.items()}
-            results_dict_names = {input_name: results_dict_names_simplified[simplified_name]
+            results_dict_names_simplified = {name: cluster_members[cluster_id]
+                                             for name, cluster_id in names_to_best_cluster_id.items()
+                                             if cluster_id in cluster_members}
+            results_dict_names = {input_name: list(results_dict_names_simplified[simplified_name])
                                   for input_name, simplified_name in names_to_simplified_names.items()
                                   if simplified_name in results_dict_names_simplified}
 
@@ -198,8 +262,15 @@ class NodeSynonymizer:
             for unrecognized_curie in unrecognized_curies:
                 results_dict[unrecognized_curie] = None
 
+        self._cache_results(uncached_curies_set.difference(names_set), results_dict, cache_key)
         return results_dict
 
+    def get_cache_info(self) -> dict:
+        return self.result_cache.info()
+
+    def clear_cache(self):
+        self.result_cache.clear()
+
     def get_normalizer_results(self, entities: Optional[Union[str, Set[str], List[str]]]) -> dict:
 
         # First handle any special input from /entity endpoint
@@ -223,12 +294,12 @@ class NodeSynonymizer:
         # Then get info for all of those equivalent nodes
         # Note: We don't need to query by capitalized curies because these are all curies that exist in the synonymizer
         all_node_ids = set().union(*equivalent_curies_dict.values())
-        sql_query_template = f"""
+        sql_query = f"""
                     SELECT N.id, N.cluster_id, N.name, N.category, N.major_branch, N.name_sri, N.category_sri, N.name_kg2pre, N.category_kg2pre, C.name
-                    FROM nodes as N
-                    INNER JOIN clusters as C on C.cluster_id == N.cluster_id
-                    WHERE N.id in ('{self.placeholder_lookup_values_str}')"""
-        matching_rows = self._run_sql_query_in_batches(sql_query_template, all_node_ids)
+                    FROM {self.lookup_table_name} as L
+                    INNER JOIN nodes as N on N.id == L.value
+                    INNER JOIN clusters as C on C.cluster_id == N.cluster_id"""
+        matching_rows = self._run_sql_query_with_lookup_values(sql_query, all_node_ids)
         nodes_dict = {row[0]: {"identifier": row[0],
                                "category": self._add_biolink_prefix(row[3]),
                                "label": row[2],
@@ -300,8 +371,8 @@ class NodeSynonymizer:
         if canonical_info[curie_or_name]:
             cluster_id = canonical_info[curie_or_name]["preferred_curie"]
 
-            sql_query = f"SELECT member_ids, intra_cluster_edge_ids FROM clusters WHERE cluster_id = '{cluster_id}'"
-            results = self._execute_sql_query(sql_query)
+            sql_query = "SELECT member_ids, intra_cluster_edge_ids FROM clusters WHERE cluster_id = ?"
+            results = self._execute_sql_query(sql_query, (cluster_id,))
             if results:
                 cluster_row = results[0]
                 member_ids = ast.literal_eval(cluster_row[0])  # Lists are stored as strings in sqlite
@@ -309,14 +380,14 @@ class NodeSynonymizer:
                 intra_cluster_edge_ids = ast.literal_eval(
                     intra_cluster_edge_ids_str)  # Lists are stored as strings in sqlite
 
-                nodes_query = f"SELECT * FROM nodes WHERE id IN ('{self._convert_to_str_format(member_ids)}')"
-                node_rows = self._execute_sql_query(nodes_query)
+                nodes_query = f"SELECT N.* FROM {self.lookup_table_name} as L INNER JOIN nodes as N on N.id == L.value"
+                node_rows = self._run_sql_query_with_lookup_values(nodes_query, set(member_ids))
                 nodes_df = self._load_records_into_dataframe(node_rows, "nodes")
 
                 # TODO: Improve formatting! (indicate if in SRI vs. KG2pre, etc...)
                 nodes_df = nodes_df[["id", "category", "name"]]
-                edges_query = f"SELECT * FROM edges WHERE id IN ('{self._convert_to_str_format(intra_cluster_edge_ids)}')"
-                edge_rows = self._execute_sql_query(edges_query)
+                edges_query = f"SELECT E.* FROM {self.lookup_table_name} as L INNER JOIN edges as E on E.id == L.value"
+                edge_rows = self._run_sql_query_with_lookup_values(edges_query, set(intra_cluster_edge_ids))
                 edges_df = self._load_records_into_dataframe(edge_rows, "edges")
                 edges_df = edges_df[["subject", "predicate", "object", "upstream_resource_id", "primary_knowledge_source"]]
 
@@ -332,12 +403,6 @@ class NodeSynonymizer:
 
     # ---------------------------------------- INTERNAL HELPER METHODS -------------------------------------------- #
 
-    @staticmethod
-    def _convert_to_str_format(list_or_set: Union[Set[str], List[str]]) -> str:
-        preprocessed_list = [item.replace("'", "''") for item in list_or_set if item]  # Need to escape ' characters for SQL
-        list_str = "','".join(preprocessed_list)  # SQL wants ('id1', 'id2') format for string lists
-        return list_str
-
     @staticmethod
     def _convert_to_set_format(some_value: any) -> set:
         if isinstance(some_value, set):
@@ -367,15 +432,12 @@ class NodeSynonymizer:
             name = row[name_index]
             cluster_id = row[cluster_id_index]
             names_to_cluster_counts[name][cluster_id] += 1
-        names_to_best_cluster_id = {name: max(cluster_counts, key=cluster_counts.get)
+        # Ties are broken by the lowest cluster id so that the result does not depend on the row order sqlite returns
+        # (the compiled synonym index applies the same rule)
+        names_to_best_cluster_id = {name: min(cluster_counts.items(), key=lambda item: (-item[1], item[0]))[0]
                                     for name, cluster_counts in names_to_cluster_counts.items()}
         return names_to_best_cluster_id
 
-    @staticmethod
-    def _divide_into_chunks(some_set: Set[str], chunk_size: int) -> List[List[str]]:
-        some_list = list(some_set)
-        return [some_list[start:start + chunk_size] for start in range(0, len(some_list), chunk_size)]
-
     @staticmethod
     def _capitalize_curie_prefix(curie: str) -> str:
         curie_chunks = curie.split(":")
@@ -398,15 +460,15 @@ class NodeSynonymizer:
         kg.nodes = trapi_nodes
 
         # Add TRAPI edges for any intra-cluster edges
-        sql_query = f"SELECT intra_cluster_edge_ids FROM clusters WHERE cluster_id = '{cluster_id}'"
-        results = self._execute_sql_query(sql_query)
+        sql_query = "SELECT intra_cluster_edge_ids FROM clusters WHERE cluster_id = ?"
+        results = self._execute_sql_query(sql_query, (cluster_id,))
         if results:
             cluster_row = results[0]
             intra_cluster_edge_ids_str = "[]" if cluster_row[0] == "nan" else cluster_row[0]
             intra_cluster_edge_ids = ast.literal_eval(intra_cluster_edge_ids_str)  # Lists are stored as strings in sqlite
 
-            edges_query = f"SELECT * FROM edges WHERE id IN ('{self._convert_to_str_format(intra_cluster_edge_ids)}')"
-            edge_rows = self._execute_sql_query(edges_query)
+            edges_query = f"SELECT E.* FROM {self.lookup_table_name} as L INNER JOIN edges as E on E.id == L.value"
+            edge_rows = self._run_sql_query_with_lookup_values(edges_query, set(intra_cluster_edge_ids))
             edges_df = self._load_records_into_dataframe(edge_rows, "edges")
             edge_dicts = edges_df.to_dict(orient="records")
             trapi_edges = {edge["id"]: self._convert_to_trapi_edge(edge)
@@ -509,6 +571,81 @@ class NodeSynonymizer:
 
         return node
 
+    @staticmethod
+    def _get_read_only_uri(database_path: str) -> str:
+        return f"{pathlib.Path(database_path).resolve().as_uri()}?mode=ro"
+
+    def _configure_connection(self):
+        cursor = self.db_connection.cursor()
+        cursor.execute(f"PRAGMA mmap_size = {int(self.mmap_size)}")
+        cursor.execute(f"PRAGMA cache_size = -{int(self.page_cache_kib)}")  # Negative values are in KiB
+        cursor.close()
+
+    def _get_cached_results(self, curies_set: Set[str], cache_key: tuple) -> Tuple[dict, Set[str]]:
+        cached_results, uncached_curies_set = dict(), set()
+        for curie in curies_set:
+            found, value = self.result_cache.get(cache_key + (curie,))
+            if found:
+                cached_results[curie] = self._copy_result(value)
+            else:
+                uncached_curies_set.add(curie)
+        return cached_results, uncached_curies_set
+
+    def _cache_results(self, curies_set: Set[str], results_dict: dict, cache_key: tuple):
+        for curie in curies_set:
+            if curie in results_dict:
+                self.result_cache.put(cache_key + (curie,), self._copy_result(results_dict[curie]))
+
+    @staticmethod
+    def _copy_result(value: any) -> any:
+        # Callers may modify the returned dicts/lists, so the cache never hands out its own objects
+        if isinstance(value, list):
+            return list(value)
+        if isinstance(value, dict):
+            return {key: dict(item) if isinstance(item, dict) else item for key, item in value.items()}
+        return value
+
+    def _create_lookup_table(self):
+        cursor = self.db_connection.cursor()
+        cursor.execute("PRAGMA temp_store = MEMORY")
+        cursor.execute(f"CREATE TEMP TABLE IF NOT EXISTS {self.lookup_table_name.split('.')[-1]} (value TEXT PRIMARY KEY)")
+        cursor.close()
+
+    def _attach_members_index(self):
+        members_index_location = self._get_read_only_uri(self.members_index_path) if self.read_only else self.members_index_path
+        self.db_connection.execute("ATTACH DATABASE ? AS members", (members_index_location,))
+        # The index is only used if it was built from this exact synonymizer database
+        try:
+            rows = self._execute_sql_query("SELECT value FROM members.index_info WHERE key = 'source_fingerprint'")
+        except sqlite3.OperationalError:
+            rows = []
+        source_fingerprint = rows[0][0] if rows else None
+        if source_fingerprint == get_database_fingerprint(self.database_path):
+            self.use_members_index = True
+        else:
+            self.db_connection.execute("DETACH DATABASE members")
+            warnings.warn(f"Cluster membership index {self.members_index_path} was not built from {self.database_path} "
+                          f"(or is outdated) and is ignored; rebuild it with --build_members_index")
+
+    def _get_cluster_members(self, cluster_ids: Set[str]) -> Dict[str, List[str]]:
+        if self.use_members_index:
+            sql_query = f"""
+                        SELECT M.cluster_id, M.member_id
+                        FROM {self.lookup_table_name} as L
+                        INNER JOIN members.cluster_members as M on M.cluster_id == L.value
+                        ORDER BY M.cluster_id, M.member_rank"""
+            cluster_members = defaultdict(list)
+            for cluster_id, member_id in self._run_sql_query_with_lookup_values(sql_query, cluster_ids):
+                cluster_members[cluster_id].append(member_id)
+            return dict(cluster_members)
+        else:
+            sql_query = f"""
+                        SELECT C.cluster_id, C.member_ids
+                        FROM {self.lookup_table_name} as L
+                        INNER JOIN clusters as C on C.cluster_id == L.value"""
+            matching_rows = self._run_sql_query_with_lookup_values(sql_query, cluster_ids)
+            return {row[0]: ast.literal_eval(row[1]) for row in matching_rows}  # Lists are stored as strings in sqlite
+
     def _create_preferred_node_dict(self, preferred_id: str, preferred_category: str, preferred_name: Optional[str]) -> dict:
         return {
             "preferred_curie": preferred_id,
@@ -516,23 +653,26 @@ class NodeSynonymizer:
             "preferred_category": self._add_biolink_prefix(preferred_category)
         }
 
-    def _run_sql_query_in_batches(self, sql_query_template: str, lookup_values: Set[str]) -> list:
+    def _run_sql_query_with_lookup_values(self, sql_query: str, lookup_values: Set[str]) -> list:
         """
-        Sqlite has a max length allowed for SQL statements, so we divide really long curie/name lists into batches.
+        Load the lookup values into a session temp table through bound parameters and run a query joined against
+        that table, so any number of curies/names is looked up in a single pass without quoting issues.
         """
-        lookup_values_batches = self._divide_into_chunks(lookup_values, 5000)
-        all_matching_rows = []
-        for lookup_values_batch in lookup_values_batches:
-            sql_query = sql_query_template.replace(self.placeholder_lookup_values_str,
-                                                   self._convert_to_str_format(lookup_values_batch))
-            matching_rows = self._execute_sql_query(sql_query)
-            all_matching_rows += matching_rows
-        return all_matching_rows
-
-    def _execute_sql_query(self, sql_query: str) -> list:
         cursor = self.db_connection.cursor()
+        cursor.execute(f"DELETE FROM {self.lookup_table_name}")
+        cursor.executemany(f"INSERT OR IGNORE INTO {self.lookup_table_name} (value) VALUES (?)",
+                           ((lookup_value,) for lookup_value in lookup_values if lookup_value))
         cursor.execute(sql_query)
         matching_rows = cursor.fetchall()
+        cursor.execute(f"DELETE FROM {self.lookup_table_name}")
+        cursor.close()
+        self.db_connection.commit()
+        return matching_rows
+
+    def _execute_sql_query(self, sql_query: str, parameters: tuple = ()) -> list:
+        cursor = self.db_connection.cursor()
+        cursor.execute(sql_query, parameters)
+        matching_rows = cursor.fetchall()
         cursor.close()
         return matching_rows
 
@@ -554,9 +694,60 @@ class NodeSynonymizer:
         return records_df
 
 
+def get_members_index_path(database_path: str) -> str:
+    return f"{os.path.splitext(database_path)[0]}_members.sqlite"
+
+
+def get_database_fingerprint(database_path: str) -> str:
+    stat = os.stat(database_path)
+    return f"{stat.st_size}:{stat.st_mtime_ns}"
+
+
+def build_members_index(database_path: str, members_index_path: Optional[str] = None, batch_size: int = 100000) -> str:
+    """
+    Decode the member_ids of every cluster once and store them in a normalized (cluster_id, member_rank, member_id)
+    table, so that get_equivalent_nodes never has to parse Python literals at query time.
+    """
+    members_index_path = members_index_path if members_index_path else get_members_index_path(database_path)
+    temp_path = f"{members_index_path}.tmp"
+    if os.path.exists(temp_path):
+        os.remove(temp_path)
+
+    source_connection = sqlite3.connect(database_path)
+    index_connection = sqlite3.connect(temp_path)
+    index_connection.execute("PRAGMA journal_mode = OFF")
+    index_connection.execute("PRAGMA synchronous = OFF")
+    index_connection.execute("CREATE TABLE cluster_members (cluster_id TEXT, member_rank INTEGER, member_id TEXT)")
+    cursor = source_connection.cursor()
+    cursor.execute("SELECT cluster_id, member_ids FROM clusters")
+    while True:
+        rows = cursor.fetchmany(batch_size)
+        if not rows:
+            break
+        index_connection.executemany("INSERT INTO cluster_members VALUES (?, ?, ?)",
+                                     ((cluster_id, member_rank, member_id)
+                                      for cluster_id, member_ids in rows
+                                      for member_rank, member_id in enumerate(ast.literal_eval(member_ids))))
+    cursor.close()
+    index_connection.execute("CREATE INDEX idx_cluster_members_cluster_id ON cluster_members (cluster_id)")
+    # Fingerprint (size and modification time) of the source database, checked when the index is attached
+    index_connection.execute("CREATE TABLE index_info (key TEXT PRIMARY KEY, value TEXT)")
+    index_connection.execute("INSERT INTO index_info VALUES ('source_fingerprint', ?)", (get_database_fingerprint(database_path),))
+    index_connection.commit()
+    index_connection.close()
+    source_connection.close()
+    os.replace(temp_path, members_index_path)
+    return members_index_path
+
+
 def main():
     arg_parser = argparse.ArgumentParser()
-    arg_parser.add_argument("curie_or_name")
+    arg_parser.add_argument("curie_or_name", nargs="?")
+    arg_parser.add_argument("--synonymizer_dir", type=str, required=True, help="path of the synonymizer directory")
+    arg_parser.add_argument("--synonymizer_dbname", type=str, required=True, help="name of the synonymizer database")
+    # Build the decoded cluster membership index next to the synonymizer database
+    arg_parser.add_argument("--build_members_index", dest="build_members_index", action="store_true")
+    arg_parser.add_argument("--read_write", dest="read_write", action="store_true", help="open the database in read-write mode")
     # Add flags corresponding to each of the three main synonymizer methods
     arg_parser.add_argument("-c", "--canonical", dest="canonical", action="store_true")
     arg_parser.add_argument("-e", "--equivalent", dest="equivalent", action="store_true")
@@ -566,7 +757,15 @@ def main():
     arg_parser.add_argument("-g", "--graph", dest="graph", action="store_true")
     args = arg_parser.parse_args()
 
-    synonymizer = NodeSynonymizer()
+    if args.build_members_index:
+        members_index_path = build_members_index(f"{args.synonymizer_dir}/{args.synonymizer_dbname}")
+        print(f"Cluster membership index is saved to {members_index_path}")
+        if not args.curie_or_name:
+            return
+    if not args.curie_or_name:
+        arg_parser.error("curie_or_name is required unless --build_members_index is given")
+
+    synonymizer = NodeSynonymizer(args.synonymizer_dir, args.synonymizer_dbname, read_only=not args.read_write)
     if args.canonical:
         results = synonymizer.get_canonical_curies(curies=args.curie_or_name)
         if not results[args.curie_or_name]:
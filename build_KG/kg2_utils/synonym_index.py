@@ -0,0 +1,420 @@
+#!/bin/env python3
+"""
+Compact, memory-mappable synonym index compiled from the NodeSynonymizer sqlite database.
+
+Usage:  python -m kg2_utils.synonym_index compile --synonymizer_dir <dir> --synonymizer_dbname <db> --index_dir <dir>
+        python -m kg2_utils.synonym_index verify --synonymizer_dir <dir> --synonymizer_dbname <db> --index_dir <dir>
+        python -m kg2_utils.synonym_index lookup --index_dir <dir> [--prefix] <curie_or_name>
+"""
+
+import argparse
+import bisect
+import json
+import os
+import random
+import sqlite3
+import string
+import sys
+from array import array
+from typing import Optional, Union, List, Set, Dict, Tuple
+
+import numpy as np
+
+from kg2_utils.node_synonymizer import NodeSynonymizer
+
+INDEX_FORMAT_VERSION = 2
+KEY_KINDS = ("curie", "name")
+UNNECESSARY_CHARS_MAP = {ord(char): None for char in string.punctuation + string.whitespace}
+
+
+FNV_OFFSET_BASIS = np.uint64(14695981039346656037)
+FNV_PRIME = np.uint64(1099511628211)
+
+
+def hash_strings(data: np.ndarray, offsets: np.ndarray) -> np.ndarray:
+    """
+    64-bit FNV-1a hashes of the strings stored in data between consecutive offsets. The strings are processed one byte
+    column at a time for all strings at once (longest first, so the strings still being hashed are always a prefix).
+    """
+    offsets = np.asarray(offsets).astype(np.int64)
+    starts, lengths = offsets[:-1], np.diff(offsets)
+    order = np.argsort(-lengths, kind="stable")
+    starts, negative_lengths = starts[order], -lengths[order]
+    hashes = np.full(len(starts), FNV_OFFSET_BASIS, dtype=np.uint64)
+    max_length = int(-negative_lengths[0]) if len(starts) else 0
+    for column in range(max_length):
+        n_active = int(np.searchsorted(negative_lengths, -column, side="left"))
+        hashes[:n_active] ^= data[starts[:n_active] + column].astype(np.uint64)
+        hashes[:n_active] *= FNV_PRIME
+    result = np.empty_like(hashes)
+    result[order] = hashes
+    return result
+
+
+def concatenate_strings(values: List[bytes]) -> Tuple[np.ndarray, np.ndarray]:
+    data = np.frombuffer(b"".join(values), dtype=np.uint8)
+    offsets = np.zeros(len(values) + 1, dtype=np.int64)
+    np.cumsum(np.fromiter(map(len, values), dtype=np.int64, count=len(values)), out=offsets[1:])
+    return data, offsets
+
+
+def encode_strings(values: List[str]) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    utf-8 encode all values into one byte array plus offsets, with a single encode call when no value holds a NUL.
+    """
+    if not values:
+        return concatenate_strings([])
+    blob = np.frombuffer("\x00".join(values).encode("utf-8"), dtype=np.uint8)
+    separators = np.flatnonzero(blob == 0)
+    if len(separators) != len(values) - 1:
+        return concatenate_strings([value.encode("utf-8") for value in values])
+    offsets = np.empty(len(values) + 1, dtype=np.int64)
+    offsets[0], offsets[-1] = 0, len(blob) - len(separators)
+    offsets[1:-1] = separators - np.arange(len(separators))
+    return np.delete(blob, separators), offsets
+
+
+def hash_keys(keys: List[bytes]) -> np.ndarray:
+    return hash_strings(*concatenate_strings(keys))
+
+
+def _equal_strings(left_data: np.ndarray, left_offsets: np.ndarray, left_positions: np.ndarray,
+                   right_data: np.ndarray, right_offsets: np.ndarray, right_positions: np.ndarray) -> np.ndarray:
+    """
+    Pairwise byte equality of left string left_positions[i] and right string right_positions[i], for all i at once.
+    """
+    left_starts = left_offsets[left_positions].astype(np.int64)
+    right_starts = right_offsets[right_positions].astype(np.int64)
+    lengths = left_offsets[left_positions + 1].astype(np.int64) - left_starts
+    same_length = lengths == right_offsets[right_positions + 1].astype(np.int64) - right_starts
+    lengths = np.where(same_length, lengths, 0)
+    pair = np.repeat(np.arange(len(lengths)), lengths)
+    within = np.arange(len(pair)) - np.repeat(np.cumsum(lengths) - lengths, lengths)
+    differs = left_data[left_starts[pair] + within] != right_data[right_starts[pair] + within]
+    return same_length & (np.bincount(pair[differs], minlength=len(lengths)) == 0)
+
+
+def simplify_name(name: str) -> str:
+    return name.lower().translate(UNNECESSARY_CHARS_MAP)
+
+
+class _StringTable:
+    """
+    Read-only view of strings stored as one concatenated utf-8 byte array plus (n + 1) offsets.
+    """
+
+    def __init__(self, data: np.ndarray, offsets: np.ndarray):
+        self.data = data
+        self.offsets = offsets
+
+    def __len__(self) -> int:
+        return len(self.offsets) - 1
+
+    def __getitem__(self, position: int) -> bytes:
+        return self.data[self.offsets[position]:self.offsets[position + 1]].tobytes()
+
+    def get_str(self, position: int) -> str:
+        return self[position].decode("utf-8")
+
+
+class _StringTableWriter:
+
+    def __init__(self, sorted_keys: bool = False):
+        self.data = bytearray()
+        self.offsets = array("Q", [0])
+        self.sorted_keys = sorted_keys
+        self.last_value = None
+
+    def append(self, value: str) -> bytes:
+        encoded = value.encode("utf-8")
+        if self.sorted_keys:
+            # Prefix search relies on byte order, which is what sqlite's default BINARY collation produces
+            if self.last_value is not None and encoded <= self.last_value:
+                raise ValueError(f"Keys are not in strictly increasing byte order at {value!r}")
+            self.last_value = encoded
+        self.data += encoded
+        self.offsets.append(len(self.data))
+        return encoded
+
+    def save(self, index_dir: str, prefix: str):
+        np.save(os.path.join(index_dir, f"{prefix}_bytes.npy"), np.frombuffer(bytes(self.data), dtype=np.uint8))
+        np.save(os.path.join(index_dir, f"{prefix}_offsets.npy"), np.frombuffer(self.offsets, dtype=np.uint64))
+
+
+def _save_key_table(index_dir: str, kind: str, keys: _StringTableWriter, key_clusters: array):
+    keys.save(index_dir, f"{kind}_keys")
+    np.save(os.path.join(index_dir, f"{kind}_clusters.npy"), np.frombuffer(key_clusters, dtype=np.uint32))
+    # Hash-ordered copy of the keys so that exact lookups can be answered with a vectorized searchsorted
+    key_hashes = hash_strings(np.frombuffer(bytes(keys.data), dtype=np.uint8), np.frombuffer(keys.offsets, dtype=np.uint64))
+    hash_order = np.argsort(key_hashes, kind="stable").astype(np.uint32)
+    np.save(os.path.join(index_dir, f"{kind}_hashes.npy"), key_hashes[hash_order])
+    np.save(os.path.join(index_dir, f"{kind}_hash_order.npy"), hash_order)
+
+
+def compile_synonym_index(database_path: str, index_dir: str, batch_size: int = 100000) -> dict:
+    """
+    Export the CURIE -> cluster and simplified name -> cluster maps of the synonymizer into sorted key tables.
+    Keys are stored in byte order (for prefix search) and in hash order (for exact lookups); cluster ids, names and
+    categories are stored once per cluster.
+    """
+    os.makedirs(index_dir, exist_ok=True)
+    connection = sqlite3.connect(f"file:{os.path.abspath(database_path)}?mode=ro", uri=True)
+    cursor = connection.cursor()
+
+    # Clusters
+    cluster_ids, cluster_names = _StringTableWriter(), _StringTableWriter()
+    cluster_categories = array("H")
+    categories, category_to_index, cluster_id_to_index = [], {}, {}
+    cursor.execute("SELECT cluster_id, name, category FROM clusters ORDER BY cluster_id")
+    while True:
+        rows = cursor.fetchmany(batch_size)
+        if not rows:
+            break
+        for cluster_id, name, category in rows:
+            cluster_id_to_index[cluster_id] = len(cluster_id_to_index)
+            cluster_ids.append(cluster_id)
+            cluster_names.append(name if name else "")
+            category = NodeSynonymizer._add_biolink_prefix(category) if category else ""
+            if category not in category_to_index:
+                category_to_index[category] = len(categories)
+                categories.append(category)
+            cluster_categories.append(category_to_index[category])
+    cluster_ids.save(index_dir, "cluster_ids")
+    cluster_names.save(index_dir, "cluster_names")
+    np.save(os.path.join(index_dir, "cluster_categories.npy"), np.frombuffer(cluster_categories, dtype=np.uint16))
+
+    # CURIEs: when several nodes share a simplified id, the synonymizer keeps the last row, so the same is done here
+    keys, key_clusters = _StringTableWriter(sorted_keys=True), array("I")
+    previous_key, previous_cluster_id = None, None
+    cursor.execute("SELECT id_simplified, cluster_id FROM nodes WHERE id_simplified IS NOT NULL ORDER BY id_simplified, rowid")
+    while True:
+        rows = cursor.fetchmany(batch_size)
+        if not rows:
+            break
+        for key, cluster_id in rows:
+            if key != previous_key and previous_key is not None:
+                keys.append(previous_key)
+                key_clusters.append(cluster_id_to_index[previous_cluster_id])
+            previous_key, previous_cluster_id = key, cluster_id
+    if previous_key is not None:
+        keys.append(previous_key)
+        key_clusters.append(cluster_id_to_index[previous_cluster_id])
+    _save_key_table(index_dir, "curie", keys, key_clusters)
+    curie_count = len(key_clusters)
+
+    # Names: pick the cluster that nodes with that simplified name most often belong to, ties go to the lowest cluster
+    # id (rows come in cluster id order, so only a strictly higher count replaces the current best), as in
+    # NodeSynonymizer._count_clusters_per_name
+    keys, key_clusters = _StringTableWriter(sorted_keys=True), array("I")
+    previous_key, best_cluster_id, best_count = None, None, 0
+    cursor.execute("""
+                   SELECT name_simplified, cluster_id, COUNT(*)
+                   FROM nodes
+                   WHERE name_simplified IS NOT NULL AND name_simplified != ''
+                   GROUP BY name_simplified, cluster_id
+                   ORDER BY name_simplified, cluster_id""")
+    while True:
+        rows = cursor.fetchmany(batch_size)
+        if not rows:
+            break
+        for key, cluster_id, count in rows:
+            if key != previous_key:
+                if previous_key is not None:
+                    keys.append(previous_key)
+                    key_clusters.append(cluster_id_to_index[best_cluster_id])
+                previous_key, best_cluster_id, best_count = key, cluster_id, count
+            elif count > best_count:
+                best_cluster_id, best_count = cluster_id, count
+    if previous_key is not None:
+        keys.append(previous_key)
+        key_clusters.append(cluster_id_to_index[best_cluster_id])
+    _save_key_table(index_dir, "name", keys, key_clusters)
+    name_count = len(key_clusters)
+
+    cursor.close()
+    connection.close()
+
+    metadata = {"format_version": INDEX_FORMAT_VERSION,
+                "source_database": os.path.abspath(database_path),
+                "categories": categories,
+                "cluster_count": len(cluster_id_to_index),
+                "curie_count": curie_count,
+                "name_count": name_count}
+    with open(os.path.join(index_dir, "metadata.json"), "w") as metadata_file:
+        json.dump(metadata, metadata_file, indent=2)
+    return metadata
+
+
+class SynonymIndex:
+
+    def __init__(self, index_dir: str):
+        self.index_dir = index_dir
+        with open(os.path.join(index_dir, "metadata.json")) as metadata_file:
+            self.metadata = json.load(metadata_file)
+        if self.metadata["format_version"] != INDEX_FORMAT_VERSION:
+            raise ValueError(f"Synonym index at {index_dir} has format version {self.metadata['format_version']}, "
+                             f"expected {INDEX_FORMAT_VERSION}; please recompile it")
+        self.categories = self.metadata["categories"]
+        self.cluster_ids = self._load_string_table("cluster_ids")
+        self.cluster_names = self._load_string_table("cluster_names")
+        self.cluster_categories = self._load_array("cluster_categories")
+        self.keys = {kind: self._load_string_table(f"{kind}_keys") for kind in KEY_KINDS}
+        self.key_clusters = {kind: self._load_array(f"{kind}_clusters") for kind in KEY_KINDS}
+        self.key_hashes = {kind: self._load_array(f"{kind}_hashes") for kind in KEY_KINDS}
+        self.hash_order = {kind: self._load_array(f"{kind}_hash_order") for kind in KEY_KINDS}
+
+    # --------------------------------------- EXTERNAL MAIN METHODS ----------------------------------------------- #
+
+    def get_canonical_curies(self, curies: Optional[Union[str, Set[str], List[str]]] = None,
+                             names: Optional[Union[str, Set[str], List[str]]] = None) -> dict:
+        """
+        Same response format as NodeSynonymizer.get_canonical_curies (without return_all_categories).
+        """
+        curies_set = NodeSynonymizer._convert_to_set_format(curies)
+        names_set = {name for name in NodeSynonymizer._convert_to_set_format(names) if name}
+        results_dict = dict()
+
+        if curies_set:
+            curies_list = list(curies_set)
+            cluster_positions = self.lookup("curie", [NodeSynonymizer._capitalize_curie_prefix(curie) for curie in curies_list])
+            results_dict.update(self._to_results(curies_list, cluster_positions))
+
+        if names_set:
+            names_list = list(names_set)
+            cluster_positions = self.lookup("name", [simplify_name(name) for name in names_list])
+            results_dict.update(self._to_results(names_list, cluster_positions))
+
+        for unrecognized_value in (curies_set.union(names_set)).difference(results_dict):
+            results_dict[unrecognized_value] = None
+        return results_dict
+
+    def lookup(self, kind: str, keys: List[str]) -> np.ndarray:
+        """
+        Exact lookup of already-normalized keys (capitalized CURIEs or simplified names).
+        Returns the cluster position of each key, or -1 if it is not in the index.
+        """
+        query_data, query_offsets = encode_strings(keys)
+        query_hashes = hash_strings(query_data, query_offsets)
+        sorted_hashes = self.key_hashes[kind]
+        key_table, hash_order = self.keys[kind], self.hash_order[kind]
+        candidates = np.searchsorted(sorted_hashes, query_hashes)
+        key_positions = np.full(len(keys), -1, dtype=np.int64)
+        pending = np.arange(len(keys))
+        # Every round compares all pending queries with their next key sharing the same hash; a second round is only
+        # needed for the (rare) queries whose hash collides with a different key
+        while len(pending) > 0:
+            pending = pending[candidates[pending] < len(sorted_hashes)]
+            pending = pending[sorted_hashes[candidates[pending]] == query_hashes[pending]]
+            if len(pending) == 0:
+                break
+            positions = hash_order[candidates[pending]].astype(np.int64)
+            matches = _equal_strings(query_data, query_offsets, pending, key_table.data, key_table.offsets, positions)
+            key_positions[pending[matches]] = positions[matches]
+            pending = pending[~matches]
+            candidates[pending] += 1
+        cluster_positions = np.full(len(keys), -1, dtype=np.int64)
+        found = key_positions >= 0
+        cluster_positions[found] = self.key_clusters[kind][key_positions[found]]
+        return cluster_positions
+
+    def prefix_search(self, prefix: str, kind: str = "curie", limit: Optional[int] = 100) -> List[Tuple[str, str]]:
+        """
+        Return (key, preferred curie) pairs for the keys starting with the given normalized prefix, in key order.
+        """
+        key_table = self.keys[kind]
+        encoded_prefix = prefix.encode("utf-8")
+        start = bisect.bisect_left(key_table, encoded_prefix)
+        matches = []
+        for position in range(start, len(key_table)):
+            key = key_table[position]
+            if not key.startswith(encoded_prefix) or (limit is not None and len(matches) >= limit):
+                break
+            matches.append((key.decode("utf-8"), self.cluster_ids.get_str(int(self.key_clusters[kind][position]))))
+        return matches
+
+    # ---------------------------------------- INTERNAL HELPER METHODS ------------------------------------------- #
+
+    def _to_results(self, input_values: List[str], cluster_positions: np.ndarray) -> dict:
+        return {input_value: {"preferred_curie": self.cluster_ids.get_str(cluster_position),
+                              "preferred_name": self.cluster_names.get_str(cluster_position) or None,
+                              "preferred_category": self.categories[self.cluster_categories[cluster_position]] or None}
+                for input_value, cluster_position in zip(input_values, cluster_positions.tolist())
+                if cluster_position >= 0}
+
+    def _load_array(self, name: str) -> np.ndarray:
+        return np.load(os.path.join(self.index_dir, f"{name}.npy"), mmap_mode="r")
+
+    def _load_string_table(self, prefix: str) -> _StringTable:
+        return _StringTable(self._load_array(f"{prefix}_bytes"), self._load_array(f"{prefix}_offsets"))
+
+
+def verify_synonym_index(index: SynonymIndex, synonymizer: NodeSynonymizer, sample_size: int = 10000,
+                         seed: int = 100) -> Dict[str, list]:
+    """
+    Compare the index against NodeSynonymizer.get_canonical_curies on a random sample of CURIEs and names.
+    Returns the mismatching (input, index preferred curie, synonymizer preferred curie) triples per key kind.
+    """
+    rng = random.Random(seed)
+    mismatches = dict()
+    for kind in KEY_KINDS:
+        key_table = index.keys[kind]
+        sample_positions = rng.sample(range(len(key_table)), min(sample_size, len(key_table)))
+        sample = [key_table.get_str(position) for position in sample_positions]
+        if kind == "curie":
+            index_results = index.get_canonical_curies(curies=sample)
+            synonymizer_results = synonymizer.get_canonical_curies(curies=sample)
+        else:
+            index_results = index.get_canonical_curies(names=sample)
+            synonymizer_results = synonymizer.get_canonical_curies(names=sample)
+        mismatches[kind] = [(value,
+                             index_results[value]["preferred_curie"] if index_results[value] else None,
+                             synonymizer_results[value]["preferred_curie"] if synonymizer_results[value] else None)
+                            for value in sample
+                            if index_results[value] != synonymizer_results[value]]
+    return mismatches
+
+
+def main():
+    arg_parser = argparse.ArgumentParser(description="Compile, verify or query the compact synonym index")
+    arg_parser.add_argument("command", choices=["compile", "verify", "lookup"])
+    arg_parser.add_argument("curie_or_name", nargs="?")
+    arg_parser.add_argument("--synonymizer_dir", type=str, help="path of the synonymizer directory")
+    arg_parser.add_argument("--synonymizer_dbname", type=str, help="name of the synonymizer database")
+    arg_parser.add_argument("--index_dir", type=str, required=True, help="directory of the compiled synonym index")
+    arg_parser.add_argument("--sample_size", type=int, default=10000, help="number of CURIEs and names to verify")
+    arg_parser.add_argument("--prefix", action="store_true", help="run a prefix search instead of an exact lookup")
+    args = arg_parser.parse_args()
+
+    if args.command == "compile":
+        if not args.synonymizer_dir or not args.synonymizer_dbname:
+            arg_parser.error("compile requires --synonymizer_dir and --synonymizer_dbname")
+        metadata = compile_synonym_index(f"{args.synonymizer_dir}/{args.synonymizer_dbname}", args.index_dir)
+        print(json.dumps(metadata, indent=2))
+    elif args.command == "verify":
+        if not args.synonymizer_dir or not args.synonymizer_dbname:
+            arg_parser.error("verify requires --synonymizer_dir and --synonymizer_dbname")
+        mismatches = verify_synonym_index(SynonymIndex(args.index_dir),
+                                          NodeSynonymizer(args.synonymizer_dir, args.synonymizer_dbname),
+                                          sample_size=args.sample_size)
+        for kind, kind_mismatches in mismatches.items():
+            print(f"{kind}: {len(kind_mismatches)} mismatches")
+            for mismatch in kind_mismatches[:20]:
+                print(f"  {mismatch}")
+        if any(mismatches.values()):
+            sys.exit(1)
+    else:
+        if not args.curie_or_name:
+            arg_parser.error("lookup requires a curie or name")
+        index = SynonymIndex(args.index_dir)
+        if args.prefix:
+            print(json.dumps(index.prefix_search(NodeSynonymizer._capitalize_curie_prefix(args.curie_or_name), kind="curie") +
+                             index.prefix_search(simplify_name(args.curie_or_name), kind="name"), indent=2))
+        else:
+            results = index.get_canonical_curies(curies=args.curie_or_name)
+            if not results[args.curie_or_name]:
+                results = index.get_canonical_curies(names=args.curie_or_name)
+            print(json.dumps(results, indent=2))
+
+
+if __name__ == "__main__":
+    main()
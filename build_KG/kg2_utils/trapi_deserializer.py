@@ -0,0 +1,244 @@
+#!/bin/env python3
+"""
+Schema-compiled fast path for deserializing TRAPI payloads into the kg2_utils model classes.
+
+util._deserialize inspects the declared type of every field of every object it converts. Here the openapi_types of
+each model class are compiled once into a flat list of per-field converters, and instances are created by copying a
+prototype's attribute dict instead of running the generated __init__. The resulting objects compare equal to the ones
+produced by util.deserialize_model.
+
+Usage:  python -m kg2_utils.trapi_deserializer [--n_nodes 200000] [--n_edges 400000]
+"""
+
+import argparse
+import datetime
+import json
+import random
+import time
+from typing import Any, Callable, Iterator, Tuple, Union
+
+import six
+
+from kg2_utils import typing_utils
+from kg2_utils import util
+from kg2_utils.models.edge import Edge
+from kg2_utils.models.knowledge_graph import KnowledgeGraph
+from kg2_utils.models.node import Node
+
+PRIMITIVE_TYPES = tuple(six.integer_types) + (float, str, bool, bytearray)
+
+_compiled_converters = dict()
+
+
+def get_converter(klass: Any, validate: bool = True) -> Callable[[Any], Any]:
+    """
+    Returns a function converting a JSON value into an instance of klass (cached per class and validate flag).
+    With validate=False model fields are written directly, skipping the validation done by the generated setters.
+    """
+    cache_key = (klass, validate)
+    if cache_key not in _compiled_converters:
+        _compiled_converters[cache_key] = _compile_converter(klass, validate)
+    return _compiled_converters[cache_key]
+
+
+def deserialize(data: Any, klass: Any, validate: bool = True) -> Any:
+    return get_converter(klass, validate)(data)
+
+
+def iter_knowledge_graph(source: Union[str, dict], validate: bool = True) -> Iterator[Tuple[str, str, Any]]:
+    """
+    Yields ('node', node_id, Node) and ('edge', edge_id, Edge) tuples from a TRAPI knowledge graph, either given as a
+    dict or as the path to a JSON file holding one (optionally wrapped in a message). Files are parsed incrementally
+    when ijson is installed, so the full payload is never held in memory as Python objects.
+    """
+    node_converter = get_converter(Node, validate)
+    edge_converter = get_converter(Edge, validate)
+    if isinstance(source, dict):
+        knowledge_graph = source.get("message", source)
+        knowledge_graph = knowledge_graph.get("knowledge_graph", knowledge_graph)
+        for node_id, node in knowledge_graph.get("nodes", dict()).items():
+            yield "node", node_id, node_converter(node)
+        for edge_id, edge in knowledge_graph.get("edges", dict()).items():
+            yield "edge", edge_id, edge_converter(edge)
+        return
+
+    try:
+        import ijson
+    except ImportError:
+        with open(source) as input_file:
+            yield from iter_knowledge_graph(json.load(input_file), validate=validate)
+        return
+
+    prefix = _find_knowledge_graph_prefix(source)
+    for item_type, converter in (("nodes", node_converter), ("edges", edge_converter)):
+        with open(source, "rb") as input_file:
+            for item_id, item in ijson.kvitems(input_file, f"{prefix}{item_type}", use_float=True):
+                yield item_type[:-1], item_id, converter(item)
+
+
+def _find_knowledge_graph_prefix(file_path: str) -> str:
+    import ijson
+    with open(file_path, "rb") as input_file:
+        for prefix, event, _ in ijson.parse(input_file):
+            if event == "start_map" and prefix in ("message.knowledge_graph", "knowledge_graph"):
+                return f"{prefix}."
+            if event == "start_map" and prefix in ("nodes", "edges"):
+                return ""
+    return ""
+
+
+# ---------------------------------------- Converter compilation ------------------------------------------- #
+
+def _compile_converter(klass: Any, validate: bool) -> Callable[[Any], Any]:
+    if klass in PRIMITIVE_TYPES:
+        return _compile_primitive_converter(klass)
+    elif klass == object:
+        return _identity
+    elif klass == datetime.date:
+        return util.deserialize_date
+    elif klass == datetime.datetime:
+        return util.deserialize_datetime
+    elif typing_utils.is_generic(klass):
+        if typing_utils.is_list(klass):
+            return _compile_list_converter(klass.__args__[0], validate)
+        if typing_utils.is_dict(klass):
+            return _compile_dict_converter(klass.__args__[1], validate)
+        return lambda data: util._deserialize(data, klass)
+    elif isinstance(klass, type) and hasattr(klass, "openapi_types"):
+        return _compile_model_converter(klass, validate)
+    else:
+        return lambda data: util._deserialize(data, klass)
+
+
+def _identity(data: Any) -> Any:
+    return data
+
+
+def _compile_primitive_converter(klass: type) -> Callable[[Any], Any]:
+    def convert(data):
+        if data is None or type(data) is klass:
+            return data
+        return util._deserialize_primitive(data, klass)
+    return convert
+
+
+def _compile_list_converter(boxed_type: Any, validate: bool) -> Callable[[Any], Any]:
+    if boxed_type in PRIMITIVE_TYPES or boxed_type == object:
+        item_converter = _compile_converter(boxed_type, validate)
+
+        def convert_primitive_list(data):
+            if data is None:
+                return None
+            # Most lists in a payload already hold the declared primitive type, so avoid a call per item then
+            if boxed_type == object or all(type(item) is boxed_type for item in data):
+                return list(data)
+            return [item_converter(item) for item in data]
+        return convert_primitive_list
+
+    def convert(data):
+        if data is None:
+            return None
+        item_converter = get_converter(boxed_type, validate)
+        return [item_converter(item) for item in data]
+    return convert
+
+
+def _compile_dict_converter(boxed_type: Any, validate: bool) -> Callable[[Any], Any]:
+    def convert(data):
+        if data is None:
+            return None
+        value_converter = get_converter(boxed_type, validate)
+        return {key: value_converter(value) for key, value in data.items()}
+    return convert
+
+
+def _compile_model_converter(klass: type, validate: bool) -> Callable[[Any], Any]:
+    prototype = klass()
+    if not prototype.openapi_types:
+        # Same as util.deserialize_model: models without declared fields (e.g. enums) keep the raw value
+        return _identity
+    template = dict(prototype.__dict__)
+    new_instance = object.__new__
+
+    # (json key, attribute name, storage key or None, field type); converters are looked up lazily through the cache
+    # so that self-referencing models compile without recursing forever
+    fields = []
+    for attr, attr_type in prototype.openapi_types.items():
+        storage_key = None
+        if not validate:
+            for candidate in (f"_{attr}", f"_{klass.__name__}_{attr}"):
+                if candidate in template:
+                    storage_key = candidate
+                    break
+        fields.append((prototype.attribute_map[attr], attr, storage_key, attr_type))
+    field_converters = []
+
+    def convert(data):
+        if data is None:
+            return None
+        instance = new_instance(klass)
+        instance_dict = instance.__dict__
+        instance_dict.update(template)
+        if not isinstance(data, dict):
+            if isinstance(data, list):
+                return util.deserialize_model(data, klass)
+            return instance
+        if not field_converters:
+            field_converters.extend(get_converter(attr_type, validate) for _, _, _, attr_type in fields)
+        for (json_key, attr, storage_key, _), field_converter in zip(fields, field_converters):
+            if json_key in data:
+                value = field_converter(data[json_key])
+                if storage_key is None:
+                    setattr(instance, attr, value)
+                else:
+                    instance_dict[storage_key] = value
+        return instance
+    return convert
+
+
+# -------------------------------------------- Benchmark ---------------------------------------------------- #
+
+def make_synthetic_knowledge_graph(n_nodes: int, n_edges: int, seed: int = 100) -> dict:
+    rng = random.Random(seed)
+    categories = ["biolink:OrganismTaxon", "biolink:Disease", "biolink:Gene", "biolink:Protein", "biolink:Pathway"]
+    node_ids = [f"KEGG:N{index:08d}" for index in range(n_nodes)]
+    nodes = {node_id: {"name": f"synthetic node {index}",
+                       "categories": [rng.choice(categories)],
+                       "attributes": [{"attribute_type_id": "biolink:synonym",
+                                       "value": [f"SYN:{index}", f"SYN:{index}b"],
+                                       "original_attribute_name": "synonyms"}]}
+             for index, node_id in enumerate(node_ids)}
+    edges = {f"e{index}": {"subject": rng.choice(node_ids),
+                           "object": rng.choice(node_ids),
+                           "predicate": "biolink:related_to",
+                           "sources": [{"resource_id": "infores:kegg", "resource_role": "primary_knowledge_source"}],
+                           "attributes": [{"attribute_type_id": "biolink:knowledge_level", "value": "knowledge_assertion"}]}
+             for index in range(n_edges)}
+    return {"nodes": nodes, "edges": edges}
+
+
+def main():
+    arg_parser = argparse.ArgumentParser(description="Benchmark the compiled TRAPI deserializer against util._deserialize")
+    arg_parser.add_argument("--n_nodes", type=int, default=200000, help="number of synthetic nodes")
+    arg_parser.add_argument("--n_edges", type=int, default=400000, help="number of synthetic edges")
+    args = arg_parser.parse_args()
+
+    payload = make_synthetic_knowledge_graph(args.n_nodes, args.n_edges)
+
+    start = time.perf_counter()
+    util._deserialize(payload, KnowledgeGraph)
+    reference_seconds = time.perf_counter() - start
+
+    timings = dict()
+    for validate in (True, False):
+        start = time.perf_counter()
+        deserialize(payload, KnowledgeGraph, validate=validate)
+        timings[validate] = time.perf_counter() - start
+
+    print(f"util._deserialize:                  {reference_seconds:.2f}s")
+    print(f"compiled (validating setters):      {timings[True]:.2f}s ({reference_seconds / timings[True]:.1f}x)")
+    print(f"compiled (direct field assignment): {timings[False]:.2f}s ({reference_seconds / timings[False]:.1f}x)")
+
+
+if __name__ == "__main__":
+    main()
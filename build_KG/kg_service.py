@@ -0,0 +1,317 @@
+"""
+This script serves a built MetagenomicKG over a small read-only HTTP API (no Neo4j needed).
+
+The graph is loaded once into a GraphIndex (from the v6 TSV files or a graph_query.py snapshot) and queried in
+process by a threaded HTTP server. Responses are cached in an LRU cache and per-endpoint request metrics are
+exposed at /metrics (requests to unknown paths are counted together under 'other'). Use --synthetic to run the service offline on a generated graph.
+
+Endpoints (all GET, JSON responses):
+    /health
+    /metrics
+    /node?id=<node id or synonym>
+    /neighbors?id=<node>&direction=both&predicate=<predicate>&node_type=<type>&limit=1000
+    /subgraph?seed=<node>&seed=<node>&k=1&node_type=<type>&predicate=<predicate>&max_nodes=5000   (k <= 3)
+    /genome?id=<genome id or synonym, e.g. GTDB:GCF_000005845.2>
+
+Examples:
+    python kg_service.py --snapshot kg_v6_index.npz --port 8000
+    python kg_service.py --synthetic --port 8000
+"""
+
+## Import standard libraries
+import time
+import json
+import random
+import argparse
+import logging
+import threading
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+from urllib.parse import urlparse, parse_qs
+from typing import List, Dict, Optional
+import numpy as np
+
+## Import custom libraries
+from utils import get_logger
+from graph_query import GraphIndex, load_graph_index, DIRECTIONS
+from kg2_utils.node_synonymizer import LRUCache
+
+AMR_NODE_TYPE = 'biolink:Protein'
+AMR_KNOWLEDGE_SOURCE = 'AMRFinderPlus'
+DISEASE_NODE_TYPE = 'biolink:Disease'
+HIERARCHY_PREDICATE = 'biolink:subclass_of'
+MAX_LINEAGE_DEPTH = 64
+MAX_NEIGHBORS = 1000
+MAX_SUBGRAPH_NODES = 5000
+MAX_SUBGRAPH_HOPS = 3
+ENDPOINTS = ('/health', '/metrics', '/node', '/neighbors', '/subgraph', '/genome')
+
+
+class QueryError(Exception):
+    def __init__(self, status: int, message: str):
+        super().__init__(message)
+        self.status = status
+
+
+class RequestMetrics:
+    """
+    Per-endpoint request counts, error counts and latencies.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._start_time = time.time()
+        self._endpoints = {}
+
+    def record(self, endpoint: str, status: int, seconds: float, cached: bool):
+        with self._lock:
+            stats = self._endpoints.setdefault(endpoint, {'requests': 0, 'errors': 0, 'cache_hits': 0, 'total_seconds': 0.0, 'max_seconds': 0.0})
+            stats['requests'] += 1
+            stats['errors'] += int(status >= 400)
+            stats['cache_hits'] += int(cached)
+            stats['total_seconds'] += seconds
+            stats['max_seconds'] = max(stats['max_seconds'], seconds)
+
+    def snapshot(self) -> dict:
+        with self._lock:
+            endpoints = {}
+            for endpoint, stats in self._endpoints.items():
+                endpoints[endpoint] = dict(stats, mean_ms=round(1000 * stats['total_seconds'] / stats['requests'], 3),
+                                           max_ms=round(1000 * stats['max_seconds'], 3))
+                del endpoints[endpoint]['total_seconds'], endpoints[endpoint]['max_seconds']
+            return {'uptime_seconds': round(time.time() - self._start_time, 1), 'endpoints': endpoints}
+
+
+class KGQueryService:
+    """
+    Read-only queries over a GraphIndex, returning JSON-serializable results.
+    """
+
+    def __init__(self, graph: GraphIndex):
+        self.graph = graph
+        self.amr_mask = graph.source_mask([AMR_KNOWLEDGE_SOURCE])
+
+    def _resolve(self, identifier: Optional[str]) -> int:
+        if not identifier:
+            raise QueryError(400, 'Missing node identifier')
+        node_index = self.graph.find_node(identifier)
+        if node_index is None:
+            raise QueryError(404, f'Node {identifier} is not found')
+        return node_index
+
+    def node(self, identifier: str) -> dict:
+        node_index = self._resolve(identifier)
+        result = self.graph.describe_node(node_index)
+        result['out_degree'] = int(self.graph.out_indptr[node_index + 1] - self.graph.out_indptr[node_index])
+        result['in_degree'] = int(self.graph.in_indptr[node_index + 1] - self.graph.in_indptr[node_index])
+        return result
+
+    def neighbors(self, identifier: str, direction: str = 'both', predicates: Optional[List[str]] = None,
+                  node_types: Optional[List[str]] = None, limit: int = MAX_NEIGHBORS) -> dict:
+        if direction not in DIRECTIONS:
+            raise QueryError(400, f'direction must be one of {", ".join(DIRECTIONS)}')
+        node_index = self._resolve(identifier)
+        _, neighbor_indices, edge_indices = self.graph.expand(np.array([node_index]), direction, predicates, node_types)
+        neighbors = [{'node_id': self.graph.node_ids[neighbor],
+                      'node_type': self.graph.node_types[self.graph.node_type_ids[neighbor]],
+                      'name': self.graph.node_names[neighbor],
+                      'predicate': self.graph.predicates[self.graph.edge_predicate_ids[edge]],
+                      'direction': 'out' if self.graph.edge_source[edge] == node_index else 'in'}
+                     for neighbor, edge in zip(neighbor_indices[:limit].tolist(), edge_indices[:limit].tolist())]
+        return {'node_id': self.graph.node_ids[node_index], 'total': int(len(neighbor_indices)),
+                'truncated': len(neighbor_indices) > limit, 'neighbors': neighbors}
+
+    def subgraph(self, seeds: List[str], k: int = 1, predicates: Optional[List[str]] = None, node_types: Optional[List[str]] = None,
+                 max_nodes: int = MAX_SUBGRAPH_NODES) -> dict:
+        """
+        The subgraph induced by the k-hop neighborhood of the seed nodes, restricted to the given types/predicates.
+        """
+        seed_indices = [self._resolve(seed) for seed in seeds]
+        distances = self.graph.k_hop_indices([self.graph.node_ids[seed] for seed in seed_indices], k, 'both', predicates, node_types)
+        # Keep the closest nodes when the neighborhood is larger than max_nodes
+        node_indices = np.array(sorted(distances, key=distances.get)[:max_nodes], dtype=np.int64)
+        selected = np.zeros(self.graph.n_nodes, dtype=bool)
+        selected[node_indices] = True
+        # Only the out-edges of the selected nodes are scanned instead of the whole edge list
+        _, targets, edge_indices = self.graph.expand(node_indices, 'out', predicates)
+        edge_indices = edge_indices[selected[targets]]
+        return {'truncated': len(distances) > max_nodes,
+                'nodes': [dict(self.graph.describe_node(node_index), hop=distances[node_index]) for node_index in node_indices.tolist()],
+                'edges': [{'source_node': self.graph.node_ids[source], 'target_node': self.graph.node_ids[target], 'predicate': self.graph.predicates[predicate]}
+                          for source, target, predicate in zip(self.graph.edge_source[edge_indices].tolist(), self.graph.edge_target[edge_indices].tolist(),
+                                                               self.graph.edge_predicate_ids[edge_indices].tolist())]}
+
+    def genome(self, identifier: str) -> dict:
+        """
+        Pathogen status (of the genome and its taxonomic ancestors), AMR genes and associated diseases of a genome.
+        """
+        node_index = self._resolve(identifier)
+        ancestors = self.graph.k_hop_indices(self.graph.node_ids[node_index], MAX_LINEAGE_DEPTH, 'out', [HIERARCHY_PREDICATE])
+        lineage = sorted((distance, ancestor) for ancestor, distance in ancestors.items() if ancestor != node_index)
+        pathogenic_lineage = [self.graph.node_ids[ancestor] for _, ancestor in lineage if self.graph.is_pathogen[ancestor]]
+
+        _, neighbor_indices, edge_indices = self.graph.expand(np.array([node_index]), 'both', None, [AMR_NODE_TYPE, DISEASE_NODE_TYPE])
+        amr_genes, diseases = {}, {}
+        for neighbor, edge in zip(neighbor_indices.tolist(), edge_indices.tolist()):
+            node_type = self.graph.node_types[self.graph.node_type_ids[neighbor]]
+            if node_type == AMR_NODE_TYPE and self.amr_mask and int(self.graph.node_source_masks[neighbor]) & self.amr_mask:
+                amr_genes[neighbor] = {'node_id': self.graph.node_ids[neighbor], 'name': self.graph.node_names[neighbor]}
+            elif node_type == DISEASE_NODE_TYPE:
+                diseases[neighbor] = {'node_id': self.graph.node_ids[neighbor], 'name': self.graph.node_names[neighbor],
+                                      'predicate': self.graph.predicates[self.graph.edge_predicate_ids[edge]]}
+        return {'genome': self.graph.describe_node(node_index),
+                'is_pathogen': bool(self.graph.is_pathogen[node_index]) or len(pathogenic_lineage) > 0,
+                'pathogenic_lineage': pathogenic_lineage,
+                'amr_genes': list(amr_genes.values()),
+                'diseases': list(diseases.values())}
+
+
+class KGRequestHandler(BaseHTTPRequestHandler):
+    # Set by make_server
+    service = None
+    cache = None
+    metrics = None
+    logger = None
+
+    def do_GET(self):
+        start = time.perf_counter()
+        url = urlparse(self.path)
+        endpoint = url.path.rstrip('/') or '/'
+        params = parse_qs(url.query)
+        cached = False
+        try:
+            if endpoint == '/metrics':
+                body = self._encode(dict(self.metrics.snapshot(), cache=self.cache.info()))
+            elif endpoint == '/health':
+                body = self._encode({'status': 'ok', 'n_nodes': self.service.graph.n_nodes, 'n_edges': self.service.graph.n_edges})
+            else:
+                cache_key = (endpoint, tuple(sorted((key, tuple(values)) for key, values in params.items())))
+                cached, body = self.cache.get(cache_key)
+                if not cached:
+                    body = self._encode(self._dispatch(endpoint, params))
+                    self.cache.put(cache_key, body)
+            status = 200
+        except QueryError as e:
+            status, body = e.status, self._encode({'error': str(e)})
+        except Exception as e:
+            self.logger.error(f"Failed to handle {self.path}: {e}")
+            status, body = 500, self._encode({'error': 'Internal server error'})
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+        # Unknown paths share one metrics entry so that arbitrary URLs cannot grow the metrics without bound
+        self.metrics.record(endpoint if endpoint in ENDPOINTS else 'other', status, time.perf_counter() - start, cached)
+
+    def _dispatch(self, endpoint: str, params: Dict[str, List[str]]) -> dict:
+        first = lambda key, default=None: params[key][0] if key in params else default
+        if endpoint == '/node':
+            return self.service.node(first('id'))
+        if endpoint == '/neighbors':
+            return self.service.neighbors(first('id'), first('direction', 'both'), params.get('predicate'), params.get('node_type'),
+                                          min(self._int(first('limit'), MAX_NEIGHBORS), MAX_NEIGHBORS))
+        if endpoint == '/subgraph':
+            if 'seed' not in params:
+                raise QueryError(400, 'At least one seed is required')
+            return self.service.subgraph(params['seed'], min(self._int(first('k'), 1), MAX_SUBGRAPH_HOPS), params.get('predicate'), params.get('node_type'),
+                                         min(self._int(first('max_nodes'), MAX_SUBGRAPH_NODES), MAX_SUBGRAPH_NODES))
+        if endpoint == '/genome':
+            return self.service.genome(first('id'))
+        raise QueryError(404, f'Unknown endpoint {endpoint}')
+
+    @staticmethod
+    def _int(value: Optional[str], default: int) -> int:
+        if value is None:
+            return default
+        try:
+            return max(0, int(value))
+        except ValueError:
+            raise QueryError(400, f'{value} is not an integer')
+
+    @staticmethod
+    def _encode(result) -> bytes:
+        return json.dumps(result).encode('utf-8')
+
+    def log_message(self, format, *args):
+        self.logger.debug(f"{self.address_string()} - {format % args}")
+
+
+def make_server(graph: GraphIndex, host: str = '127.0.0.1', port: int = 8000, cache_size: int = 10000, logger=None) -> ThreadingHTTPServer:
+    handler = type('KGRequestHandler', (KGRequestHandler,), {'service': KGQueryService(graph), 'cache': LRUCache(cache_size),
+                                                            'metrics': RequestMetrics(), 'logger': logger or get_logger()})
+    server = ThreadingHTTPServer((host, port), handler)
+    server.daemon_threads = True
+    return server
+
+
+def make_synthetic_graph(n_genomes: int = 1000, n_other_nodes: int = 5000, n_edges: int = 20000, seed: int = 100) -> GraphIndex:
+    """
+    Generate a random graph with the node types, predicates and knowledge sources of MetagenomicKG.
+    """
+    rng = random.Random(seed)
+    node_types = ['biolink:OrganismTaxon', 'biolink:Disease', 'biolink:Protein', 'biolink:BiologicalEntity', 'biolink:Pathway', 'biolink:Drug']
+    predicates = [HIERARCHY_PREDICATE, 'biolink:superclass_of', 'biolink:associated_with', 'biolink:related_to', 'biolink:causes']
+    knowledge_sources = ['GTDB', 'KEGG', 'BV-BRC', 'MicroPhenoDB', AMR_KNOWLEDGE_SOURCE]
+
+    n_taxa = max(1, n_genomes // 10)
+    node_ids, node_type_ids, node_names, node_source_masks, is_pathogen, synonyms, synonym_node_indices = [], [], [], [], [], [], []
+    for index in range(n_taxa + n_genomes + n_other_nodes):
+        if index < n_taxa + n_genomes:
+            node_type_id, source_id = 0, 0
+            if index >= n_taxa:
+                synonyms.append(f'GTDB:GCF_{index:09d}.1')
+                synonym_node_indices.append(index)
+        else:
+            node_type_id = rng.randrange(1, len(node_types))
+            source_id = len(knowledge_sources) - 1 if node_type_id == 2 else rng.randrange(1, len(knowledge_sources) - 1)
+        node_ids.append(f'MKG:{index:08d}')
+        node_type_ids.append(node_type_id)
+        node_names.append(f'synthetic {node_types[node_type_id].split(":")[1]} {index}')
+        node_source_masks.append(1 << source_id)
+        is_pathogen.append(node_type_id == 0 and rng.random() < 0.1)
+
+    edges = []
+    for genome in range(n_taxa, n_taxa + n_genomes):
+        taxon = rng.randrange(n_taxa)
+        edges += [(genome, taxon, 0, 0), (taxon, genome, 1, 0)]
+    while len(edges) < n_edges:
+        source, target = rng.randrange(len(node_ids)), rng.randrange(len(node_ids))
+        if source != target:
+            edges.append((source, target, rng.randrange(2, len(predicates)), rng.randrange(len(knowledge_sources))))
+    edge_source, edge_target, edge_predicate_ids, edge_source_ids = (np.array(column, dtype=np.int64) for column in zip(*edges))
+    return GraphIndex(node_ids, np.array(node_type_ids, dtype=np.uint16), node_types, node_names,
+                      np.array(node_source_masks, dtype=np.uint64), np.array(is_pathogen, dtype=bool),
+                      edge_source, edge_target, edge_predicate_ids.astype(np.uint16), predicates,
+                      (np.uint64(1) << edge_source_ids.astype(np.uint64)), knowledge_sources,
+                      synonyms, np.array(synonym_node_indices, dtype=np.int64))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='Serve a built MetagenomicKG over a read-only HTTP API')
+    parser.add_argument('--kg_dir', type=str, help='path of the knowledge graph directory', default=None)
+    parser.add_argument('--node_filename', type=str, help='name of the node TSV file', default='KG_nodes_v6.tsv')
+    parser.add_argument('--edge_filename', type=str, help='name of the edge TSV file', default='KG_edges_v6.tsv')
+    parser.add_argument('--snapshot', type=str, help='path of a graph index snapshot created by graph_query.py', default=None)
+    parser.add_argument('--synthetic', action='store_true', help='serve a generated graph instead of a built KG')
+    parser.add_argument('--host', type=str, help='host to bind', default='127.0.0.1')
+    parser.add_argument('--port', type=int, help='port to bind', default=8000)
+    parser.add_argument('--cache_size', type=int, help='number of cached responses', default=10000)
+    args = parser.parse_args()
+
+    logger = get_logger()
+    logger.setLevel(logging.INFO)
+
+    if args.synthetic:
+        graph = make_synthetic_graph()
+    else:
+        graph = load_graph_index(args.snapshot, args.kg_dir, args.node_filename, args.edge_filename, logger=logger)
+    logger.info(f"Loaded a graph with {graph.n_nodes} nodes and {graph.n_edges} edges")
+
+    server = make_server(graph, args.host, args.port, args.cache_size, logger=logger)
+    logger.info(f"Serving MetagenomicKG on http://{args.host}:{args.port}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
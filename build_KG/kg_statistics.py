@@ -0,0 +1,218 @@
+"""
+This script is used to compute a statistics and integrity report for one version of the knowledge graph.
+
+The node/edge TSV files are read once into a GraphIndex (see graph_query.py) and all statistics are computed with
+vectorized operations over its arrays:
+    - node counts by type, edge counts by predicate and by (source type, predicate, target type)
+    - node/edge counts by knowledge source and the number of pathogen nodes
+    - out/in/total degree distributions (overall and per node type) and the highest-degree nodes
+    - integrity checks: dangling edges, orphan nodes, self loops, duplicated edges and synonym collisions
+    - weakly connected components
+The report is saved as JSON; given the report of the previous KG version, a diff of all counts is saved as well.
+
+Examples:
+    python kg_statistics.py --kg_dir ../data/merged_KG --node_filename KG_nodes_v6.tsv --edge_filename KG_edges_v6.tsv \
+        --output_file ../data/merged_KG/stats/KG_stats_v6.json --previous_report ../data/merged_KG/stats/KG_stats_v5.json
+"""
+
+## Import standard libraries
+import os
+import json
+import time
+import argparse
+import logging
+from typing import Dict, Tuple
+import numpy as np
+import pandas as pd
+from scipy.sparse import csr_matrix, csgraph
+
+## Import custom libraries
+from utils import get_logger
+from graph_query import GraphIndex
+
+N_TOP_NODES = 20
+N_EXAMPLES = 20
+DEGREE_PERCENTILES = [50, 90, 99, 99.9]
+# Report entries that are not compared between KG versions
+SKIPPED_DIFF_SECTIONS = {'files', 'seconds', 'diff'}
+
+
+def count_by_name(ids: np.ndarray, names: list) -> Dict[str, int]:
+    counts = np.bincount(ids.astype(np.int64), minlength=len(names))
+    return {name: int(count) for name, count in sorted(zip(names, counts.tolist()), key=lambda item: -item[1]) if count > 0}
+
+
+def count_by_source(masks: np.ndarray, knowledge_sources: list) -> Dict[str, int]:
+    return {source: int(((masks >> np.uint64(index)) & np.uint64(1)).sum()) for index, source in enumerate(knowledge_sources)}
+
+
+def degree_summary(degrees: np.ndarray) -> dict:
+    if len(degrees) == 0:
+        return {}
+    # Histogram over power-of-two bins: 0, 1, 2-3, 4-7, ...
+    bins = np.zeros(len(degrees), dtype=np.int64)
+    bins[degrees > 0] = np.floor(np.log2(degrees[degrees > 0])).astype(np.int64) + 1
+    histogram = np.bincount(bins)
+    return {'min': int(degrees.min()), 'max': int(degrees.max()), 'mean': round(float(degrees.mean()), 4),
+            'percentiles': {str(percentile): float(value) for percentile, value in zip(DEGREE_PERCENTILES, np.percentile(degrees, DEGREE_PERCENTILES))},
+            'histogram': {('0' if index == 0 else f'{2 ** (index - 1)}-{2 ** index - 1}'): int(count) for index, count in enumerate(histogram.tolist()) if count > 0}}
+
+
+def connected_components(graph: GraphIndex) -> np.ndarray:
+    """
+    Label the weakly connected components on the out-CSR arrays of the graph.
+    """
+    if graph.n_edges == 0:
+        return np.arange(graph.n_nodes, dtype=np.int64)
+    adjacency = csr_matrix((np.ones(graph.n_edges, dtype=np.int8), graph.edge_target[graph.out_edges], graph.out_indptr),
+                           shape=(graph.n_nodes, graph.n_nodes))
+    _, labels = csgraph.connected_components(adjacency, directed=True, connection='weak')
+    return labels.astype(np.int64)
+
+
+def synonym_collisions(graph: GraphIndex, n_examples: int = N_EXAMPLES) -> Tuple[int, Dict[str, list]]:
+    """
+    Count the synonyms that map to more than one node; the first n_examples of them (in order of first appearance) are
+    returned with the sorted ids of their nodes.
+    """
+    if len(graph.synonyms) == 0:
+        return 0, {}
+    synonym_codes, unique_synonyms = pd.factorize(pd.Series(graph.synonyms, dtype=object), sort=False)
+    # Distinct (synonym, node) pairs; sorting and comparing neighbours is several times faster than np.unique here
+    pair_keys = np.sort(synonym_codes.astype(np.int64) * graph.n_nodes + graph.synonym_node_indices)
+    pair_keys = pair_keys[np.concatenate(([True], pair_keys[1:] != pair_keys[:-1]))]
+    pair_codes, pair_nodes = pair_keys // graph.n_nodes, pair_keys % graph.n_nodes
+    colliding_codes = np.flatnonzero(np.bincount(pair_codes, minlength=len(unique_synonyms)) > 1)
+    examples = {unique_synonyms[code]: sorted(graph.node_ids[node_index] for node_index in pair_nodes[pair_codes == code].tolist())
+                for code in colliding_codes[:n_examples].tolist()}
+    return len(colliding_codes), examples
+
+
+def compute_statistics(graph: GraphIndex) -> dict:
+    """
+    Compute the statistics and integrity report of a GraphIndex.
+    """
+    out_degree = np.diff(graph.out_indptr)
+    in_degree = np.diff(graph.in_indptr)
+    total_degree = out_degree + in_degree
+
+    # Edges by (source type, predicate, target type)
+    n_types, n_predicates = len(graph.node_types), len(graph.predicates)
+    triple_keys = (graph.node_type_ids[graph.edge_source].astype(np.int64) * n_predicates + graph.edge_predicate_ids) * n_types + graph.node_type_ids[graph.edge_target]
+    triples, triple_counts = np.unique(triple_keys, return_counts=True)
+    edges_by_triple = {f"{graph.node_types[key // n_types // n_predicates]} {graph.predicates[key // n_types % n_predicates]} {graph.node_types[key % n_types]}": int(count)
+                       for key, count in sorted(zip(triples.tolist(), triple_counts.tolist()), key=lambda item: -item[1])}
+
+    # Degree by node type
+    degree_by_type = {}
+    for type_id, node_type in enumerate(graph.node_types):
+        type_mask = graph.node_type_ids == type_id
+        if type_mask.any():
+            degree_by_type[node_type] = {'mean_out': round(float(out_degree[type_mask].mean()), 4), 'mean_in': round(float(in_degree[type_mask].mean()), 4),
+                                         'max_total': int(total_degree[type_mask].max())}
+    top_nodes = np.argsort(-total_degree, kind='stable')[:N_TOP_NODES]
+
+    # Integrity checks
+    orphan_mask = total_degree == 0
+    self_loops = int((graph.edge_source == graph.edge_target).sum())
+    edge_keys = (graph.edge_source * graph.n_nodes + graph.edge_target) * max(n_predicates, 1) + graph.edge_predicate_ids
+    n_duplicated_edges = int(graph.n_edges - len(np.unique(edge_keys)))
+    n_synonym_collisions, synonym_collision_examples = synonym_collisions(graph)
+
+    # Connected components
+    labels = connected_components(graph)
+    component_sizes = np.bincount(labels, minlength=graph.n_nodes)
+    component_sizes = np.sort(component_sizes[component_sizes > 0])[::-1]
+
+    return {
+        'n_nodes': graph.n_nodes,
+        'n_edges': graph.n_edges,
+        'n_pathogen_nodes': int(graph.is_pathogen.sum()),
+        'nodes_by_type': count_by_name(graph.node_type_ids, graph.node_types),
+        'edges_by_predicate': count_by_name(graph.edge_predicate_ids, graph.predicates),
+        'edges_by_type_triple': edges_by_triple,
+        'nodes_by_knowledge_source': count_by_source(graph.node_source_masks, graph.knowledge_sources),
+        'edges_by_knowledge_source': count_by_source(graph.edge_source_masks, graph.knowledge_sources),
+        'degree': {'out': degree_summary(out_degree), 'in': degree_summary(in_degree), 'total': degree_summary(total_degree),
+                   'by_node_type': degree_by_type,
+                   'top_nodes': [{'node_id': graph.node_ids[node_index], 'node_type': graph.node_types[graph.node_type_ids[node_index]],
+                                  'degree': int(total_degree[node_index])} for node_index in top_nodes.tolist()]},
+        'integrity': {'n_dangling_edges': int(graph.n_skipped_edges),
+                      'n_orphan_nodes': int(orphan_mask.sum()),
+                      'orphan_nodes_by_type': count_by_name(graph.node_type_ids[orphan_mask], graph.node_types),
+                      'orphan_node_examples': [graph.node_ids[node_index] for node_index in np.flatnonzero(orphan_mask)[:N_EXAMPLES].tolist()],
+                      'n_self_loops': self_loops,
+                      'n_duplicated_edges': n_duplicated_edges,
+                      'n_synonym_collisions': n_synonym_collisions,
+                      'synonym_collision_examples': synonym_collision_examples},
+        'components': {'n_components': int(len(component_sizes)),
+                       'n_singleton_components': int((component_sizes == 1).sum()),
+                       'largest_component_size': int(component_sizes[0]) if len(component_sizes) > 0 else 0,
+                       'largest_component_sizes': component_sizes[:N_TOP_NODES].tolist()},
+    }
+
+
+def diff_reports(previous: dict, current: dict) -> dict:
+    """
+    Diff all counts of two reports: scalar counts as {previous, current, change}, count tables per key.
+    """
+    def diff_value(old, new):
+        if isinstance(old, dict) or isinstance(new, dict):
+            old, new = old if isinstance(old, dict) else {}, new if isinstance(new, dict) else {}
+            result = {}
+            for key in list(old) + [key for key in new if key not in old]:
+                value = diff_value(old.get(key), new.get(key))
+                if value is not None:
+                    result[key] = value
+            return result or None
+        if isinstance(old, (int, float)) or isinstance(new, (int, float)):
+            old, new = old or 0, new or 0
+            if old == new:
+                return None
+            return {'previous': old, 'current': new, 'change': round(new - old, 4)}
+        return None
+
+    diff = {}
+    for key in [key for key in current if key not in SKIPPED_DIFF_SECTIONS]:
+        value = diff_value(previous.get(key), current[key])
+        if value is not None:
+            diff[key] = value
+    return diff
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='Compute a statistics and integrity report for a knowledge graph version')
+    parser.add_argument('--kg_dir', type=str, help='path of the knowledge graph directory')
+    parser.add_argument('--node_filename', type=str, help='name of the node TSV file', default='KG_nodes_v6.tsv')
+    parser.add_argument('--edge_filename', type=str, help='name of the edge TSV file', default='KG_edges_v6.tsv')
+    parser.add_argument('--output_file', type=str, help='path of the output report (JSON)')
+    parser.add_argument('--previous_report', type=str, help='path of the report of the previous KG version', default=None)
+    args = parser.parse_args()
+
+    # Create a logger object
+    logger = get_logger()
+    logger.setLevel(logging.INFO)
+
+    start = time.time()
+    graph = GraphIndex.from_tsv(os.path.join(args.kg_dir, args.node_filename), os.path.join(args.kg_dir, args.edge_filename), logger=logger)
+    report = compute_statistics(graph)
+    report['files'] = {'nodes': args.node_filename, 'edges': args.edge_filename}
+    report['seconds'] = round(time.time() - start, 2)
+
+    output_dir = os.path.dirname(os.path.abspath(args.output_file))
+    if not os.path.exists(output_dir):
+        os.makedirs(output_dir)
+    if args.previous_report is not None:
+        if os.path.exists(args.previous_report):
+            with open(args.previous_report) as f:
+                report['diff'] = diff_reports(json.load(f), report)
+        else:
+            logger.warning(f"Previous report {args.previous_report} is not found, no diff is computed")
+    with open(args.output_file, 'w') as f:
+        json.dump(report, f, indent=2)
+
+    integrity = report['integrity']
+    logger.info(f"{report['n_nodes']} nodes, {report['n_edges']} edges, {report['components']['n_components']} connected components")
+    logger.info(f"{integrity['n_dangling_edges']} dangling edges, {integrity['n_orphan_nodes']} orphan nodes, {integrity['n_self_loops']} self loops, "
+                f"{integrity['n_duplicated_edges']} duplicated edges, {integrity['n_synonym_collisions']} synonym collisions")
+    logger.info(f"Report is saved to {args.output_file}")
@@ -0,0 +1,294 @@
+"""
+This script is used to load a knowledge graph version into a running Neo4j instance through the Python driver.
+
+Nodes and relationships are upserted with batched, parameterized UNWIND ... MERGE statements that are run by a pool
+of worker threads, each batch in its own managed write transaction with retries on transient errors. When the
+previous KG version is given, only the delta between the two versions (added/changed/removed nodes and edges) is
+applied; otherwise the whole graph is upserted.
+
+The loader only needs an object with a driver-like session() method, so it can be run with --dry_run (which records
+the statements instead of sending them) or against a local Neo4j container for offline testing.
+"""
+
+## Import standard libraries
+import os
+import sys
+import csv
+import time
+import random
+import hashlib
+import argparse
+import logging
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from typing import List, Dict, Tuple, Iterator, Optional, Callable
+from tqdm import tqdm
+
+## Import custom libraries
+sys.path.append(f'{os.path.dirname(os.path.realpath(__file__))}/..')
+from utils import get_logger
+from prepare_neo4j_inputs import iter_tsv_rows, parse_list, format_node_description
+
+
+def node_properties(row: dict) -> dict:
+    """
+    Neo4j properties of a KG node row, formatted the same way as the neo4j-admin import files.
+    """
+    return {'node_type': row['node_type'],
+            'all_names': parse_list(row['all_names']),
+            'description': format_node_description(row['description']),
+            'knowledge_source': parse_list(row['knowledge_source']),
+            'link': parse_list(row['link']),
+            'synonyms': parse_list(row['synonyms']),
+            'is_pathogen': row['is_pathogen']}
+
+
+def edge_properties(row: dict) -> dict:
+    return {'source_node': row['source_node'],
+            'target_node': row['target_node'],
+            'predicate': row['predicate'],
+            'knowledge_source': parse_list(row['knowledge_source'])}
+
+
+def row_digest(row: dict, columns: List[str]) -> bytes:
+    return hashlib.blake2b('\t'.join(row.get(column, '') for column in columns).encode('utf-8'), digest_size=16).digest()
+
+
+def edge_key(row: dict) -> Tuple[str, str, str]:
+    return row['source_node'], row['predicate'], row['target_node']
+
+
+class DryRunDriver:
+    """
+    Stand-in for neo4j.Driver that records the statements and row counts instead of running them. With
+    record_rows=True, the (statement, rows) of every batch are also kept in `batches`.
+    """
+
+    def __init__(self, record_rows: bool = False):
+        self.statements = []
+        self.record_rows = record_rows
+        self.batches = []
+
+    def session(self, database: Optional[str] = None):
+        return _DryRunSession(self)
+
+    def close(self):
+        pass
+
+
+class _DryRunSession:
+
+    def __init__(self, driver: DryRunDriver):
+        self.driver = driver
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        pass
+
+    def execute_write(self, transaction_function: Callable, *args, **kwargs):
+        return transaction_function(self, *args, **kwargs)
+
+    def run(self, query: str, **parameters):
+        rows = parameters.get('rows', [])
+        self.driver.statements.append((query, len(rows)))
+        if self.driver.record_rows:
+            self.driver.batches.append((query, list(rows)))
+        return []
+
+
+class Neo4jLoader:
+    """
+    Upsert/delete KG nodes and relationships in batches through an injected Neo4j driver.
+    """
+
+    def __init__(self, driver, logger, database: Optional[str] = None, batch_size: int = 10000, n_workers: int = 4, max_retries: int = 5):
+        self.driver = driver
+        self.logger = logger
+        self.database = database
+        self.batch_size = batch_size
+        self.n_workers = max(1, n_workers)
+        self.max_retries = max_retries
+
+    def upsert_nodes(self, rows: Iterator[dict]) -> int:
+        # Labels cannot be parameterized, so batches are grouped by label (the node type)
+        query_template = "UNWIND $rows AS row MERGE (n:`{label}` {{node_id: row.node_id}}) SET n += row.properties"
+        grouped_rows = ((row['node_type'], {'node_id': row['node_id'], 'properties': node_properties(row)}) for row in rows)
+        return self._run_grouped(grouped_rows, lambda label: query_template.format(label=label), desc='Upserting nodes')
+
+    def upsert_edges(self, rows: Iterator[dict], node_labels: Dict[str, str]) -> int:
+        # Endpoint labels are part of the grouping key so that both MATCHes use the (label, node_id) indexes
+        query_template = ("UNWIND $rows AS row "
+                          "MATCH (s:`{source_label}` {{node_id: row.source_node}}) "
+                          "MATCH (t:`{target_label}` {{node_id: row.target_node}}) "
+                          "MERGE (s)-[r:`{predicate}`]->(t) SET r += row.properties")
+        grouped_rows = (((node_labels[row['source_node']], row['predicate'], node_labels[row['target_node']]),
+                         {'source_node': row['source_node'], 'target_node': row['target_node'], 'properties': edge_properties(row)})
+                        for row in rows if row['source_node'] in node_labels and row['target_node'] in node_labels)
+        return self._run_grouped(grouped_rows, lambda key: query_template.format(source_label=key[0], predicate=key[1], target_label=key[2]),
+                                 desc='Upserting edges')
+
+    def delete_edges(self, keys: Iterator[Tuple[str, str, str]], node_labels: Dict[str, str]) -> int:
+        query_template = ("UNWIND $rows AS row "
+                          "MATCH (s:`{source_label}` {{node_id: row.source_node}})-[r:`{predicate}`]->(t:`{target_label}` {{node_id: row.target_node}}) "
+                          "DELETE r")
+        grouped_rows = (((node_labels[source_node], predicate, node_labels[target_node]), {'source_node': source_node, 'target_node': target_node})
+                        for source_node, predicate, target_node in keys
+                        if source_node in node_labels and target_node in node_labels)
+        return self._run_grouped(grouped_rows, lambda key: query_template.format(source_label=key[0], predicate=key[1], target_label=key[2]),
+                                 desc='Deleting edges')
+
+    def delete_nodes(self, node_ids: Iterator[str], node_labels: Dict[str, str]) -> int:
+        query_template = "UNWIND $rows AS row MATCH (n:`{label}` {{node_id: row.node_id}}) DETACH DELETE n"
+        grouped_rows = ((node_labels[node_id], {'node_id': node_id}) for node_id in node_ids if node_id in node_labels)
+        return self._run_grouped(grouped_rows, lambda label: query_template.format(label=label), desc='Deleting nodes')
+
+    def _run_grouped(self, grouped_rows: Iterator[Tuple[object, dict]], make_query: Callable, desc: str) -> int:
+        """
+        Collect rows into per-group batches and run full batches concurrently; at most n_workers * 2 batches are
+        in flight at a time so memory stays bounded.
+        """
+        pending_batches = defaultdict(list)
+        futures = set()
+        row_count = 0
+        progress_bar = tqdm(desc=desc, unit='rows')
+        with ThreadPoolExecutor(max_workers=self.n_workers) as executor:
+            def submit(group_key, batch):
+                if len(futures) >= self.n_workers * 2:
+                    done = next(as_completed(futures))
+                    futures.remove(done)
+                    progress_bar.update(done.result())
+                futures.add(executor.submit(self._write_batch, make_query(group_key), batch))
+
+            for group_key, row in grouped_rows:
+                pending_batches[group_key].append(row)
+                row_count += 1
+                if len(pending_batches[group_key]) >= self.batch_size:
+                    submit(group_key, pending_batches.pop(group_key))
+            for group_key, batch in pending_batches.items():
+                submit(group_key, batch)
+            for future in as_completed(futures):
+                progress_bar.update(future.result())
+        progress_bar.close()
+        return row_count
+
+    def _write_batch(self, query: str, rows: List[dict]) -> int:
+        for attempt in range(self.max_retries + 1):
+            try:
+                with self.driver.session(database=self.database) as session:
+                    session.execute_write(self._run_query, query, rows)
+                return len(rows)
+            except Exception as e:
+                # Deadlocks between concurrent MERGEs and lost connections are worth retrying; anything else is not
+                if attempt == self.max_retries or not self._is_transient(e):
+                    raise
+                wait_seconds = min(60, 2 ** attempt) * (0.5 + random.random())
+                self.logger.warning(f"Transient Neo4j error ({type(e).__name__}), retrying batch of {len(rows)} rows in {wait_seconds:.1f}s")
+                time.sleep(wait_seconds)
+
+    @staticmethod
+    def _run_query(tx, query: str, rows: List[dict]):
+        tx.run(query, rows=rows)
+
+    @staticmethod
+    def _is_transient(error: Exception) -> bool:
+        try:
+            from neo4j.exceptions import TransientError, ServiceUnavailable, SessionExpired
+        except ImportError:
+            return False
+        return isinstance(error, (TransientError, ServiceUnavailable, SessionExpired))
+
+
+def load_node_index(node_file: str, with_digest: bool = False) -> Tuple[Dict[str, str], Dict[str, bytes]]:
+    """
+    Map every node id to its label (and optionally to a digest of its row, used to detect changed nodes).
+    """
+    node_labels, node_digests = dict(), dict()
+    with open(node_file, newline='', encoding='utf-8') as f:
+        header = next(csv.reader(f, delimiter='\t'))
+    for row in tqdm(iter_tsv_rows(node_file), desc=f'Indexing nodes of {os.path.basename(node_file)}'):
+        node_labels[row['node_id']] = row['node_type']
+        if with_digest:
+            node_digests[row['node_id']] = row_digest(row, header)
+    return node_labels, node_digests
+
+
+def load_edge_digests(edge_file: str) -> Dict[Tuple[str, str, str], bytes]:
+    with open(edge_file, newline='', encoding='utf-8') as f:
+        header = next(csv.reader(f, delimiter='\t'))
+    return {edge_key(row): row_digest(row, header) for row in tqdm(iter_tsv_rows(edge_file), desc=f'Indexing edges of {os.path.basename(edge_file)}')}
+
+
+def apply_kg_version(loader: Neo4jLoader, logger, node_file: str, edge_file: str,
+                     previous_node_file: Optional[str] = None, previous_edge_file: Optional[str] = None) -> dict:
+    """
+    Upsert a KG version into Neo4j. If the previous version is given, only its delta is applied.
+    """
+    summary = dict()
+    is_delta = previous_node_file is not None and previous_edge_file is not None
+    node_labels, node_digests = load_node_index(node_file, with_digest=is_delta)
+
+    if is_delta:
+        logger.info("Computing the delta against the previous KG version...")
+        previous_node_labels, previous_node_digests = load_node_index(previous_node_file, with_digest=True)
+        previous_edge_digests = load_edge_digests(previous_edge_file)
+        with open(edge_file, newline='', encoding='utf-8') as f:
+            edge_header = next(csv.reader(f, delimiter='\t'))
+
+        # A node whose label changed is removed and re-created, since MERGE would otherwise create a duplicate
+        removed_nodes = {node_id for node_id, label in previous_node_labels.items() if node_labels.get(node_id) != label}
+        current_edge_keys = {edge_key(row) for row in iter_tsv_rows(edge_file)}
+        removed_edges = [key for key in previous_edge_digests if key not in current_edge_keys]
+        del current_edge_keys
+
+        summary['deleted_edges'] = loader.delete_edges(removed_edges, previous_node_labels)
+        summary['deleted_nodes'] = loader.delete_nodes(removed_nodes, previous_node_labels)
+        summary['upserted_nodes'] = loader.upsert_nodes(row for row in iter_tsv_rows(node_file)
+                                                        if row['node_id'] in removed_nodes
+                                                        or previous_node_digests.get(row['node_id']) != node_digests[row['node_id']])
+        # Edges of re-created nodes were dropped by DETACH DELETE, so they are re-inserted even if unchanged
+        summary['upserted_edges'] = loader.upsert_edges((row for row in iter_tsv_rows(edge_file)
+                                                         if row['source_node'] in removed_nodes or row['target_node'] in removed_nodes
+                                                         or previous_edge_digests.get(edge_key(row)) != row_digest(row, edge_header)),
+                                                        node_labels)
+    else:
+        summary['upserted_nodes'] = loader.upsert_nodes(iter_tsv_rows(node_file))
+        summary['upserted_edges'] = loader.upsert_edges(iter_tsv_rows(edge_file), node_labels)
+    return summary
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='Load a KG version (or its delta to the previous version) into a running Neo4j instance')
+    parser.add_argument('--kg_nodes', type=str, required=True, help='path of the knowledge graph nodes to load')
+    parser.add_argument('--kg_edges', type=str, required=True, help='path of the knowledge graph edges to load')
+    parser.add_argument('--previous_kg_nodes', type=str, help='path of the previously loaded knowledge graph nodes (enables delta loading)', default=None)
+    parser.add_argument('--previous_kg_edges', type=str, help='path of the previously loaded knowledge graph edges (enables delta loading)', default=None)
+    parser.add_argument('--database', type=str, help='name of the Neo4j database (default: the server default)', default=None)
+    parser.add_argument('--batch_size', type=int, help='number of rows per UNWIND transaction', default=10000)
+    parser.add_argument('--n_workers', type=int, help='number of concurrent write transactions', default=4)
+    parser.add_argument('--max_retries', type=int, help='number of retries of a batch on transient errors', default=5)
+    parser.add_argument('--dry_run', action='store_true', help='record the statements instead of connecting to Neo4j')
+    args = parser.parse_args()
+
+    # Create a logger object
+    logger = get_logger()
+    logger.setLevel(logging.INFO)
+    csv.field_size_limit(sys.maxsize)
+
+    if args.dry_run:
+        driver = DryRunDriver()
+    else:
+        import neo4j
+        from config_loader import get_neo4j_config
+        neo4j_config = get_neo4j_config()
+        driver = neo4j.GraphDatabase.driver(neo4j_config['neo4j_bolt'], auth=(neo4j_config['neo4j_username'], neo4j_config['neo4j_password']))
+
+    loader = Neo4jLoader(driver, logger, database=args.database, batch_size=args.batch_size, n_workers=args.n_workers, max_retries=args.max_retries)
+    try:
+        summary = apply_kg_version(loader, logger, args.kg_nodes, args.kg_edges, args.previous_kg_nodes, args.previous_kg_edges)
+    finally:
+        driver.close()
+    logger.info(f"Neo4j load summary: {summary}")
+    if args.dry_run:
+        logger.info(f"{len(driver.statements)} batched statements would have been run")
@@ -1,106 +1,183 @@
 """
 This script is used to prepare the input files for Neo4j.
+
+Nodes and edges are streamed row by row from the knowledge graph TSV files into neo4j-admin import files: one typed
+header file per entity (nodes_header.tsv / edges_header.tsv) followed by size-bounded data shards
+(nodes_part001.tsv, ... / edges_part001.tsv, ...) that neo4j-admin import reads in parallel.
 """
 
 ## Import standard libraries
 import os
 import sys
+import ast
+import csv
 from tqdm import tqdm, trange
 from glob import glob
-import pandas as pd
 import argparse
 import logging
+from typing import List, Iterator
 
 ## Import custom libraries
 sys.path.append(f'{os.path.dirname(os.path.realpath(__file__))}/..')
-from utils import get_logger, KnowledgeGraph
+from utils import get_logger
+
+ARRAY_DELIMITER = 'ǂ'
+NODE_HEADER = ['node_id:ID', 'node_type', 'all_names:string[]', 'description', 'knowledge_source:string[]', 'link:string[]', 'synonyms:string[]', 'is_pathogen', ':LABEL']
+EDGE_HEADER = ['source_node', 'target_node', 'predicate', 'knowledge_source:string[]', ':TYPE', ':START_ID', ':END_ID']
+# description keys that are not loaded into neo4j (KO related genes are removed for better neo4j visualization)
+SKIPPED_NODE_DESCRIPTIONS = {'KO_related_genes'}
+
+
+class ShardedTSVWriter:
+    """
+    Write rows into <prefix>_partNNN.tsv files, starting a new shard once the current one exceeds max_shard_bytes.
+    """
+
+    def __init__(self, output_dir: str, prefix: str, max_shard_bytes: int, batch_size: int = 10000):
+        self.output_dir = output_dir
+        self.prefix = prefix
+        self.max_shard_bytes = max_shard_bytes
+        self.batch_size = batch_size
+        self.shard_paths = []
+        self.row_count = 0
+        self._file = None
+        self._writer = None
+        self._batch = []
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def write(self, row: List[str]):
+        self._batch.append(row)
+        if len(self._batch) >= self.batch_size:
+            self._flush()
+
+    def close(self):
+        self._flush()
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+
+    def _flush(self):
+        if not self._batch:
+            return
+        if self._file is None or self._file.tell() >= self.max_shard_bytes:
+            self._open_next_shard()
+        self._writer.writerows(self._batch)
+        self.row_count += len(self._batch)
+        self._batch = []
+
+    def _open_next_shard(self):
+        if self._file is not None:
+            self._file.close()
+        shard_path = os.path.join(self.output_dir, f'{self.prefix}_part{len(self.shard_paths) + 1:03d}.tsv')
+        self.shard_paths.append(shard_path)
+        self._file = open(shard_path, 'w', newline='', encoding='utf-8')
+        self._writer = csv.writer(self._file, delimiter='\t', lineterminator='\n')
+
+
+def iter_tsv_rows(file_path: str) -> Iterator[dict]:
+    """
+    Stream the rows of a knowledge graph TSV file as dicts keyed by the header.
+    """
+    with open(file_path, newline='', encoding='utf-8') as f:
+        reader = csv.reader(f, delimiter='\t')
+        header = next(reader)
+        for row in reader:
+            yield dict(zip(header, row))
+
+
+def parse_list(value: str) -> list:
+    if value in ('', '[nan]'):
+        return []
+    return ast.literal_eval(value)
+
+
+def format_node_description(value: str) -> str:
+    """
+    Flatten the (key, value) description pairs of a node into the single string stored in neo4j.
+    """
+    description = [pair for pair in parse_list(value) if pair[0] not in SKIPPED_NODE_DESCRIPTIONS]
+    return '; '.join([f'{key}:{value}' for key, value in description if value])
+
+
+def format_node(row: dict) -> List[str]:
+    return [row['node_id'],
+            row['node_type'],
+            ARRAY_DELIMITER.join(parse_list(row['all_names'])),
+            format_node_description(row['description']),
+            ARRAY_DELIMITER.join(parse_list(row['knowledge_source'])),
+            ARRAY_DELIMITER.join(parse_list(row['link'])),
+            ARRAY_DELIMITER.join(parse_list(row['synonyms'])),
+            row['is_pathogen'],
+            row['node_type']]
+
+
+def format_edge(row: dict) -> List[str]:
+    return [row['source_node'],
+            row['target_node'],
+            row['predicate'],
+            ARRAY_DELIMITER.join(parse_list(row['knowledge_source'])),
+            row['predicate'],
+            row['source_node'],
+            row['target_node']]
+
+
+def write_header(file_path: str, header: List[str]):
+    with open(file_path, 'w', newline='', encoding='utf-8') as f:
+        csv.writer(f, delimiter='\t', lineterminator='\n').writerow(header)
 
 
 if __name__ == "__main__":
-    parser = argparse.ArgumentParser(description='Integrate all MicroPhenoDB into a knolwedge graph')
+    parser = argparse.ArgumentParser(description='Prepare neo4j-admin import files from the knowledge graph')
     parser.add_argument('--existing_KG_nodes', type=str, help='path of the existing knowledge graph nodes')
     parser.add_argument('--existing_KG_edges', type=str, help='path of the existing knowledge graph edges')
     parser.add_argument('--kg_dir', type=str, help='path of the knowledge graph directory')
     parser.add_argument('--output_dir', type=str, help='path of the output directory')
+    parser.add_argument('--max_shard_mb', type=int, help='maximum size (in MB) of each node/edge data shard', default=1024)
     args = parser.parse_args()
-    
+
     # Create a logger object
     logger = get_logger()
     logger.setLevel(logging.INFO)
+    csv.field_size_limit(sys.maxsize)
+
+    node_file = os.path.join(args.kg_dir, os.path.basename(args.existing_KG_nodes))
+    edge_file = os.path.join(args.kg_dir, os.path.basename(args.existing_KG_edges))
+    max_shard_bytes = args.max_shard_mb * 1024 * 1024
 
-    # Create a knowledge graph object
-    logger.info("Creating a knowledge graph object...")
-    kg = KnowledgeGraph(logger)
-    # Load existing knowledge graph nodes and edges
-    logger.info("Loading existing knowledge graph nodes and edges...")
-    node_filename = args.existing_KG_nodes.split('/')[-1]
-    edge_filename = args.existing_KG_edges.split('/')[-1]
-    kg.load_graph(load_dir=args.kg_dir, node_filename=node_filename, edge_filename=edge_filename)
-
-    # Convert knowledge graph nodes and edges to dataframes
-    logger.info("Converting knowledge graph nodes and edges to dataframes...")
-    kg_node_df = kg.nodes_to_dataframe()
-    kg_edge_df = kg.edges_to_dataframe()
-    
-    ## Construct the headers
-    logger.info("Constructing the headers...")
-    node_headers = list(kg_node_df.columns)
-    node_headers[node_headers.index('node_id')] = node_headers[node_headers.index('node_id')] + ':ID'
-    node_headers[node_headers.index('all_names')] = node_headers[node_headers.index('all_names')] + ':string[]'
-    node_headers[node_headers.index('knowledge_source')] = node_headers[node_headers.index('knowledge_source')] + ':string[]'
-    node_headers[node_headers.index('link')] = node_headers[node_headers.index('link')] + ':string[]'
-    node_headers[node_headers.index('synonyms')] = node_headers[node_headers.index('synonyms')] + ':string[]'
-    node_headers[node_headers.index('is_pathogen')] = node_headers[node_headers.index('is_pathogen')]
-    node_headers += [':LABEL']
-    
-    kg_edge_df = kg_edge_df.drop(columns=['description'])
-    edge_headers = list(kg_edge_df.columns)
-    edge_headers[edge_headers.index('source_node')] = edge_headers[edge_headers.index('source_node')]
-    edge_headers[edge_headers.index('target_node')] = edge_headers[edge_headers.index('target_node')]
-    edge_headers[edge_headers.index('knowledge_source')] = edge_headers[edge_headers.index('knowledge_source')] + ':string[]'
-    edge_headers += [':TYPE', ':START_ID', ':END_ID']
-
-    ## Write headers to a TSV file
     if not os.path.exists(args.output_dir):
         os.makedirs(args.output_dir)
-    
-    # logger.info("Writing headers to a TSV file...")
-    # with open(os.path.join(args.output_dir, 'nodes_header.tsv'), 'w') as f:
-    #     f.write('\t'.join(node_headers)+'\n')
-
-    # with open(os.path.join(args.output_dir, 'edges_header.tsv'), 'w') as f:
-    #     f.write('\t'.join(edge_headers)+'\n')
-
-    # Format nodes for neo4j
-    logger.info("Formatting nodes for neo4j...")
-    kg_node_temp = []
-    for row in tqdm(kg_node_df.to_numpy()):
-        node_id, node_type, all_names, description, knowledge_source, link, synonyms, is_pathogen = row
-        ## remove KO related genes for better neo4j visualization
-        description = [x for x in description if x[0] != 'KO_related_genes']
-        all_names = 'ǂ'.join(all_names)
-        description = '; '.join([pair[0]+":"+pair[1] for pair in description if pair[1]])
-        knowledge_source = 'ǂ'.join(knowledge_source)
-        link = 'ǂ'.join(link)
-        synonyms = 'ǂ'.join(synonyms)
-        kg_node_temp += [[node_id, node_type, all_names, description, knowledge_source, link, synonyms, is_pathogen, node_type]]
-    kg_node_df = pd.DataFrame(kg_node_temp)
-    
-    ## Save KG nodes with neo4j format
-    logger.info("Saving KG nodes with neo4j format...")
-    kg_node_df.columns = node_headers
-    kg_node_df.to_csv(os.path.join(args.output_dir, 'nodes.tsv'), sep='\t', index=None)
-    
+    # Remove the outputs of a previous run so that stale shards are not picked up by neo4j-admin
+    for old_file in glob(os.path.join(args.output_dir, 'nodes_*.tsv')) + glob(os.path.join(args.output_dir, 'edges_*.tsv')):
+        os.remove(old_file)
+
+    # Format nodes for neo4j; node ids are kept to drop edges whose endpoints are missing
+    logger.info(f"Streaming KG nodes from {node_file}...")
+    node_ids = set()
+    with ShardedTSVWriter(args.output_dir, 'nodes', max_shard_bytes) as node_writer:
+        for row in tqdm(iter_tsv_rows(node_file), desc='Formatting nodes for neo4j'):
+            node_ids.add(row['node_id'])
+            node_writer.write(format_node(row))
+    logger.info(f"{node_writer.row_count} nodes are written to {len(node_writer.shard_paths)} shards")
+
     # Format edges for neo4j
-    logger.info("Formatting edges for neo4j...")
-    kg_edge_temp = []
-    for row in tqdm(kg_edge_df.to_numpy()):
-        source_node, target_node, predicate, knowledge_source = row
-        knowledge_source = 'ǂ'.join(knowledge_source)
-        kg_edge_temp += [[source_node, target_node, predicate, knowledge_source, predicate, source_node, target_node]]
-    kg_edge_df = pd.DataFrame(kg_edge_temp)
-    
-    ## Save KG edges with neo4j format
-    logger.info("Saving KG edges with neo4j format...")
-    kg_edge_df.columns = edge_headers
-    kg_edge_df.to_csv(os.path.join(args.output_dir, 'edges.tsv'), sep='\t', index=None)
+    logger.info(f"Streaming KG edges from {edge_file}...")
+    skipped_edges = 0
+    with ShardedTSVWriter(args.output_dir, 'edges', max_shard_bytes) as edge_writer:
+        for row in tqdm(iter_tsv_rows(edge_file), desc='Formatting edges for neo4j'):
+            if row['source_node'] not in node_ids or row['target_node'] not in node_ids:
+                skipped_edges += 1
+                continue
+            edge_writer.write(format_edge(row))
+    if skipped_edges > 0:
+        logger.warning(f"Skipped {skipped_edges} edges whose source or target node is missing")
+    logger.info(f"{edge_writer.row_count} edges are written to {len(edge_writer.shard_paths)} shards")
+
+    ## Write the headers last, they are the outputs tracked by the pipeline
+    write_header(os.path.join(args.output_dir, 'nodes_header.tsv'), NODE_HEADER)
+    write_header(os.path.join(args.output_dir, 'edges_header.tsv'), EDGE_HEADER)
+    logger.info(f"neo4j-admin import files are saved to {args.output_dir}")
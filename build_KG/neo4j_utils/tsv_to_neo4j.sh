@@ -15,7 +15,9 @@ database=${1:-"MetagenomicsKG"}
 tsv_dir=${2:-"../../neo4j/input_files"}
 
 # import TSV files into Neo4j as Neo4j
-neo4j-admin database import full --nodes="${tsv_dir}/nodes.tsv" \
---relationships="${tsv_dir}/edges.tsv" \
+# (each entity has one header file followed by the data shards written by prepare_neo4j_inputs.py)
+neo4j-admin database import full --nodes="${tsv_dir}/nodes_header.tsv,${tsv_dir}/nodes_part[0-9]+\.tsv" \
+--relationships="${tsv_dir}/edges_header.tsv,${tsv_dir}/edges_part[0-9]+\.tsv" \
 --delimiter="\t" \
---array-delimiter="ǂ" "${database}.db"
\ No newline at end of file
+--array-delimiter="ǂ" \
+--threads="${NEO4J_IMPORT_THREADS:-$(nproc)}" "${database}.db"
\ No newline at end of file
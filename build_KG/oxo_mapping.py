@@ -6,28 +6,40 @@ Basic implementation of EMBL-EBI's OxO mappings (https://www.ebi.ac.uk/spot/oxo/
 Notes:
     The mapping algorithm may be different from OxO's. A few test cases have been run and produced matching results.
 
+    The mapping graph is compiled once into a CSR adjacency (plus connected components) and cached next to the
+    mapping files as oxo_index.npz; later instantiations load that index instead of re-reading the CSV files.
+    find_mappings_bulk searches from all query curies at once: the breadth-first search runs over (query, curie) pairs,
+    so each distance level is one vectorized expansion for the whole batch instead of one search per curie.
+
 Examples:
     OxO.find_mappings('DOID:162')
     OxO.find_mappings('UMLS:C0002199', distance=3)
     OxO.find_mappings('SNOMEDCT:136111001', distance=3, targets=['MeSH', 'UMLS'])
+    OxO.find_mappings_bulk(['DOID:162', 'UMLS:C0002199'], distance=2)
 """
 
 ## Import standard libraries
 import os
 import sys
-from tqdm import tqdm, trange
+from tqdm import tqdm
 import csv
+import numpy as np
+from scipy.sparse import csr_matrix, csgraph
 from collections import defaultdict
 from typing import List, Dict, Tuple, Set, Union, Optional
 
 ## Import custom libraries
 from utils import get_logger
 
+OXO_INDEX_VERSION = 1
+STRING_SEPARATOR = '\x00'
+
 class OxO:
 
-    def __init__(self, mapping_file_dir: str):
+    def __init__(self, mapping_file_dir: str, index_path: Optional[str] = None, rebuild_index: bool = False):
         # Initialize logger
         self.logger = get_logger()
+        self._index_path = index_path if index_path else os.path.join(mapping_file_dir, 'oxo_index.npz')
 
         # set up mapping file paths
         self._file_ols = os.path.join(mapping_file_dir, 'ols_mappings.csv')
@@ -50,9 +62,17 @@ class OxO:
             self.logger.error(f'Could not find UMLS terms file at {self._file_umls_terms}')
             return
         
-        # Load mapping files
+        # Load the compiled index if it is newer than all mapping files, otherwise compile it from the mapping files
+        mapping_files = [self._file_ols, self._file_umls, self._file_ols_terms, self._file_umls_terms]
+        if not rebuild_index and os.path.exists(self._index_path) and \
+                os.path.getmtime(self._index_path) >= max(os.path.getmtime(file_path) for file_path in mapping_files):
+            self.logger.info(f'Loading OxO mapping index from {self._index_path}')
+            if self._load_index():
+                return
         self.logger.info(f'Loading OxO mapping files from {mapping_file_dir}')
         self._load_files()
+        self._build_index()
+        self._save_index()
 
     def _load_files(self):
         # Initialize
@@ -101,57 +121,174 @@ class OxO:
                 self._mappings[curie_from].add(curie_to)
                 self._mappings[curie_to].add(curie_from)
 
+    def _build_index(self):
+        """
+        Compile the dict-of-sets mapping graph into a CSR adjacency with per-node term info and connected components
+        """
+        self._curies = sorted(self._mappings)
+        curie_to_index = {curie: index for index, curie in enumerate(self._curies)}
+        degrees = np.fromiter((len(self._mappings[curie]) for curie in self._curies), dtype=np.int64, count=len(self._curies))
+        self._indptr = np.zeros(len(self._curies) + 1, dtype=np.int64)
+        np.cumsum(degrees, out=self._indptr[1:])
+        self._indices = np.fromiter((curie_to_index[neighbor] for curie in self._curies for neighbor in sorted(self._mappings[curie])),
+                                    dtype=np.int32, count=int(self._indptr[-1]))
+
+        # Intern the prefixes so that prefix/target filters are integer comparisons
+        prefixes = [curie.split(':')[0] for curie in self._curies]
+        self._prefixes = sorted(set(prefixes))
+        prefix_to_index = {prefix: index for index, prefix in enumerate(self._prefixes)}
+        self._prefix_ids = np.fromiter((prefix_to_index[prefix] for prefix in prefixes), dtype=np.int32, count=len(prefixes))
+
+        self._labels = [self._terms[curie]['label'] if curie in self._terms else '' for curie in self._curies]
+        self._uris = [self._terms[curie]['uri'] if curie in self._terms else '' for curie in self._curies]
+
+        # Connected components (a query can never reach outside of its own component)
+        adjacency = csr_matrix((np.ones(len(self._indices), dtype=np.int8), self._indices, self._indptr), shape=(len(self._curies), len(self._curies)))
+        _, components = csgraph.connected_components(adjacency, directed=False)
+        self._components = components.astype(np.int32)
+
+        self._finish_index()
+        del self._terms, self._mappings
+
+    def _finish_index(self):
+        self._curie_to_index = {curie: index for index, curie in enumerate(self._curies)}
+        self._prefix_to_id = {prefix: index for index, prefix in enumerate(self._prefixes)}
+
+    def _save_index(self):
+        try:
+            np.savez(self._index_path,
+                     version=np.array([OXO_INDEX_VERSION]),
+                     curies=np.frombuffer(STRING_SEPARATOR.join(self._curies).encode('utf-8'), dtype=np.uint8),
+                     labels=np.frombuffer(STRING_SEPARATOR.join(self._labels).encode('utf-8'), dtype=np.uint8),
+                     uris=np.frombuffer(STRING_SEPARATOR.join(self._uris).encode('utf-8'), dtype=np.uint8),
+                     prefixes=np.frombuffer(STRING_SEPARATOR.join(self._prefixes).encode('utf-8'), dtype=np.uint8),
+                     prefix_ids=self._prefix_ids, indptr=self._indptr, indices=self._indices, components=self._components)
+            self.logger.info(f'OxO mapping index is saved to {self._index_path}')
+        except OSError as e:
+            self.logger.warning(f'Could not save OxO mapping index to {self._index_path}: {e}')
+
+    def _load_index(self) -> bool:
+        with np.load(self._index_path) as index:
+            if int(index['version'][0]) != OXO_INDEX_VERSION:
+                self.logger.warning(f'OxO mapping index at {self._index_path} is outdated, rebuilding it')
+                return False
+            self._curies = index['curies'].tobytes().decode('utf-8').split(STRING_SEPARATOR)
+            self._labels = index['labels'].tobytes().decode('utf-8').split(STRING_SEPARATOR)
+            self._uris = index['uris'].tobytes().decode('utf-8').split(STRING_SEPARATOR)
+            self._prefixes = index['prefixes'].tobytes().decode('utf-8').split(STRING_SEPARATOR)
+            self._prefix_ids = index['prefix_ids']
+            self._indptr = index['indptr']
+            self._indices = index['indices']
+            self._components = index['components']
+        self._finish_index()
+        return True
+
+    def _expand(self, frontier: np.ndarray) -> np.ndarray:
+        """
+        Return the concatenated CSR neighbor lists of all nodes in the frontier
+        """
+        starts, ends = self._indptr[frontier], self._indptr[frontier + 1]
+        lengths = ends - starts
+        if lengths.sum() == 0:
+            return np.empty(0, dtype=np.int64)
+        offsets = np.repeat(starts - np.cumsum(lengths) + lengths, lengths)
+        return self._indices[offsets + np.arange(lengths.sum())].astype(np.int64)
+
+    def _to_index_set(self, values: Union[List, str, None]) -> Set[int]:
+        if values is None:
+            return set()
+        if isinstance(values, str):
+            values = [values]
+        return {self._prefix_to_id[value] for value in values if value in self._prefix_to_id}
+
+    def _target_ids(self, targets: Union[List, str, None]) -> Optional[np.ndarray]:
+        # None means any target; an empty array (only unknown target prefixes) can never match
+        if targets is None or len(targets) == 0:
+            return None
+        return np.array(sorted(self._to_index_set(targets)), dtype=np.int64)
+
     def find_mappings(self, curie_source: Union[List, str], distance: int = 1, targets: Union[List, str] = None):
         self.logger.info(f'Finding mappings for {curie_source} with distance {distance} and targets {targets}')
 
-        if not hasattr(self, '_terms') or not hasattr(self, '_mappings'):
-            self._load_files()
-
-        found = dict()  # mapping results (key:curie, value:distance)
-        visited = set()  # nodes already visited
-        # nodes to visit on this iteration
+        # all source curies form a single query
         if isinstance(curie_source, str):
-            searching = set([curie_source])
-        elif type(curie_source) is list:
-            searching = set(curie_source)
-        prefix_source = [curie.split(':')[0] for curie in searching]
-
-        # Convert targets to a set
-        if targets is None:
-            targets = set()
-        elif type(targets) is str:
-            targets = set([targets])
-        else:
-            targets = set(targets)
-
-        for i in range(distance):
-            search_add = set()  # nodes to search in the next iteration
+            curie_source = [curie_source]
+        source_nodes = np.array(sorted({self._curie_to_index[curie] for curie in curie_source if curie in self._curie_to_index}), dtype=np.int64)
+        excluded_prefix_ids = np.array(sorted(self._to_index_set(list({curie.split(':')[0] for curie in curie_source}))), dtype=np.int64)
+        # with a single query (index 0) the excluded keys are the prefix ids themselves
+        return self._search(np.zeros(len(source_nodes), dtype=np.int64), source_nodes, 1, excluded_prefix_ids, distance, self._target_ids(targets))[0]
 
-            # Mark all nodes that we're about to visit as already visited
-            visited = visited.union(searching)
+    def find_mappings_bulk(self, curies: List[str], distance: int = 1, targets: Union[List, str] = None) -> Dict[str, Dict[str, dict]]:
+        """
+        Find the mappings of each curie separately (the same result as find_mappings per curie), searching from all
+        curies at once, and return a dict of curie -> mappings
+        """
+        unique_curies = list(dict.fromkeys(curies))
+        known = [(query, self._curie_to_index[curie]) for query, curie in enumerate(unique_curies) if curie in self._curie_to_index]
+        source_queries = np.array([query for query, _ in known], dtype=np.int64)
+        source_nodes = np.array([node for _, node in known], dtype=np.int64)
+        # a query never reports curies with its own prefix
+        excluded_keys = source_queries * len(self._prefixes) + self._prefix_ids[source_nodes]
+        results = self._search(source_queries, source_nodes, len(unique_curies), excluded_keys, distance, self._target_ids(targets))
+        return dict(zip(unique_curies, results))
 
-            # Visit each new node
-            for curie in tqdm(searching, desc=f'Searching with distance={i}'):
-                curr_mappings = self._mappings[curie]
+    def get_component(self, curie: str) -> List[str]:
+        """
+        Return all curies connected to the given curie through any number of mappings
+        """
+        if curie not in self._curie_to_index:
+            return []
+        component_id = self._components[self._curie_to_index[curie]]
+        return [self._curies[index] for index in np.flatnonzero(self._components == component_id)]
 
-                # Add new mappings to the set to search in the next iteration if we have not already visited
-                search_add = search_add.union([x for x in curr_mappings if x not in visited])
+    def _search(self, source_queries: np.ndarray, source_nodes: np.ndarray, n_queries: int, excluded_keys: np.ndarray, distance: int,
+                target_prefix_ids: Optional[np.ndarray]) -> List[Dict[str, dict]]:
+        """
+        Level-synchronous breadth-first search for a batch of queries over the CSR adjacency. The search state is a
+        sorted array of (query, curie) keys, so every level is one expansion of the frontiers of all queries.
+        :param source_queries: query index of each source node
+        :param source_nodes: source node indices
+        :param n_queries: number of queries
+        :param excluded_keys: query * number of prefixes + prefix id of the prefixes that are not reported for a query
+        :param distance: maximum mapping distance
+        :param target_prefix_ids: prefix ids that may be reported (None for any)
+        :return: one dict of mappings (key: curie, value: distance, label and uri) per query
+        """
+        results = [dict() for _ in range(n_queries)]
+        if len(source_nodes) == 0 or (target_prefix_ids is not None and len(target_prefix_ids) == 0):
+            return results
+        n_nodes, n_prefixes = len(self._curies), len(self._prefixes)
+        visited = np.unique(source_queries * n_nodes + source_nodes)
+        searching = visited
+        found_keys, found_distances = [], []
 
-                # Add new mappings to the set of found mappings if it's in the target ontologies
-                for m in curr_mappings:
-                    prefix_curr = m.split(':')[0]
-                    if m not in found and prefix_curr not in prefix_source and (len(targets) == 0 or prefix_curr in targets):
-                        info = {'distance': i + 1, 'label': '', 'uri': ''}
-                        if m in self._terms:
-                            term = self._terms[m]
-                            info['label'] = term['label']
-                            info['uri'] = term['uri']
-                        found[m] = info
+        for i in range(distance):
+            queries, nodes = searching // n_nodes, searching % n_nodes
+            neighbors = self._expand(nodes)
+            keys = np.unique(np.repeat(queries, self._indptr[nodes + 1] - self._indptr[nodes]) * n_nodes + neighbors)
+            new_keys = np.setdiff1d(keys, visited, assume_unique=True)
+            if len(new_keys) == 0:
+                break
+            visited = np.union1d(visited, new_keys)
 
-            searching = search_add
+            # Add new mappings to the set of found mappings if it's in the target ontologies
+            new_queries, new_prefix_ids = new_keys // n_nodes, self._prefix_ids[new_keys % n_nodes]
+            keep = ~np.isin(new_queries * n_prefixes + new_prefix_ids, excluded_keys)
+            if target_prefix_ids is not None:
+                keep &= np.isin(new_prefix_ids, target_prefix_ids)
+            found_keys.append(new_keys[keep])
+            found_distances.append(np.full(int(keep.sum()), i + 1, dtype=np.int64))
 
-        return found
+            searching = new_keys
 
+        if len(found_keys) == 0:
+            return results
+        found_keys, found_distances = np.concatenate(found_keys), np.concatenate(found_distances)
+        # per query, mappings are listed by distance and then by curie
+        order = np.lexsort((found_keys, found_distances, found_keys // n_nodes))
+        for query, node, node_distance in zip((found_keys[order] // n_nodes).tolist(), (found_keys[order] % n_nodes).tolist(), found_distances[order].tolist()):
+            results[query][self._curies[node]] = {'distance': node_distance, 'label': self._labels[node], 'uri': self._uris[node]}
+        return results
 
 if __name__ == '__main__':
     oxo = OxO('oxo_mapping_data/oxo-mappings-2020-02-04/')
@@ -0,0 +1,231 @@
+"""
+This script is used to cache the outputs of the build pipeline steps by the content of their inputs.
+
+A step is identified by a key hashed from the content of its input files/directories, its parameters and the code of
+the build scripts. If the cache already holds the outputs of that key they are hard-linked back (copied if the cache
+is on another file system) instead of running the step, otherwise the step command is run and its outputs are added
+to the cache the same way. Cache entries are made read-only, and outputs are always removed rather than truncated
+before a step rewrites them, so a linked output never changes its cache entry; a restored output is trusted by its
+stored size and digest instead of being hashed again. File digests are memoized by (path, size, mtime, inode) in a
+small SQLite table, so unchanged files are only hashed once while touched or re-downloaded files with identical content
+still lead to a cache hit.
+
+Usage:
+    python step_cache.py --cache_dir ../data/step_cache --step step2 --input data_dir=../data/Micobial_hierarchy \
+        --output ../data/merged_KG/KG_nodes_v1.tsv --output ../data/merged_KG/KG_edges_v1.tsv \
+        --params_json '{"ani_threshold": 99.5}' --code_path . -- python integrate_microbial_hierarchy.py ...
+"""
+
+## Import standard libraries
+import os
+import sys
+import json
+import time
+import stat
+import shutil
+import sqlite3
+import hashlib
+import argparse
+import logging
+import subprocess
+from typing import List, Dict, Optional
+
+## Import custom libraries
+from utils import get_logger
+
+CACHE_FORMAT_VERSION = 2
+HASH_CHUNK_SIZE = 8 * 1024 * 1024
+CODE_SUFFIXES = ('.py', '.sh')
+
+
+class StepCache:
+
+    def __init__(self, cache_dir: str, max_entries_per_step: int = 2, logger=None):
+        self.cache_dir = cache_dir
+        self.max_entries_per_step = max_entries_per_step
+        self.logger = logger if logger is not None else get_logger()
+        if not os.path.exists(cache_dir):
+            os.makedirs(cache_dir, exist_ok=True)
+        # Steps may run concurrently, sqlite serializes the writes to the digest memo
+        self.memo = sqlite3.connect(os.path.join(cache_dir, 'file_digests.sqlite'), timeout=600)
+        self.memo.execute("CREATE TABLE IF NOT EXISTS file_digests (path TEXT PRIMARY KEY, size INTEGER, mtime_ns INTEGER, inode INTEGER, digest TEXT)")
+        self.memo.commit()
+
+    # ---------------------------------------------- Hashing ------------------------------------------------ #
+
+    def _remember_digest(self, path: str, digest: str):
+        stat = os.stat(path)
+        self.memo.execute("INSERT OR REPLACE INTO file_digests VALUES (?, ?, ?, ?, ?)", (os.path.abspath(path), stat.st_size, stat.st_mtime_ns, stat.st_ino, digest))
+        self.memo.commit()
+
+    def file_digest(self, path: str) -> str:
+        stat = os.stat(path)
+        row = self.memo.execute("SELECT size, mtime_ns, inode, digest FROM file_digests WHERE path = ?", (os.path.abspath(path),)).fetchone()
+        if row is not None and tuple(row[:3]) == (stat.st_size, stat.st_mtime_ns, stat.st_ino):
+            return row[3]
+        hasher = hashlib.blake2b(digest_size=20)
+        with open(path, 'rb') as f:
+            for chunk in iter(lambda: f.read(HASH_CHUNK_SIZE), b''):
+                hasher.update(chunk)
+        digest = hasher.hexdigest()
+        self._remember_digest(path, digest)
+        return digest
+
+    def path_digest(self, path: str, suffixes: Optional[tuple] = None) -> str:
+        """
+        Digest of a file, or of the relative names and contents of all files under a directory.
+        """
+        if os.path.isfile(path):
+            return self.file_digest(path)
+        if not os.path.isdir(path):
+            return 'missing'
+        hasher = hashlib.blake2b(digest_size=20)
+        for root, dirs, files in os.walk(path):
+            dirs[:] = sorted(name for name in dirs if name != '__pycache__')
+            for name in sorted(files):
+                if suffixes is not None and not name.endswith(suffixes):
+                    continue
+                file_path = os.path.join(root, name)
+                hasher.update(f'{os.path.relpath(file_path, path)}\t{self.file_digest(file_path)}\n'.encode('utf-8'))
+        return hasher.hexdigest()
+
+    def step_key(self, step: str, inputs: Dict[str, str], params: dict, code_paths: List[str]) -> str:
+        """
+        Hash the content of the inputs (by input name, not path), the parameters and the code into the step key.
+        """
+        description = {'version': CACHE_FORMAT_VERSION,
+                      'step': step,
+                      'inputs': {name: self.path_digest(path) for name, path in sorted(inputs.items())},
+                      'params': params,
+                      'code': [self.path_digest(path, CODE_SUFFIXES) for path in code_paths]}
+        return hashlib.sha256(json.dumps(description, sort_keys=True, default=str).encode('utf-8')).hexdigest()[:32]
+
+    # ------------------------------------------- Store / restore ------------------------------------------- #
+
+    @staticmethod
+    def _remove(path: str):
+        # Outputs are removed before they are rewritten, so that an output linked elsewhere is never truncated in place
+        if os.path.lexists(path):
+            os.remove(path)
+
+    @staticmethod
+    def _link_or_copy(source: str, target: str):
+        try:
+            os.link(source, target)
+        except OSError:
+            # Cache and outputs on different file systems
+            shutil.copyfile(source, target)
+
+    def restore(self, step: str, key: str, outputs: List[str]) -> bool:
+        entry_dir = os.path.join(self.cache_dir, step, key)
+        manifest_path = os.path.join(entry_dir, 'manifest.json')
+        if not os.path.exists(manifest_path):
+            return False
+        with open(manifest_path) as f:
+            manifest = json.load(f)
+        stored = manifest['outputs']
+        if len(stored) != len(outputs) or not all(os.path.exists(os.path.join(entry_dir, item['file'])) for item in stored):
+            self.logger.warning(f"Cache entry {entry_dir} is incomplete, ignoring it")
+            return False
+        # A truncated or otherwise resized cache file is treated as a miss; the content is trusted by its stored digest
+        if any(os.path.getsize(os.path.join(entry_dir, item['file'])) != item['size'] for item in stored):
+            self.logger.warning(f"Cache entry {entry_dir} does not match its stored sizes, removing it")
+            shutil.rmtree(entry_dir, ignore_errors=True)
+            return False
+        now = time.time()
+        for output, item in zip(outputs, stored):
+            if os.path.dirname(output):
+                os.makedirs(os.path.dirname(output), exist_ok=True)
+            self._remove(output)
+            self._link_or_copy(os.path.join(entry_dir, item['file']), output)
+            # Restored outputs must look newer than the inputs to snakemake
+            os.utime(output, (now, now))
+            # Later steps hash this output as their input, so its digest is memoized instead of recomputed
+            self._remember_digest(output, item['digest'])
+        os.utime(entry_dir, (now, now))
+        return True
+
+    def store(self, step: str, key: str, outputs: List[str], metadata: dict):
+        step_dir = os.path.join(self.cache_dir, step)
+        entry_dir = os.path.join(step_dir, key)
+        temp_dir = f'{entry_dir}.tmp{os.getpid()}'
+        if os.path.exists(temp_dir):
+            shutil.rmtree(temp_dir)
+        os.makedirs(temp_dir)
+        stored = []
+        for index, output in enumerate(outputs):
+            file_name = f'{index}_{os.path.basename(output)}'
+            digest = self.file_digest(output)
+            self._link_or_copy(output, os.path.join(temp_dir, file_name))
+            os.chmod(os.path.join(temp_dir, file_name), stat.S_IRUSR | stat.S_IRGRP | stat.S_IROTH)
+            stored.append({'file': file_name, 'digest': digest, 'size': os.path.getsize(output)})
+        with open(os.path.join(temp_dir, 'manifest.json'), 'w') as f:
+            json.dump(dict(metadata, step=step, key=key, outputs=stored, created=time.strftime('%Y-%m-%d %H:%M:%S')), f, indent=2)
+        if os.path.exists(entry_dir):
+            shutil.rmtree(entry_dir)
+        os.rename(temp_dir, entry_dir)
+        self._prune(step_dir)
+
+    def _prune(self, step_dir: str):
+        """
+        Keep only the most recently used entries of a step.
+        """
+        entries = [os.path.join(step_dir, name) for name in os.listdir(step_dir) if '.tmp' not in name]
+        entries.sort(key=os.path.getmtime, reverse=True)
+        for entry_dir in entries[self.max_entries_per_step:]:
+            shutil.rmtree(entry_dir, ignore_errors=True)
+            self.logger.info(f"Removed old cache entry {entry_dir}")
+
+    # ------------------------------------------------- Run ------------------------------------------------- #
+
+    def run(self, step: str, command: List[str], inputs: Dict[str, str], outputs: List[str], params: Optional[dict] = None,
+            code_paths: Optional[List[str]] = None) -> bool:
+        """
+        Restore the outputs of a step from the cache, or run the step and cache its outputs.
+        Returns True when the outputs were restored from the cache.
+        """
+        start = time.time()
+        params = params or {}
+        code_paths = code_paths or []
+        key = self.step_key(step, inputs, params, code_paths)
+        self.logger.info(f"{step}: cache key {key} (hashed in {time.time() - start:.1f}s)")
+        if self.restore(step, key, outputs):
+            self.logger.info(f"{step}: inputs, parameters and code are unchanged, outputs are restored from the cache")
+            return True
+
+        self.logger.info(f"{step}: no cache entry, running {' '.join(command)}")
+        for output in outputs:
+            self._remove(output)
+        subprocess.run(command, check=True)
+        missing = [output for output in outputs if not os.path.exists(output)]
+        if missing:
+            raise FileNotFoundError(f"{step} did not create {', '.join(missing)}")
+        self.store(step, key, outputs, {'params': params, 'inputs': inputs, 'seconds': round(time.time() - start, 1)})
+        self.logger.info(f"{step}: finished in {time.time() - start:.1f}s, outputs are cached")
+        return False
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='Run a build pipeline step unless its outputs can be restored from the content-hash cache')
+    parser.add_argument('--cache_dir', type=str, help='path of the cache directory')
+    parser.add_argument('--step', type=str, help='name of the step')
+    parser.add_argument('--input', type=str, action='append', default=[], help='input of the step as name=path (file or directory), can be repeated')
+    parser.add_argument('--output', type=str, action='append', default=[], help='output file of the step, can be repeated')
+    parser.add_argument('--params_json', type=str, help='parameters of the step as a JSON object', default='{}')
+    parser.add_argument('--code_path', type=str, action='append', default=[], help='code file or directory the step depends on, can be repeated')
+    parser.add_argument('--max_entries_per_step', type=int, help='number of cache entries kept per step', default=2)
+    parser.add_argument('command', nargs=argparse.REMAINDER, help='step command, after --')
+    args = parser.parse_args()
+
+    # Create a logger object
+    logger = get_logger()
+    logger.setLevel(logging.INFO)
+
+    command = args.command[1:] if args.command[:1] == ['--'] else args.command
+    if not command:
+        logger.error('No step command is given')
+        sys.exit(1)
+    inputs = dict(item.split('=', 1) for item in args.input)
+
+    step_cache = StepCache(args.cache_dir, args.max_entries_per_step, logger=logger)
+    step_cache.run(args.step, command, inputs, args.output, json.loads(args.params_json), args.code_path)
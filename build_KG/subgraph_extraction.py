@@ -0,0 +1,311 @@
+"""
+This script is used to extract typed subgraphs from a built MetagenomicKG and export them for downstream use cases.
+
+Nodes are selected by node type and knowledge source, edges by predicate, knowledge source and (excluded) node type
+pairs, optionally restricted to the k-hop neighborhood of seed nodes. The selection is computed with boolean masks
+over a GraphIndex (see graph_query.py), so memory stays proportional to the number of nodes and edges, and the
+induced subgraph can be exported as:
+    tsv       KG_nodes/KG_edges TSV files in the KG format (streamed from the source TSVs)
+    npz       node ids/types plus a COO edge list and out-edge CSR arrays
+    networkx  a tab-separated edge list readable by networkx.read_edgelist (plus a node table)
+    dgl       a DGL heterograph keyed by (source type, predicate, target type) (requires dgl and torch)
+
+Examples:
+    python subgraph_extraction.py --snapshot kg_v6_index.npz --node_types biolink:OrganismTaxon biolink:Disease --formats npz networkx --output_dir sub
+    python subgraph_extraction.py --kg_dir ../data/merged_KG --seeds GTDB:GCF_000005845.2 --k 2 --formats tsv --output_dir sub
+"""
+
+## Import standard libraries
+import os
+import sys
+import csv
+import json
+import argparse
+import logging
+from typing import List, Tuple, Optional
+import numpy as np
+from tqdm import tqdm
+
+## Import custom libraries
+from utils import get_logger
+from graph_query import GraphIndex, load_graph_index, encode_strings
+
+EXPORT_FORMATS = ('tsv', 'npz', 'networkx', 'dgl')
+
+
+class SubgraphSelection:
+    """
+    Node and edge masks of a subgraph of a GraphIndex.
+    """
+
+    def __init__(self, graph: GraphIndex, node_mask: np.ndarray, edge_mask: np.ndarray, filters: dict):
+        self.graph = graph
+        self.node_mask = node_mask
+        self.edge_mask = edge_mask
+        self.filters = filters
+
+    @property
+    def n_nodes(self) -> int:
+        return int(self.node_mask.sum())
+
+    @property
+    def n_edges(self) -> int:
+        return int(self.edge_mask.sum())
+
+    def node_indices(self) -> np.ndarray:
+        return np.flatnonzero(self.node_mask)
+
+    def edge_indices(self) -> np.ndarray:
+        return np.flatnonzero(self.edge_mask)
+
+    def local_node_index(self) -> np.ndarray:
+        """
+        Map every node of the full graph to its position in the subgraph (-1 if it is not selected).
+        """
+        local_index = np.full(self.graph.n_nodes, -1, dtype=np.int64)
+        local_index[self.node_mask] = np.arange(self.n_nodes)
+        return local_index
+
+
+def select_subgraph(graph: GraphIndex, node_types: Optional[List[str]] = None, predicates: Optional[List[str]] = None,
+                    knowledge_sources: Optional[List[str]] = None, exclude_type_pairs: Optional[List[Tuple[str, str]]] = None,
+                    seeds: Optional[List[str]] = None, k: int = 1, drop_isolated: bool = False, logger=None) -> SubgraphSelection:
+    """
+    Select the subgraph induced by the given filters.
+    :param node_types: keep only nodes of these types
+    :param predicates: keep only edges with these predicates
+    :param knowledge_sources: keep only nodes and edges from at least one of these knowledge sources
+    :param exclude_type_pairs: drop edges between these (unordered) node type pairs, e.g. (biolink:OrganismTaxon, biolink:Disease)
+    :param seeds: restrict the subgraph to the k-hop neighborhood (over the selected nodes and edges) of these nodes
+    :param drop_isolated: drop nodes without any selected edge
+    """
+    node_mask = np.ones(graph.n_nodes, dtype=bool)
+    edge_mask = np.ones(graph.n_edges, dtype=bool)
+    if node_types is not None:
+        node_mask &= np.isin(graph.node_type_ids, [graph.node_type_index[node_type] for node_type in node_types if node_type in graph.node_type_index])
+    if knowledge_sources is not None:
+        source_mask = np.uint64(graph.source_mask(knowledge_sources))
+        node_mask &= (graph.node_source_masks & source_mask) != 0
+        edge_mask &= (graph.edge_source_masks & source_mask) != 0
+    if predicates is not None:
+        edge_mask &= np.isin(graph.edge_predicate_ids, [graph.predicate_index[predicate] for predicate in predicates if predicate in graph.predicate_index])
+    if exclude_type_pairs:
+        source_types = graph.node_type_ids[graph.edge_source]
+        target_types = graph.node_type_ids[graph.edge_target]
+        for first_type, second_type in exclude_type_pairs:
+            if first_type not in graph.node_type_index or second_type not in graph.node_type_index:
+                continue
+            first_id, second_id = graph.node_type_index[first_type], graph.node_type_index[second_type]
+            edge_mask &= ~(((source_types == first_id) & (target_types == second_id)) | ((source_types == second_id) & (target_types == first_id)))
+        del source_types, target_types
+    edge_mask &= node_mask[graph.edge_source] & node_mask[graph.edge_target]
+
+    if seeds is not None:
+        seed_indices = [graph.find_node(seed) for seed in seeds]
+        if logger is not None and None in seed_indices:
+            logger.warning(f"{seed_indices.count(None)} seed nodes are not found in the graph")
+        frontier = np.unique(np.array([seed for seed in seed_indices if seed is not None and node_mask[seed]], dtype=np.int64))
+        visited = np.zeros(graph.n_nodes, dtype=bool)
+        visited[frontier] = True
+        for _ in range(k):
+            if len(frontier) == 0:
+                break
+            _, neighbors, edges = graph.expand(frontier, 'both')
+            neighbors = neighbors[edge_mask[edges]]
+            frontier = np.unique(neighbors[~visited[neighbors]])
+            visited[frontier] = True
+        node_mask &= visited
+        edge_mask &= node_mask[graph.edge_source] & node_mask[graph.edge_target]
+
+    if drop_isolated:
+        connected = np.zeros(graph.n_nodes, dtype=bool)
+        connected[graph.edge_source[edge_mask]] = True
+        connected[graph.edge_target[edge_mask]] = True
+        node_mask &= connected
+
+    filters = {'node_types': node_types, 'predicates': predicates, 'knowledge_sources': knowledge_sources,
+               'exclude_type_pairs': exclude_type_pairs, 'seeds': seeds, 'k': k if seeds is not None else None, 'drop_isolated': drop_isolated}
+    return SubgraphSelection(graph, node_mask, edge_mask, filters)
+
+
+# ------------------------------------------------ Exports ------------------------------------------------- #
+
+def export_npz(selection: SubgraphSelection, file_path: str):
+    """
+    Save node ids/types, the COO edge list (local node indices) with predicate ids and the out-edge CSR arrays.
+    """
+    graph = selection.graph
+    node_indices, edge_indices = selection.node_indices(), selection.edge_indices()
+    local_index = selection.local_node_index()
+    edge_index = np.stack([local_index[graph.edge_source[edge_indices]], local_index[graph.edge_target[edge_indices]]])
+    order = np.argsort(edge_index[0], kind='stable')
+    indptr = np.zeros(len(node_indices) + 1, dtype=np.int64)
+    np.cumsum(np.bincount(edge_index[0], minlength=len(node_indices)), out=indptr[1:])
+    np.savez(file_path,
+             node_ids=encode_strings([graph.node_ids[node_index] for node_index in node_indices.tolist()]),
+             node_type_ids=graph.node_type_ids[node_indices], node_types=encode_strings(graph.node_types),
+             is_pathogen=graph.is_pathogen[node_indices],
+             edge_index=edge_index, edge_predicate_ids=graph.edge_predicate_ids[edge_indices], predicates=encode_strings(graph.predicates),
+             csr_indptr=indptr, csr_indices=edge_index[1][order], csr_edge_ids=order)
+
+
+def export_networkx(selection: SubgraphSelection, output_dir: str):
+    """
+    Write edges.edgelist (readable with networkx.read_edgelist(path, delimiter='\\t', create_using=networkx.MultiDiGraph))
+    and nodes.tsv with the node attributes.
+    """
+    graph = selection.graph
+    with open(os.path.join(output_dir, 'nodes.tsv'), 'w', newline='', encoding='utf-8') as f:
+        writer = csv.writer(f, delimiter='\t', lineterminator='\n')
+        writer.writerow(['node_id', 'node_type', 'name', 'is_pathogen'])
+        for node_index in selection.node_indices().tolist():
+            writer.writerow([graph.node_ids[node_index], graph.node_types[graph.node_type_ids[node_index]], graph.node_names[node_index], bool(graph.is_pathogen[node_index])])
+    with open(os.path.join(output_dir, 'edges.edgelist'), 'w', encoding='utf-8') as f:
+        edge_indices = selection.edge_indices()
+        for source, target, predicate in zip(graph.edge_source[edge_indices].tolist(), graph.edge_target[edge_indices].tolist(), graph.edge_predicate_ids[edge_indices].tolist()):
+            f.write(f"{graph.node_ids[source]}\t{graph.node_ids[target]}\t{{'predicate': '{graph.predicates[predicate]}'}}\n")
+
+
+def to_networkx(selection: SubgraphSelection):
+    """
+    Build a networkx MultiDiGraph of the subgraph (requires networkx).
+    """
+    import networkx as nx
+    graph = selection.graph
+    nx_graph = nx.MultiDiGraph()
+    nx_graph.add_nodes_from((graph.node_ids[node_index], {'node_type': graph.node_types[graph.node_type_ids[node_index]], 'is_pathogen': bool(graph.is_pathogen[node_index])})
+                            for node_index in selection.node_indices().tolist())
+    edge_indices = selection.edge_indices()
+    nx_graph.add_edges_from((graph.node_ids[source], graph.node_ids[target], {'predicate': graph.predicates[predicate]})
+                            for source, target, predicate in zip(graph.edge_source[edge_indices].tolist(), graph.edge_target[edge_indices].tolist(), graph.edge_predicate_ids[edge_indices].tolist()))
+    return nx_graph
+
+
+def to_dgl(selection: SubgraphSelection):
+    """
+    Build a DGL heterograph with one node type per KG node type and one relation per (source type, predicate, target type).
+    Returns the graph and, per node type, the KG node ids in DGL node order (requires dgl and torch).
+    """
+    import dgl
+    import torch
+    graph = selection.graph
+    node_indices, edge_indices = selection.node_indices(), selection.edge_indices()
+    # Position of every selected node within the nodes of its own type
+    type_local_index = np.full(graph.n_nodes, -1, dtype=np.int64)
+    node_ids_by_type = {}
+    for type_id in np.unique(graph.node_type_ids[node_indices]).tolist():
+        typed_nodes = node_indices[graph.node_type_ids[node_indices] == type_id]
+        type_local_index[typed_nodes] = np.arange(len(typed_nodes))
+        node_ids_by_type[graph.node_types[type_id]] = [graph.node_ids[node_index] for node_index in typed_nodes.tolist()]
+
+    sources, targets = graph.edge_source[edge_indices], graph.edge_target[edge_indices]
+    relation_keys = np.stack([graph.node_type_ids[sources].astype(np.int64), graph.edge_predicate_ids[edge_indices].astype(np.int64), graph.node_type_ids[targets].astype(np.int64)], axis=1)
+    relations, relation_ids = np.unique(relation_keys, axis=0, return_inverse=True)
+    # Group the edges by relation with one sort instead of one scan per relation
+    order = np.argsort(relation_ids.reshape(-1), kind='stable')
+    boundaries = np.cumsum(np.bincount(relation_ids.reshape(-1), minlength=len(relations)))[:-1]
+    data_dict = {}
+    for (source_type, predicate, target_type), relation_edges in zip(relations.tolist(), np.split(order, boundaries)):
+        data_dict[(graph.node_types[source_type], graph.predicates[predicate], graph.node_types[target_type])] = \
+            (torch.from_numpy(type_local_index[sources[relation_edges]]), torch.from_numpy(type_local_index[targets[relation_edges]]))
+    num_nodes_dict = {node_type: len(node_ids) for node_type, node_ids in node_ids_by_type.items()}
+    return dgl.heterograph(data_dict, num_nodes_dict=num_nodes_dict), node_ids_by_type
+
+
+def export_dgl(selection: SubgraphSelection, output_dir: str):
+    import dgl
+    dgl_graph, node_ids_by_type = to_dgl(selection)
+    dgl.save_graphs(os.path.join(output_dir, 'subgraph.dgl'), [dgl_graph])
+    with open(os.path.join(output_dir, 'dgl_node_ids.json'), 'w') as f:
+        json.dump(node_ids_by_type, f)
+
+
+def export_tsv(selection: SubgraphSelection, node_file: str, edge_file: str, output_dir: str, node_filename: str, edge_filename: str):
+    """
+    Stream the source KG TSV files and keep the rows of the selected nodes and edges, preserving all columns.
+    """
+    graph = selection.graph
+    selected_node_ids = set(graph.node_ids[node_index] for node_index in selection.node_indices().tolist())
+    allowed_predicates = set(selection.filters['predicates']) if selection.filters['predicates'] is not None else None
+    # Edge rows are matched by (source, target, predicate); duplicated keys share one decision as in KnowledgeGraph
+    selected_edge_keys = set()
+    edge_indices = selection.edge_indices()
+    for source, target, predicate in zip(graph.edge_source[edge_indices].tolist(), graph.edge_target[edge_indices].tolist(), graph.edge_predicate_ids[edge_indices].tolist()):
+        selected_edge_keys.add((source, target, predicate))
+
+    csv.field_size_limit(sys.maxsize)
+    with open(node_file, newline='', encoding='utf-8') as fin, open(os.path.join(output_dir, node_filename), 'w', newline='', encoding='utf-8') as fout:
+        reader, writer = csv.reader(fin, delimiter='\t'), csv.writer(fout, delimiter='\t', lineterminator='\n')
+        header = next(reader)
+        writer.writerow(header)
+        node_id_column = header.index('node_id')
+        for row in tqdm(reader, desc='Writing subgraph nodes'):
+            if row[node_id_column] in selected_node_ids:
+                writer.writerow(row)
+    with open(edge_file, newline='', encoding='utf-8') as fin, open(os.path.join(output_dir, edge_filename), 'w', newline='', encoding='utf-8') as fout:
+        reader, writer = csv.reader(fin, delimiter='\t'), csv.writer(fout, delimiter='\t', lineterminator='\n')
+        header = next(reader)
+        writer.writerow(header)
+        source_column, target_column, predicate_column = header.index('source_node'), header.index('target_node'), header.index('predicate')
+        for row in tqdm(reader, desc='Writing subgraph edges'):
+            predicate = row[predicate_column]
+            if allowed_predicates is not None and predicate not in allowed_predicates:
+                continue
+            key = (graph.node_index.get(row[source_column]), graph.node_index.get(row[target_column]), graph.predicate_index.get(predicate))
+            if key in selected_edge_keys:
+                writer.writerow(row)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='Extract a typed subgraph from the knowledge graph and export it')
+    parser.add_argument('--kg_dir', type=str, help='path of the knowledge graph directory', default=None)
+    parser.add_argument('--node_filename', type=str, help='name of the node TSV file', default='KG_nodes_v6.tsv')
+    parser.add_argument('--edge_filename', type=str, help='name of the edge TSV file', default='KG_edges_v6.tsv')
+    parser.add_argument('--snapshot', type=str, help='path of a graph index snapshot created by graph_query.py', default=None)
+    parser.add_argument('--node_types', type=str, nargs='*', help='node types to keep', default=None)
+    parser.add_argument('--predicates', type=str, nargs='*', help='edge predicates to keep', default=None)
+    parser.add_argument('--knowledge_sources', type=str, nargs='*', help='knowledge sources to keep', default=None)
+    parser.add_argument('--exclude_type_pair', type=str, nargs=2, action='append', help='drop edges between these two node types (can be repeated)', default=None)
+    parser.add_argument('--seeds', type=str, nargs='*', help='seed node ids or synonyms', default=None)
+    parser.add_argument('--seed_file', type=str, help='file with one seed node id or synonym per line', default=None)
+    parser.add_argument('--k', type=int, help='number of hops around the seed nodes', default=1)
+    parser.add_argument('--drop_isolated', action='store_true', help='drop nodes without any selected edge')
+    parser.add_argument('--formats', type=str, nargs='+', choices=EXPORT_FORMATS, help='export formats', default=['npz'])
+    parser.add_argument('--output_dir', type=str, help='path of the output directory')
+    args = parser.parse_args()
+
+    # Create a logger object
+    logger = get_logger()
+    logger.setLevel(logging.INFO)
+
+    seeds = args.seeds
+    if args.seed_file is not None:
+        with open(args.seed_file) as f:
+            seeds = (seeds or []) + [line.strip() for line in f if line.strip()]
+
+    if 'tsv' in args.formats and args.kg_dir is None:
+        logger.error('The tsv format streams the source KG files, please provide --kg_dir')
+        sys.exit(1)
+    if not os.path.exists(args.output_dir):
+        os.makedirs(args.output_dir)
+
+    graph = load_graph_index(args.snapshot, args.kg_dir, args.node_filename, args.edge_filename, logger=logger)
+    logger.info(f"Loaded a graph with {graph.n_nodes} nodes and {graph.n_edges} edges")
+    selection = select_subgraph(graph, args.node_types, args.predicates, args.knowledge_sources, args.exclude_type_pair, seeds, args.k, args.drop_isolated, logger=logger)
+    logger.info(f"Selected a subgraph with {selection.n_nodes} nodes and {selection.n_edges} edges")
+
+    if 'npz' in args.formats:
+        export_npz(selection, os.path.join(args.output_dir, 'subgraph.npz'))
+    if 'networkx' in args.formats:
+        export_networkx(selection, args.output_dir)
+    if 'dgl' in args.formats:
+        try:
+            export_dgl(selection, args.output_dir)
+        except ImportError:
+            logger.error('The dgl format requires dgl and torch to be installed')
+    if 'tsv' in args.formats:
+        export_tsv(selection, os.path.join(args.kg_dir, args.node_filename), os.path.join(args.kg_dir, args.edge_filename),
+                   args.output_dir, 'KG_nodes_subgraph.tsv', 'KG_edges_subgraph.tsv')
+    with open(os.path.join(args.output_dir, 'subgraph_info.json'), 'w') as f:
+        json.dump({'n_nodes': selection.n_nodes, 'n_edges': selection.n_edges, 'filters': selection.filters, 'formats': args.formats}, f, indent=2)
+    logger.info(f"Subgraph is saved to {args.output_dir}")
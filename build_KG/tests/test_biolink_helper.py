@@ -0,0 +1,113 @@
+"""
+Checks the compiled (bitset) BiolinkHelper lookups against the set-based lookups they replaced, on a small local
+Biolink yaml (no network access).
+
+Run from build_KG:  python -m pytest tests
+"""
+
+import os
+import sys
+import random
+import itertools
+
+import pytest
+
+sys.path.append(os.path.join(os.path.dirname(os.path.realpath(__file__)), '..'))
+from kg2_utils.biolink_helper import BiolinkHelper, BIOLINK_LOOKUP_KINDS
+
+BIOLINK_YAML = """
+slots:
+  name: {}
+  related to: {}
+  related to at instance level: {is_a: related to}
+  affects: {is_a: related to at instance level, inverse: affected by, annotations: {canonical_predicate: true}}
+  affected by: {is_a: related to at instance level, inverse: affects}
+  interacts with: {is_a: related to at instance level, symmetric: true}
+  physically interacts with: {is_a: interacts with, mixins: [positively regulates]}
+  regulates: {mixin: true}
+  positively regulates: {is_a: regulates, mixin: true}
+classes:
+  named thing: {}
+  biological entity: {is_a: named thing}
+  gene: {is_a: biological entity, mixins: [gene or gene product]}
+  protein: {is_a: biological entity, mixins: [gene product mixin]}
+  gene or gene product: {mixin: true}
+  gene product mixin: {is_a: gene or gene product, mixin: true}
+  disease or phenotypic feature: {is_a: biological entity}
+  disease: {is_a: disease or phenotypic feature}
+  phenotypic feature: {is_a: disease or phenotypic feature}
+  chemical entity: {is_a: named thing, mixins: [physical essence]}
+  physical essence: {mixin: true}
+  drug: {is_a: chemical entity}
+enums:
+  gene_or_gene_product_or_chemical_entity_aspect_enum:
+    permissible_values:
+      activity or abundance:
+      activity: {is_a: activity or abundance}
+      abundance: {is_a: activity or abundance}
+  direction_qualifier_enum:
+    permissible_values:
+      increased: {}
+      decreased:
+      upregulated: {is_a: increased}
+"""
+
+
+def set_based_closure(helper: BiolinkHelper, biolink_items, direction: str, include_mixins: bool, include_conflations: bool) -> set:
+    """
+    The set unions that get_ancestors/get_descendants did before the lookup was compiled into bitsets.
+    """
+    lookup_map = helper.biolink_lookup_map
+    input_item_set = helper._convert_to_set(biolink_items)
+    closure = set(input_item_set)
+    mixin_property = f"{direction}_with_mixins" if include_mixins else direction
+    categories = input_item_set.intersection(lookup_map["categories"])
+    if include_conflations:
+        categories = set(helper.add_conflations(categories))
+    for category in categories:
+        closure.update(lookup_map["categories"][category][mixin_property])
+    for item in input_item_set.intersection(lookup_map["predicates"]):
+        closure.update(lookup_map["predicates"][item][mixin_property])
+    for kind in BIOLINK_LOOKUP_KINDS[2:]:
+        for item in input_item_set.intersection(lookup_map[kind]):
+            closure.update(lookup_map[kind][item][direction])
+    return closure
+
+
+@pytest.fixture
+def biolink_yaml_path(tmp_path):
+    yaml_path = tmp_path / "biolink-model.yaml"
+    yaml_path.write_text(BIOLINK_YAML)
+    return str(yaml_path)
+
+
+def test_compiled_lookup_matches_set_based_lookup(biolink_yaml_path):
+    helper = BiolinkHelper(biolink_version="3.0.0", is_test=True, biolink_yaml_path=biolink_yaml_path)
+    assert not os.path.exists(helper.compiled_lookup_path) and not os.path.exists(helper.biolink_lookup_map_path)
+    assert "biolink:Drug" in helper.get_descendants("biolink:ChemicalEntity")
+    assert "biolink:PhysicalEssence" in helper.get_ancestors("biolink:Drug", include_mixins=True)
+    assert "biolink:PhysicalEssence" not in helper.get_ancestors("biolink:Drug", include_mixins=False)
+    assert helper.get_canonical_predicates("biolink:affected_by") == ["biolink:affects"]
+
+    items = sorted({item for kind in BIOLINK_LOOKUP_KINDS for item in helper.biolink_lookup_map[kind]}) + ["biolink:NotInBiolink"]
+    rng = random.Random(100)
+    inputs = items + [rng.sample(items, 3) for _ in range(50)]
+    for include_mixins, include_conflations in itertools.product([True, False], repeat=2):
+        flags = dict(include_mixins=include_mixins, include_conflations=include_conflations)
+        for biolink_items in inputs:
+            assert set(helper.get_ancestors(biolink_items, **flags)) == set_based_closure(helper, biolink_items, "ancestors", **flags)
+            assert set(helper.get_descendants(biolink_items, **flags)) == set_based_closure(helper, biolink_items, "descendants", **flags)
+        for ancestor, item in itertools.product(items, repeat=2):
+            assert helper.is_ancestor(ancestor, item, **flags) == (ancestor in set_based_closure(helper, item, "ancestors", **flags))
+
+
+def test_lookup_is_keyed_by_yaml_content(biolink_yaml_path, tmp_path):
+    helper = BiolinkHelper(biolink_version="3.0.0", is_test=True, biolink_yaml_path=biolink_yaml_path)
+    edited_yaml_path = tmp_path / "edited-biolink-model.yaml"
+    edited_yaml_path.write_text(BIOLINK_YAML.replace("drug: {is_a: chemical entity}", "drug: {is_a: biological entity}"))
+    edited_helper = BiolinkHelper(biolink_version="3.0.0", is_test=True, biolink_yaml_path=str(edited_yaml_path))
+
+    assert edited_helper.compiled_lookup_path != helper.compiled_lookup_path
+    assert edited_helper.biolink_lookup_map_path != helper.biolink_lookup_map_path
+    assert helper.is_ancestor("biolink:ChemicalEntity", "biolink:Drug")
+    assert not edited_helper.is_ancestor("biolink:ChemicalEntity", "biolink:Drug")
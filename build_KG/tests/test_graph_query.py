@@ -0,0 +1,66 @@
+"""
+Checks the vectorized path pattern matching of GraphIndex against a plain depth-first search, and the snapshot round trip.
+
+Run from build_KG:  python -m pytest tests
+"""
+
+import os
+import sys
+
+import numpy as np
+
+sys.path.append(os.path.join(os.path.dirname(os.path.realpath(__file__)), '..'))
+from graph_query import GraphIndex
+
+
+def make_graph(n_nodes: int = 300, n_edges: int = 1500, seed: int = 100) -> GraphIndex:
+    rng = np.random.default_rng(seed)
+    node_types = ['biolink:OrganismTaxon', 'biolink:BiologicalEntity', 'biolink:Pathway']
+    predicates = ['biolink:related_to', 'biolink:has_part']
+    graph = GraphIndex([f'TEST:{index}' for index in range(n_nodes)], rng.integers(0, len(node_types), n_nodes).astype(np.uint8), node_types,
+                       [f'node {index}' for index in range(n_nodes)], np.ones(n_nodes, dtype=np.uint64), np.zeros(n_nodes, dtype=bool),
+                       rng.integers(0, n_nodes, n_edges), rng.integers(0, n_nodes, n_edges), rng.integers(0, len(predicates), n_edges).astype(np.uint16),
+                       predicates, np.ones(n_edges, dtype=np.uint64), ['TEST'], [], np.zeros(0, dtype=np.int64))
+    graph.n_skipped_edges = 7
+    return graph
+
+
+def depth_first_paths(graph: GraphIndex, categories, predicates, direction, limit):
+    starts = np.flatnonzero(graph.node_type_ids == graph.node_type_index[categories[0]])
+    paths = []
+
+    def extend(path):
+        if len(paths) >= limit:
+            return
+        if len(path) == len(categories):
+            paths.append([graph.node_ids[node_index] for node_index in path])
+            return
+        predicate = predicates[len(path) - 1]
+        _, neighbors, _ = graph.expand(np.array([path[-1]]), direction, None if predicate is None else [predicate], [categories[len(path)]])
+        for neighbor in np.unique(neighbors).tolist():
+            if neighbor not in path:
+                extend(path + [neighbor])
+
+    for start in starts.tolist():
+        extend([start])
+    return paths
+
+
+def test_match_path_pattern_matches_depth_first_search():
+    graph = make_graph()
+    patterns = [(['biolink:OrganismTaxon', 'biolink:BiologicalEntity', 'biolink:Pathway'], [None, None]),
+                (['biolink:OrganismTaxon', 'biolink:OrganismTaxon', 'biolink:OrganismTaxon', 'biolink:OrganismTaxon'], [None, 'biolink:has_part', None]),
+                (['biolink:Pathway', 'biolink:BiologicalEntity'], ['biolink:related_to'])]
+    for categories, predicates in patterns:
+        for direction in ('out', 'in', 'both'):
+            for limit in (1, 10, 100, 100000):
+                assert graph.match_path_pattern(categories, predicates, direction=direction, limit=limit) == \
+                    depth_first_paths(graph, categories, predicates, direction, limit)
+
+
+def test_snapshot_keeps_skipped_edge_count(tmp_path):
+    graph = make_graph()
+    graph.save(str(tmp_path / 'index.npz'))
+    loaded = GraphIndex.load(str(tmp_path / 'index.npz'))
+    assert loaded.n_skipped_edges == 7
+    assert np.array_equal(loaded.edge_source, graph.edge_source)
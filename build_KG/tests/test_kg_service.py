@@ -0,0 +1,97 @@
+"""
+Runs the KG HTTP service on a synthetic graph and checks its endpoints, error responses and metrics.
+
+Run from build_KG:  python -m pytest tests
+"""
+
+import os
+import sys
+import json
+import threading
+import urllib.error
+import urllib.request
+
+import pytest
+
+sys.path.append(os.path.join(os.path.dirname(os.path.realpath(__file__)), '..'))
+from kg_service import make_server, make_synthetic_graph, MAX_NEIGHBORS, MAX_SUBGRAPH_HOPS
+
+
+@pytest.fixture(scope='module')
+def service_url():
+    server = make_server(make_synthetic_graph(n_genomes=200, n_other_nodes=1000, n_edges=5000), port=0)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield f'http://127.0.0.1:{server.server_address[1]}'
+    server.shutdown()
+    server.server_close()
+
+
+def get(service_url, path):
+    try:
+        with urllib.request.urlopen(service_url + path) as response:
+            return response.status, json.loads(response.read())
+    except urllib.error.HTTPError as e:
+        return e.code, json.loads(e.read())
+
+
+def test_endpoints(service_url):
+    status, health = get(service_url, '/health')
+    assert status == 200 and health == {'status': 'ok', 'n_nodes': 1220, 'n_edges': 5000}
+
+    # Genome 20 (after the 20 taxa) carries the synonym GTDB:GCF_000000020.1; other versions of the accession also resolve
+    status, node = get(service_url, '/node?id=GTDB:GCF_000000020.3')
+    assert status == 200 and node['node_id'] == 'MKG:00000020' and node['node_type'] == 'biolink:OrganismTaxon'
+    assert node['out_degree'] >= 1
+
+    status, neighbors = get(service_url, '/neighbors?id=MKG:00000020&direction=out&limit=1')
+    assert status == 200 and len(neighbors['neighbors']) == 1 and neighbors['truncated'] == (neighbors['total'] > 1)
+    assert all(neighbor['direction'] == 'out' for neighbor in neighbors['neighbors'])
+    status, neighbors = get(service_url, f'/neighbors?id=MKG:00000020&limit={10 * MAX_NEIGHBORS}')
+    assert status == 200 and len(neighbors['neighbors']) <= MAX_NEIGHBORS
+
+    status, subgraph = get(service_url, '/subgraph?seed=MKG:00000020&k=1&max_nodes=10')
+    assert status == 200 and 1 <= len(subgraph['nodes']) <= 10
+    assert subgraph['nodes'][0]['node_id'] == 'MKG:00000020' and subgraph['nodes'][0]['hop'] == 0
+    node_ids = {node['node_id'] for node in subgraph['nodes']}
+    assert all(edge['source_node'] in node_ids and edge['target_node'] in node_ids for edge in subgraph['edges'])
+    # k is capped like limit and max_nodes
+    assert get(service_url, f'/subgraph?seed=MKG:00000020&k={MAX_SUBGRAPH_HOPS + 5}&max_nodes=50')[1] == \
+        get(service_url, f'/subgraph?seed=MKG:00000020&k={MAX_SUBGRAPH_HOPS}&max_nodes=50')[1]
+
+    status, genome = get(service_url, '/genome?id=MKG:00000020')
+    assert status == 200 and genome['genome']['node_id'] == 'MKG:00000020'
+    assert set(genome) == {'genome', 'is_pathogen', 'pathogenic_lineage', 'amr_genes', 'diseases'}
+
+
+@pytest.mark.parametrize('path, status', [
+    ('/node', 400),
+    ('/node?id=MKG:99999999', 404),
+    ('/neighbors?id=MKG:00000001&direction=sideways', 400),
+    ('/neighbors?id=MKG:00000001&limit=many', 400),
+    ('/subgraph?k=1', 400),
+    ('/no/such/endpoint', 404),
+])
+def test_errors(service_url, path, status):
+    response_status, body = get(service_url, path)
+    assert response_status == status and 'error' in body
+
+
+def test_metrics(service_url):
+    before = get(service_url, '/metrics')[1]
+    get(service_url, '/node?id=MKG:00000042')
+    get(service_url, '/node?id=MKG:00000042')
+    get(service_url, '/unknown-a')
+    get(service_url, '/unknown-b?x=1')
+    status, metrics = get(service_url, '/metrics')
+    assert status == 200
+
+    endpoints, before_endpoints = metrics['endpoints'], before['endpoints']
+    count = lambda stats, endpoint, key: stats.get(endpoint, {}).get(key, 0)
+    assert count(endpoints, '/node', 'requests') - count(before_endpoints, '/node', 'requests') == 2
+    assert count(endpoints, '/node', 'cache_hits') - count(before_endpoints, '/node', 'cache_hits') == 1
+    # Unknown paths are bucketed together instead of getting an entry each
+    assert count(endpoints, 'other', 'requests') - count(before_endpoints, 'other', 'requests') == 2
+    assert count(endpoints, 'other', 'errors') - count(before_endpoints, 'other', 'errors') == 2
+    assert set(endpoints) <= {'/health', '/metrics', '/node', '/neighbors', '/subgraph', '/genome', 'other'}
+    assert metrics['cache']['hits'] - before['cache']['hits'] == 1 and metrics['cache']['size'] >= 1
@@ -0,0 +1,91 @@
+"""
+Checks the KG statistics report and the diff between two reports on small synthetic graphs.
+
+Run from build_KG:  python -m pytest tests
+"""
+
+import os
+import sys
+import random
+
+import numpy as np
+
+sys.path.append(os.path.join(os.path.dirname(os.path.realpath(__file__)), '..'))
+from graph_query import GraphIndex
+from kg_statistics import compute_statistics, diff_reports, synonym_collisions
+from test_graph_query import make_graph
+
+
+def make_small_graph(extra_edges=()):
+    """
+    Six nodes: A-B-C form one component (with a duplicated edge and a self loop on C), D-E another and F is an orphan.
+    """
+    node_types = ['biolink:OrganismTaxon', 'biolink:Disease']
+    predicates = ['biolink:related_to', 'biolink:causes']
+    edges = [(0, 1, 0), (1, 2, 1), (1, 2, 1), (2, 2, 0), (3, 4, 1)] + list(extra_edges)
+    edge_source, edge_target, edge_predicate_ids = (np.array(column, dtype=np.int64) for column in zip(*edges))
+    synonyms = ['X:a', 'X:b', 'X:shared', 'X:shared', 'X:c', 'X:other', 'X:other', 'X:other']
+    synonym_node_indices = np.array([0, 1, 0, 3, 2, 4, 4, 5], dtype=np.int64)
+    graph = GraphIndex([f'TEST:{name}' for name in 'ABCDEF'], np.array([0, 0, 1, 1, 0, 1], dtype=np.uint16), node_types,
+                       [f'node {name}' for name in 'ABCDEF'], np.array([1, 1, 2, 2, 3, 1], dtype=np.uint64), np.array([True, False, False, False, True, False]),
+                       edge_source, edge_target, edge_predicate_ids.astype(np.uint16), predicates,
+                       np.ones(len(edges), dtype=np.uint64), ['GTDB', 'KEGG'], synonyms, synonym_node_indices)
+    graph.n_skipped_edges = 2
+    return graph
+
+
+def test_compute_statistics():
+    report = compute_statistics(make_small_graph())
+    assert report['n_nodes'] == 6 and report['n_edges'] == 5 and report['n_pathogen_nodes'] == 2
+    assert report['nodes_by_type'] == {'biolink:OrganismTaxon': 3, 'biolink:Disease': 3}
+    assert report['edges_by_predicate'] == {'biolink:causes': 3, 'biolink:related_to': 2}
+    assert report['edges_by_type_triple'] == {'biolink:OrganismTaxon biolink:causes biolink:Disease': 2,
+                                              'biolink:OrganismTaxon biolink:related_to biolink:OrganismTaxon': 1,
+                                              'biolink:Disease biolink:related_to biolink:Disease': 1,
+                                              'biolink:Disease biolink:causes biolink:OrganismTaxon': 1}
+    assert report['nodes_by_knowledge_source'] == {'GTDB': 4, 'KEGG': 3}
+    # C: two duplicated in-edges plus both ends of its self loop
+    assert report['degree']['top_nodes'][:2] == [{'node_id': 'TEST:C', 'node_type': 'biolink:Disease', 'degree': 4},
+                                                 {'node_id': 'TEST:B', 'node_type': 'biolink:OrganismTaxon', 'degree': 3}]
+
+    integrity = report['integrity']
+    assert integrity['n_dangling_edges'] == 2
+    assert integrity['n_orphan_nodes'] == 1 and integrity['orphan_node_examples'] == ['TEST:F']
+    assert integrity['n_self_loops'] == 1 and integrity['n_duplicated_edges'] == 1
+    # 'X:other' is listed twice for E but also belongs to F; 'X:shared' belongs to A and D
+    assert integrity['n_synonym_collisions'] == 2
+    assert integrity['synonym_collision_examples'] == {'X:shared': ['TEST:A', 'TEST:D'], 'X:other': ['TEST:E', 'TEST:F']}
+
+    assert report['components'] == {'n_components': 3, 'n_singleton_components': 1, 'largest_component_size': 3,
+                                     'largest_component_sizes': [3, 2, 1]}
+
+
+def test_synonym_collisions_match_loop():
+    rng = random.Random(100)
+    graph = make_graph()
+    graph.synonyms = [f'X:{rng.randrange(400)}' for _ in range(1000)]
+    graph.synonym_node_indices = np.array([rng.randrange(graph.n_nodes) for _ in range(1000)], dtype=np.int64)
+    expected = {}
+    for synonym, node_index in zip(graph.synonyms, graph.synonym_node_indices.tolist()):
+        expected.setdefault(synonym, set()).add(graph.node_ids[node_index])
+    expected = {synonym: sorted(node_ids) for synonym, node_ids in expected.items() if len(node_ids) > 1}
+    n_collisions, examples = synonym_collisions(graph, n_examples=len(graph.synonyms))
+    assert n_collisions == len(expected) and examples == expected
+    assert list(synonym_collisions(graph, n_examples=5)[1]) == list(expected)[:5]
+
+
+def test_diff_reports():
+    previous = compute_statistics(make_small_graph())
+    # Connect F to A with a new predicate-type combination
+    current = compute_statistics(make_small_graph(extra_edges=[(5, 0, 1)]))
+    previous['seconds'], current['seconds'] = 1.0, 2.0
+    diff = diff_reports(previous, current)
+
+    assert diff['n_edges'] == {'previous': 5, 'current': 6, 'change': 1}
+    assert diff['edges_by_predicate'] == {'biolink:causes': {'previous': 3, 'current': 4, 'change': 1}}
+    assert diff['edges_by_type_triple'] == {'biolink:Disease biolink:causes biolink:OrganismTaxon': {'previous': 1, 'current': 2, 'change': 1}}
+    assert diff['integrity']['n_orphan_nodes'] == {'previous': 1, 'current': 0, 'change': -1}
+    assert diff['integrity']['orphan_nodes_by_type'] == {'biolink:Disease': {'previous': 1, 'current': 0, 'change': -1}}
+    assert diff['components']['n_components'] == {'previous': 3, 'current': 2, 'change': -1}
+    assert 'n_nodes' not in diff and 'seconds' not in diff
+    assert diff_reports(current, current) == {}
@@ -0,0 +1,34 @@
+"""
+Checks how KnowledgeGraph merges edges that are added more than once.
+
+Run from build_KG:  python -m pytest tests
+"""
+
+import os
+import sys
+import logging
+
+import pandas as pd
+
+sys.path.append(os.path.join(os.path.dirname(os.path.realpath(__file__)), '..'))
+from utils import KnowledgeGraph, Node
+
+
+def test_supporting_gene_counts_are_summed_on_merge():
+    kg = KnowledgeGraph(logging.getLogger(__name__))
+    kg.add_node(Node(node_type='Microbe', synonyms=['KEGG:gn_T00001']))
+    # Two KEGG pathway synonyms that belong to the same node
+    kg.add_node(Node(node_type='Pathway', synonyms=['KEGG:map00010', 'KEGG:ko00010']))
+    edge_table = pd.DataFrame({
+        'source_node': ['KEGG:gn_T00001', 'KEGG:gn_T00001', 'KEGG:gn_T00001'],
+        'target_node': ['KEGG:map00010', 'KEGG:ko00010', 'KEGG:ko00010'],
+        'predicate': 'biolink:genetically_associated_with',
+        'knowledge_source': [['KEGG']] * 3,
+        'description': [[('supporting_gene_count', '3')], [('supporting_gene_count', '5')], [('supporting_gene_count', '2')]],
+    })
+    kg.add_edges(edge_table)
+
+    assert len(kg.edges) == 1
+    edge = next(iter(kg.edges.values()))
+    assert dict(edge.description) == {'supporting_gene_count': '10'}
+    assert edge.knowledge_source == ['KEGG']
@@ -0,0 +1,133 @@
+"""
+Checks AsyncMappingResolver against a local stub of the UMLS and OxO APIs.
+
+Run from build_KG:  python -m pytest tests
+"""
+
+import os
+import sys
+import json
+import time
+import threading
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+from urllib.parse import urlparse, parse_qs
+
+import pytest
+
+sys.path.append(os.path.join(os.path.dirname(os.path.realpath(__file__)), '..'))
+from utils import AsyncMappingResolver
+
+
+class StubState:
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.requests = []
+        self.in_flight = 0
+        self.max_in_flight = 0
+
+
+def make_handler(state: StubState):
+
+    class StubHandler(BaseHTTPRequestHandler):
+
+        def log_message(self, *args):
+            pass
+
+        def _reply(self, payload):
+            body = json.dumps(payload).encode('utf-8')
+            self.send_response(200)
+            self.send_header('Content-Type', 'application/json')
+            self.send_header('Content-Length', str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def _track(self, request):
+            with state.lock:
+                state.requests.append(request)
+                state.in_flight += 1
+                state.max_in_flight = max(state.max_in_flight, state.in_flight)
+            # keep the request open for a while so that concurrent requests overlap
+            time.sleep(0.05)
+            with state.lock:
+                state.in_flight -= 1
+
+        def do_GET(self):
+            url = urlparse(self.path)
+            query = parse_qs(url.query)
+            self._track(('GET', url.path, query.get('string', [None])[0]))
+            if url.path == '/search/current':
+                name = query['string'][0]
+                results = [] if name.startswith('unknown') else [{'ui': f"C{name.split()[-1]}"}]
+                self._reply({'result': {'results': results}})
+            elif url.path.endswith('/atoms'):
+                self._reply({'result': [{'rootSource': 'NCBI', 'name': 'microbe', 'code': 'https://uts-ws.nlm.nih.gov/rest/content/2023AB/source/NCBI/562'},
+                                        {'rootSource': 'MSH', 'name': 'microbe', 'code': 'D004926'}]})
+            elif url.path.startswith('/content/current/CUI/'):
+                self._reply({'result': {'name': 'microbe'}})
+            else:
+                self.send_error(404)
+
+        def do_POST(self):
+            data = json.loads(self.rfile.read(int(self.headers['Content-Length'])))
+            self._track(('POST', urlparse(self.path).path, tuple(data['ids'])))
+            self._reply({'_embedded': {'searchResults': [{'queryId': query_id, 'mappingResponseList': [{'curie': f"MONDO:{query_id.split(':')[1]}", 'distance': 1},
+                                                                                                      {'curie': f"DOID:{query_id.split(':')[1]}", 'distance': 2}]}
+                                                         for query_id in data['ids']]}})
+
+    return StubHandler
+
+
+@pytest.fixture
+def stub_server():
+    state = StubState()
+    server = ThreadingHTTPServer(('127.0.0.1', 0), make_handler(state))
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield f"http://127.0.0.1:{server.server_address[1]}", state
+    server.shutdown()
+    server.server_close()
+
+
+def test_umls_mappings_are_deduplicated_and_concurrency_is_bounded(stub_server):
+    base_url, state = stub_server
+    resolver = AsyncMappingResolver('key', max_concurrency=3, umls_base_url=base_url, oxo_api=f"{base_url}/oxo")
+    names = [f"disease {index % 10}" for index in range(30)] + ['unknown disease', 'unknown disease', None]
+    result = resolver.get_umls_mappings(names)
+    resolver.close()
+
+    assert list(result.columns) == ['name', 'umls_id']
+    assert list(result['name']) == [f"disease {index}" for index in range(10)] + ['unknown disease']
+    assert list(result['umls_id'][:10]) == [f"UMLS:C{index}" for index in range(10)]
+    assert result['umls_id'].isna().tolist() == [False] * 10 + [True]
+    searched = [request[2] for request in state.requests]
+    assert sorted(searched) == sorted(set(searched)) and len(searched) == 11
+    assert 1 < state.max_in_flight <= 3
+
+
+def test_taxon_ids_reuse_one_lookup_per_query(stub_server):
+    base_url, state = stub_server
+    resolver = AsyncMappingResolver('key', max_concurrency=2, umls_base_url=base_url, oxo_api=f"{base_url}/oxo")
+    result = resolver.get_taxon_ids(['E. coli', 'Escherichia coli', 'unmapped'], [float('nan'), float('nan'), float('nan')], ['UMLS:C001', 'UMLS:C001', None])
+    resolver.close()
+
+    assert list(result.columns) == ['name', 'umls_id', 'taxon_id']
+    assert list(result['taxon_id']) == [[562], [562], None]
+    # the CUI and its atoms are requested once for the two names sharing the UMLS id
+    assert len(state.requests) == 2
+
+
+def test_oxo_mappings_are_sent_in_batches(stub_server):
+    base_url, state = stub_server
+    resolver = AsyncMappingResolver('key', max_concurrency=4, oxo_batch_size=4, umls_base_url=base_url, oxo_api=f"{base_url}/oxo")
+    ids = [f"EFO:{index:07d}" for index in range(10)] * 2
+    result = resolver.get_oxo_mappings(ids, distance=2)
+    distance_one = resolver.get_oxo_mappings(ids[:3], distance=2, output_only=1)
+    resolver.close()
+
+    batches = [request[2] for request in state.requests if request[0] == 'POST']
+    assert sorted(len(batch) for batch in batches[:3]) == [2, 4, 4]
+    assert sorted(query_id for batch in batches[:3] for query_id in batch) == [f"EFO:{index:07d}" for index in range(10)]
+    assert list(result.columns) == ['query_id', 'curie', 'distance']
+    assert len(result) == 20 and set(result['query_id']) == set(ids)
+    assert list(distance_one['curie']) == [f"MONDO:{index:07d}" for index in range(3)]
@@ -0,0 +1,100 @@
+"""
+Checks the statements that the Neo4j loader runs to move from one KG version to the next.
+
+Run from build_KG:  python -m pytest tests
+"""
+
+import os
+import sys
+import csv
+import logging
+
+sys.path.append(os.path.join(os.path.dirname(os.path.realpath(__file__)), '..', 'neo4j_utils'))
+from neo4j_loader import DryRunDriver, Neo4jLoader, apply_kg_version
+from prepare_neo4j_inputs import format_node
+
+NODE_COLUMNS = ['node_id', 'node_type', 'all_names', 'description', 'knowledge_source', 'link', 'synonyms', 'is_pathogen']
+EDGE_COLUMNS = ['source_node', 'target_node', 'predicate', 'knowledge_source']
+
+
+def write_kg(directory, nodes, edges):
+    """
+    Write a KG version as node/edge TSV files; nodes are (node_id, node_type, description) and edges are
+    (source_node, predicate, target_node).
+    """
+    os.makedirs(directory, exist_ok=True)
+    node_file, edge_file = os.path.join(directory, 'KG_nodes.tsv'), os.path.join(directory, 'KG_edges.tsv')
+    with open(node_file, 'w', newline='', encoding='utf-8') as f:
+        writer = csv.writer(f, delimiter='\t', lineterminator='\n')
+        writer.writerow(NODE_COLUMNS)
+        for node_id, node_type, description in nodes:
+            writer.writerow([node_id, node_type, str([node_id.lower()]), str(description), str(['KEGG']), '[]', str([node_id]), 'False'])
+    with open(edge_file, 'w', newline='', encoding='utf-8') as f:
+        writer = csv.writer(f, delimiter='\t', lineterminator='\n')
+        writer.writerow(EDGE_COLUMNS)
+        for source_node, predicate, target_node in edges:
+            writer.writerow([source_node, target_node, predicate, str(['KEGG'])])
+    return node_file, edge_file
+
+
+def classify_batches(batches):
+    """
+    Split the recorded batches into deleted/upserted node (label, node_id) and edge (source, predicate, target) sets.
+    """
+    result = {'deleted_nodes': set(), 'deleted_edges': set(), 'upserted_nodes': dict(), 'upserted_edges': set()}
+    for query, rows in batches:
+        if 'DETACH DELETE' in query:
+            label = query.split('MATCH (n:`')[1].split('`')[0]
+            result['deleted_nodes'] |= {(label, row['node_id']) for row in rows}
+        elif 'DELETE r' in query:
+            predicate = query.split('-[r:`')[1].split('`')[0]
+            result['deleted_edges'] |= {(row['source_node'], predicate, row['target_node']) for row in rows}
+        elif 'MERGE (n:' in query:
+            label = query.split('MERGE (n:`')[1].split('`')[0]
+            result['upserted_nodes'].update({(label, row['node_id']): row['properties'] for row in rows})
+        else:
+            predicate = query.split('MERGE (s)-[r:`')[1].split('`')[0]
+            result['upserted_edges'] |= {(row['source_node'], predicate, row['target_node']) for row in rows}
+    return result
+
+
+def test_delta_between_two_versions(tmp_path):
+    old_nodes = [('A', 'Microbe', []), ('B', 'Disease', []), ('C', 'Drug', [('info', 'old')]), ('D', 'Pathway', [])]
+    old_edges = [('A', 'biolink:related_to', 'B'), ('B', 'biolink:treated_by', 'C'), ('C', 'biolink:related_to', 'D'),
+                 ('A', 'biolink:related_to', 'D'), ('A', 'biolink:related_to', 'C'), ('C', 'biolink:affects', 'A')]
+    # B changes its label, C its description, D is removed and E is added
+    new_nodes = [('A', 'Microbe', []), ('B', 'Phenotypic_Feature', []), ('C', 'Drug', [('info', 'new'), ('KO_related_genes', 'x')]),
+                 ('E', 'Pathway', [])]
+    new_edges = [('A', 'biolink:related_to', 'B'), ('B', 'biolink:treated_by', 'C'), ('A', 'biolink:related_to', 'C'),
+                 ('A', 'biolink:related_to', 'E')]
+    old_node_file, old_edge_file = write_kg(str(tmp_path / 'v1'), old_nodes, old_edges)
+    new_node_file, new_edge_file = write_kg(str(tmp_path / 'v2'), new_nodes, new_edges)
+
+    driver = DryRunDriver(record_rows=True)
+    loader = Neo4jLoader(driver, logging.getLogger(__name__), batch_size=2, n_workers=2)
+    summary = apply_kg_version(loader, loader.logger, new_node_file, new_edge_file, old_node_file, old_edge_file)
+    result = classify_batches(driver.batches)
+
+    # Nodes whose label changed or that disappeared are DETACH DELETEd under their previous label
+    assert result['deleted_nodes'] == {('Disease', 'B'), ('Pathway', 'D')}
+    # Edges that disappeared between surviving nodes must be deleted explicitly
+    assert result['deleted_edges'] == {('C', 'biolink:related_to', 'D'), ('A', 'biolink:related_to', 'D'), ('C', 'biolink:affects', 'A')}
+    assert set(result['upserted_nodes']) == {('Phenotypic_Feature', 'B'), ('Drug', 'C'), ('Pathway', 'E')}
+    # Unchanged edges of the re-created node B are re-inserted; the unchanged A->C edge is not touched
+    assert result['upserted_edges'] == {('A', 'biolink:related_to', 'B'), ('B', 'biolink:treated_by', 'C'), ('A', 'biolink:related_to', 'E')}
+    assert summary == {'deleted_edges': 3, 'deleted_nodes': 2, 'upserted_nodes': 3, 'upserted_edges': 3}
+
+    # Node properties are formatted like the neo4j-admin import files
+    with open(new_node_file, newline='', encoding='utf-8') as f:
+        rows = {row['node_id']: row for row in csv.DictReader(f, delimiter='\t')}
+    assert result['upserted_nodes'][('Drug', 'C')]['description'] == format_node(rows['C'])[3] == 'info:new'
+
+    # Without the previous version, everything is upserted and nothing deleted
+    driver = DryRunDriver(record_rows=True)
+    loader = Neo4jLoader(driver, logging.getLogger(__name__), batch_size=2, n_workers=2)
+    apply_kg_version(loader, loader.logger, new_node_file, new_edge_file)
+    result = classify_batches(driver.batches)
+    assert not result['deleted_nodes'] and not result['deleted_edges']
+    assert set(result['upserted_nodes']) == {(node_type, node_id) for node_id, node_type, _ in new_nodes}
+    assert result['upserted_edges'] == set(new_edges)
+    assert len(driver.statements) == len(driver.batches)
@@ -0,0 +1,87 @@
+"""
+Checks that NodeSynonymizer only uses a cluster membership index built from its own database, and that its
+per-CURIE result cache behaves as an LRU that never hands out its own objects.
+
+Run from build_KG:  python -m pytest tests
+"""
+
+import os
+import sqlite3
+import sys
+
+import pytest
+
+sys.path.append(os.path.join(os.path.dirname(os.path.realpath(__file__)), '..'))
+from kg2_utils.node_synonymizer import NodeSynonymizer, LRUCache, build_members_index
+from test_synonym_index import make_synonymizer_db
+
+
+def test_members_index_is_ignored_when_database_changes(tmp_path):
+    database_path = str(tmp_path / "synonymizer.sqlite")
+    _, node_ids = make_synonymizer_db(database_path, n_clusters=50, n_nodes=500)
+    build_members_index(database_path)
+    synonymizer = NodeSynonymizer(str(tmp_path), "synonymizer.sqlite")
+    assert synonymizer.use_members_index
+    expected = synonymizer.get_equivalent_nodes(node_ids[:50])
+    del synonymizer
+
+    # Move a node to another cluster; the index built before no longer matches the database
+    connection = sqlite3.connect(database_path)
+    connection.execute("UPDATE clusters SET member_ids = '[]' WHERE cluster_id = (SELECT cluster_id FROM nodes WHERE id = ?)", (node_ids[0],))
+    connection.commit()
+    connection.close()
+    with pytest.warns(UserWarning, match="outdated"):
+        synonymizer = NodeSynonymizer(str(tmp_path), "synonymizer.sqlite")
+    assert not synonymizer.use_members_index
+    assert synonymizer.get_equivalent_nodes(node_ids[:1]) != {node_ids[0]: expected[node_ids[0]]}
+    del synonymizer
+
+    build_members_index(database_path)
+    assert NodeSynonymizer(str(tmp_path), "synonymizer.sqlite").use_members_index
+
+
+def test_result_cache_evicts_least_recently_used():
+    cache = LRUCache(2)
+    cache.put(("a",), 1)
+    cache.put(("b",), 2)
+    assert cache.get(("a",)) == (True, 1)  # "a" is now the most recently used
+    cache.put(("c",), 3)
+    assert cache.get(("b",)) == (False, None)
+    assert cache.get(("a",)) == (True, 1)
+    assert cache.get(("c",)) == (True, 3)
+    assert cache.info() == {"hits": 3, "misses": 1, "size": 2, "maxsize": 2}
+
+    cache.clear()
+    assert cache.info() == {"hits": 0, "misses": 0, "size": 0, "maxsize": 2}
+    disabled = LRUCache(0)
+    disabled.put(("a",), 1)
+    assert disabled.get(("a",)) == (False, None)
+    assert disabled.info()["size"] == 0
+
+
+def test_synonymizer_results_are_copied_in_and_out_of_cache(tmp_path):
+    _, node_ids = make_synonymizer_db(str(tmp_path / "synonymizer.sqlite"), n_clusters=50, n_nodes=500)
+    synonymizer = NodeSynonymizer(str(tmp_path), "synonymizer.sqlite", result_cache_size=10)
+    curies = node_ids[:5]
+
+    first = synonymizer.get_equivalent_nodes(curies)
+    assert synonymizer.get_cache_info() == {"hits": 0, "misses": 5, "size": 5, "maxsize": 10}
+    expected = {curie: list(equivalent_curies) for curie, equivalent_curies in first.items()}
+    # Modifying a result after it was cached must not change the cached copy
+    first[curies[0]].append("test:MODIFIED")
+
+    second = synonymizer.get_equivalent_nodes(curies)
+    assert second == expected
+    assert synonymizer.get_cache_info()["hits"] == 5
+    # ... nor may modifying a result that was served from the cache
+    second[curies[0]].append("test:MODIFIED")
+    assert synonymizer.get_equivalent_nodes(curies) == expected
+
+    canonical = synonymizer.get_canonical_curies(curies)
+    canonical[curies[0]]["preferred_name"] = "modified"
+    assert synonymizer.get_canonical_curies(curies)[curies[0]]["preferred_name"] != "modified"
+    # Five equivalent and five canonical entries fill the cache; more lookups evict the oldest
+    synonymizer.get_equivalent_nodes(node_ids[5:8])
+    assert synonymizer.get_cache_info()["size"] == 10
+    synonymizer.clear_cache()
+    assert synonymizer.get_cache_info() == {"hits": 0, "misses": 0, "size": 0, "maxsize": 10}
@@ -0,0 +1,99 @@
+"""
+Checks the OxO mapping index against a plain breadth-first search over the mapping files.
+
+Run from build_KG:  python -m pytest tests
+"""
+
+import os
+import sys
+import csv
+import random
+from collections import defaultdict
+
+sys.path.append(os.path.join(os.path.dirname(os.path.realpath(__file__)), '..'))
+from oxo_mapping import OxO
+
+PREFIXES = ['DOID', 'MESH', 'UMLS', 'EFO', 'OMIM', 'ICD10CM']
+
+
+def write_mapping_files(mapping_dir: str, n_curies: int = 3000, n_mappings: int = 2500, seed: int = 100):
+    """
+    Synthetic OxO mapping files with many small components and a few larger ones.
+    """
+    rng = random.Random(seed)
+    curies = [f"{rng.choice(PREFIXES)}:{index:06d}" for index in range(n_curies)]
+    mappings = set()
+    while len(mappings) < n_mappings:
+        source = rng.randrange(n_curies)
+        target = min(n_curies - 1, source + rng.randint(1, 6)) if rng.random() < 0.9 else rng.randrange(n_curies)
+        if source != target:
+            mappings.add((curies[source], curies[target]))
+    mappings = sorted(mappings)
+
+    def write(file_name, header, rows):
+        with open(os.path.join(mapping_dir, file_name), 'w', newline='') as fh:
+            writer = csv.writer(fh, delimiter=',', quotechar='"', doublequote=False, lineterminator='\r\n', escapechar='\\')
+            writer.writerow(header)
+            writer.writerows(rows)
+
+    half = len(mappings) // 2
+    write('ols_mappings.csv', ['curie_from', 'curie_to'], mappings[:half])
+    write('umls_mappings.csv', ['curie_from', 'curie_to'], mappings[half:])
+    terms = [(curie.split(':')[1], curie, f"label {curie}", f"http://example.org/{curie}", curie.split(':')[0]) for curie in curies]
+    write('ols_terms.csv', ['identifier', 'curie', 'label', 'uri', 'prefix'], terms[::2])
+    write('umls_terms.csv', ['identifier', 'curie', 'label', 'uri', 'prefix'], terms[1::2])
+    return curies, mappings
+
+
+def reference_mappings(graph, labels, curie_source, distance, targets):
+    """
+    Level-by-level search over a dict of sets, as in the original OxO.py.
+    """
+    prefix_source = {curie.split(':')[0] for curie in curie_source}
+    visited = {curie for curie in curie_source if curie in graph}
+    searching = set(visited)
+    found = dict()
+    for level in range(1, distance + 1):
+        new_nodes = {neighbor for curie in searching for neighbor in graph[curie]} - visited
+        if len(new_nodes) == 0:
+            break
+        visited |= new_nodes
+        for curie in sorted(new_nodes):
+            prefix = curie.split(':')[0]
+            if prefix not in prefix_source and (not targets or prefix in targets):
+                found[curie] = {'distance': level, 'label': labels[curie][0], 'uri': labels[curie][1]}
+        searching = new_nodes
+    return found
+
+
+def test_mappings_match_reference_search(tmp_path):
+    curies, mappings = write_mapping_files(str(tmp_path))
+    graph = defaultdict(set)
+    for curie_from, curie_to in mappings:
+        graph[curie_from].add(curie_to)
+        graph[curie_to].add(curie_from)
+    labels = {curie: (f"label {curie}", f"http://example.org/{curie}") for curie in curies}
+
+    rng = random.Random(1)
+    queries = rng.sample(curies, 300) + ['NOTACURIE:1', curies[0]]
+    for rebuild_index in (True, False):
+        oxo = OxO(str(tmp_path), rebuild_index=rebuild_index)
+        for distance in (1, 2, 3):
+            for targets in (None, ['MESH', 'UMLS'], ['UNKNOWN']):
+                bulk = oxo.find_mappings_bulk(queries, distance=distance, targets=targets)
+                assert list(bulk) == list(dict.fromkeys(queries))
+                for curie in queries:
+                    expected = reference_mappings(graph, labels, [curie], distance, targets)
+                    assert list(bulk[curie].items()) == list(expected.items())
+                    assert list(oxo.find_mappings(curie, distance=distance, targets=targets).items()) == list(expected.items())
+                # several sources searched as one query
+                assert oxo.find_mappings(queries[:5], distance=distance, targets=targets) == reference_mappings(graph, labels, queries[:5], distance, targets)
+
+
+def test_components_group_connected_curies(tmp_path):
+    curies, mappings = write_mapping_files(str(tmp_path))
+    oxo = OxO(str(tmp_path))
+    for curie_from, curie_to in mappings[:200]:
+        component = oxo.get_component(curie_from)
+        assert curie_to in component and curie_from in component
+        assert set(oxo.find_mappings_bulk([curie_from], distance=len(curies))[curie_from]) <= set(component)
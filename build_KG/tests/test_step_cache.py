@@ -0,0 +1,104 @@
+"""
+Checks the key/restore/store cycle of the content-hash step cache.
+
+Run from build_KG:  python -m pytest tests
+"""
+
+import os
+import sys
+import glob
+import json
+import logging
+
+sys.path.append(os.path.join(os.path.dirname(os.path.realpath(__file__)), '..'))
+from step_cache import StepCache
+
+# Step command: append a line to the run log and write both outputs from the input
+STEP_SCRIPT = """
+import sys
+input_path, output_a, output_b, run_log = sys.argv[1:]
+content = open(input_path).read()
+open(run_log, 'a').write('run\\n')
+open(output_a, 'w').write(content.upper())
+open(output_b, 'w').write(content[::-1])
+"""
+
+
+def make_step(tmp_path):
+    (tmp_path / 'code').mkdir()
+    (tmp_path / 'out').mkdir()
+    (tmp_path / 'code' / 'integrate.py').write_text('VERSION = 1\n')
+    (tmp_path / 'input.txt').write_text('microbe\tdisease\n')
+    outputs = [str(tmp_path / 'out' / 'KG_nodes.tsv'), str(tmp_path / 'out' / 'KG_edges.tsv')]
+    run_log = str(tmp_path / 'runs.log')
+    command = [sys.executable, '-c', STEP_SCRIPT, str(tmp_path / 'input.txt')] + outputs + [run_log]
+    step_cache = StepCache(str(tmp_path / 'cache'), max_entries_per_step=10, logger=logging.getLogger(__name__))
+
+    def run(params=None):
+        restored = step_cache.run('step1', command, {'data': str(tmp_path / 'input.txt')}, outputs, params or {'threshold': 1}, [str(tmp_path / 'code')])
+        n_runs = len(open(run_log).readlines()) if os.path.exists(run_log) else 0
+        return restored, n_runs
+
+    return step_cache, outputs, run
+
+
+def test_hits_and_misses(tmp_path):
+    step_cache, outputs, run = make_step(tmp_path)
+    assert run() == (False, 1)
+    assert open(outputs[0]).read() == 'MICROBE\tDISEASE\n'
+
+    # Removed outputs come back from the cache without running the step
+    for output in outputs:
+        os.remove(output)
+    assert run() == (True, 1)
+    assert open(outputs[0]).read() == 'MICROBE\tDISEASE\n' and open(outputs[1]).read() == '\nesaesid\teborcim'
+
+    # Touching an input does not change its content, so it is still a hit
+    os.utime(tmp_path / 'input.txt', (1, 1))
+    assert run() == (True, 1)
+
+    # Any change of content, parameters or code is a miss
+    (tmp_path / 'input.txt').write_text('microbe\tdrug\n')
+    assert run() == (False, 2)
+    assert open(outputs[0]).read() == 'MICROBE\tDRUG\n'
+    assert run(params={'threshold': 2}) == (False, 3)
+    (tmp_path / 'code' / 'integrate.py').write_text('VERSION = 2\n')
+    assert run(params={'threshold': 2}) == (False, 4)
+    # ... and going back to earlier inputs hits the earlier entries
+    (tmp_path / 'input.txt').write_text('microbe\tdisease\n')
+    (tmp_path / 'code' / 'integrate.py').write_text('VERSION = 1\n')
+    assert run() == (True, 4)
+    assert open(outputs[0]).read() == 'MICROBE\tDISEASE\n'
+
+
+def test_restore_links_read_only_entries_and_memoizes_digests(tmp_path):
+    step_cache, outputs, run = make_step(tmp_path)
+    run()
+    entry_dir, = glob.glob(str(tmp_path / 'cache' / 'step1' / '*'))
+    with open(os.path.join(entry_dir, 'manifest.json')) as f:
+        stored = json.load(f)['outputs']
+    assert run() == (True, 1)
+    for output, item in zip(outputs, stored):
+        entry_file = os.path.join(entry_dir, item['file'])
+        assert os.stat(output).st_ino == os.stat(entry_file).st_ino
+        assert not os.stat(entry_file).st_mode & 0o222
+        # The digest of a restored output is known without hashing it again
+        row = step_cache.memo.execute("SELECT size, mtime_ns, inode, digest FROM file_digests WHERE path = ?", (os.path.abspath(output),)).fetchone()
+        stat = os.stat(output)
+        assert row == (stat.st_size, stat.st_mtime_ns, stat.st_ino, item['digest']) and item['size'] == stat.st_size
+
+
+def test_corrupted_entry_is_discarded(tmp_path):
+    step_cache, outputs, run = make_step(tmp_path)
+    run()
+    entry_dir, = glob.glob(str(tmp_path / 'cache' / 'step1' / '*'))
+    entry_file = glob.glob(os.path.join(entry_dir, '0_*'))[0]
+    os.chmod(entry_file, 0o644)
+    with open(entry_file, 'w') as f:
+        f.write('truncated')
+
+    assert run() == (False, 2)
+    assert open(outputs[0]).read() == 'MICROBE\tDISEASE\n'
+    # The entry was replaced by a fresh one
+    assert run() == (True, 2)
+    assert open(outputs[0]).read() == 'MICROBE\tDISEASE\n'
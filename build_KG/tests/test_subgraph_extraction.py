@@ -0,0 +1,113 @@
+"""
+Checks the subgraph filters and k-hop seeding of select_subgraph against plain Python loops, and the npz/networkx exports.
+
+Run from build_KG:  python -m pytest tests
+"""
+
+import os
+import sys
+
+import numpy as np
+import pytest
+
+sys.path.append(os.path.join(os.path.dirname(os.path.realpath(__file__)), '..'))
+from graph_query import decode_strings
+from subgraph_extraction import select_subgraph, export_npz, export_networkx, to_networkx
+from test_graph_query import make_graph
+
+
+def edge_rows(graph):
+    return list(zip(graph.edge_source.tolist(), graph.edge_target.tolist(), graph.edge_predicate_ids.tolist()))
+
+
+def test_filters_match_row_by_row_selection():
+    graph = make_graph()
+    excluded = ('biolink:OrganismTaxon', 'biolink:Pathway')
+    selection = select_subgraph(graph, node_types=['biolink:OrganismTaxon', 'biolink:Pathway'], predicates=['biolink:has_part'],
+                                exclude_type_pairs=[excluded], drop_isolated=True)
+
+    kept_types = {graph.node_type_index['biolink:OrganismTaxon'], graph.node_type_index['biolink:Pathway']}
+    excluded_ids = {graph.node_type_index[node_type] for node_type in excluded}
+    expected_edges = []
+    for edge_index, (source, target, predicate) in enumerate(edge_rows(graph)):
+        source_type, target_type = int(graph.node_type_ids[source]), int(graph.node_type_ids[target])
+        if source_type not in kept_types or target_type not in kept_types or graph.predicates[predicate] != 'biolink:has_part':
+            continue
+        if {source_type, target_type} == excluded_ids:
+            continue
+        expected_edges.append(edge_index)
+    expected_nodes = sorted({node for edge_index in expected_edges for node in (int(graph.edge_source[edge_index]), int(graph.edge_target[edge_index]))})
+
+    assert selection.edge_indices().tolist() == expected_edges
+    assert selection.node_indices().tolist() == expected_nodes
+    assert selection.filters['k'] is None
+
+
+def test_unknown_filter_values_select_nothing():
+    graph = make_graph()
+    assert select_subgraph(graph, node_types=['biolink:Unknown']).n_nodes == 0
+    assert select_subgraph(graph, predicates=['biolink:unknown']).n_edges == 0
+
+
+def test_seeds_keep_the_k_hop_neighborhood():
+    graph = make_graph(n_nodes=200, n_edges=400, seed=7)
+    seeds = ['TEST:0', 'TEST:1', 'TEST:missing']
+    for k in (0, 1, 2, 3):
+        selection = select_subgraph(graph, predicates=['biolink:related_to'], seeds=seeds, k=k)
+
+        # Breadth-first search over the related_to edges, ignoring their direction
+        allowed = [(source, target) for source, target, predicate in edge_rows(graph) if graph.predicates[predicate] == 'biolink:related_to']
+        visited = {0, 1}
+        frontier = {0, 1}
+        for _ in range(k):
+            frontier = {node for source, target in allowed for node, other in ((target, source), (source, target)) if other in frontier} - visited
+            visited |= frontier
+
+        assert selection.node_indices().tolist() == sorted(visited)
+        assert selection.edge_indices().tolist() == [edge_index for edge_index, (source, target, predicate) in enumerate(edge_rows(graph))
+                                                     if graph.predicates[predicate] == 'biolink:related_to' and source in visited and target in visited]
+        assert selection.filters['k'] == k
+
+
+def test_export_npz_round_trip(tmp_path):
+    graph = make_graph()
+    selection = select_subgraph(graph, node_types=['biolink:OrganismTaxon', 'biolink:BiologicalEntity'])
+    export_npz(selection, str(tmp_path / 'subgraph.npz'))
+
+    with np.load(str(tmp_path / 'subgraph.npz')) as subgraph:
+        node_ids = decode_strings(subgraph['node_ids'])
+        predicates = decode_strings(subgraph['predicates'])
+        edge_index = subgraph['edge_index']
+        assert node_ids == [graph.node_ids[node_index] for node_index in selection.node_indices().tolist()]
+        assert decode_strings(subgraph['node_types']) == graph.node_types
+        assert sorted((node_ids[source], node_ids[target], predicates[predicate]) for source, target, predicate
+                      in zip(edge_index[0].tolist(), edge_index[1].tolist(), subgraph['edge_predicate_ids'].tolist())) == \
+            sorted((graph.node_ids[source], graph.node_ids[target], graph.predicates[predicate]) for source, target, predicate
+                   in (edge_rows(graph)[edge_index] for edge_index in selection.edge_indices().tolist()))
+        # The CSR arrays hold the out-neighbors of every local node
+        indptr, indices, edge_ids = subgraph['csr_indptr'], subgraph['csr_indices'], subgraph['csr_edge_ids']
+        for node in range(len(node_ids)):
+            neighbors = indices[indptr[node]:indptr[node + 1]]
+            assert sorted(neighbors.tolist()) == sorted(edge_index[1][edge_index[0] == node].tolist())
+            assert np.array_equal(edge_index[1][edge_ids[indptr[node]:indptr[node + 1]]], neighbors)
+
+
+def test_export_networkx_edge_list(tmp_path):
+    graph = make_graph()
+    selection = select_subgraph(graph, seeds=['TEST:3'], k=1)
+    export_networkx(selection, str(tmp_path))
+
+    with open(tmp_path / 'nodes.tsv') as f:
+        rows = [line.rstrip('\n').split('\t') for line in f]
+    assert rows[0] == ['node_id', 'node_type', 'name', 'is_pathogen']
+    assert [row[0] for row in rows[1:]] == [graph.node_ids[node_index] for node_index in selection.node_indices().tolist()]
+    with open(tmp_path / 'edges.edgelist') as f:
+        edges = [line.rstrip('\n').split('\t') for line in f]
+    assert edges == [[graph.node_ids[source], graph.node_ids[target], f"{{'predicate': '{graph.predicates[predicate]}'}}"]
+                     for source, target, predicate in (edge_rows(graph)[edge_index] for edge_index in selection.edge_indices().tolist())]
+
+    nx = pytest.importorskip('networkx')
+    loaded = nx.read_edgelist(str(tmp_path / 'edges.edgelist'), delimiter='\t', create_using=nx.MultiDiGraph)
+    assert loaded.number_of_edges() == selection.n_edges
+    nx_graph = to_networkx(selection)
+    assert nx_graph.number_of_nodes() == selection.n_nodes and nx_graph.number_of_edges() == selection.n_edges
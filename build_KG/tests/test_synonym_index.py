@@ -0,0 +1,80 @@
+"""
+Checks that the compiled synonym index returns the same canonical curies as NodeSynonymizer.
+
+Run from build_KG:  python -m pytest tests
+"""
+
+import os
+import random
+import sqlite3
+import sys
+
+sys.path.append(os.path.join(os.path.dirname(os.path.realpath(__file__)), '..'))
+from kg2_utils.node_synonymizer import NodeSynonymizer
+from kg2_utils.synonym_index import SynonymIndex, compile_synonym_index, hash_keys, simplify_name
+
+
+def make_synonymizer_db(database_path: str, n_clusters: int = 500, n_nodes: int = 5000, n_names: int = 300, seed: int = 100):
+    """
+    Synthetic synonymizer database in which many simplified names are shared by nodes of several clusters with
+    tied counts.
+    """
+    rng = random.Random(seed)
+    connection = sqlite3.connect(database_path)
+    connection.execute("CREATE TABLE clusters (cluster_id TEXT PRIMARY KEY, name TEXT, category TEXT, member_ids TEXT, intra_cluster_edge_ids TEXT)")
+    connection.execute("CREATE TABLE nodes (id TEXT PRIMARY KEY, id_simplified TEXT, name_simplified TEXT, cluster_id TEXT, name TEXT, category TEXT)")
+    cluster_ids = [f"TEST:C{index:05d}" for index in range(n_clusters)]
+    members = {cluster_id: [] for cluster_id in cluster_ids}
+    # Insert the nodes in a shuffled order so that sqlite's row order differs from the cluster id order
+    node_rows = []
+    for index in range(n_nodes):
+        cluster_id = rng.choice(cluster_ids)
+        node_id = f"test:N{index:06d}"
+        name = f"Name {rng.randrange(n_names)}"
+        node_rows.append((node_id, NodeSynonymizer._capitalize_curie_prefix(node_id), simplify_name(name), cluster_id, name, "NamedThing"))
+        members[cluster_id].append(node_id)
+    rng.shuffle(node_rows)
+    connection.executemany("INSERT INTO nodes VALUES (?, ?, ?, ?, ?, ?)", node_rows)
+    connection.executemany("INSERT INTO clusters VALUES (?, ?, ?, ?, ?)",
+                           [(cluster_id, f"cluster {cluster_id}", "NamedThing", str(members[cluster_id]), "[]") for cluster_id in cluster_ids])
+    connection.execute("CREATE INDEX nodes_name_simplified ON nodes (name_simplified)")
+    connection.execute("CREATE INDEX nodes_id_simplified ON nodes (id_simplified)")
+    connection.commit()
+    connection.close()
+    return sorted({row[2] for row in node_rows}), [row[0] for row in node_rows]
+
+
+def test_index_matches_synonymizer_with_tied_names(tmp_path):
+    names, node_ids = make_synonymizer_db(str(tmp_path / "synonymizer.sqlite"))
+    compile_synonym_index(str(tmp_path / "synonymizer.sqlite"), str(tmp_path / "index"))
+    index = SynonymIndex(str(tmp_path / "index"))
+    synonymizer = NodeSynonymizer(str(tmp_path), "synonymizer.sqlite")
+
+    # Make sure the database actually has tied names
+    connection = sqlite3.connect(str(tmp_path / "synonymizer.sqlite"))
+    tied_names = connection.execute("""
+        SELECT COUNT(*) FROM (SELECT name_simplified, MAX(n) AS best FROM
+            (SELECT name_simplified, cluster_id, COUNT(*) AS n FROM nodes GROUP BY name_simplified, cluster_id) GROUP BY name_simplified) AS B
+        WHERE (SELECT COUNT(*) FROM (SELECT cluster_id FROM nodes AS N WHERE N.name_simplified = B.name_simplified
+                                     GROUP BY cluster_id HAVING COUNT(*) = B.best)) > 1""").fetchone()[0]
+    connection.close()
+    assert tied_names > 0
+
+    assert index.get_canonical_curies(names=names) == synonymizer.get_canonical_curies(names=names)
+    assert index.get_canonical_curies(curies=node_ids) == synonymizer.get_canonical_curies(curies=node_ids)
+
+
+def test_lookup_handles_missing_keys_and_hash_collisions(tmp_path):
+    names, _ = make_synonymizer_db(str(tmp_path / "synonymizer.sqlite"), n_clusters=20, n_nodes=200, n_names=50)
+    compile_synonym_index(str(tmp_path / "synonymizer.sqlite"), str(tmp_path / "index"))
+    index = SynonymIndex(str(tmp_path / "index"))
+    queries = names + ["missing", "", names[0] + "x"]
+    positions = index.lookup("name", queries)
+    assert (positions[:len(names)] >= 0).all()
+    assert (positions[len(names):] == -1).all()
+
+    # Force every key into one hash bucket: lookups must still resolve to the exact key
+    target = names[len(names) // 2]
+    index.key_hashes["name"] = index.key_hashes["name"].copy()
+    index.key_hashes["name"][:] = hash_keys([target.encode("utf-8")])[0]
+    assert index.lookup("name", [target, target + "x"]).tolist() == [positions[len(names) // 2], -1]
@@ -0,0 +1,43 @@
+"""
+Checks that the compiled TRAPI deserializer builds the same model objects as util._deserialize, with and without
+the validating setters.
+
+Run from build_KG:  python -m pytest tests
+"""
+
+import copy
+import os
+import sys
+
+import pytest
+
+sys.path.append(os.path.join(os.path.dirname(os.path.realpath(__file__)), '..'))
+from kg2_utils import util
+from kg2_utils.models.edge import Edge
+from kg2_utils.models.knowledge_graph import KnowledgeGraph
+from kg2_utils.models.node import Node
+from kg2_utils.trapi_deserializer import deserialize, iter_knowledge_graph, make_synthetic_knowledge_graph
+
+
+@pytest.mark.parametrize("validate", [True, False])
+def test_deserialize_matches_util(validate):
+    payload = make_synthetic_knowledge_graph(50, 120)
+    # The reference gets its own copy so that values passed through unchanged are not shared between both outputs
+    reference = util._deserialize(copy.deepcopy(payload), KnowledgeGraph)
+    fast = deserialize(payload, KnowledgeGraph, validate=validate)
+
+    assert isinstance(fast, KnowledgeGraph)
+    assert fast.nodes == reference.nodes
+    assert fast.edges == reference.edges
+    assert all(isinstance(node, Node) for node in fast.nodes.values())
+    assert all(isinstance(edge, Edge) for edge in fast.edges.values())
+
+
+@pytest.mark.parametrize("validate", [True, False])
+def test_iter_knowledge_graph_matches_util(validate):
+    payload = make_synthetic_knowledge_graph(20, 40, seed=7)
+    reference = util._deserialize(copy.deepcopy(payload), KnowledgeGraph)
+    items = list(iter_knowledge_graph({"message": {"knowledge_graph": payload}}, validate=validate))
+
+    assert {item_id: item for item_type, item_id, item in items if item_type == "node"} == reference.nodes
+    assert {item_id: item for item_type, item_id, item in items if item_type == "edge"} == reference.edges
@@ -22,9 +22,11 @@ from tqdm import tqdm, trange
 from typing import List, Dict, Tuple, Union, Any, Optional, Set
 csv.field_size_limit(100000000)  # set the maximum field size limit to 100MB or any value you need
 import requests
+from requests.adapters import HTTPAdapter
 import json
 import re
 import ast
+from concurrent.futures import ThreadPoolExecutor
 
 def get_logger():
     """
@@ -62,6 +64,41 @@ def check_files(file_path: str, logger):
     else:
         return True
 
+def load_gtdbtk_assignment(file_path: str, prefix: str, ani_threshold: float = 0.0, af_threshold: float = 0.0) -> pd.DataFrame:
+    """
+    Load a GTDB-Tk summary file as a mapping table.
+    :param file_path: path of the GTDB-Tk summary file
+    :param prefix: prefix of the genome ids (e.g., 'KEGG' for 'KEGG:gn_XXXX')
+    :param ani_threshold: ANI threshold to map a genome to its closest GTDB reference genome
+    :param af_threshold: AF threshold to map a genome to its closest GTDB reference genome
+    :return: a dataframe with columns 'genome_id', 'assigned_id', 'classification', 'ani', 'af' (NaN if 'N/A') and
+             'description' (a list of (key, value) tuples from the GTDB-Tk summary, empty if ANI is 'N/A')
+    """
+    # (description key, GTDB-Tk column)
+    description_fields = [('ANI_reference_radius', 'closest_genome_reference_radius'), ('ANI', 'closest_genome_ani'), ('AF', 'closest_genome_af'),
+                          ('classification_method', 'classification_method'), ('MSA_percent', 'msa_percent')]
+    usecols = ['user_genome', 'classification', 'closest_genome_reference'] + [column for _, column in description_fields]
+    assignment = pd.read_csv(file_path, sep='\t', usecols=usecols, dtype=str, keep_default_na=False, quoting=csv.QUOTE_NONE)
+
+    ani = pd.to_numeric(assignment['closest_genome_ani'], errors='coerce')
+    af = pd.to_numeric(assignment['closest_genome_af'], errors='coerce')
+    # 'N/A' values become NaN and never pass the thresholds
+    passed = (ani >= ani_threshold) & (af >= af_threshold)
+    genome_ids = f"{prefix}:gn_" + assignment['user_genome']
+
+    description_values = zip(*[assignment[column] for _, column in description_fields])
+    has_ani = (assignment['closest_genome_ani'] != 'N/A').to_numpy()
+    descriptions = [list(zip([key for key, _ in description_fields], values)) if flag else [] for values, flag in zip(description_values, has_ani)]
+
+    return pd.DataFrame({
+        'genome_id': genome_ids,
+        'assigned_id': genome_ids.where(~passed, 'GTDB:' + assignment['closest_genome_reference']),
+        'classification': assignment['classification'],
+        'ani': ani,
+        'af': af,
+        'description': descriptions
+    })
+
 
 class Node:
     def __init__(self, node_type: str, all_names: List[str] = [], description: List[Tuple] = [], knowledge_source: List[str] = [], link: List[str] = [], synonyms: List[str] = [], is_pathogen: bool = False):
@@ -183,6 +220,68 @@ class KnowledgeGraph:
         self.node_by_type[node.node_type] += [node.id]
         self.nodes[node.id] = node
 
+    def add_nodes(self, nodes: List[Node]) -> Tuple[int, int]:
+        """
+        Add a batch of nodes with the same merge behavior as add_node.
+        :param nodes: a list of Node objects
+        :return: a tuple of (number of new nodes, number of nodes merged into existing ones)
+        """
+        synonym_map, node_type_count = self.map_synonym_to_node_id, self.node_type_count
+        all_synonyms = [synonym for node in nodes for synonym in node.synonyms]
+        if (all(isinstance(node, Node) and node.id is None and node.node_type in node_type_count and len(node.synonyms) > 0 for node in nodes)
+                and len(set(all_synonyms)) == len(all_synonyms) and synonym_map.keys().isdisjoint(all_synonyms)):
+            # No node of the batch shares a synonym with the graph or with another node of the batch, so all of them are
+            # new: ids, synonyms and node types are assigned in bulk (the result, including the node ids, is the same as
+            # adding them one by one with add_node)
+            node_ids = []
+            for node in nodes:
+                node_type_count[node.node_type] += 1
+                node_ids.append(f"{node.node_type}:{node_type_count[node.node_type]}")
+            synonym_map.update(zip(node_ids, node_ids))
+            synonym_map.update(zip(all_synonyms, [node_id for node, node_id in zip(nodes, node_ids) for _ in node.synonyms]))
+            for node, node_id in zip(nodes, node_ids):
+                node.id = node_id
+                node.node_type = self.mapping_nodetype_biolink[node.node_type]
+                self.node_by_type.setdefault(node.node_type, []).append(node_id)
+            self.nodes.update(zip(node_ids, nodes))
+            return len(nodes), 0
+
+        new_count, merged_count = 0, 0
+        for node in nodes:
+            node_count = len(self.nodes)
+            self.add_node(node)
+            if len(self.nodes) > node_count:
+                new_count += 1
+            elif len(node.synonyms) > 0 and node.synonyms[0] in synonym_map:
+                merged_count += 1
+        return new_count, merged_count
+
+    def add_hierarchy(self, parents, children, nodes: List[Node], kg_source: str) -> Tuple[int, int]:
+        """
+        Add a taxonomy hierarchy in bulk: the taxon nodes plus 'biolink:superclass_of' (parent -> child) and 'biolink:subclass_of' (child -> parent) edges.
+        :param parents: a list or pandas Series of parent synonyms
+        :param children: a list or pandas Series of child synonyms aligned with parents
+        :param nodes: one Node object per taxon appearing in parents or children, in the order their node ids are assigned
+        :param kg_source: knowledge source of the edges
+        :return: a tuple of (number of new nodes, number of nodes merged into existing ones)
+        """
+        new_count, merged_count = self.add_nodes(nodes)
+
+        pairs = pd.DataFrame({'parent': self.resolve_synonyms(parents).to_numpy(), 'child': self.resolve_synonyms(children).to_numpy()})
+        missing = pairs['parent'].isna() | pairs['child'].isna()
+        if missing.any():
+            self.logger.warning(f"{missing.sum()} hierarchy pairs are skipped because their taxa are not in the graph!")
+        pairs = pairs.loc[~missing,:].drop_duplicates()
+        # Both edges of a pair are added next to each other, in the order of the pairs
+        edge_table = pd.concat([
+            pd.DataFrame({'source_node': pairs['parent'], 'target_node': pairs['child'], 'predicate': 'biolink:superclass_of'}),
+            pd.DataFrame({'source_node': pairs['child'], 'target_node': pairs['parent'], 'predicate': 'biolink:subclass_of'})
+        ]).sort_index(kind='stable')
+        edge_table['knowledge_source'] = [[kg_source]] * len(edge_table)
+        self.add_edges(edge_table, resolved=True)
+
+        return new_count, merged_count
+
     def add_edge(self, edge: Edge):
         if not isinstance(edge, Edge):
             self.logger.warning("Edge must be an instance of the Edge class.")
@@ -210,15 +309,7 @@ class KnowledgeGraph:
             self.edges[edge.edge_id] = edge
         else:
             # self.edges[edge.edge_id].predicate = list(set(self.edges[edge.edge_id].predicate + edge.predicate))
-            temp_description_dict = dict(edge.description)
-            old_temp_description_dict = dict(self.edges[edge.edge_id].description)
-            for key in temp_description_dict:
-                if key in old_temp_description_dict:
-                    old_temp_description_dict[key] = '#####'.join(list(set([temp_description_dict[key]] + old_temp_description_dict[key].split('#####'))))
-                else:
-                    old_temp_description_dict[key] = temp_description_dict[key]
-            self.edges[edge.edge_id].description = list(old_temp_description_dict.items())
-            self.edges[edge.edge_id].knowledge_source = list(set(self.edges[edge.edge_id].knowledge_source + edge.knowledge_source))
+            self._merge_edge(self.edges[edge.edge_id], edge.description, edge.knowledge_source)
         
         # Add edge to the in_edge and out_edge
         if edge.target_node not in self.in_edge:
@@ -228,6 +319,68 @@ class KnowledgeGraph:
             self.out_edge[edge.source_node] = set()
         self.out_edge[edge.source_node].add(edge.target_node)
 
+    # Description keys holding counts; merged edges carry the total instead of the '#####'-joined values
+    summed_description_keys = {'supporting_gene_count'}
+
+    @classmethod
+    def _merge_edge(cls, existing_edge: Edge, description: List[Tuple], knowledge_source: List[str]):
+        temp_description_dict = dict(description)
+        old_temp_description_dict = dict(existing_edge.description)
+        for key in temp_description_dict:
+            if key in old_temp_description_dict and key in cls.summed_description_keys:
+                old_temp_description_dict[key] = str(sum(int(count) for value in [temp_description_dict[key], old_temp_description_dict[key]] for count in str(value).split('#####')))
+            elif key in old_temp_description_dict:
+                old_temp_description_dict[key] = '#####'.join(list(set([temp_description_dict[key]] + old_temp_description_dict[key].split('#####'))))
+            else:
+                old_temp_description_dict[key] = temp_description_dict[key]
+        existing_edge.description = list(old_temp_description_dict.items())
+        existing_edge.knowledge_source = list(set(existing_edge.knowledge_source + knowledge_source))
+
+    def resolve_synonyms(self, synonyms) -> pd.Series:
+        """
+        Vectorized version of find_node_by_synonym.
+        :param synonyms: a list or pandas Series of synonyms
+        :return: a pandas Series of node ids aligned with the input (NaN if not found)
+        """
+        synonyms = pd.Series(synonyms, dtype=object)
+        unique_synonyms = pd.Series(synonyms.dropna().unique(), dtype=object)
+        resolved = unique_synonyms.map(self.map_synonym_to_node_id)
+        # GTDB assembly accessions need the GCF/GCA and version suffix handling of find_node_by_synonym
+        is_assembly = unique_synonyms.str.contains('GTDB:', regex=False) & unique_synonyms.str.contains(':GC[FA]_', regex=True)
+        resolved[is_assembly] = unique_synonyms[is_assembly].map(self.find_node_by_synonym)
+        return synonyms.map(dict(zip(unique_synonyms, resolved)))
+
+    def add_edges(self, edge_table: pd.DataFrame, resolved: bool = False) -> int:
+        """
+        Add edges in bulk with the same merge behavior as add_edge.
+        :param edge_table: a dataframe with columns 'source_node', 'target_node', 'predicate', 'knowledge_source' (a list) and optionally 'description' (a list of tuples)
+        :param resolved: whether 'source_node' and 'target_node' are already node ids of this graph
+        :return: the number of edges added or merged
+        """
+        edge_table = edge_table.loc[edge_table['predicate'].notna(),:]
+        if not resolved:
+            source_nodes = self.resolve_synonyms(edge_table['source_node']).to_numpy()
+            target_nodes = self.resolve_synonyms(edge_table['target_node']).to_numpy()
+            edge_table = edge_table.assign(source_node=source_nodes, target_node=target_nodes)
+            missing = edge_table['source_node'].isna() | edge_table['target_node'].isna()
+            if missing.any():
+                self.logger.warning(f"{missing.sum()} edges are skipped because their source or target nodes are not in the graph!")
+            edge_table = edge_table.loc[~missing,:]
+
+        descriptions = edge_table['description'] if 'description' in edge_table.columns else [[]] * len(edge_table)
+        for source_node, target_node, predicate, knowledge_source, description in zip(edge_table['source_node'], edge_table['target_node'], edge_table['predicate'], edge_table['knowledge_source'], descriptions):
+            edge_id = source_node + "_" + predicate + "_" + target_node
+            if edge_id not in self.edges:
+                edge = Edge(source_node=source_node, target_node=target_node, predicate=predicate, description=description, knowledge_source=knowledge_source)
+                edge.edge_id = edge_id
+                self.edges[edge_id] = edge
+            else:
+                self._merge_edge(self.edges[edge_id], description, knowledge_source)
+            self.in_edge.setdefault(target_node, set()).add(source_node)
+            self.out_edge.setdefault(source_node, set()).add(target_node)
+
+        return len(edge_table)
+
     def get_node_by_type(self, node_type):
         if node_type not in self.all_node_type:
             self.logger.warning("Node type {} is not supported!".format(node_type))
@@ -432,6 +585,48 @@ def extract_disease_synonyms(name, nodesynonymizer, umls_class, umls_api_key=Non
             return []
 
 
+def extract_disease_synonyms_batch(names, nodesynonymizer, resolver=None) -> Dict[str, List[str]]:
+    """
+    Batch version of extract_disease_synonyms.
+    :param names: a list of disease names
+    :param nodesynonymizer: a NodeSynonymizer object
+    :param resolver: an AsyncMappingResolver object used for the names unknown to the Node Synonymizer (skipped if None)
+    :return: a dictionary mapping each name to its list of synonyms (empty if not found)
+    """
+    names = list(dict.fromkeys([name for name in names if isinstance(name, str) and name != '']))
+    results = {name: [] for name in names}
+    if len(names) == 0:
+        return results
+
+    # Use Node Synonymizer to get canonical curies for all names at once
+    normalizer = nodesynonymizer.get_canonical_curies(names=names)
+    name_to_canonical_curie = {name: normalizer[name]['preferred_curie'] for name in names if normalizer.get(name)}
+
+    # Only send the misses to UMLS
+    misses = [name for name in names if name not in name_to_canonical_curie]
+    if resolver is not None and len(misses) > 0:
+        name_to_umls = {name: umls_id for name, umls_id in resolver.get_umls_mappings(misses).to_numpy() if umls_id}
+        if len(name_to_umls) > 0:
+            umls_normalizer = nodesynonymizer.get_canonical_curies(curies=list(set(name_to_umls.values())))
+            for name, umls_id in name_to_umls.items():
+                if umls_normalizer.get(umls_id):
+                    name_to_canonical_curie[name] = umls_normalizer[umls_id]['preferred_curie']
+                else:
+                    results[name] = [change_prefix(umls_id)]
+
+    # Get all synonyms of all canonical curies at once
+    canonical_curies = list(set(name_to_canonical_curie.values()))
+    equivalent_nodes = nodesynonymizer.get_equivalent_nodes(curies=canonical_curies) if len(canonical_curies) > 0 else {}
+    for name, canonical_curie in name_to_canonical_curie.items():
+        synonyms = equivalent_nodes.get(canonical_curie)
+        if synonyms:
+            results[name] = list(set([change_prefix(synonym) for synonym in synonyms if change_prefix(synonym)]))
+        elif change_prefix(canonical_curie):
+            results[name] = [change_prefix(canonical_curie)]
+
+    return results
+
+
 class UMLSMapping:
     
     def __init__(self, apikey):
@@ -504,7 +699,153 @@ class OxOMapping:
             return self._parse_response(response.json(), output_only)
         else:
             return None
-        
+
+
+class AsyncMappingResolver:
+    """
+    Resolve names and identifiers through the UMLS and OxO APIs with concurrent requests.
+
+    Inputs are de-duplicated before any request is sent. UMLS lookups are fanned out to a thread
+    pool of max_concurrency workers, while OxO ids are sent in batches because its search endpoint accepts
+    a list of ids. All requests share one pooled session and the base URLs can be pointed to
+    a local mock server. Every public method returns a pandas DataFrame.
+    """
+
+    def __init__(self, apikey: Optional[str] = None, max_concurrency: int = 8, oxo_batch_size: int = 100, timeout: int = 30,
+                 umls_base_url: str = "https://uts-ws.nlm.nih.gov/rest", oxo_api: str = "https://www.ebi.ac.uk/spot/oxo/api/search"):
+        self.apikey = apikey
+        self.max_concurrency = max(1, int(max_concurrency))
+        self.oxo_batch_size = max(1, int(oxo_batch_size))
+        self.timeout = timeout
+        self.umls_search_api = f"{umls_base_url}/search/current"
+        self.umls_content_api = f"{umls_base_url}/content/current"
+        self.oxo_api = oxo_api
+        self.headers = {'content-type': 'application/json'}
+        # all worker threads share the same connection pool
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=self.max_concurrency, pool_maxsize=self.max_concurrency)
+        self.session.mount('http://', adapter)
+        self.session.mount('https://', adapter)
+
+    def close(self):
+        self.session.close()
+
+    def _request_json(self, method: str, url: str, **kwargs):
+        try:
+            response = self.session.request(method, url, timeout=self.timeout, **kwargs)
+        except requests.RequestException:
+            return None
+        if response.status_code != 200:
+            return None
+        try:
+            return response.json()
+        except ValueError:
+            return None
+
+    def _run_concurrently(self, func, items: List[Any]) -> List[Any]:
+        # the requests are blocking, so a thread pool of max_concurrency workers bounds the number of requests in flight;
+        # results are returned in the order of items
+        if len(items) == 0:
+            return []
+        with ThreadPoolExecutor(max_workers=min(self.max_concurrency, len(items))) as executor:
+            return list(executor.map(func, items))
+
+    def _search_umls(self, name: str) -> Optional[str]:
+        response_json = self._request_json('GET', self.umls_search_api, params={'string': name, 'apiKey': self.apikey, 'pageNumber': 0})
+        if not response_json:
+            return None
+        items = response_json['result']['results']
+        if len(items) == 0:
+            return None
+        return f"UMLS:{items[0]['ui']}"
+
+    @staticmethod
+    def _parse_ncbi_taxon_ids(response_json, preferred_name: str) -> List[int]:
+        temp = list(set([int(res['code'].split('/')[-1]) for res in response_json['result'] if res['rootSource'] == 'NCBI' and res['name'].lower() == preferred_name.lower()]))
+        if len(temp) == 0:
+            temp = list(set([int(res['code'].split('/')[-1]) for res in response_json['result'] if res['rootSource'] == 'NCBI']))
+        return temp
+
+    def _map_to_taxon_ids(self, query: Tuple[Any, Any]) -> Optional[List[int]]:
+        ncit, umls_id = query
+        params = {'apiKey': self.apikey}
+        if isinstance(ncit, str):
+            response_json = self._request_json('GET', f"{self.umls_content_api}/source/NCI/{ncit.split('_')[1]}/atoms", params=params)
+            if not response_json:
+                return None
+            cui = response_json['result'][0]['concept'].split('/')[-1]
+        elif isinstance(umls_id, str) and umls_id.split(':')[0] == 'UMLS':
+            cui = umls_id.split(':')[1]
+        else:
+            return None
+
+        response_json = self._request_json('GET', f"{self.umls_content_api}/CUI/{cui}", params=params)
+        if not response_json:
+            return None
+        preferred_name = response_json['result']['name']
+        response_json = self._request_json('GET', f"{self.umls_content_api}/CUI/{cui}/atoms", params=params)
+        if not response_json:
+            return None
+        taxon_ids = self._parse_ncbi_taxon_ids(response_json, preferred_name)
+        return taxon_ids if len(taxon_ids) > 0 else None
+
+    def _search_oxo(self, query: Tuple[List[str], int, Optional[List[str]]]) -> List[Tuple[str, str, int]]:
+        ids, distance, mappingTarget = query
+        data = {'ids': ids, 'distance': distance}
+        if isinstance(mappingTarget, list):
+            data['mappingTarget'] = mappingTarget
+        # ask for one page that is large enough to hold the results of the whole batch
+        response_json = self._request_json('POST', self.oxo_api, params={'size': len(ids)}, data=json.dumps(data), headers=self.headers)
+        if not response_json:
+            return []
+        rows = []
+        for result in response_json.get('_embedded', {}).get('searchResults', []):
+            for mapping in result['mappingResponseList']:
+                rows.append((result['queryId'], mapping['curie'], mapping['distance']))
+        return rows
+
+    def get_umls_mappings(self, names: List[str]) -> pd.DataFrame:
+        """
+        Map names to UMLS ids.
+        :param names: a list of names (duplicates are only queried once)
+        :return: a dataframe with columns 'name' and 'umls_id' (None if not found)
+        """
+        unique_names = list(dict.fromkeys([name for name in names if isinstance(name, str)]))
+        umls_ids = self._run_concurrently(self._search_umls, unique_names)
+        return pd.DataFrame({'name': unique_names, 'umls_id': umls_ids}, columns=['name', 'umls_id'])
+
+    def get_taxon_ids(self, names: List[str], ncit_ids: List[Any], umls_ids: List[Any]) -> pd.DataFrame:
+        """
+        Map NCIT ids (preferred) or UMLS ids of microbes to NCBI taxon ids.
+        :param names: a list of microbe names
+        :param ncit_ids: a list of NCIT ids aligned with names (non-str values are ignored)
+        :param umls_ids: a list of UMLS ids aligned with names
+        :return: a dataframe with columns 'name', 'umls_id' and 'taxon_id' (a list of taxon ids or None)
+        """
+        queries = list(zip(names, ncit_ids, umls_ids))
+        unique_queries = list(dict.fromkeys([(ncit_id if isinstance(ncit_id, str) else None, umls_id) for _, ncit_id, umls_id in queries]))
+        results = dict(zip(unique_queries, self._run_concurrently(self._map_to_taxon_ids, unique_queries)))
+        taxon_ids = [results[(ncit_id if isinstance(ncit_id, str) else None, umls_id)] for _, ncit_id, umls_id in queries]
+        return pd.DataFrame({'name': [query[0] for query in queries], 'umls_id': [query[2] for query in queries], 'taxon_id': taxon_ids}, columns=['name', 'umls_id', 'taxon_id'])
+
+    def get_oxo_mappings(self, ids: List[str], distance: int = 1, mappingTarget: Optional[List[str]] = None, output_only: Optional[int] = None) -> pd.DataFrame:
+        """
+        Get OxO mappings for a list of ids.
+        :param ids: a list of curies (duplicates are only queried once)
+        :param distance: the maximum mapping distance
+        :param mappingTarget: a list of target ontologies (default: all)
+        :param output_only: only keep mappings with this distance (1, 2 or 3)
+        :return: a dataframe with columns 'query_id', 'curie' and 'distance'
+        """
+        unique_ids = list(dict.fromkeys([x for x in ids if isinstance(x, str)]))
+        batches = [(unique_ids[start:start + self.oxo_batch_size], distance, mappingTarget) for start in range(0, len(unique_ids), self.oxo_batch_size)]
+        results = self._run_concurrently(self._search_oxo, batches)
+        mapping_df = pd.DataFrame([row for rows in results for row in rows], columns=['query_id', 'curie', 'distance'])
+        if output_only:
+            mapping_df = mapping_df.loc[mapping_df['distance'] == output_only, :]
+        return mapping_df.reset_index(drop=True)
+
+
 def MappingLink(synonym):
     prefix = synonym.split(':')[0]
     if prefix in ['MONDO', 'OMIM', 'LOINC', 'RXNORM', 'DOID', 'ORPHANET', 'ICD-9', 'ICD-10', 'MeSH', 'UMLS', 'HP', 'NBO', 'SYMP', 'PSY', 'DRUGBANK', 'KEGG', 'DrugCentral', 'VANDF', 'PathWhiz.Compound', 'HMDB', 'CHEMBL.COMPOUND', 'PubChem', 'ChEBI', 'PathWhiz.ProteinComplex', 'UniProtKB', 'GO']:
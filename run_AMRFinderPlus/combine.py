@@ -0,0 +1,119 @@
+"""
+This script is used to combine the per-genome AMRFinderPlus results of a database (BVBRC, GTDB or KEGG) into a single Parquet file.
+
+Usage (run inside the database folder, e.g. ./KEGG):
+    python ../combine.py --database KEGG
+"""
+
+## Import standard libraries
+import os
+import argparse
+from multiprocessing import Pool
+import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
+from tqdm import tqdm
+
+# result directory and 'source' label of each database
+DATABASE_SETTINGS = {
+    'BVBRC': {'result_dir': 'genomes', 'source': 'PATRIC'},
+    'GTDB': {'result_dir': 'seqs', 'source': 'GTDB'},
+    'KEGG': {'result_dir': 'seqs', 'source': 'KEGG'},
+}
+
+
+def read_chunk_columns(args):
+    """
+    Read the header line of the AMRFinderPlus results of a chunk of genomes.
+    :param args: a tuple of (list of (genome_id, result_file), source label)
+    :return: list of the column names, in the order they are first seen
+    """
+    tasks, _ = args
+    columns = {}
+    for _, result_file in tasks:
+        try:
+            with open(result_file) as f:
+                header = f.readline().rstrip('\n')
+        except FileNotFoundError:
+            continue
+        if header:
+            columns.update(dict.fromkeys(header.split('\t')))
+    return list(columns)
+
+
+def read_chunk(args):
+    """
+    Read the AMRFinderPlus results of a chunk of genomes.
+    :param args: a tuple of (list of (genome_id, result_file), source label, list of all result columns)
+    :return: a tuple of (combined dataframe or None, list of skipped result files)
+    """
+    tasks, source, columns = args
+    chunk_df, skipped = [], []
+    for genome_id, result_file in tasks:
+        try:
+            temp_df = pd.read_csv(result_file, sep='\t', header=0, dtype=str, keep_default_na=False)
+        except (FileNotFoundError, pd.errors.EmptyDataError):
+            skipped += [result_file]
+            continue
+        temp_df['genome_id'] = genome_id
+        chunk_df += [temp_df]
+    if len(chunk_df) == 0:
+        return None, skipped
+
+    # all values are kept as the strings written by AMRFinderPlus (e.g. '100.00'), the same as in the TSV results;
+    # results written by other AMRFinderPlus versions may lack some columns, which are left empty
+    chunk_df = pd.concat(chunk_df, axis=0, ignore_index=True).reindex(columns=columns + ['genome_id'], fill_value='')
+    chunk_df['source'] = pd.Categorical([source] * len(chunk_df))
+    return chunk_df, skipped
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='Combine the per-genome AMRFinderPlus results into a single Parquet file')
+    parser.add_argument('--database', type=str, required=True, choices=list(DATABASE_SETTINGS.keys()), help='database the genomes come from')
+    parser.add_argument('--accession_file', type=str, help='path of the accession list with successful runs', default='finished_accession_list.txt')
+    parser.add_argument('--mapping_file', type=str, help='path of the KEGG genome id to assembly id mapping (KEGG only)', default='KEGG_microbe_assembly_mapping.tsv')
+    parser.add_argument('--result_dir', type=str, help='directory containing one sub-directory per genome (default depends on --database)', default=None)
+    parser.add_argument('--n_jobs', type=int, help='number of worker processes', default=os.cpu_count())
+    parser.add_argument('--chunk_size', type=int, help='number of genomes read by a worker at a time', default=1000)
+    parser.add_argument('--output', type=str, help='path of the output Parquet file', default='amrfinderplus_all_results.parquet')
+    args = parser.parse_args()
+
+    settings = DATABASE_SETTINGS[args.database]
+    result_dir = args.result_dir if args.result_dir else settings['result_dir']
+
+    # Read accession file with sccessful runs
+    accessions = pd.read_csv(args.accession_file, sep='\t', header=None, dtype=str)[0].to_list()
+    if args.database == 'KEGG':
+        # Filter some genomes without AMR results
+        mapping = pd.read_csv(args.mapping_file, sep='\t', header=0, dtype=str)
+        mapping = mapping.loc[mapping['assembly_id'].isin(accessions),:].reset_index(drop=True)
+        tasks = [(gn_id, os.path.join(result_dir, assembly_id, 'amrfinder_results.txt')) for gn_id, assembly_id in mapping[['gn_id', 'assembly_id']].to_numpy()]
+    else:
+        tasks = [(genome_id, os.path.join(result_dir, genome_id, 'amrfinder_results.txt')) for genome_id in accessions]
+    chunks = [(tasks[start:start + args.chunk_size], settings['source']) for start in range(0, len(tasks), args.chunk_size)]
+
+    writer, skipped_files, row_count = None, [], 0
+    with Pool(processes=args.n_jobs) as pool:
+        # the Parquet schema is the union of the columns of all result files
+        columns = {}
+        for chunk_columns in tqdm(pool.imap(read_chunk_columns, chunks), total=len(chunks), desc='Reading AMRFinderPlus result headers'):
+            columns.update(dict.fromkeys(chunk_columns))
+        columns = [column for column in columns if column not in ('genome_id', 'source')]
+        schema = pa.schema([(column, pa.string()) for column in columns + ['genome_id']] + [('source', pa.dictionary(pa.int32(), pa.string()))])
+        chunks = [(chunk_tasks, source, columns) for chunk_tasks, source in chunks]
+
+        # combine AMR results chunk by chunk so that only a few chunks are held in memory at a time
+        for chunk_df, skipped in tqdm(pool.imap(read_chunk, chunks), total=len(chunks), desc='Combining AMRFinderPlus results'):
+            skipped_files += skipped
+            if chunk_df is None:
+                continue
+            if writer is None:
+                writer = pq.ParquetWriter(args.output, schema, compression='zstd', use_dictionary=['source'])
+            writer.write_table(pa.Table.from_pandas(chunk_df, schema=schema, preserve_index=False))
+            row_count += len(chunk_df)
+    if writer is not None:
+        writer.close()
+
+    for result_file in skipped_files:
+        print(f'{result_file} is empty or missing', flush=True)
+    print(f'{row_count} AMRFinderPlus results of {len(tasks) - len(skipped_files)} genomes are saved to {args.output}', flush=True)
@@ -9,6 +9,7 @@ configfile: "./config.yml"
 
 ## Import Python standard libraries
 import os, sys
+import json, shlex
 import subprocess
 
 ## Define Some Global Variables
@@ -25,6 +26,34 @@ else:
     raise ValueError("UMLS_API_KEY is not set in the environment or the config file. Please set it in 'config.yaml' file before running the pipeline.")
 node_synonymizer_dbname = config['BUILD_KG_VARIABLES']['NODE_SYNONYMIZER_DBNAME']
 neo4j_dbname = config['BUILD_KG_VARIABLES']['NEO4J_DBNAME']
+KG_VERSIONS = ['v1', 'v2', 'v3', 'v4', 'v5', 'v6']
+
+## Content-hash based step caching (see build_KG/step_cache.py)
+# A build step reruns only when the content of its inputs, its parameters or the build code change; otherwise its
+# outputs are restored from the cache. Set STEP_CACHE to False in config.yml to always run the steps. Steps that write
+# files besides their declared outputs (step1 and step7) are not cached.
+use_step_cache = config['BUILD_KG_VARIABLES'].get('STEP_CACHE', True)
+STEP_CACHE_DIR = os.path.join(DATA_PATH, "step_cache")
+STEP_CACHE_CODE_PATHS = [os.path.join(SCRIPT_PATH, name) for name in ["utils.py", "config_loader.py", "oxo_mapping.py", "kg2_utils", "kegg_utils"]]
+# Inputs/parameters that do not change the outputs of a step are not part of its cache key; step5 reads only the
+# synonymizer database out of synonymizer_dir, so the database file (synonymizer_db) is hashed instead of the directory
+STEP_CACHE_IGNORED_NAMES = {'script', 'output_dir', 'umls_api_key', 'max_concurrency', 'synonymizer_dir'}
+
+def step_cache_prefix(step, input, output, params):
+    """
+    Return the command prefix that runs a step through step_cache.py (empty if step caching is disabled).
+    """
+    if not use_step_cache:
+        return ""
+    options = [f"--cache_dir {STEP_CACHE_DIR}", f"--step {step}"]
+    options += [f"--code_path {path}" for path in [input.script] + STEP_CACHE_CODE_PATHS]
+    options += [f"--input {name}={path}" for name, path in input.items() if name not in STEP_CACHE_IGNORED_NAMES]
+    options += [f"--output {path}" for path in output]
+    step_params = {name: value for name, value in params.items() if name not in STEP_CACHE_IGNORED_NAMES}
+    options += ["--params_json " + shlex.quote(json.dumps(step_params, sort_keys=True))]
+    prefix = f"python {os.path.join(SCRIPT_PATH, 'step_cache.py')} " + " ".join(options) + " -- "
+    # shell() formats the command string, so literal braces have to be escaped
+    return prefix.replace("{", "{{").replace("}", "}}")
 
 ## Create Required Folders
 if not os.path.exists(os.path.join(DATA_PATH, "KEGG_data")):
@@ -166,7 +195,9 @@ rule targets:
         os.path.join(DATA_PATH, "merged_KG", config['BUILD_KG_VARIABLES']['KG_FILES']['NODES_V6']),
         os.path.join(DATA_PATH, "merged_KG", config['BUILD_KG_VARIABLES']['KG_FILES']['EDGES_V6']),
         os.path.join(DATA_PATH, "neo4j", "input_files", config['BUILD_KG_VARIABLES']['KG_FILES']['FINAL_NODES']),
-        os.path.join(DATA_PATH, "neo4j", "input_files", config['BUILD_KG_VARIABLES']['KG_FILES']['FINAL_EDGES'])
+        os.path.join(DATA_PATH, "neo4j", "input_files", config['BUILD_KG_VARIABLES']['KG_FILES']['FINAL_EDGES']),
+        # statistics and integrity report of each KG version, each diffed against the report of the previous version
+        expand(os.path.join(DATA_PATH, "merged_KG", "stats", "KG_stats_{version}.json"), version=KG_VERSIONS)
 
 
 # Get Taxonomy hierarchy for Archeaa and Bacteria from GTDB as well as Fungi and Viruses from NCBI Taxonomy
@@ -184,7 +215,7 @@ rule step0_get_taxonomy:
         os.path.join(DATA_PATH, "Micobial_hierarchy", "fungi_hierarchy.tsv"),
         os.path.join(DATA_PATH, "Micobial_hierarchy", "viruses_hierarchy.tsv")
     run:
-        shell("python {input.script} --output_dir {input.output_dir} --bacteria_taxonomy {input.bacteria_taxonomy} --archaea_taxonomy {input.archaea_taxonomy} --bacteria_metadata {input.bacteria_metadata} --archaea_metadata {input.archaea_metadata}")
+        shell(step_cache_prefix("step0_get_taxonomy", input, output, params) + "python {input.script} --output_dir {input.output_dir} --bacteria_taxonomy {input.bacteria_taxonomy} --archaea_taxonomy {input.archaea_taxonomy} --bacteria_metadata {input.bacteria_metadata} --archaea_metadata {input.archaea_metadata}")
 
 # Process the KEGG FTP data and download KEGG link info from APIs
 rule step1_process_kegg_data:
@@ -226,7 +257,7 @@ rule step2_integrate_microbial_hierarchy:
         os.path.join(DATA_PATH, "merged_KG", config['BUILD_KG_VARIABLES']['KG_FILES']['NODES_V1']),
         os.path.join(DATA_PATH, "merged_KG", config['BUILD_KG_VARIABLES']['KG_FILES']['EDGES_V1'])
     run:
-        shell("python {input.script} --data_dir {input.data_dir} --bacteria_metadata {input.bacteria_metadata} --archaea_metadata {input.archaea_metadata} --output_dir {input.output_dir}")
+        shell(step_cache_prefix("step2_integrate_microbial_hierarchy", input, output, params) + "python {input.script} --data_dir {input.data_dir} --bacteria_metadata {input.bacteria_metadata} --archaea_metadata {input.archaea_metadata} --output_dir {input.output_dir}")
 
 
 # Integrate knowledge from KEGG into a KG
@@ -247,11 +278,13 @@ rule step3_integrate_kegg_data:
     output:
         os.path.join(DATA_PATH, "merged_KG", config['BUILD_KG_VARIABLES']['KG_FILES']['NODES_V2']),
         os.path.join(DATA_PATH, "merged_KG", config['BUILD_KG_VARIABLES']['KG_FILES']['EDGES_V2'])
+    # snakemake lowers this to --cores when fewer cores are given
+    threads: 16
     run:
         if params.microb_only:
-            shell("python {input.script} --existing_KG_nodes {input.existing_KG_nodes} --existing_KG_edges {input.existing_KG_edges} --kegg_data_dir {input.kegg_data_dir} --kegg_processed_data_dir {input.kegg_processed_data_dir} --gtdb_assignment {input.gtdb_assignment} --microb_only --ANI_threshold {params.ani_threshold} --AF_threshold {params.af_threshold} --output_dir {input.output_dir}")
+            shell(step_cache_prefix("step3_integrate_kegg_data", input, output, params) + "python {input.script} --existing_KG_nodes {input.existing_KG_nodes} --existing_KG_edges {input.existing_KG_edges} --kegg_data_dir {input.kegg_data_dir} --kegg_processed_data_dir {input.kegg_processed_data_dir} --gtdb_assignment {input.gtdb_assignment} --microb_only --ANI_threshold {params.ani_threshold} --AF_threshold {params.af_threshold} --n_jobs {threads} --output_dir {input.output_dir}")
         else:
-            shell("python {input.script} --existing_KG_nodes {input.existing_KG_nodes} --existing_KG_edges {input.existing_KG_edges} --kegg_data_dir {input.kegg_data_dir} --kegg_processed_data_dir {input.kegg_processed_data_dir} --gtdb_assignment {input.gtdb_assignment} --ANI_threshold {params.ani_threshold} --AF_threshold {params.af_threshold} --output_dir {input.output_dir}")
+            shell(step_cache_prefix("step3_integrate_kegg_data", input, output, params) + "python {input.script} --existing_KG_nodes {input.existing_KG_nodes} --existing_KG_edges {input.existing_KG_edges} --kegg_data_dir {input.kegg_data_dir} --kegg_processed_data_dir {input.kegg_processed_data_dir} --gtdb_assignment {input.gtdb_assignment} --ANI_threshold {params.ani_threshold} --AF_threshold {params.af_threshold} --n_jobs {threads} --output_dir {input.output_dir}")
 
 # Integrate KG2 data into into a KG
 rule step4_integrate_kg2_data:
@@ -265,7 +298,7 @@ rule step4_integrate_kg2_data:
         os.path.join(DATA_PATH, "merged_KG", config['BUILD_KG_VARIABLES']['KG_FILES']['NODES_V3']),
         os.path.join(DATA_PATH, "merged_KG", config['BUILD_KG_VARIABLES']['KG_FILES']['EDGES_V3'])
     run:
-        shell("python {input.script} --existing_KG_nodes {input.existing_KG_nodes} --existing_KG_edges {input.existing_KG_edges} --data_dir {input.data_dir} --output_dir {input.output_dir}")
+        shell(step_cache_prefix("step4_integrate_kg2_data", input, output, params) + "python {input.script} --existing_KG_nodes {input.existing_KG_nodes} --existing_KG_edges {input.existing_KG_edges} --data_dir {input.data_dir} --output_dir {input.output_dir}")
 
 # Integrate BVBRC data into the a KG
 rule step5_integrate_bvbrc_data:
@@ -276,17 +309,19 @@ rule step5_integrate_bvbrc_data:
         data_dir = ancient(os.path.join(DATA_PATH, "Zenodo_data", "pathogen_database", "BV-BRC")),
         gtdb_assignment = ancient(os.path.join(DATA_PATH, "Zenodo_data", "taxonomy_assignment_by_GTDB_tk", "merged_BVBRC_assignment.tsv")),
         synonymizer_dir = ancient(os.path.join(DATA_PATH, "Zenodo_data")),
+        synonymizer_db = ancient(os.path.join(DATA_PATH, "Zenodo_data", node_synonymizer_dbname)),
         output_dir = ancient(os.path.join(DATA_PATH, "merged_KG"))
     params:
         umls_api_key = umls_apikey,
         synonymizer_dbname = node_synonymizer_dbname,
         ani_threshold = config['BUILD_KG_VARIABLES']['ANI_THRESHOLD'],
-        af_threshold = config['BUILD_KG_VARIABLES']['AF_THRESHOLD']
+        af_threshold = config['BUILD_KG_VARIABLES']['AF_THRESHOLD'],
+        max_concurrency = config['BUILD_KG_VARIABLES']['MAX_CONCURRENCY']
     output:
         os.path.join(DATA_PATH, "merged_KG", config['BUILD_KG_VARIABLES']['KG_FILES']['NODES_V4']),
         os.path.join(DATA_PATH, "merged_KG", config['BUILD_KG_VARIABLES']['KG_FILES']['EDGES_V4'])
     run:
-        shell("python {input.script} --existing_KG_nodes {input.existing_KG_nodes} --existing_KG_edges {input.existing_KG_edges} --data_dir {input.data_dir} --gtdb_assignment {input.gtdb_assignment} --synonymizer_dir {input.synonymizer_dir} --synonymizer_dbname {params.synonymizer_dbname} --umls_api_key {params.umls_api_key} --ANI_threshold {params.ani_threshold} --AF_threshold {params.af_threshold} --output_dir {input.output_dir}")
+        shell(step_cache_prefix("step5_integrate_bvbrc_data", input, output, params) + "python {input.script} --existing_KG_nodes {input.existing_KG_nodes} --existing_KG_edges {input.existing_KG_edges} --data_dir {input.data_dir} --gtdb_assignment {input.gtdb_assignment} --synonymizer_dir {input.synonymizer_dir} --synonymizer_dbname {params.synonymizer_dbname} --umls_api_key {params.umls_api_key} --ANI_threshold {params.ani_threshold} --AF_threshold {params.af_threshold} --max_concurrency {params.max_concurrency} --output_dir {input.output_dir}")
 
 
 # Integarte MicroPhenoDB data into a KG
@@ -297,15 +332,17 @@ rule step5_integrate_micropheno_data:
         existing_KG_edges = ancient(os.path.join(DATA_PATH, "merged_KG", config['BUILD_KG_VARIABLES']['KG_FILES']['EDGES_V4'])),
         data_dir = ancient(os.path.join(DATA_PATH, "Zenodo_data", 'pathogen_database', 'MicroPhenoDB')),
         synonymizer_dir = ancient(os.path.join(DATA_PATH, "Zenodo_data")),
+        synonymizer_db = ancient(os.path.join(DATA_PATH, "Zenodo_data", node_synonymizer_dbname)),
         output_dir = ancient(os.path.join(DATA_PATH, "merged_KG"))
     params:
         umls_api_key = umls_apikey,
-        synonymizer_dbname = node_synonymizer_dbname
+        synonymizer_dbname = node_synonymizer_dbname,
+        max_concurrency = config['BUILD_KG_VARIABLES']['MAX_CONCURRENCY']
     output:
         os.path.join(DATA_PATH, "merged_KG", config['BUILD_KG_VARIABLES']['KG_FILES']['NODES_V5']),
         os.path.join(DATA_PATH, "merged_KG", config['BUILD_KG_VARIABLES']['KG_FILES']['EDGES_V5'])
     run:
-        shell("python {input.script} --existing_KG_nodes {input.existing_KG_nodes} --existing_KG_edges {input.existing_KG_edges} --data_dir {input.data_dir} --synonymizer_dir {input.synonymizer_dir} --synonymizer_dbname {params.synonymizer_dbname} --umls_api_key {params.umls_api_key} --output_dir {input.output_dir}")
+        shell(step_cache_prefix("step5_integrate_micropheno_data", input, output, params) + "python {input.script} --existing_KG_nodes {input.existing_KG_nodes} --existing_KG_edges {input.existing_KG_edges} --data_dir {input.data_dir} --synonymizer_dir {input.synonymizer_dir} --synonymizer_dbname {params.synonymizer_dbname} --umls_api_key {params.umls_api_key} --max_concurrency {params.max_concurrency} --output_dir {input.output_dir}")
 
 # Integrate AMR data into a KG
 rule step6_integrate_amr_data:
@@ -323,7 +360,7 @@ rule step6_integrate_amr_data:
         os.path.join(DATA_PATH, "merged_KG", config['BUILD_KG_VARIABLES']['KG_FILES']['NODES_V6']),
         os.path.join(DATA_PATH, "merged_KG", config['BUILD_KG_VARIABLES']['KG_FILES']['EDGES_V6'])
     run:
-        shell("python {input.script} --existing_KG_nodes {input.existing_KG_nodes} --existing_KG_edges {input.existing_KG_edges} --amr_result {input.amr_result} --amr_metadata {input.amr_metadata} --coverage_threshold {params.coverage_threshold} --identity_threshold {params.identity_threshold} --output_dir {input.output_dir}")
+        shell(step_cache_prefix("step6_integrate_amr_data", input, output, params) + "python {input.script} --existing_KG_nodes {input.existing_KG_nodes} --existing_KG_edges {input.existing_KG_edges} --amr_result {input.amr_result} --amr_metadata {input.amr_metadata} --coverage_threshold {params.coverage_threshold} --identity_threshold {params.identity_threshold} --output_dir {input.output_dir}")
 
 
 # Prepare neo4j input files
@@ -340,3 +377,32 @@ rule step7_prepare_neo4j_inputs:
         os.path.join(DATA_PATH, "neo4j", "input_files", config['BUILD_KG_VARIABLES']['KG_FILES']['FINAL_EDGES'])
     run:
         shell("python {input.script} --existing_KG_nodes {input.existing_KG_nodes} --existing_KG_edges {input.existing_KG_edges} --kg_dir {input.kg_dir} --output_dir {params.output_dir}")
+
+
+# Compute a statistics and integrity report (with a diff against the previous version) for each KG version
+# The reports are part of 'targets'; to only (re)compute them run: snakemake --cores 16 -s run_buildKG_pipeline.smk kg_statistics_reports
+def previous_kg_report(wildcards):
+    version_index = KG_VERSIONS.index(wildcards.version)
+    if version_index == 0:
+        return []
+    return os.path.join(DATA_PATH, "merged_KG", "stats", f"KG_stats_{KG_VERSIONS[version_index - 1]}.json")
+
+rule kg_statistics_reports:
+    input:
+        expand(os.path.join(DATA_PATH, "merged_KG", "stats", "KG_stats_{version}.json"), version=KG_VERSIONS)
+
+rule kg_statistics:
+    wildcard_constraints:
+        version = "v[1-6]"
+    input:
+        script = ancient(os.path.join(SCRIPT_PATH, "kg_statistics.py")),
+        existing_KG_nodes = lambda wildcards: os.path.join(DATA_PATH, "merged_KG", config['BUILD_KG_VARIABLES']['KG_FILES'][f"NODES_{wildcards.version.upper()}"]),
+        existing_KG_edges = lambda wildcards: os.path.join(DATA_PATH, "merged_KG", config['BUILD_KG_VARIABLES']['KG_FILES'][f"EDGES_{wildcards.version.upper()}"]),
+        previous_report = previous_kg_report
+    params:
+        kg_dir = os.path.join(DATA_PATH, "merged_KG")
+    output:
+        os.path.join(DATA_PATH, "merged_KG", "stats", "KG_stats_{version}.json")
+    run:
+        previous_report_option = f"--previous_report {input.previous_report}" if input.previous_report else ""
+        shell("python {input.script} --kg_dir {params.kg_dir} --node_filename $(basename {input.existing_KG_nodes}) --edge_filename $(basename {input.existing_KG_edges}) --output_file {output} " + previous_report_option)